@@ -1,6 +1,7 @@
 from flask import Flask, request, jsonify, render_template_string, send_from_directory
 from flask_cors import CORS
 from datetime import datetime, timedelta
+import hmac
 import os
 from dotenv import load_dotenv
 from utils.file_path_handler import file_handler
@@ -11,14 +12,30 @@ from mongodb_collections import (
     HubSpotDealCollection,
     FormTrackingCollection, TemplateCollection, HubSpotQuoteCollection,
     GeneratedPDFCollection, GeneratedAgreementCollection,
-    ApprovalWorkflowCollection
+    ApprovalWorkflowCollection, DocumentViewCollection
 )
 from mongodb_collections.template_builder_collection import TemplateBuilderCollection
+from mongodb_collections.asset_collection import AssetCollection
 from mongodb_collections.signature_certificate_collection import SignatureCertificateCollection
 from cpq.pricing_logic import calculate_quote
+from cpq.db import db
+from cpq.cache_invalidation import process_cache, start_invalidation_bus
+from cpq.mongo_monitoring import command_monitor
+from cpq.log_writer import log_writer
+from mongodb_collections.document_cleanup import start_cleanup_scheduler
+from mongodb_collections.document_blob_collection import track_generated_documents
+from mongodb_collections.generation_job_collection import (
+    GenerationJobCollection, format_job, start_generation_worker
+)
+from pymongo.errors import DuplicateKeyError
 from flask import send_file
-from templates import PDFGenerator
+from templates.pdf_renderer import parse_html_table, parse_table_content, create_purchase_agreement_table
+from templates.placeholders import replace_placeholders
+from templates.render_plan import template_plans
+from cpq.render_service import render_service
 from cpq.email_service import EmailService
+from exports import export_bp
+from imports import import_bp
 from werkzeug.utils import secure_filename
 from mongodb_collections.signature_collection import SignatureCollection
 from integrations.google_docs import upsert_doc_from_template, export_doc_as_pdf
@@ -32,12 +49,17 @@ load_dotenv()
 if not os.getenv('OAUTHLIB_INSECURE_TRANSPORT'):
     os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 app = Flask(__name__)
+# Shared secret for admin actions (X-Admin-Token header); unset disables them
+ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN')
 try:
-    from template_builder import template_builder_bp
+    from template_builder import template_builder_bp, assets_bp
     app.register_blueprint(template_builder_bp)
+    app.register_blueprint(assets_bp)
 except Exception:
     # Blueprint is optional during partial environments/tests
     pass
+app.register_blueprint(export_bp)
+app.register_blueprint(import_bp)
 # OAuth endpoints for Google
 @app.route('/oauth/login')
 def oauth_login():
@@ -104,18 +126,37 @@ smtp_collection = SMTPCollection()
 pricing = PricingCollection()
 form_tracking = FormTrackingCollection()
 template_collection = TemplateCollection()
+# WeasyPrint has no base URL for /assets/<hash>, so assets are inlined before rendering
+template_assets = AssetCollection()
 hubspot_quotes = HubSpotQuoteCollection()
 signatures = SignatureCollection()
 generated_pdfs = GeneratedPDFCollection()
 generated_agreements = GeneratedAgreementCollection()
 signature_certificate_collection = SignatureCertificateCollection()
 approval_workflows = ApprovalWorkflowCollection()
+document_view = DocumentViewCollection()
+generation_jobs = GenerationJobCollection()
+
+# Record Mongo round trips and time per request (see /api/metrics/mongo)
+command_monitor.init_app(app)
+
+# Tail changes to cached collections so this worker's cache never serves
+# documents another gunicorn worker has since modified
+start_invalidation_bus(db)
+
+# Remove orphaned and expired generated documents a batch at a time
+start_cleanup_scheduler()
 
+# Start the PDF render workers now so the first render doesn't wait for them
+render_service.start()
 
 
 
-# Initialize PDF generator
-pdf_generator = PDFGenerator()
+
+def _render_quote_pdf(client_data, quote_data, configuration, selected_plan='standard'):
+    """Quote PDF rendered by the render workers, as a BytesIO ready to send"""
+    from io import BytesIO
+    return BytesIO(render_service.render('quote_pdf', client_data, quote_data, configuration, selected_plan))
 
 def _build_template_data_from_quote(quote: dict) -> dict:
     """Builds the template_data dict used for DOCX exports from a quote document.
@@ -371,6 +412,81 @@ def get_system_info():
 
 
 
+@app.route('/api/system/cache')
+def get_cache_status():
+    """API endpoint to inspect this worker's document cache and invalidation bus"""
+    from cpq.cache_invalidation import get_invalidation_bus
+    bus = get_invalidation_bus()
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'cache': process_cache.get_stats(),
+        'invalidation': bus.get_status() if bus else None,
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+def _admin_denied():
+    """403 response unless the request carries ADMIN_API_TOKEN in X-Admin-Token, else None.
+
+    Admin actions are disabled while ADMIN_API_TOKEN is unset.
+    """
+    token = request.headers.get('X-Admin-Token', '')
+    if ADMIN_API_TOKEN and hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+        return None
+    return jsonify({'success': False, 'message': 'Admin token required'}), 403
+
+
+@app.route('/api/system/render')
+def get_render_status():
+    """API endpoint to inspect this worker's PDF render pool, render cache and template plans"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'render': render_service.get_status(),
+        'template_plans': template_plans.get_stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/api/system/render/cache/clear', methods=['POST'])
+def clear_render_cache():
+    """Admin action: drop every cached PDF (memory and disk) so the next renders start fresh"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if render_service.cache is not None:
+        render_service.cache.clear()
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'cache': render_service.cache.get_stats() if render_service.cache is not None else None,
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/api/metrics/mongo')
+def get_mongo_metrics():
+    """API endpoint exposing per-endpoint and per-collection Mongo histograms and slow queries"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'metrics': command_monitor.get_metrics(),
+        'log_writer': log_writer.get_metrics(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@app.route('/api/metrics/mongo/reset', methods=['POST'])
+def reset_mongo_metrics():
+    """Admin action: start this worker's Mongo histograms and slow-query log afresh"""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    command_monitor.reset()
+    return jsonify({'success': True, 'pid': os.getpid(), 'timestamp': datetime.now().isoformat()})
+
+
 # Serve uploaded files (e.g., images) for use in templates
 @app.route('/uploads/<path:filename>')
 def serve_uploads(filename):
@@ -399,6 +515,11 @@ def save_client():
             "client_id": str(result.inserted_id)
         }), 201
         
+    except DuplicateKeyError:
+        return jsonify({
+            "success": False,
+            "message": "A client with this email already exists"
+        }), 409
     except Exception as e:
         return jsonify({
             "success": False,
@@ -663,7 +784,7 @@ def generate_pdf():
         print(f"  Configuration: {configuration}")
         
         # Create PDF using template with selected plan
-        pdf_buffer = pdf_generator.create_quote_pdf(client_data, quote_data, configuration, selected_plan)
+        pdf_buffer = _render_quote_pdf(client_data, quote_data, configuration, selected_plan)
         pdf_buffer.seek(0)
         
         return send_file(
@@ -930,26 +1051,21 @@ def sync_client_from_hubspot():
             'serviceType': 'HubSpot',
         }
 
-        updated = False
+        created = False
         if client_id:
             result = clients.update_client(client_id, update_payload)
             updated = result.matched_count > 0
         else:
-            existing = clients.get_client_by_email(email)
-            if existing:
-                result = clients.update_client(str(existing['_id']), update_payload)
-                updated = result.matched_count > 0
-                client_id = str(existing['_id'])
-            else:
-                insert_result = clients.create_client(update_payload)
-                client_id = str(insert_result.inserted_id)
-                updated = True
+            client, created = clients.upsert_client_by_email(update_payload)
+            client_id = str(client['_id'])
+            updated = True
 
         return jsonify({
             'success': True,
             'message': 'Client synced from HubSpot',
             'client_id': client_id,
             'updated': updated,
+            'created': created,
             'hubspot': contact
         })
     except Exception as e:
@@ -958,6 +1074,47 @@ def sync_client_from_hubspot():
             'message': f'Failed to sync client from HubSpot: {str(e)}'
         }), 500
 
+@app.route('/api/hubspot/sync-clients', methods=['POST'])
+def sync_clients_from_hubspot():
+    """Batch sync of local clients from HubSpot for a list of emails (nightly reconciliation)."""
+    try:
+        data = request.get_json() or {}
+        emails = data.get('emails') or []
+        if not isinstance(emails, list) or not emails:
+            return jsonify({"success": False, "message": "emails must be a non-empty list"}), 400
+
+        from hubspot.hubspot_basic import HubSpotBasic
+        hubspot = HubSpotBasic()
+        hs = hubspot.get_contacts_by_emails(emails)
+        if not hs.get('success'):
+            return jsonify({"success": False, "message": f"HubSpot error: {hs.get('error')}"}), 502
+
+        result = clients.upsert_clients_by_email([
+            {
+                'clientName': contact.get('name'),
+                'companyName': contact.get('company'),
+                'email': contact.get('email'),
+                'phoneNumber': contact.get('phone'),
+                'serviceType': 'HubSpot',
+            }
+            for contact in hs['contacts']
+        ])
+
+        return jsonify({
+            'success': True,
+            'message': f"Synced {len(result['clients'])} clients from HubSpot",
+            'client_ids': {email: str(client['_id']) for email, client in result['clients'].items()},
+            'upserted': result['upserted'],
+            'modified': result['modified'],
+            'not_found': hs['missing'],
+            'errors': result['errors']
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to sync clients from HubSpot: {str(e)}'
+        }), 500
+
 # HubSpot Deal APIs
 @app.route('/api/hubspot/fetch-deals', methods=['GET'])
 def fetch_hubspot_deals():
@@ -1152,30 +1309,22 @@ def send_quote_email():
             
             # If no PDF exists, generate one
             if not pdf_path or not os.path.exists(pdf_path):
-                pdf_buffer = pdf_generator.create_quote_pdf(
+                pdf_buffer = _render_quote_pdf(
                     quote.get('client', {}), 
                     quote.get('quote', {}), 
                     quote.get('configuration', {})
                 )
                 pdf_buffer.seek(0)
                 
-                # Save PDF to documents directory
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 filename = f"quote_{quote.get('client', {}).get('name', 'client')}_{timestamp}.pdf"
-                file_path = os.path.join('documents', filename)
-                
-                # Ensure documents directory exists
-                os.makedirs('documents', exist_ok=True)
                 
-                # Save PDF file
-                with open(file_path, 'wb') as f:
-                    f.write(pdf_buffer.getvalue())
-                
-                # Store PDF metadata in MongoDB
+                # Store PDF metadata in MongoDB; the content is saved under
+                # documents/ by its hash, shared with identical PDFs
                 pdf_metadata = {
                     'quote_id': quote_id,
                     'filename': filename,
-                    'file_path': file_path,
+                    'file_path': os.path.join('documents', filename),
                     'client_name': quote.get('client', {}).get('name', 'N/A'),
                     'company_name': quote.get('client', {}).get('company', 'N/A'),
                     'service_type': quote.get('client', {}).get('serviceType', 'N/A'),
@@ -1185,7 +1334,7 @@ def send_quote_email():
                 try:
                     # Store PDF metadata with content for regeneration
                     generated_pdfs.store_pdf_metadata(pdf_metadata, pdf_buffer.getvalue())
-                    pdf_path = file_path
+                    pdf_path = pdf_metadata['file_path']
                 except Exception as e:
                     print(f"Warning: Failed to store PDF metadata: {e}")
         except Exception as e:
@@ -1271,7 +1420,7 @@ def send_quote_email_direct():
         pdf_path = None
         try:
             # Create PDF using template
-            pdf_buffer = pdf_generator.create_quote_pdf(
+            pdf_buffer = _render_quote_pdf(
                 {
                     'name': recipient_name,
                     'company': company_name,
@@ -1401,15 +1550,7 @@ def generate_pdf_from_template(quote_data, template_id, selected_plan='standard'
         print(f"Template ID: {template_id}")
         
         from mongodb_collections.template_builder_collection import TemplateBuilderCollection
-        from reportlab.lib.pagesizes import letter
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-        from reportlab.lib.styles import getSampleStyleSheet
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
         from io import BytesIO
-        import re
-        import base64
-        import tempfile
         
         # Get template data
         template_collection = TemplateBuilderCollection()
@@ -1435,410 +1576,45 @@ def generate_pdf_from_template(quote_data, template_id, selected_plan='standard'
         print(f"  [Client.Company] value: {template_data.get('Client.Company', 'NOT FOUND')}")
         print(f"  [company name] value: {template_data.get('company name', 'NOT FOUND')}")
         
-        # Create PDF buffer
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=letter,
-            leftMargin=0.75*inch,
-            rightMargin=0.75*inch,
-            topMargin=0.6*inch,
-            bottomMargin=0.75*inch
-        )
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Try to render real logos from image block if present
-        def extract_base64_images(html: str):
-            try:
-                # Support common raster formats
-                pattern = r"data:image/(png|jpeg|jpg|webp|gif);base64,([A-Za-z0-9+/=]+)"
-                matches = re.findall(pattern, html)
-                return [m[1] for m in matches]
-            except Exception:
-                return []
-
-        logo_images_added = False
-        extracted_logo_paths = []
+        # Logos come from the first image block, already decoded by the asset store
+        logo_images = []
         debug_info = []
-        
         for block in template.get('blocks', []):
             if block.get('type') == 'image':
-                print(f"🔍 Processing image block: {block.get('type')}")
-                print(f"📏 Content length: {len(block.get('content', ''))}")
-                
-                b64_list = extract_base64_images(block.get('content', ''))
-                print(f"🖼️ Found {len(b64_list)} base64 images")
-                debug_info.append(f"Image block: {len(b64_list)} base64 images found")
-                
-                if b64_list:
-                    # Collect up to two images and place them side-by-side
-                    for i, b64 in enumerate(b64_list[:2]):
-                        try:
-                            print(f"🔄 Processing image {i+1}, base64 length: {len(b64)}")
-                            img_bytes = base64.b64decode(b64)
-                            tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-                            tmp.write(img_bytes)
-                            tmp.flush()
-                            extracted_logo_paths.append(tmp.name)
-                            logo_images_added = True
-                            debug_info.append(f"Image {i+1}: Successfully decoded and saved")
-                            print(f"✅ Image {i+1} saved to: {tmp.name}")
-                        except Exception as e:
-                            debug_info.append(f"Image {i+1}: Error - {str(e)}")
-                            print(f"❌ Error processing image {i+1}: {str(e)}")
+                images = template_collection.assets.get_block_images(block)
+                print(f"🖼️ Found {len(images)} images")
+                debug_info.append(f"Image block: {len(images)} images found")
+                if images:
+                    # Up to two logos, placed side-by-side
+                    logo_images = images[:2]
                 else:
-                    debug_info.append("No base64 images found in content")
-                    print("⚠️ No base64 images found in image block content")
+                    debug_info.append("No images found in content")
                 break
         
-        # Build a table with the logos if we have at least one
-        if extracted_logo_paths:
-            imgs = []
-            if len(extracted_logo_paths) == 1:
-                # Single centered logo, larger size with preserved aspect ratio
-                img = Image(extracted_logo_paths[0])
-                target_h = 1.4*inch  # Increased height
-                aspect = img.imageWidth / float(img.imageHeight)
-                img.drawHeight = target_h
-                img.drawWidth = min(4.5*inch, target_h * aspect)  # Increased max width
-                img.hAlign = 'CENTER'
-                imgs = [[img]]
-                tbl_col_widths = [6.5*inch]  # Wider table
-                tbl_style = [('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                             ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                             ('LEFTPADDING', (0,0), (-1,-1), 0),
-                             ('RIGHTPADDING', (0,0), (-1,-1), 0),
-                             ('TOPPADDING', (0,0), (-1,-1), 0),
-                             ('BOTTOMPADDING', (0,0), (-1,-1), 0)]
-            else:
-                # Two logos: left (CloudFuze), right (Microsoft Partner) - bigger with preserved aspect
-                img_left = Image(extracted_logo_paths[0])
-                img_right = Image(extracted_logo_paths[1])
-                target_h_left = 1.5*inch   # Increased height
-                target_h_right = 1.4*inch  # Increased height
-                aspect_left = img_left.imageWidth / float(img_left.imageHeight)
-                aspect_right = img_right.imageWidth / float(img_right.imageHeight)
-                img_left.drawHeight = target_h_left
-                img_left.drawWidth = min(4.0*inch, target_h_left * aspect_left)  # Increased max width
-                img_right.drawHeight = target_h_right
-                img_right.drawWidth = min(3.8*inch, target_h_right * aspect_right)  # Increased max width
-                img_left.hAlign = 'LEFT'
-                img_right.hAlign = 'RIGHT'
-                imgs = [[img_left, img_right]]
-                tbl_col_widths = [4.0*inch, 4.0*inch]  # Wider columns
-                tbl_style = [
-                    ('ALIGN', (0,0), (0,0), 'LEFT'),
-                    ('ALIGN', (1,0), (1,0), 'RIGHT'),
-                    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                    ('LEFTPADDING', (0,0), (-1,-1), 0),
-                    ('RIGHTPADDING', (0,0), (-1,-1), 0),
-                    ('TOPPADDING', (0,0), (-1,-1), 0),
-                    ('BOTTOMPADDING', (0,0), (-1,-1), 0),
-                    ('INNERGRID', (0,0), (-1,-1), 0, colors.white),
-                    ('BOX', (0,0), (-1,-1), 0, colors.white),
-                ]
-            logo_table = Table(imgs, colWidths=tbl_col_widths, hAlign='CENTER')
-            logo_table.setStyle(TableStyle(tbl_style))
-            story.append(logo_table)
-            story.append(Spacer(1, 15))
-
-        if not logo_images_added:
-            # Show debug information instead of logos
-            debug_section = f"""
-            <para align="center" fontSize="12" spaceAfter="20" textColor="red">
-            <b>DEBUG LOGS - Logo Processing:</b><br/>
-            {chr(10).join(debug_info) if debug_info else 'No debug info available'}<br/>
-            <br/>
-            <b>Fallback:</b> CloudFuze - Microsoft Partner<br/>
-            <font color="gold">Gold Cloud Productivity</font>
-            </para>
-            """
-            story.append(Paragraph(debug_section, styles['Normal']))
-            story.append(Spacer(1, 30))
-        
-        # Add main title
-        title_text = f"CloudFuze Purchase Agreement for {client_company}"
-        story.append(Paragraph(title_text, styles['Title']))
-        story.append(Spacer(1, 30))
-        
-        # Process each template block and convert to PDF
-        for block in template.get('blocks', []):
-            block_type = block.get('type', 'text')
-            content = block.get('content', '')
-            
-            print(f"Processing block type: {block_type}")
-            print(f"Original content length: {len(content)}")
-            print(f"Original content preview: {content[:200]}...")
-            
-            # Extract actual content from HTML wrapper
-            # Look for the actual template content within the HTML
-            actual_content = content
-            
-            # Try to extract content from common HTML patterns
-            import re
-            
-            # Look for content within the main block structure
-            # The template content is usually within a div that contains the actual content
-            patterns = [
-                r'<div[^>]*class="[^"]*content[^"]*"[^>]*>(.*?)</div>',  # div with content class
-                r'<div[^>]*class="[^"]*block[^"]*"[^>]*>(.*?)</div>',   # div with block class
-                r'<p[^>]*>(.*?)</p>',                                   # paragraph tags
-                r'<h[1-6][^>]*>(.*?)</h[1-6]>',                        # heading tags
-                r'<span[^>]*>(.*?)</span>',                             # span tags
-                r'<div[^>]*>(.*?)</div>'                                # any div (fallback)
-            ]
-            
-            for pattern in patterns:
-                matches = re.findall(pattern, content, re.DOTALL)
-                if matches:
-                    # Take the longest match (most likely to be the actual content)
-                    actual_content = max(matches, key=len)
-                    break
-            
-            # If we still have HTML wrapper, try to extract text content
-            if '<div class="block-toolbar"' in actual_content:
-                # This is still a wrapper, look deeper
-                inner_patterns = [
-                    r'<div[^>]*class="[^"]*editor[^"]*"[^>]*>(.*?)</div>',
-                    r'<div[^>]*class="[^"]*prose[^"]*"[^>]*>(.*?)</div>',
-                    r'<div[^>]*class="[^"]*document[^"]*"[^>]*>(.*?)</div>',
-                    r'<div[^>]*>(.*?)</div>'
-                ]
-                
-                for pattern in inner_patterns:
-                    matches = re.findall(pattern, actual_content, re.DOTALL)
-                    if matches:
-                        actual_content = max(matches, key=len)
-                        break
-            
-            # If we still can't extract meaningful content, create default content based on block type
-            if not actual_content or len(actual_content.strip()) < 10 or '<div class="block-toolbar"' in actual_content:
-                print(f"Could not extract meaningful content for {block_type} block, using default")
-                if block_type == 'text':
-                    actual_content = f"CloudFuze Purchase Agreement for {client_company}"
-                elif block_type == 'table':
-                    actual_content = "table_content"  # Will be handled by create_purchase_agreement_table
-                elif block_type == 'image':
-                    actual_content = "logo_content"  # Will be handled by image block logic
-            
-            print(f"Extracted content: {actual_content[:100]}...")
-            
-            # Replace ALL placeholders in content
-            processed_content = actual_content
-            
-            # First do special replacements for common placeholders
-            processed_content = processed_content.replace('[Client.Company]', client_company)
-            processed_content = processed_content.replace('[Client Company]', client_company)
-            processed_content = processed_content.replace('[client_company]', client_company)
-            processed_content = processed_content.replace('[company name]', template_data.get('company_name', 'CloudFuze'))
-            processed_content = processed_content.replace('[company_name]', template_data.get('company_name', 'CloudFuze'))
-            
-            # Then do general replacements
-            for key, value in template_data.items():
-                # Replace [key] format
-                processed_content = processed_content.replace(f'[{key}]', str(value))
-                # Replace {{key}} format
-                processed_content = processed_content.replace(f'{{{{{key}}}}}', str(value))
-                # Replace {key} format
-                processed_content = processed_content.replace(f'{{{key}}}', str(value))
-            
-            print(f"🔍 Placeholder replacement debug:")
-            print(f"  Original content: {actual_content[:200]}...")
-            print(f"  Processed content: {processed_content[:200]}...")
-            print(f"  Client company: {client_company}")
-            print(f"  Company name: {template_data.get('company_name', 'NOT FOUND')}")
-            print(f"  Template data keys: {list(template_data.keys())}")
-            
-            # Check if placeholders are still in the content
-            if '[Client.Company]' in processed_content:
-                print("❌ [Client.Company] placeholder still present!")
-            else:
-                print("✅ [Client.Company] placeholder replaced")
-                
-            if '[company name]' in processed_content:
-                print("❌ [company name] placeholder still present!")
-            else:
-                print("✅ [company name] placeholder replaced")
-            
-            # Replace specific template placeholders with actual data
-            processed_content = processed_content.replace('{Up to i want to keep here no of users}', str(template_data.get('config_users', 1)))
-            processed_content = processed_content.replace('{up to i want to keep here no of users}', str(template_data.get('config_users', 1)))
-            processed_content = processed_content.replace('{UP TO I WANT TO KEEP HERE NO OF USERS}', str(template_data.get('config_users', 1)))
-
-            # Determine plan prefix based on selected plan to pull matching values
-            plan_prefix = 'standard'
-            if selected_plan == 'basic':
-                plan_prefix = 'basic'
-            elif selected_plan == 'advanced':
-                plan_prefix = 'advanced'
-
-            # Compute combined (migration + instance) for the selected plan
-            try:
-                mig_val = float(template_data.get(f'{plan_prefix}_migration_cost', 0) or 0)
-                inst_val = float(template_data.get(f'{plan_prefix}_instance_cost', 0) or 0)
-            except Exception:
-                mig_val = 0.0
-                inst_val = 0.0
-            combined_val = mig_val + inst_val
-            combined_formatted = f"${combined_val:,.2f}"
-
-            # Replace placeholders for costs
-            processed_content = processed_content.replace('{i want to mention here cost of migration only}', template_data.get(f'{plan_prefix}_migration_cost_formatted', '$0.00'))
-            processed_content = processed_content.replace('{i want to mention here cost of service here}', template_data.get(f'{plan_prefix}_migration_cost_formatted', '$0.00'))
-            processed_content = processed_content.replace('{i want to mention here total amount}', template_data.get(f'{plan_prefix}_total_cost_formatted', '$0.00'))
-            
-            # Replace the specific placeholders from your template
-            processed_content = processed_content.replace('{i want to mention total cost - (migration cost+if instance cost)}', template_data.get(f'{plan_prefix}_total_cost_formatted', '$0.00'))
-            processed_content = processed_content.replace('{I WANT TO MENTION TOTAL COST - (MIGRATION COST+IF INSTANCE COST)}', template_data.get(f'{plan_prefix}_total_cost_formatted', '$0.00'))
-            processed_content = processed_content.replace('{i want to mention total cost}', template_data.get(f'{plan_prefix}_total_cost_formatted', '$0.00'))
-            
-            # Replace migration cost placeholders
-            processed_content = processed_content.replace('{migration cost}', template_data.get(f'{plan_prefix}_migration_cost_formatted', '$0.00'))
-            processed_content = processed_content.replace('{MIGRATION COST}', template_data.get(f'{plan_prefix}_migration_cost_formatted', '$0.00'))
-            
-            # Replace instance cost placeholders
-            processed_content = processed_content.replace('{instance cost}', template_data.get(f'{plan_prefix}_instance_cost_formatted', '$0.00'))
-            processed_content = processed_content.replace('{INSTANCE COST}', template_data.get(f'{plan_prefix}_instance_cost_formatted', '$0.00'))
-            
-            # Replace duration placeholders
-            processed_content = processed_content.replace('{Valid for how m,any Months i want tomention here}', str(template_data.get('config_duration_months', '3')))
-            processed_content = processed_content.replace('{valid for how many months i want to mention here}', str(template_data.get('config_duration_months', '3')))
-            processed_content = processed_content.replace('{VALID FOR HOW MANY MONTHS I WANT TO MENTION HERE}', str(template_data.get('config_duration_months', '3')))
-            
-            # Replace the specific placeholder from your template (with the typo)
-            processed_content = processed_content.replace('Valid for how m,any Months i want tomention here', str(template_data.get('config_duration_months', '3')))
-
-            # Add debugging for placeholder replacement
-            print(f"🔍 Final placeholder replacement debug:")
-            print(f"  Client company: {client_company}")
-            print(f"  Config users: {template_data.get('config_users', 'NOT FOUND')}")
-            print(f"  Plan prefix: {plan_prefix}")
-            print(f"  Migration cost: {template_data.get(f'{plan_prefix}_migration_cost_formatted', 'NOT FOUND')}")
-            print(f"  Total cost: {template_data.get(f'{plan_prefix}_total_cost_formatted', 'NOT FOUND')}")
-            print(f"  Processed content preview: {processed_content[:300]}...")
-            
-            # Check if any placeholders are still present
-            remaining_placeholders = []
-            if '[Client.Company]' in processed_content:
-                remaining_placeholders.append('[Client.Company]')
-            if '{Up to i want to keep here no of users}' in processed_content:
-                remaining_placeholders.append('{Up to i want to keep here no of users}')
-            if '{i want to mention total cost' in processed_content:
-                remaining_placeholders.append('{i want to mention total cost...}')
-            
-            if remaining_placeholders:
-                print(f"⚠️ Remaining placeholders: {remaining_placeholders}")
-            else:
-                print("✅ All placeholders replaced successfully")
-            
-            print(f"Processed content: {processed_content[:100]}...")
-            
-            if block_type == 'image':
-                # Handle image block - this contains the logos
-                print("Processing image block - adding logos")
-                
-                # Try to extract logo content from the image block
-                if 'CloudFuze' in actual_content or 'Microsoft' in actual_content:
-                    # This block contains logo information, add it to PDF
-                    logo_text = """
-                    <para align="center">
-                    <b>CloudFuze</b> - Microsoft Partner<br/>
-                    Gold Cloud Productivity
-                    </para>
-                    """
-                    story.append(Paragraph(logo_text, styles['Normal']))
-                    story.append(Spacer(1, 20))
-                    print("Added logo content from image block")
-                else:
-                    print("Image block doesn't contain logo content, skipping")
-                continue
-                
-            elif block_type == 'text':
-                # Skip duplicate titles
-                if 'CloudFuze Purchase Agreement for' in processed_content and processed_content != title_text:
-                    print("Skipping duplicate title")
-                    continue
-                
-                # Convert HTML to plain text and add to PDF
-                plain_text = re.sub(r'<[^>]+>', '', processed_content)
-                if plain_text.strip():
-                    story.append(Paragraph(plain_text, styles['Normal']))
-                    story.append(Spacer(1, 12))
-            
-            elif block_type == 'table':
-                # Try to parse the actual table content from template first
-                table_data = None
-                
-                # Look for table content in the processed content
-                if '<table' in processed_content or '<tr>' in processed_content:
-                    print("Found HTML table in template content, parsing...")
-                    table_data = parse_html_table(processed_content)
-                elif 'job' in processed_content.lower() and 'description' in processed_content.lower():
-                    print("Found structured table content in template, parsing...")
-                    table_data = parse_table_content(processed_content)
-                
-                # Fallback to default table if no table content found
-                if not table_data:
-                    print(f"No table content found, using default purchase agreement table with {selected_plan} plan")
-                    table_data = create_purchase_agreement_table(template_data, selected_plan)
-                
-                if table_data:
-                    table = Table(table_data, colWidths=[2.5*inch, 2.5*inch, 1.5*inch])
-                    table.setStyle(TableStyle([
-                        # Header row - white background
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.white),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('FONTSIZE', (0, 0), (-1, 0), 11),
-                        # Data rows - light blue background like template preview
-                        ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#E3F2FD')),  # Light blue
-                        ('TEXTCOLOR', (0, 1), (-1, -2), colors.black),
-                        ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
-                        ('FONTSIZE', (0, 1), (-1, -2), 10),
-                        # Total row - white background
-                        ('BACKGROUND', (0, -1), (-1, -1), colors.white),
-                        ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
-                        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                        ('FONTSIZE', (0, -1), (-1, -1), 10),
-                        # Alignment - left for job/description, right for price
-                        ('ALIGN', (0, 0), (0, -1), 'LEFT'),   # job column
-                        ('ALIGN', (1, 0), (1, -1), 'LEFT'),   # description column  
-                        ('ALIGN', (2, 0), (2, -1), 'RIGHT'),  # price column
-                        # Padding
-                        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-                        ('TOPPADDING', (0, 0), (-1, -1), 8),
-                        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-                        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-                        # Borders
-                        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ]))
-                    story.append(table)
-                    story.append(Spacer(1, 20))
+        # The blocks are compiled once per template version; the worker
+        # only fills the plan's placeholder slots and lays out the PDF.
+        plan = template_plans.get(template_id, template.get('updated'), template.get('blocks', []))
         
-        # Build PDF
-        doc.build(story)
-        buffer.seek(0)
+        # Render in a worker process; this thread only waits for the bytes.
+        # Unchanged template version + data + plan is served from the render cache
+        pdf_bytes = render_service.render(
+            'template_plan_pdf', plan, logo_images, template_data,
+            client_company, selected_plan, debug_info,
+            cache_key=[template_id, template.get('updated'), template_data, client_company, selected_plan]
+        )
+        buffer = BytesIO(pdf_bytes)
         
-        # Save PDF to documents directory
         client = quote_data.get('client', {})
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"quote_{client.get('name', 'client')}_{timestamp}.pdf"
-        file_path = os.path.join('documents', filename)
-        
-        # Ensure documents directory exists
-        os.makedirs('documents', exist_ok=True)
-        
-        # Save PDF file
-        with open(file_path, 'wb') as f:
-            f.write(buffer.getvalue())
         
-        # Store PDF metadata in MongoDB
+        # Store PDF metadata in MongoDB; the content is saved under
+        # documents/ by its hash, shared with identical PDFs
         pdf_metadata = {
             'quote_id': str(quote_data.get('_id')),
             'template_id': template_id,
             'filename': filename,
-            'file_path': file_path,
+            'file_path': os.path.join('documents', filename),
             'client_name': client.get('name', 'N/A'),
             'company_name': client.get('company', 'N/A')
         }
@@ -1863,55 +1639,9 @@ def generate_pdf_from_template(quote_data, template_id, selected_plan='standard'
         return jsonify({'success': False, 'message': f'PDF generation failed: {str(e)}'}), 500
 
 def replace_placeholders_in_content(content, template_data):
-    """Replace placeholders in content with actual data"""
+    """Replace placeholders in content with actual data (see templates/placeholders.py)"""
     try:
-        import re
-        
-        print(f"Replacing placeholders in content: {content[:100]}...")
-        print(f"Available template data: {list(template_data.keys())}")
-        
-        # Replace placeholders in format {{placeholder_name}} and [placeholder_name]
-        for key, value in template_data.items():
-            # Replace {{key}} format (case insensitive)
-            old_content = content
-            content = re.sub(r'\{\{' + re.escape(key) + r'\}\}', str(value), content, flags=re.IGNORECASE)
-            if content != old_content:
-                print(f"Replaced {{{{{key}}}}} with {value}")
-            
-            # Replace [key] format (case insensitive)
-            old_content = content
-            content = re.sub(r'\[' + re.escape(key) + r'\]', str(value), content, flags=re.IGNORECASE)
-            if content != old_content:
-                print(f"Replaced [{key}] with {value}")
-            
-            # Replace {key} format (case insensitive)
-            old_content = content
-            content = re.sub(r'\{' + re.escape(key) + r'\}', str(value), content, flags=re.IGNORECASE)
-            if content != old_content:
-                print(f"Replaced {{{key}}} with {value}")
-        
-        # Special handling for common placeholders
-        special_replacements = {
-            '[Client.Company]': template_data.get('client_company', 'Client Company'),
-            '[Client Company]': template_data.get('client_company', 'Client Company'),
-            '[client_company]': template_data.get('client_company', 'Client Company'),
-            '[Client.Name]': template_data.get('client_name', 'Client Name'),
-            '[Client Name]': template_data.get('client_name', 'Client Name'),
-            '[client_name]': template_data.get('client_name', 'Client Name'),
-            '[company name]': template_data.get('company_name', 'CloudFuze'),
-            '[company_name]': template_data.get('company_name', 'CloudFuze'),
-        }
-        
-        for placeholder, value in special_replacements.items():
-            if placeholder in content:
-                content = content.replace(placeholder, str(value))
-                print(f"Replaced {placeholder} with {value}")
-        
-        # Handle special formatting for currency values
-        content = re.sub(r'\$(\d+(?:\.\d{2})?)', r'$\1', content)  # Ensure proper currency formatting
-        
-        print(f"Final content after replacement: {content[:200]}...")
-        return content
+        return replace_placeholders(content, template_data)
     except Exception as e:
         print(f"Error replacing placeholders: {str(e)}")
         return content
@@ -1988,163 +1718,6 @@ def parse_html_content(content, styles):
             return [Paragraph(plain_text, styles['Normal'])]
         return []
 
-def parse_html_table(table_html):
-    """Parse HTML table and return table data for ReportLab"""
-    try:
-        import re
-        
-        # Extract table rows
-        rows = re.findall(r'<tr[^>]*>(.*?)</tr>', table_html, re.IGNORECASE | re.DOTALL)
-        table_data = []
-        
-        for row in rows:
-            # Extract table cells (both th and td)
-            cells = re.findall(r'<(?:th|td)[^>]*>(.*?)</(?:th|td)>', row, re.IGNORECASE | re.DOTALL)
-            if cells:
-                # Clean cell content
-                clean_cells = []
-                for cell in cells:
-                    cell_text = re.sub(r'<[^>]+>', '', cell).strip()
-                    clean_cells.append(cell_text)
-                table_data.append(clean_cells)
-        
-        return table_data if table_data else None
-    except Exception as e:
-        print(f"Error parsing HTML table: {str(e)}")
-        return None
-
-def parse_table_content(content):
-    """Parse table content and return table data for ReportLab"""
-    try:
-        import re
-        
-        # First try to parse HTML table
-        if '<table' in content.lower():
-            return parse_html_table(content)
-        
-        # If not HTML, try to parse structured text
-        lines = content.split('\n')
-        table_data = []
-        
-        # Look for common table patterns
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Check if line contains table-like structure
-            if '|' in line or '\t' in line or '  ' in line:
-                # Split by common separators
-                row = re.split(r'[|\t]+|\s{2,}', line)
-                if len(row) >= 2:  # At least 2 columns
-                    clean_row = [cell.strip() for cell in row if cell.strip()]
-                    if clean_row:
-                        table_data.append(clean_row)
-            elif any(keyword in line.lower() for keyword in ['job', 'description', 'price', 'amount', 'total']):
-                # This might be a header or data row
-                if 'job' in line.lower() and 'description' in line.lower() and 'price' in line.lower():
-                    # This is likely a header row
-                    table_data.append(['Job', 'Description', 'Price'])
-                elif any(keyword in line.lower() for keyword in ['cloudfuze', 'migration', 'managed', 'total']):
-                    # This might be a data row, try to extract meaningful content
-                    # For now, add as a single cell row
-                    table_data.append([line])
-        
-        # If we found structured data, return it
-        if table_data:
-            return table_data
-        
-        # Fallback: create a simple table from the content
-        # Look for lines that might be table rows
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('<') and not line.startswith('{'):
-                # This might be table content
-                if any(keyword in line.lower() for keyword in ['cloudfuze', 'migration', 'managed', 'total', 'amount']):
-                    table_data.append([line])
-        
-        return table_data if table_data else None
-    except Exception as e:
-        print(f"Error parsing table content: {str(e)}")
-        return None
-
-def create_purchase_agreement_table(template_data, selected_plan='standard'):
-    """Create a professional purchase agreement table based on template data and selected plan"""
-    try:
-        # Extract relevant data based on selected plan
-        client_company = template_data.get('client_company', 'Client Company')
-        config_users = template_data.get('config_users', 1)
-        config_duration = template_data.get('config_duration_months', 1)
-        
-        # Get pricing based on selected plan
-        if selected_plan == 'basic':
-            plan_prefix = 'basic'
-        elif selected_plan == 'advanced':
-            plan_prefix = 'advanced'
-        else:
-            plan_prefix = 'standard'
-
-        # Totals for table (both numeric and formatted)
-        total_cost_num = float(template_data.get(f'{plan_prefix}_total_cost', 0) or 0)
-        total_cost = template_data.get(f'{plan_prefix}_total_cost_formatted', '$0.00')
-
-        # Compute combined (migration + instance) for the selected plan
-        try:
-            mig_val = float(template_data.get(f'{plan_prefix}_migration_cost', 0) or 0)
-            inst_val = float(template_data.get(f'{plan_prefix}_instance_cost', 0) or 0)
-        except Exception:
-            mig_val = 0.0
-            inst_val = 0.0
-        combined_val = (mig_val + inst_val)
-        combined_formatted = f"${combined_val:,.2f}"
-
-        # Formatted single migration cost for row 2
-        migration_formatted = template_data.get(f'{plan_prefix}_migration_cost_formatted', '$0.00')
-
-        # Row 1 amount: total cost - (migration + instance)
-        row1_val = max(0.0, total_cost_num - combined_val)
-        row1_formatted = f"${row1_val:,.2f}"
-        
-        # Get migration type, default to "slack to teams" to match template preview
-        config_migration_type = template_data.get('config_migration_type', 'slack to teams')
-        if config_migration_type == 'content':
-            config_migration_type = 'slack to teams'  # Map content to slack to teams
-        
-        print(f"Creating table with {selected_plan} plan:")
-        print(f"  Client company: {client_company}")
-        print(f"  Total cost: {total_cost}")
-        print(f"  Migration cost: {mig_val}")
-        print(f"  Migration type: {config_migration_type}")
-        print(f"  Duration: {config_duration} months")
-        
-        # Create table data exactly as shown in template preview
-        table_data = [
-            ['job', 'Description', 'price'],
-            [
-                'CloudFuze X-Change Data Migration',
-                f'{config_migration_type} (Up to {config_users} users)',  # Include user count
-                row1_formatted  # total - (migration + instance)
-            ],
-            [
-                'Managed Migration Service',
-                f'valid for {config_duration} month{"s" if config_duration > 1 else ""}',
-                migration_formatted  # migration cost only
-            ],
-            [
-                'total',
-                'price',
-                total_cost  # Use total cost for the total row
-            ]
-        ]
-        
-        print(f"Table data: {table_data}")
-        return table_data
-    except Exception as e:
-        print(f"Error creating purchase agreement table: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return None
-
 @app.route('/api/test-placeholder-replacement', methods=['POST'])
 def test_placeholder_replacement():
     """Test endpoint to verify placeholder replacement works"""
@@ -2252,6 +1825,7 @@ def update_quote_selected_plan(quote_id):
             {'_id': ObjectId(quote_id)},
             {'$set': update_data}
         )
+        process_cache.evict(quote_collection.collection.name, quote_id)
 
         if result.matched_count == 0:
             return jsonify({'success': False, 'message': 'Quote not found'}), 404
@@ -2405,11 +1979,9 @@ def generate_pdf_by_lookup():
             
             # Generate PDF using WeasyPrint or ReportLab
             try:
-                from weasyprint import HTML
                 from io import BytesIO
                 
-                html_doc = HTML(string=template_content)
-                pdf_bytes = html_doc.write_pdf()
+                pdf_bytes = render_service.render('html_pdf', template_assets.inline_assets(template_content))
                 
                 return send_file(
                     BytesIO(pdf_bytes),
@@ -2646,23 +2218,15 @@ def generate_pdf_by_lookup():
         doc.build(story)
         buffer.seek(0)
 
-        # Save PDF to documents directory
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"quote_{client.get('name', 'client')}_{timestamp}.pdf"
-        file_path = os.path.join('documents', filename)
-        
-        # Ensure documents directory exists
-        os.makedirs('documents', exist_ok=True)
         
-        # Save PDF file
-        with open(file_path, 'wb') as f:
-            f.write(buffer.getvalue())
-        
-        # Store PDF metadata in MongoDB
+        # Store PDF metadata in MongoDB; the content is saved under
+        # documents/ by its hash, shared with identical PDFs
         pdf_metadata = {
             'quote_id': str(quote_data.get('_id')),
             'filename': filename,
-            'file_path': file_path,
+            'file_path': os.path.join('documents', filename),
             'client_name': client.get('name', 'N/A'),
             'company_name': client.get('company', 'N/A'),
             'service_type': client.get('serviceType', 'N/A'),
@@ -2670,7 +2234,7 @@ def generate_pdf_by_lookup():
         }
         
         try:
-            generated_pdfs.store_pdf_metadata(pdf_metadata)
+            generated_pdfs.store_pdf_metadata(pdf_metadata, buffer.getvalue())
         except Exception as e:
             print(f"Warning: Failed to store PDF metadata: {e}")
         
@@ -3048,12 +2612,8 @@ def generate_agreement_from_quote():
         }
         
         try:
-            # Ensure documents directory exists
-            os.makedirs('documents', exist_ok=True)
-            
             # Generate PDF from the agreement content
             try:
-                from weasyprint import HTML
                 from io import BytesIO
                 
                 # Create a simple HTML template for the agreement
@@ -3084,36 +2644,30 @@ def generate_agreement_from_quote():
                     </div>
                     <div class="content">{personalized_content}</div>
                     <div class="footer">
-                        <p>Generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
+                        <p>Generated on {datetime.now().strftime('%B %d, %Y')}</p>
                     </div>
                 </body>
                 </html>
                 """
                 
-                # Create PDF
-                html_doc = HTML(string=html_content)
-                pdf_bytes = html_doc.write_pdf()
-                
-                # Save PDF file
-                with open(agreement_metadata['file_path'], 'wb') as f:
-                    f.write(pdf_bytes)
-                
-                # Update file size to actual PDF size
-                agreement_metadata['file_size'] = len(pdf_bytes)
+                # Create PDF; the body only carries the date, so the same
+                # agreement is served from the render cache for the rest of the day
+                pdf_bytes = render_service.render('html_pdf', template_assets.inline_assets(html_content))
                 
+                agreement_file = pdf_bytes
                 print(f"✅ PDF Agreement generated: {agreement_metadata['filename']}")
                 
             except ImportError:
                 print("⚠️ WeasyPrint not available, falling back to text file")
                 # Fallback to text file if WeasyPrint is not available
-                with open(agreement_metadata['file_path'].replace('.pdf', '.txt'), 'w', encoding='utf-8') as f:
-                    f.write(personalized_content)
+                agreement_file = personalized_content.encode('utf-8')
                 # Update metadata for text file
                 agreement_metadata['filename'] = agreement_metadata['filename'].replace('.pdf', '.txt')
                 agreement_metadata['file_path'] = agreement_metadata['file_path'].replace('.pdf', '.txt')
                 
-            # Store agreement metadata in MongoDB
-            generated_agreements.store_agreement_metadata(agreement_metadata)
+            # Store agreement metadata in MongoDB; the file is saved under
+            # documents/ by its hash, shared with identical agreements
+            generated_agreements.store_agreement_metadata(agreement_metadata, agreement_file)
             print(f"✅ Agreement stored in MongoDB: {agreement_metadata['filename']}")
             
         except Exception as e:
@@ -3173,30 +2727,20 @@ def generate_agreement_pdf():
         
         # Generate PDF from HTML template
         try:
-            from weasyprint import HTML
             from io import BytesIO
             
             # Create PDF
-            html_doc = HTML(string=template_content)
-            pdf_bytes = html_doc.write_pdf()
+            pdf_bytes = render_service.render('html_pdf', template_assets.inline_assets(template_content))
             
-            # Save PDF to documents directory
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"agreement_{template_data.get('client_name', 'client')}_{timestamp}.pdf"
-            file_path = os.path.join('documents', filename)
-            
-            # Ensure documents directory exists
-            os.makedirs('documents', exist_ok=True)
             
-            # Save PDF file
-            with open(file_path, 'wb') as f:
-                f.write(pdf_bytes)
-            
-            # Store agreement metadata in MongoDB
+            # Store agreement metadata in MongoDB; the content is saved under
+            # documents/ by its hash, shared with identical agreements
             agreement_metadata = {
                 'quote_id': quote_id,
                 'filename': filename,
-                'file_path': file_path,
+                'file_path': os.path.join('documents', filename),
                 'client_name': template_data.get('client_name', 'N/A'),
                 'company_name': template_data.get('client_company', 'N/A'),
                 'service_type': template_data.get('service_type', 'N/A'),
@@ -3231,6 +2775,130 @@ def generate_agreement_pdf():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# Generation endpoints that can also run as background jobs, by job type
+GENERATION_JOB_TYPES = {
+    'pdf_by_lookup': '/api/generate-pdf-by-lookup',
+    'agreement_from_quote': '/api/agreements/generate-from-quote',
+    'agreement_pdf': '/api/agreements/generate-pdf',
+    'template_agreement_pdf': '/api/templates/generate-agreement-pdf',
+}
+
+
+def _email_generated_documents(email, documents):
+    """Send the documents a job produced as attachments"""
+    attachments = []
+    for document in documents:
+        if document['collection'] == generated_pdfs.collection.name:
+            record = generated_pdfs.get_pdf_by_id(document['id'])
+            get_content = generated_pdfs.get_pdf_content
+        else:
+            record = generated_agreements.get_agreement_by_id(document['id'])
+            get_content = generated_agreements.get_agreement_content
+        if not record:
+            continue
+
+        file_path = record.get('file_path')
+        if record.get('content_hash') and not (file_path and os.path.exists(file_path)):
+            # Restore the local copy from the blob store
+            content = get_content(record)
+            if content:
+                extension = os.path.splitext(file_path or '')[1] or '.pdf'
+                file_path = generated_pdfs.blobs.write_file(record['content_hash'], content, extension)
+        if file_path and os.path.exists(file_path):
+            attachments.append({'filename': record.get('filename', 'document.pdf'), 'file_path': file_path})
+
+    recipient_name = email.get('recipient_name') or 'there'
+    subject = email.get('subject') or 'Your generated documents'
+    body = email.get('body') or f"""
+    <html>
+    <body>
+        <h2>Hello {recipient_name},</h2>
+        <p>Please find attached the requested documents.</p>
+        <p><strong>Attachments:</strong> {len(attachments)} document(s)</p>
+        <br>
+        <p>Best regards,<br>Your Team</p>
+    </body>
+    </html>
+    """
+    return EmailService().send_email_with_attachments(email['recipient_email'], subject, body, attachments)
+
+
+def _run_generation_job(job, report_progress):
+    """Run the generation endpoint for a job with its payload, then email the result if asked.
+
+    Returns the documents stored while generating and a summary of the response.
+    """
+    report_progress(10, 'generating')
+    path = GENERATION_JOB_TYPES[job['job_type']]
+    with track_generated_documents() as documents:
+        with app.test_request_context(path, method='POST', json=job.get('payload') or {}):
+            response = app.full_dispatch_request()
+    try:
+        body = response.get_json(silent=True) if response.is_json else None
+    finally:
+        response.close()
+
+    if response.status_code >= 400 or (body and body.get('success') is False):
+        raise RuntimeError((body or {}).get('message') or f'Generation failed with status {response.status_code}')
+
+    result = {'status_code': response.status_code, 'mimetype': response.mimetype}
+    if body is not None:
+        result['response'] = body
+    if job.get('email'):
+        report_progress(80, 'emailing')
+        try:
+            result['email'] = _email_generated_documents(job['email'], documents)
+        except Exception as e:
+            # The documents exist; report the email failure without failing the job
+            result['email'] = {'success': False, 'message': str(e)}
+    return documents, result
+
+
+# Each web worker runs queued generation jobs in a background thread
+start_generation_worker(_run_generation_job)
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_generation_job():
+    """Queue a document generation request and return its job id at once.
+
+    Body: {"type": one of GENERATION_JOB_TYPES, "payload": <the endpoint's
+    usual JSON body>, "email": optional {"recipient_email", "recipient_name",
+    "subject", "body"}}. Poll /api/jobs/<job_id> for progress.
+    """
+    try:
+        data = request.get_json() or {}
+        job_type = data.get('type')
+        if job_type not in GENERATION_JOB_TYPES:
+            return jsonify({
+                'success': False,
+                'message': f"Unknown job type. Expected one of: {', '.join(GENERATION_JOB_TYPES)}"
+            }), 400
+
+        email = data.get('email')
+        if email is not None and not (isinstance(email, dict) and email.get('recipient_email')):
+            return jsonify({'success': False, 'message': 'email.recipient_email is required'}), 400
+
+        job_id = generation_jobs.create_job(job_type, data.get('payload') or {}, email)
+        start_generation_worker(_run_generation_job).notify()
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/api/jobs/{job_id}'
+        }), 202
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_generation_job(job_id):
+    """Status, progress and resulting document ids of a generation job"""
+    job = generation_jobs.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': format_job(job)})
+
 # Template Management API Endpoints
 @app.route('/api/templates', methods=['GET'])
 def get_all_templates():
@@ -3389,6 +3057,28 @@ def update_template(template_id):
             'message': f'Error updating template: {str(e)}'
         }), 500
 
+@app.route('/api/templates/<template_id>/versions', methods=['GET'])
+def get_template_versions(template_id):
+    """List the version history of a template (metadata only)"""
+    try:
+        versions = template_collection.get_template_versions(template_id)
+        return jsonify({'success': True, 'versions': versions}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error fetching template versions: {str(e)}'}), 500
+
+@app.route('/api/templates/<template_id>/versions/<int:version>', methods=['GET'])
+def get_template_version(template_id, version):
+    """Get a past version of a template, rebuilt from its history"""
+    try:
+        template = template_collection.get_template_version(template_id, version)
+        if not template:
+            return jsonify({'success': False, 'message': 'Template version not found'}), 404
+        template['template_id'] = str(template['template_id'])
+        template['created_at'] = template['created_at'].isoformat()
+        return jsonify({'success': True, 'template': template}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error fetching template version: {str(e)}'}), 500
+
 @app.route('/api/templates/<template_id>', methods=['DELETE'])
 def delete_template(template_id):
     """Soft delete a template"""
@@ -3817,19 +3507,12 @@ def generate_agreement_for_signature():
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"agreement_{client_name.replace(' ', '_')}_{timestamp}.pdf"
         
-        # Use file handler to get correct path
-        file_handler.ensure_documents_directory()
-        file_path = file_handler.get_document_path(filename)
-        
-        # Save PDF file
-        with open(file_path, 'wb') as f:
-            f.write(pdf_bytes)
-        
-        # Store agreement metadata in MongoDB
+        # Store agreement metadata in MongoDB; the content is saved under
+        # documents/ by its hash, shared with identical agreements
         agreement_metadata = {
             'quote_id': f'template_{timestamp}',
             'filename': filename,
-            'file_path': file_path,
+            'file_path': file_handler.get_document_path(filename),
             'client_name': client_name,
             'company_name': client_company,
             'service_type': service_type,
@@ -3842,7 +3525,7 @@ def generate_agreement_for_signature():
         }
         
         try:
-            generated_agreements.store_agreement_metadata(agreement_metadata)
+            generated_agreements.store_agreement_metadata(agreement_metadata, pdf_bytes)
             print(f"✅ Agreement metadata stored: {filename}")
         except Exception as e:
             print(f"Warning: Failed to store agreement metadata: {e}")
@@ -4198,12 +3881,16 @@ def generate_agreement_pdf_from_template():
         try:
             # Try WeasyPrint first (better HTML rendering)
             try:
-                from weasyprint import HTML
                 from io import BytesIO
                 
-                # Create PDF
-                html_doc = HTML(string=html_content)
-                pdf_bytes = html_doc.write_pdf()
+                # Create PDF. The certificate page prints the time of rendering,
+                # so the cache is keyed on the agreement's inputs instead of its HTML
+                pdf_bytes = render_service.render(
+                    'html_pdf', template_assets.inline_assets(html_content),
+                    cache_key=['generate-agreement-pdf', company_name, company_address, client_company,
+                               client_name, service_type, service_description, total_price, currency,
+                               start_date, end_date, ceo_signature, client_signature]
+                )
                 
                 print("✅ PDF generated successfully using WeasyPrint")
                 
@@ -4414,19 +4101,12 @@ def generate_agreement_pdf_from_template():
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"agreement_{client_name.replace(' ', '_')}_{timestamp}.pdf"
             
-            # Use file handler to get correct path
-            file_handler.ensure_documents_directory()
-            file_path = file_handler.get_document_path(filename)
-            
-            # Save PDF file
-            with open(file_path, 'wb') as f:
-                f.write(pdf_bytes)
-            
-            # Store agreement metadata in MongoDB
+            # Store agreement metadata in MongoDB; the content is saved under
+            # documents/ by its hash, shared with identical agreements
             agreement_metadata = {
                 'quote_id': f'template_{timestamp}',
                 'filename': filename,
-                'file_path': file_path,
+                'file_path': file_handler.get_document_path(filename),
                 'client_name': client_name,
                 'company_name': client_company,
                 'service_type': service_type,
@@ -4439,7 +4119,7 @@ def generate_agreement_pdf_from_template():
             }
             
             try:
-                generated_agreements.store_agreement_metadata(agreement_metadata)
+                generated_agreements.store_agreement_metadata(agreement_metadata, pdf_bytes)
                 print(f"✅ Agreement metadata stored: {filename}")
             except Exception as e:
                 print(f"Warning: Failed to store agreement metadata: {e}")
@@ -4505,8 +4185,14 @@ def download_agreement_pdf(agreement_id):
                 'message': 'Agreement not found'
             }), 404
         
-        # Get the file path
+        # Get the file path; the local copy may be gone after a redeploy
         file_path = agreement.get('file_path')
+        if file_path and not os.path.exists(file_path) and agreement.get('content_hash'):
+            content = generated_agreements.get_agreement_content(agreement)
+            if content:
+                file_path = generated_agreements.blobs.write_file(
+                    agreement['content_hash'], content, os.path.splitext(file_path)[1] or '.pdf'
+                )
         if not file_path or not os.path.exists(file_path):
             return jsonify({
                 'success': False,
@@ -4601,22 +4287,6 @@ def submit_client_signature(agreement_id):
     try:
         data = request.get_json()
         
-        # Get the agreement
-        agreement = generated_agreements.get_agreement_by_id(agreement_id)
-        if not agreement:
-            return jsonify({
-                'success': False,
-                'message': 'Agreement not found'
-            }), 404
-        
-        # Check if already signed
-        signatures = agreement.get('signatures', {})
-        if signatures.get('client', {}).get('data'):
-            return jsonify({
-                'success': False,
-                'message': 'Agreement has already been signed by client'
-            }), 400
-        
         # Validate signature data
         signature_info = data.get('signature', {})
         if not signature_info.get('data'):
@@ -4649,78 +4319,52 @@ def submit_client_signature(agreement_id):
             'user_agent': request.headers.get('User-Agent', '')
         }
         
-        # Update signatures in agreement
-        if 'signatures' not in agreement:
-            agreement['signatures'] = {}
-        agreement['signatures']['client'] = client_signature
-        signatures = agreement['signatures']
-        
-        # Update agreement status
-        agreement_status = 'client_signed'
-        if signatures.get('ceo', {}).get('data'):
-            agreement_status = 'completed'
-        
-        # Update the agreement in MongoDB
-        try:
-            from bson import ObjectId
-            
-            update_data = {
-                'signatures': signatures,
-                'status': agreement_status,
-                'client_signed_at': datetime.now(),
-                'updated_at': datetime.now()
-            }
-            
-            # If both signatures are complete, mark as completed and generate certificate
-            if agreement_status == 'completed':
-                update_data['completed_at'] = datetime.now()
-            
-                # Automatically generate signature certificate when both parties sign
-                try:
-                    print(f"🎉 Both parties have signed! Generating signature certificate for agreement: {agreement_id}")
-                    generate_automatic_signature_certificate(agreement_id, agreement, signatures)
-                except Exception as e:
-                    print(f"Warning: Failed to generate automatic signature certificate: {e}")
-            
-            # Update using the same logic as get_agreement_by_id
-            if ObjectId.is_valid(agreement_id):
-                result = generated_agreements.collection.update_one(
-                    {'_id': ObjectId(agreement_id)},
-                    {'$set': update_data}
-                )
-            else:
-                result = generated_agreements.collection.update_one(
-                    {'quote_id': agreement_id},
-                    {'$set': update_data}
-                )
-            
-            if result.modified_count == 0:
+        # Conditional update: only applies if this role has not signed yet,
+        # and derives the new status from the other party's signature
+        agreement = generated_agreements.sign_agreement(agreement_id, 'client', client_signature)
+        if not agreement:
+            existing = generated_agreements.get_agreement_by_id(agreement_id, include_content=False)
+            if not existing:
                 return jsonify({
                     'success': False,
-                    'message': 'Failed to update agreement'
-                }), 500
-            
-            print(f"✅ Client signature added to agreement: {agreement_id}")
-            
-            # Send notification emails (optional - implement if needed)
-            try:
-                send_signature_notification(agreement, client_signature)
-            except Exception as e:
-                print(f"Warning: Failed to send notification email: {e}")
-            
-            return jsonify({
-                'success': True,
-                'message': 'Signature submitted successfully',
-                'status': agreement_status
-            }), 200
-            
-        except Exception as e:
-            print(f"Database update error: {str(e)}")
+                    'message': 'Agreement not found'
+                }), 404
+            if existing.get('signatures', {}).get('client', {}).get('data'):
+                return jsonify({
+                    'success': False,
+                    'message': 'Agreement has already been signed by client'
+                }), 400
             return jsonify({
                 'success': False,
                 'message': 'Failed to save signature'
             }), 500
         
+        signatures = agreement.get('signatures', {})
+        agreement_status = agreement.get('status')
+        
+        # If both signatures are complete, generate certificate
+        if agreement_status == 'completed':
+            # Automatically generate signature certificate when both parties sign
+            try:
+                print(f"🎉 Both parties have signed! Generating signature certificate for agreement: {agreement_id}")
+                generate_automatic_signature_certificate(agreement_id, agreement, signatures)
+            except Exception as e:
+                print(f"Warning: Failed to generate automatic signature certificate: {e}")
+        
+        print(f"✅ Client signature added to agreement: {agreement_id}")
+        
+        # Send notification emails (optional - implement if needed)
+        try:
+            send_signature_notification(agreement, client_signature)
+        except Exception as e:
+            print(f"Warning: Failed to send notification email: {e}")
+        
+        return jsonify({
+            'success': True,
+            'message': 'Signature submitted successfully',
+            'status': agreement_status
+        }), 200
+        
     except Exception as e:
         print(f"Error submitting client signature: {str(e)}")
         return jsonify({
@@ -4734,22 +4378,6 @@ def submit_ceo_signature(agreement_id):
     try:
         data = request.get_json()
         
-        # Get the agreement
-        agreement = generated_agreements.get_agreement_by_id(agreement_id)
-        if not agreement:
-            return jsonify({
-                'success': False,
-                'message': 'Agreement not found'
-            }), 404
-        
-        # Check if already signed by CEO
-        signatures = agreement.get('signatures', {})
-        if signatures.get('ceo', {}).get('data'):
-            return jsonify({
-                'success': False,
-                'message': 'Agreement has already been signed by CEO'
-            }), 400
-        
         # Validate signature data
         signature_info = data.get('signature', {})
         if not signature_info.get('data'):
@@ -4782,72 +4410,46 @@ def submit_ceo_signature(agreement_id):
             'user_agent': request.headers.get('User-Agent', '')
         }
         
-        # Update signatures in agreement
-        if 'signatures' not in agreement:
-            agreement['signatures'] = {}
-        agreement['signatures']['ceo'] = ceo_signature
-        signatures = agreement['signatures']
-        
-        # Update agreement status
-        agreement_status = 'ceo_signed'
-        if signatures.get('client', {}).get('data'):
-            agreement_status = 'completed'
-        
-        # Update the agreement in MongoDB
-        try:
-            from bson import ObjectId
-            
-            update_data = {
-                'signatures': signatures,
-                'status': agreement_status,
-                'ceo_signed_at': datetime.now(),
-                'updated_at': datetime.now()
-            }
-            
-            # If both signatures are complete, mark as completed and generate certificate
-            if agreement_status == 'completed':
-                update_data['completed_at'] = datetime.now()
-                
-                # Automatically generate signature certificate when both parties sign
-                try:
-                    print(f"🎉 Both parties have signed! Generating signature certificate for agreement: {agreement_id}")
-                    generate_automatic_signature_certificate(agreement_id, agreement, signatures)
-                except Exception as e:
-                    print(f"Warning: Failed to generate automatic signature certificate: {e}")
-            
-            # Update using the same logic as get_agreement_by_id
-            if ObjectId.is_valid(agreement_id):
-                result = generated_agreements.collection.update_one(
-                    {'_id': ObjectId(agreement_id)},
-                    {'$set': update_data}
-                )
-            else:
-                result = generated_agreements.collection.update_one(
-                    {'quote_id': agreement_id},
-                    {'$set': update_data}
-                )
-            
-            if result.modified_count == 0:
+        # Conditional update: only applies if this role has not signed yet,
+        # and derives the new status from the other party's signature
+        agreement = generated_agreements.sign_agreement(agreement_id, 'ceo', ceo_signature)
+        if not agreement:
+            existing = generated_agreements.get_agreement_by_id(agreement_id, include_content=False)
+            if not existing:
                 return jsonify({
                     'success': False,
-                    'message': 'Failed to update agreement'
-                }), 500
-            
-            print(f"✅ CEO signature added to agreement: {agreement_id}")
-            
-            return jsonify({
-                'success': True,
-                'message': 'CEO signature submitted successfully',
-                'agreement_status': agreement_status
-            })
-            
-        except Exception as e:
-            print(f"Database update error: {str(e)}")
+                    'message': 'Agreement not found'
+                }), 404
+            if existing.get('signatures', {}).get('ceo', {}).get('data'):
+                return jsonify({
+                    'success': False,
+                    'message': 'Agreement has already been signed by CEO'
+                }), 400
             return jsonify({
                 'success': False,
-                'message': f'Database error: {str(e)}'
+                'message': 'Failed to save signature'
             }), 500
         
+        signatures = agreement.get('signatures', {})
+        agreement_status = agreement.get('status')
+        
+        # If both signatures are complete, generate certificate
+        if agreement_status == 'completed':
+            # Automatically generate signature certificate when both parties sign
+            try:
+                print(f"🎉 Both parties have signed! Generating signature certificate for agreement: {agreement_id}")
+                generate_automatic_signature_certificate(agreement_id, agreement, signatures)
+            except Exception as e:
+                print(f"Warning: Failed to generate automatic signature certificate: {e}")
+        
+        print(f"✅ CEO signature added to agreement: {agreement_id}")
+        
+        return jsonify({
+            'success': True,
+            'message': 'CEO signature submitted successfully',
+            'agreement_status': agreement_status
+        })
+        
     except Exception as e:
         print(f"Error submitting CEO signature: {str(e)}")
         return jsonify({
@@ -5316,15 +4918,6 @@ def generate_automatic_signature_certificate(agreement_id, agreement, signatures
 def generate_signature_certificate_pdf(certificate_data):
     """Generate signature certificate PDF using ReportLab"""
     try:
-        from reportlab.lib.pagesizes import letter
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch
-        from reportlab.lib import colors
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-        import base64
-        import io
-        
         # Create PDF file path
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"signature_certificate_{certificate_data['reference_number']}_{timestamp}.pdf"
@@ -5333,174 +4926,9 @@ def generate_signature_certificate_pdf(certificate_data):
         # Ensure documents directory exists
         os.makedirs('documents', exist_ok=True)
         
-        # Create PDF document with custom styling
-        doc = SimpleDocTemplate(file_path, pagesize=letter, 
-                              topMargin=72, bottomMargin=72, 
-                              leftMargin=72, rightMargin=72)
-        story = []
-        
-        # Get styles
-        styles = getSampleStyleSheet()
-        
-        # Title style - matches your image
-        title_style = ParagraphStyle(
-            'SignatureCertificateTitle',
-            parent=styles['Heading1'],
-            fontSize=28,
-            spaceAfter=20,
-            alignment=TA_CENTER,
-            textColor=colors.darkblue,
-            fontName='Helvetica-Bold'
-        )
-        
-        # Reference number style
-        ref_style = ParagraphStyle(
-            'ReferenceNumber',
-            parent=styles['Normal'],
-            fontSize=14,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=colors.black,
-            fontName='Helvetica'
-        )
-        
-        # Document info style
-        doc_info_style = ParagraphStyle(
-            'DocumentInfo',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=20,
-            alignment=TA_LEFT,
-            textColor=colors.black,
-            fontName='Helvetica'
-        )
-        
-        # Add title - matches your image format
-        story.append(Paragraph("Signature Certificate", title_style))
-        story.append(Spacer(1, 15))
-        
-        # Add reference number - matches your image format
-        story.append(Paragraph(f"Reference number: {certificate_data['reference_number']}", ref_style))
-        story.append(Spacer(1, 25))
-        
-        # Create signers table - matches your image format exactly
-        table_data = [['Signer', 'Timestamp', 'Signature']]
-        
-        for signer in certificate_data['signers']:
-            # Format timestamps to match your image
-            current_time = datetime.now().strftime('%d %b %Y %H:%M:%S UTC')
-            sent_time = current_time
-            viewed_time = current_time
-            signed_time = signer['signed_at'] if signer['signed_at'] else current_time
-            
-            # Create signer info - matches your image format
-            signer_info = f"""
-            <b>{signer['name']}</b><br/>
-            {signer['email']}<br/><br/>
-            <b>Sent:</b> {sent_time}<br/>
-            <b>Viewed:</b> {viewed_time}<br/>
-            <b>Signed:</b> {signed_time}<br/><br/>
-            <b>Recipient Verification:</b><br/>
-            ✓ Email verified
-            """
-            
-            # Create timestamp info - matches your image format
-            timestamp_info = f"""
-            <b>Sent:</b> {sent_time}<br/>
-            <b>Viewed:</b> {viewed_time}<br/>
-            <b>Signed:</b> {signed_time}<br/><br/>
-            <b>Recipient Verification:</b><br/>
-            ✓ Email verified<br/>
-            {viewed_time}<br/><br/>
-            <b>IP address:</b> {signer['ip_address'] or 'N/A'}<br/>
-            <b>Location:</b> {signer['location'] or 'N/A'}
-            """
-            
-            # Create signature display - matches your image format
-            signature_display = f"""
-            ✓ Digital Signature<br/>
-            {signer['signature_data'] or signer['name']}
-            """
-            
-            table_data.append([
-                signer_info,
-                timestamp_info,
-                signature_display
-            ])
-        
-        # Create table with 3 columns to match your image
-        # Convert HTML content to Paragraph objects for proper rendering
-        formatted_table_data = []
-        for row_idx, row in enumerate(table_data):
-            formatted_row = []
-            for col_idx, cell_content in enumerate(row):
-                if row_idx == 0:  # Header row
-                    formatted_row.append(cell_content)
-                else:  # Data rows
-                    if isinstance(cell_content, str) and '<' in cell_content:
-                        # Convert HTML to Paragraph
-                        formatted_row.append(Paragraph(cell_content, styles['Normal']))
-                    else:
-                        formatted_row.append(cell_content)
-            formatted_table_data.append(formatted_row)
-        
-        table = Table(formatted_table_data, colWidths=[2.5*inch, 2.0*inch, 2.0*inch])
-        table.setStyle(TableStyle([
-            # Header styling - matches your image
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TOPPADDING', (0, 0), (-1, 0), 12),
-            
-            # Data row styling - matches your image
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            
-            # Alignment and spacing - matches your image
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 1), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-            
-            # Borders - matches your image
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        
-        story.append(table)
-        story.append(Spacer(1, 30))
-        
-        # Add completion info - matches your image format
-        completion_date = certificate_data.get('completion_date', datetime.now())
-        if isinstance(completion_date, str):
-            try:
-                completion_date = datetime.fromisoformat(completion_date.replace('Z', '+00:00'))
-            except:
-                completion_date = datetime.now()
-        
-        # Create completion section - matches your image format
-        completion_style = ParagraphStyle(
-            'Completion',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=20,
-            alignment=TA_LEFT,
-            textColor=colors.black,
-            fontName='Helvetica'
-        )
-        
-        completion_text = f"""
-        <b>Document completed by all parties on:</b> {completion_date.strftime('%d %b %Y %H:%M:%S UTC')}<br/>
-        Page 1 of 1
-        """
-        story.append(Paragraph(completion_text, completion_style))
-        
-        # Build PDF
-        doc.build(story)
+        pdf_bytes = render_service.render('signature_certificate_pdf', certificate_data)
+        with open(file_path, 'wb') as f:
+            f.write(pdf_bytes)
         
         print(f"✅ Signature certificate generated: {file_path}")
         return file_path
@@ -5617,61 +5045,50 @@ def gdocs_export_pdf():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 # Document Storage and Retrieval API Endpoints
+def _list_documents_page(fields):
+    """One page of the unified PDF/agreement listing from query parameters.
+
+    Query parameters: limit (default 100, max 500), cursor (next_cursor of
+    the previous page), client, client_email, company, quote_id, from/to
+    (ISO dates on generated_at).
+    """
+    args = request.args
+    try:
+        limit = min(max(int(args.get('limit', 100)), 1), 500)
+        filters = {name: args.get(name) for name in ('client', 'client_email', 'company', 'quote_id')}
+        if args.get('from'):
+            filters['from'] = datetime.fromisoformat(args['from'])
+        if args.get('to'):
+            filters['to'] = datetime.fromisoformat(args['to'])
+            if len(args['to']) == 10:
+                # A bare date covers that whole day
+                filters['to'] += timedelta(days=1)
+        docs, next_cursor = document_view.list_documents(filters, args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid parameter: {str(e)}'}), 400
+
+    documents = []
+    for doc in docs:
+        document = {'id': str(doc['_id']), 'document_type': doc['document_type']}
+        for field in fields:
+            document[field] = doc.get(field, '' if field == 'client_email' else 'Unknown')
+        document['generated_at'] = doc.get('generated_at') or datetime.now()
+        documents.append(document)
+
+    return jsonify({
+        'success': True,
+        'documents': documents,
+        'count': len(documents),
+        'next_cursor': next_cursor
+    })
+
 @app.route('/api/documents/stored', methods=['GET'])
 def get_stored_documents():
-    """Get all stored documents (PDFs and Agreements)"""
+    """Get stored documents (PDFs and Agreements), newest first, one page at a time"""
     try:
-        print("🔍 Debug: Starting get_stored_documents...")
-        
-        # Get all PDFs and agreements
-        all_pdfs = generated_pdfs.get_all_pdfs(limit=100)
-        print(f"🔍 Debug: Found {len(all_pdfs)} PDFs")
-        
-        all_agreements = generated_agreements.get_all_agreements(limit=100)
-        print(f"🔍 Debug: Found {len(all_agreements)} agreements")
-        
-        # Combine and format documents
-        documents = []
-        
-        # Add PDFs
-        for pdf in all_pdfs:
-            documents.append({
-                'id': str(pdf['_id']),
-                'document_type': 'PDF',
-                'filename': pdf.get('filename', 'Unknown'),
-                'client_name': pdf.get('client_name', 'Unknown'),
-                'company_name': pdf.get('company_name', 'Unknown'),
-                'generated_at': pdf.get('generated_at', datetime.now()),
-                'quote_id': pdf.get('quote_id', 'Unknown'),
-                'file_path': pdf.get('file_path', 'Unknown')
-            })
-        
-        # Add Agreements
-        for agreement in all_agreements:
-            documents.append({
-                'id': str(agreement['_id']),
-                'document_type': 'Agreement',
-                'filename': agreement.get('filename', 'Unknown'),
-                'client_name': agreement.get('client_name', 'Unknown'),
-                'company_name': agreement.get('company_name', 'Unknown'),
-                'generated_at': agreement.get('generated_at', datetime.now()),
-                'quote_id': agreement.get('quote_id', 'Unknown'),
-                'file_path': agreement.get('file_path', 'Unknown')
-            })
-        
-        print(f"🔍 Debug: Total documents: {len(documents)}")
-        
-        # Sort by generation date (newest first)
-        documents.sort(key=lambda x: x['generated_at'], reverse=True)
-        
-        return jsonify({
-            'success': True,
-            'documents': documents,
-            'count': len(documents)
-        })
-        
+        return _list_documents_page(['filename', 'client_name', 'company_name', 'quote_id', 'file_path'])
     except Exception as e:
-        print(f"❌ Debug: Error in get_stored_documents: {e}")
+        print(f"❌ Error in get_stored_documents: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/documents/download/<document_id>', methods=['GET'])
@@ -5691,11 +5108,8 @@ def download_document(document_id):
                 else:
                     # Try to regenerate the PDF from stored data
                     try:
-                        pdf_data = pdf.get('pdf_data')
-                        if pdf_data:
-                            import base64
-                            pdf_bytes = base64.b64decode(pdf_data)
-                            
+                        pdf_bytes = generated_pdfs.get_pdf_content(pdf)
+                        if pdf_bytes:
                             file_handler.ensure_documents_directory()
                             
                             with open(correct_path, 'wb') as f:
@@ -5720,8 +5134,16 @@ def download_document(document_id):
                 else:
                     # Try to regenerate the agreement from stored data
                     try:
+                        agreement_bytes = generated_agreements.get_agreement_content(agreement)
                         agreement_content = agreement.get('content') or agreement.get('agreement_content')
-                        if agreement_content:
+                        if agreement_bytes:
+                            file_handler.ensure_documents_directory()
+                            
+                            with open(correct_path, 'wb') as f:
+                                f.write(agreement_bytes)
+                            
+                            return send_file(correct_path, as_attachment=True, download_name=agreement.get('filename', 'document.txt'))
+                        elif agreement_content:
                             file_handler.ensure_documents_directory()
                             
                             with open(correct_path, 'w', encoding='utf-8') as f:
@@ -5771,13 +5193,9 @@ def preview_document(document_id):
                     try:
                         print(f"🔄 Attempting to regenerate PDF from stored data...")
                         
-                        # Get the PDF data from the database
-                        pdf_data = pdf.get('pdf_data')  # Base64 encoded PDF data
-                        if pdf_data:
-                            # Decode and save the PDF
-                            import base64
-                            pdf_bytes = base64.b64decode(pdf_data)
-                            
+                        # Get the PDF bytes from the database
+                        pdf_bytes = generated_pdfs.get_pdf_content(pdf)
+                        if pdf_bytes:
                             # Ensure documents directory exists
                             file_handler.ensure_documents_directory()
                             
@@ -5821,7 +5239,7 @@ def preview_document(document_id):
                             'available_files': file_handler.list_documents(),
                             'current_working_dir': os.getcwd(),
                             'project_root': file_handler.project_root,
-                            'has_pdf_data': bool(pdf.get('pdf_data'))
+                            'has_pdf_data': bool(pdf.get('content_hash') or pdf.get('pdf_data'))
                         }
                     }), 404
             else:
@@ -5914,13 +5332,9 @@ def preview_document(document_id):
                         
                         # Get the agreement content from the database
                         agreement_content = agreement.get('content') or agreement.get('agreement_content')
-                        agreement_data = agreement.get('agreement_data')  # Base64 encoded PDF data
+                        agreement_bytes = generated_agreements.get_agreement_content(agreement)
                         
-                        if agreement_data:
-                            # Decode and save the PDF agreement
-                            import base64
-                            agreement_bytes = base64.b64decode(agreement_data)
-                            
+                        if agreement_bytes and not filename.endswith('.txt'):
                             # Ensure documents directory exists
                             file_handler.ensure_documents_directory()
                             
@@ -6235,9 +5649,7 @@ def generate_pdf_and_send_email():
         }
         
         # Generate PDF
-        from templates.pdf_generator import PDFGenerator
-        pdf_generator = PDFGenerator()
-        pdf_buffer = pdf_generator.create_quote_pdf(
+        pdf_buffer = _render_quote_pdf(
             {'name': recipient_name, 'company': company_name, 'email': recipient_email, 'phone': '', 'serviceType': service_type},
             quote_data,
             configuration
@@ -6247,22 +5659,15 @@ def generate_pdf_and_send_email():
         import os
         from datetime import datetime
         
-        os.makedirs('documents', exist_ok=True)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"quote_{recipient_name.replace(' ', '_')}_{timestamp}.pdf"
-        pdf_path = os.path.join('documents', filename)
-        
-        with open(pdf_path, 'wb') as f:
-            f.write(pdf_buffer.getvalue())
-        
-        print(f"✅ Debug: PDF generated and saved to {pdf_path}")
-        print(f"✅ Debug: File size: {os.path.getsize(pdf_path)} bytes")
         
-        # Store PDF metadata in MongoDB
+        # Store PDF metadata in MongoDB; the content is saved under
+        # documents/ by its hash, shared with identical PDFs
         pdf_metadata = {
             'quote_id': f'auto_{timestamp}',
             'filename': filename,
-            'file_path': pdf_path,
+            'file_path': os.path.join('documents', filename),
             'client_name': recipient_name,
             'company_name': company_name,
             'service_type': service_type,
@@ -6271,7 +5676,8 @@ def generate_pdf_and_send_email():
         
         # Store PDF metadata with content for regeneration
         generated_pdfs.store_pdf_metadata(pdf_metadata, pdf_buffer.getvalue())
-        print(f"✅ Debug: PDF metadata stored in MongoDB")
+        pdf_path = pdf_metadata['file_path']
+        print(f"✅ Debug: PDF saved to {pdf_path} ({os.path.getsize(pdf_path)} bytes)")
         
         # Send email with the generated PDF
         email_service = EmailService()
@@ -6330,6 +5736,141 @@ def generate_pdf_and_send_email():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 # Approval Workflow API Endpoints
+def _format_pending_workflow(workflow):
+    return {
+        '_id': str(workflow['_id']),
+        'document_id': workflow.get('document_id'),
+        'document_name': workflow.get('document_name', 'N/A'),
+        'client_name': workflow.get('client_name', 'N/A'),
+        'company_name': workflow.get('company_name', 'N/A'),
+        'document_type': workflow.get('document_type', 'N/A'),
+        'current_stage': workflow.get('current_stage', 'N/A'),
+        'status': workflow.get('workflow_status', 'pending'),
+        'manager_status': workflow.get('manager_status', 'pending'),
+        'manager_comments': workflow.get('manager_comments', ''),
+        'ceo_status': workflow.get('ceo_status', 'pending'),
+        'ceo_comments': workflow.get('ceo_comments', ''),
+        'client_status': workflow.get('client_status', 'pending'),
+        'client_comments': workflow.get('client_comments', ''),
+        'created_at': workflow.get('created_at'),
+        'can_approve': True  # This would be determined by user role
+    }
+
+def _format_queue_workflow(workflow):
+    return {
+        '_id': str(workflow['_id']),
+        'document_id': workflow.get('document_id'),
+        'document_name': workflow.get('document_name', 'N/A'),
+        'client_name': workflow.get('client_name', 'N/A'),
+        'company_name': workflow.get('company_name', 'N/A'),
+        'document_type': workflow.get('document_type', 'N/A'),
+        'created_at': workflow.get('created_at'),
+        'priority': 'normal'  # This could be calculated based on urgency
+    }
+
+def _format_status_workflow(workflow):
+    return {
+        '_id': str(workflow['_id']),
+        'document_id': workflow.get('document_id'),
+        'document_name': workflow.get('document_name', 'N/A'),
+        'document_type': workflow.get('document_type', 'N/A'),
+        'client_name': workflow.get('client_name', 'N/A'),
+        'company_name': workflow.get('company_name', 'N/A'),
+        'current_stage': workflow.get('current_stage', 'manager'),
+        'workflow_status': workflow.get('workflow_status', 'active'),
+        'manager_status': workflow.get('manager_status', 'pending'),
+        'manager_comments': workflow.get('manager_comments', ''),
+        'ceo_status': workflow.get('ceo_status', 'pending'),
+        'ceo_comments': workflow.get('ceo_comments', ''),
+        'client_status': workflow.get('client_status', 'pending'),
+        'client_comments': workflow.get('client_comments', ''),
+        'created_at': workflow.get('created_at')
+    }
+
+def _format_history_workflow(item):
+    return {
+        '_id': str(item['_id']),
+        'document_id': item.get('document_id'),
+        'document_name': item.get('document_name', 'N/A'),
+        'client_name': item.get('client_name', 'N/A'),
+        'company_name': item.get('company_name', 'N/A'),
+        'document_type': item.get('document_type', 'N/A'),
+        'final_status': item.get('final_status', 'completed'),
+        'manager_decision': item.get('manager_status', 'N/A'),
+        'ceo_decision': item.get('ceo_status', 'N/A'),
+        'manager_comments': item.get('manager_comments', ''),
+        'ceo_comments': item.get('ceo_comments', ''),
+        # Include client feedback for history view
+        'client_decision': item.get('client_decision') or item.get('client_status', 'N/A'),
+        'client_comments': item.get('client_comments', ''),
+        'completed_at': item.get('completed_at') or item.get('updated_at')
+    }
+
+def _format_denied_workflow(workflow):
+    # Determine who denied it and when
+    denied_by_role = 'Unknown'
+    denied_at = None
+
+    if workflow.get('client_status') == 'rejected':
+        denied_by_role = 'Client'
+        denied_at = workflow.get('client_updated_at')
+    elif workflow.get('ceo_status') == 'denied':
+        denied_by_role = 'CEO'
+        denied_at = workflow.get('ceo_updated_at')
+    elif workflow.get('manager_status') == 'denied':
+        denied_by_role = 'Manager'
+        denied_at = workflow.get('manager_updated_at')
+
+    return {
+        '_id': str(workflow.get('_id')),
+        'document_name': workflow.get('document_name', 'N/A'),
+        'document_type': workflow.get('document_type', 'Document'),
+        'client_name': workflow.get('client_name', 'N/A'),
+        'denied_by_role': denied_by_role,
+        'denied_by_email': workflow.get('denied_by_email', 'Unknown'),
+        'denied_at': denied_at,
+        'comments': workflow.get('comments', 'No comments provided'),
+        'workflow_id': str(workflow.get('_id')),
+        # Include all comments for proper display
+        'manager_comments': workflow.get('manager_comments', ''),
+        'ceo_comments': workflow.get('ceo_comments', ''),
+        'client_comments': workflow.get('client_comments', ''),
+        'manager_status': workflow.get('manager_status', 'pending'),
+        'ceo_status': workflow.get('ceo_status', 'pending'),
+        'client_status': workflow.get('client_status', 'pending')
+    }
+
+@app.route('/api/approval/dashboard', methods=['GET'])
+def get_approval_dashboard():
+    """Stats, counts and first page of every approval panel from one aggregation"""
+    try:
+        user_role = request.args.get('role', 'manager')
+        limit = max(1, min(int(request.args.get('limit', 100)), 500))
+        dashboard = approval_workflows.get_dashboard(user_role, limit=limit)
+
+        def panel(name, formatter):
+            return {
+                'count': dashboard[name]['count'],
+                'workflows': [formatter(workflow) for workflow in dashboard[name]['workflows']]
+            }
+
+        return jsonify({
+            'success': True,
+            'stats': dashboard['stats'],
+            'pending': panel('active', _format_pending_workflow),
+            'my_queue': panel('my_queue', _format_queue_workflow),
+            'workflow_status': panel('active', _format_status_workflow),
+            'history': panel('history', _format_history_workflow),
+            'denied': panel('denied', _format_denied_workflow)
+        }), 200
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit must be an integer'}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error fetching approval dashboard: {str(e)}'
+        }), 500
+
 @app.route('/api/approval/stats', methods=['GET'])
 def get_approval_stats():
     """Get approval workflow statistics"""
@@ -6349,36 +5890,10 @@ def get_approval_stats():
 def get_pending_approvals():
     """Get all pending approval workflows"""
     try:
-        # Temporarily use the more inclusive method to debug
-        # Ensure we are not serving a cached cursor
         workflows = approval_workflows.get_all_active_workflows(limit=100)
-        
-        # Format workflows for frontend
-        formatted_workflows = []
-        for workflow in workflows:
-            formatted_workflow = {
-                '_id': str(workflow['_id']),
-                'document_id': workflow.get('document_id'),
-                'document_name': workflow.get('document_name', 'N/A'),
-                'client_name': workflow.get('client_name', 'N/A'),
-                'company_name': workflow.get('company_name', 'N/A'),
-                'document_type': workflow.get('document_type', 'N/A'),
-                'current_stage': workflow.get('current_stage', 'N/A'),
-                'status': workflow.get('workflow_status', 'pending'),
-                'manager_status': workflow.get('manager_status', 'pending'),
-                'manager_comments': workflow.get('manager_comments', ''),
-                'ceo_status': workflow.get('ceo_status', 'pending'),
-                'ceo_comments': workflow.get('ceo_comments', ''),
-                'client_status': workflow.get('client_status', 'pending'),
-                'client_comments': workflow.get('client_comments', ''),
-                'created_at': workflow.get('created_at'),
-                'can_approve': True  # This would be determined by user role
-            }
-            formatted_workflows.append(formatted_workflow)
-        
         return jsonify({
             'success': True,
-            'workflows': formatted_workflows
+            'workflows': [_format_pending_workflow(workflow) for workflow in workflows]
         }), 200
     except Exception as e:
         return jsonify({
@@ -6393,29 +5908,10 @@ def get_my_approval_queue():
         # Get role and email from request parameters
         user_role = request.args.get('role', 'manager')
         user_email = request.args.get('email', 'manager@company.com')
-        
-        print(f"🔍 API: Getting approval queue for role: {user_role}, email: {user_email}")
-        
         workflows = approval_workflows.get_my_approval_queue(user_role, user_email, limit=100)
-        
-        # Format workflows for frontend
-        formatted_workflows = []
-        for workflow in workflows:
-            formatted_workflow = {
-                '_id': str(workflow['_id']),
-                'document_id': workflow.get('document_id'),
-                'document_name': workflow.get('document_name', 'N/A'),
-                'client_name': workflow.get('client_name', 'N/A'),
-                'company_name': workflow.get('company_name', 'N/A'),
-                'document_type': workflow.get('document_type', 'N/A'),
-                'created_at': workflow.get('created_at'),
-                'priority': 'normal'  # This could be calculated based on urgency
-            }
-            formatted_workflows.append(formatted_workflow)
-        
         return jsonify({
             'success': True,
-            'workflows': formatted_workflows
+            'workflows': [_format_queue_workflow(workflow) for workflow in workflows]
         }), 200
     except Exception as e:
         return jsonify({
@@ -6427,39 +5923,10 @@ def get_my_approval_queue():
 def get_workflow_status():
     """Get all active workflow statuses"""
     try:
-        # Temporarily use the more inclusive method to debug
-        # Ensure we are not serving a cached cursor
         workflows = approval_workflows.get_all_active_workflows(limit=100)
-        
-        # Format workflows for frontend
-        formatted_workflows = []
-        for workflow in workflows:
-            # Debug: Print manager comments from database
-            manager_comments = workflow.get('manager_comments', '')
-            print(f"🔍 Workflow {workflow.get('_id')} - Manager comments from DB: '{manager_comments}'")
-            
-            formatted_workflow = {
-                '_id': str(workflow['_id']),
-                'document_id': workflow.get('document_id'),
-                'document_name': workflow.get('document_name', 'N/A'),
-                'document_type': workflow.get('document_type', 'N/A'),
-                'client_name': workflow.get('client_name', 'N/A'),
-                'company_name': workflow.get('company_name', 'N/A'),
-                'current_stage': workflow.get('current_stage', 'manager'),
-                'workflow_status': workflow.get('workflow_status', 'active'),
-                'manager_status': workflow.get('manager_status', 'pending'),
-                'manager_comments': manager_comments,
-                'ceo_status': workflow.get('ceo_status', 'pending'),
-                'ceo_comments': workflow.get('ceo_comments', ''),
-                'client_status': workflow.get('client_status', 'pending'),
-                'client_comments': workflow.get('client_comments', ''),
-                'created_at': workflow.get('created_at')
-            }
-            formatted_workflows.append(formatted_workflow)
-        
         return jsonify({
             'success': True,
-            'workflows': formatted_workflows
+            'workflows': [_format_status_workflow(workflow) for workflow in workflows]
         }), 200
     except Exception as e:
         return jsonify({
@@ -6472,32 +5939,9 @@ def get_approval_history():
     """Get approval history"""
     try:
         history = approval_workflows.get_approval_history(limit=100)
-        
-        # Format history for frontend
-        formatted_history = []
-        for item in history:
-            formatted_item = {
-                '_id': str(item['_id']),
-                'document_id': item.get('document_id'),
-                'document_name': item.get('document_name', 'N/A'),
-                'client_name': item.get('client_name', 'N/A'),
-                'company_name': item.get('company_name', 'N/A'),
-                'document_type': item.get('document_type', 'N/A'),
-                'final_status': item.get('final_status', 'completed'),
-                'manager_decision': item.get('manager_status', 'N/A'),
-                'ceo_decision': item.get('ceo_status', 'N/A'),
-                'manager_comments': item.get('manager_comments', ''),
-                'ceo_comments': item.get('ceo_comments', ''),
-                # Include client feedback for history view
-                'client_decision': item.get('client_decision') or item.get('client_status', 'N/A'),
-                'client_comments': item.get('client_comments', ''),
-                'completed_at': item.get('completed_at') or item.get('updated_at')
-            }
-            formatted_history.append(formatted_item)
-        
         return jsonify({
             'success': True,
-            'history': formatted_history
+            'history': [_format_history_workflow(item) for item in history]
         }), 200
     except Exception as e:
         return jsonify({
@@ -6559,6 +6003,19 @@ def get_workflow_details(workflow_id):
             'message': f'Error fetching workflow details: {str(e)}'
         }), 500
 
+def _workflow_transition_failed(workflow_id, client_email=None):
+    """Response for a transition that matched nothing: unknown workflow, or not in the expected stage"""
+    workflow = approval_workflows.get_workflow_by_id(workflow_id)
+    if not workflow or (client_email and workflow.get('client_email') != client_email):
+        return jsonify({
+            'success': False,
+            'message': 'Workflow not found or access denied'
+        }), 404
+    return jsonify({
+        'success': False,
+        'message': 'Workflow is not awaiting this action (it may already have been processed)'
+    }), 409
+
 @app.route('/api/approval/approve', methods=['GET', 'POST'])
 def approve_workflow():
     """Approve a workflow"""
@@ -6591,96 +6048,90 @@ def approve_workflow():
                 'message': 'Action must be either approve or deny'
             }), 500
         
-        # Update workflow status
-        success = approval_workflows.update_workflow_status(workflow_id, role, action, comments)
+        # Conditional update; returns the updated workflow, or None if another
+        # request already moved it past this stage
+        workflow = approval_workflows.transition(workflow_id, role, action, comments)
         
-        if success:
-            # Get updated workflow details
-            workflow = approval_workflows.get_workflow_by_id(workflow_id)
-            
-            if workflow:
-                try:
-                    # If manager approves, send email to CEO
-                    if role == 'manager' and action == 'approve':
-                        ceo_email = workflow.get('ceo_email')
-                        if ceo_email:
-                            # Get PDF file path for attachment
-                            pdf_path = None
-                            document_type = workflow.get('document_type')
-                            if document_type == 'PDF':
-                                document = generated_pdfs.get_pdf_by_id(workflow.get('document_id'))
-                                pdf_path = document.get('file_path') if document else None
-                            elif document_type == 'Agreement':
-                                document = generated_agreements.get_agreement_by_id(workflow.get('document_id'))
-                                pdf_path = document.get('file_path') if document else None
-                            
-                            # Send approval email to CEO
-                            email_service = EmailService()
-                            email_result = email_service.send_approval_workflow_email(
-                                recipient_email=ceo_email,
-                                recipient_role='ceo',
-                                workflow_data=workflow,
-                                pdf_path=pdf_path
-                            )
-                            
-                            if email_result['success']:
-                                print(f"✅ Approval email sent to CEO: {ceo_email}")
-                            else:
-                                print(f"⚠️ Failed to send approval email to CEO: {email_result['message']}")
-                    
-                    # If CEO approves, send final document to client
-                    elif role == 'ceo' and action == 'approve':
-                        client_email = workflow.get('client_email')
-                        if client_email:
-                            # Send final approved document to client
-                            email_service = EmailService()
-                            
-                            # Get PDF file path for attachment
-                            pdf_path = None
-                            document_type = workflow.get('document_type')
-                            if document_type == 'PDF':
-                                document = generated_pdfs.get_pdf_by_id(workflow.get('document_id'))
-                                pdf_path = document.get('file_path') if document else None
-                            elif document_type == 'Agreement':
-                                document = generated_agreements.get_agreement_by_id(workflow.get('document_id'))
-                                pdf_path = document.get('file_path') if document else None
-                            
-                            # Send final approved document to client
-                            client_name = workflow.get('client_name', 'Valued Client')
-                            company_name = workflow.get('company_name', 'Your Company')
-                            
-                            email_result = email_service.send_client_delivery_email(
-                                client_email=client_email,
-                                client_name=client_name,
-                                company_name=company_name,
-                                workflow_data=workflow,
-                                pdf_path=pdf_path
-                            )
-                            
-                            if email_result['success']:
-                                print(f"✅ Final approved document sent to client: {client_email}")
-                            else:
-                                print(f"⚠️ Failed to send final document to client: {email_result['message']}")
+        if workflow:
+            try:
+                # If manager approves, send email to CEO
+                if role == 'manager' and action == 'approve':
+                    ceo_email = workflow.get('ceo_email')
+                    if ceo_email:
+                        # Get PDF file path for attachment
+                        pdf_path = None
+                        document_type = workflow.get('document_type')
+                        if document_type == 'PDF':
+                            document = generated_pdfs.get_pdf_by_id(workflow.get('document_id'))
+                            pdf_path = document.get('file_path') if document else None
+                        elif document_type == 'Agreement':
+                            document = generated_agreements.get_agreement_by_id(workflow.get('document_id'))
+                            pdf_path = document.get('file_path') if document else None
+                        
+                        # Send approval email to CEO
+                        email_service = EmailService()
+                        email_result = email_service.send_approval_workflow_email(
+                            recipient_email=ceo_email,
+                            recipient_role='ceo',
+                            workflow_data=workflow,
+                            pdf_path=pdf_path
+                        )
+                        
+                        if email_result['success']:
+                            print(f"✅ Approval email sent to CEO: {ceo_email}")
                         else:
-                            print(f"⚠️ No client email found in workflow for final delivery")
-                    
-                    # If anyone denies, notify initiator
-                    elif action == 'deny':
-                        print(f"⚠️ Workflow denied by {role}. Notifying initiator...")
+                            print(f"⚠️ Failed to send approval email to CEO: {email_result['message']}")
+                
+                # If CEO approves, send final document to client
+                elif role == 'ceo' and action == 'approve':
+                    client_email = workflow.get('client_email')
+                    if client_email:
+                        # Send final approved document to client
+                        email_service = EmailService()
                         
-                except Exception as email_error:
-                    print(f"⚠️ Error sending workflow notification email: {str(email_error)}")
-                    # Continue with workflow update even if email fails
-            
+                        # Get PDF file path for attachment
+                        pdf_path = None
+                        document_type = workflow.get('document_type')
+                        if document_type == 'PDF':
+                            document = generated_pdfs.get_pdf_by_id(workflow.get('document_id'))
+                            pdf_path = document.get('file_path') if document else None
+                        elif document_type == 'Agreement':
+                            document = generated_agreements.get_agreement_by_id(workflow.get('document_id'))
+                            pdf_path = document.get('file_path') if document else None
+                        
+                        # Send final approved document to client
+                        client_name = workflow.get('client_name', 'Valued Client')
+                        company_name = workflow.get('company_name', 'Your Company')
+                        
+                        email_result = email_service.send_client_delivery_email(
+                            client_email=client_email,
+                            client_name=client_name,
+                            company_name=company_name,
+                            workflow_data=workflow,
+                            pdf_path=pdf_path
+                        )
+                        
+                        if email_result['success']:
+                            print(f"✅ Final approved document sent to client: {client_email}")
+                        else:
+                            print(f"⚠️ Failed to send final document to client: {email_result['message']}")
+                    else:
+                        print(f"⚠️ No client email found in workflow for final delivery")
+                
+                # If anyone denies, notify initiator
+                elif action == 'deny':
+                    print(f"⚠️ Workflow denied by {role}. Notifying initiator...")
+                    
+            except Exception as email_error:
+                print(f"⚠️ Error sending workflow notification email: {str(email_error)}")
+                # Continue with workflow update even if email fails
+        
             return jsonify({
                 'success': True,
                 'message': f'Workflow {action}d successfully'
             }), 200
         else:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to update workflow status'
-            }), 500
+            return _workflow_transition_failed(workflow_id)
         
     except Exception as e:
         print(f"❌ Error in approve_workflow: {str(e)}")
@@ -6712,18 +6163,15 @@ def deny_workflow():
             }), 500
         
         # Update workflow status
-        success = approval_workflows.update_workflow_status(workflow_id, role, action, comments)
+        workflow = approval_workflows.transition(workflow_id, role, action, comments)
         
-        if success:
+        if workflow:
             return jsonify({
                 'success': True,
                 'message': 'Workflow denied successfully'
             }), 200
         else:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to update workflow status'
-            }), 500
+            return _workflow_transition_failed(workflow_id)
         
     except Exception as e:
         return jsonify({
@@ -6735,59 +6183,13 @@ def deny_workflow():
 def get_denied_workflows():
     """Get all denied workflows with comments"""
     try:
-        # Get denied workflows from the database
         denied_workflows = approval_workflows.get_denied_workflows()
-        
-        if denied_workflows:
-            # Format the data for frontend display
-            formatted_workflows = []
-            for workflow in denied_workflows:
-                # Determine who denied it and when
-                denied_by_role = 'Unknown'
-                denied_at = None
-                
-                if workflow.get('client_status') == 'rejected':
-                    denied_by_role = 'Client'
-                    denied_at = workflow.get('client_updated_at')
-                elif workflow.get('ceo_status') == 'denied':
-                    denied_by_role = 'CEO'
-                    denied_at = workflow.get('ceo_updated_at')
-                elif workflow.get('manager_status') == 'denied':
-                    denied_by_role = 'Manager'
-                    denied_at = workflow.get('manager_updated_at')
-                
-                formatted_workflow = {
-                    '_id': str(workflow.get('_id')),
-                    'document_name': workflow.get('document_name', 'N/A'),
-                    'document_type': workflow.get('document_type', 'Document'),
-                    'client_name': workflow.get('client_name', 'N/A'),
-                    'denied_by_role': denied_by_role,
-                    'denied_by_email': workflow.get('denied_by_email', 'Unknown'),
-                    'denied_at': denied_at,
-                    'comments': workflow.get('comments', 'No comments provided'),
-                    'workflow_id': str(workflow.get('_id')),
-                    # Include all comments for proper display
-                    'manager_comments': workflow.get('manager_comments', ''),
-                    'ceo_comments': workflow.get('ceo_comments', ''),
-                    'client_comments': workflow.get('client_comments', ''),
-                    'manager_status': workflow.get('manager_status', 'pending'),
-                    'ceo_status': workflow.get('ceo_status', 'pending'),
-                    'client_status': workflow.get('client_status', 'pending')
-                }
-                formatted_workflows.append(formatted_workflow)
-            
-            return jsonify({
-                'success': True,
-                'denied_requests': formatted_workflows,
-                'count': len(formatted_workflows)
-            }), 200
-        else:
-            return jsonify({
-                'success': True,
-                'denied_requests': [],
-                'count': 0
-            }), 200
-        
+        formatted_workflows = [_format_denied_workflow(workflow) for workflow in denied_workflows]
+        return jsonify({
+            'success': True,
+            'denied_requests': formatted_workflows,
+            'count': len(formatted_workflows)
+        }), 200
     except Exception as e:
         return jsonify({
             'success': False,
@@ -6838,7 +6240,7 @@ def start_approval_workflow():
         if document_type == 'PDF':
             document = generated_pdfs.get_pdf_by_id(document_id)
         elif document_type == 'Agreement':
-            document = generated_agreements.get_agreement_by_id(document_id)
+            document = generated_agreements.get_agreement_by_id(document_id, include_content=False)
         
         if not document:
             return jsonify({
@@ -6916,50 +6318,9 @@ def start_approval_workflow():
 
 @app.route('/api/documents/list', methods=['GET'])
 def list_documents_for_approval():
-    """Get all documents for approval workflow selection"""
+    """Get documents for approval workflow selection, newest first, one page at a time"""
     try:
-        # Get all PDFs and agreements
-        all_pdfs = generated_pdfs.get_all_pdfs(limit=100)
-        all_agreements = generated_agreements.get_all_agreements(limit=100)
-        
-        # Combine and format documents
-        documents = []
-        
-        # Add PDFs
-        for pdf in all_pdfs:
-            documents.append({
-                'id': str(pdf['_id']),
-                'document_type': 'PDF',
-                'filename': pdf.get('filename', 'Unknown'),
-                'client_name': pdf.get('client_name', 'Unknown'),
-                'company_name': pdf.get('company_name', 'Unknown'),
-                'client_email': pdf.get('client_email', ''),
-                'generated_at': pdf.get('generated_at', datetime.now()),
-                'quote_id': pdf.get('quote_id', 'Unknown')
-            })
-        
-        # Add Agreements
-        for agreement in all_agreements:
-            documents.append({
-                'id': str(agreement['_id']),
-                'document_type': 'Agreement',
-                'filename': agreement.get('filename', 'Unknown'),
-                'client_name': agreement.get('client_name', 'Unknown'),
-                'company_name': agreement.get('company_name', 'Unknown'),
-                'client_email': agreement.get('client_email', ''),
-                'generated_at': agreement.get('generated_at', datetime.now()),
-                'quote_id': agreement.get('quote_id', 'Unknown')
-            })
-        
-        # Sort by generation date (newest first)
-        documents.sort(key=lambda x: x['generated_at'], reverse=True)
-        
-        return jsonify({
-            'success': True,
-            'documents': documents,
-            'count': len(documents)
-        })
-        
+        return _list_documents_page(['filename', 'client_name', 'company_name', 'client_email', 'quote_id'])
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -7063,8 +6424,6 @@ def convert_agreement_to_pdf(agreement_id):
             return jsonify({'success': False, 'message': 'Agreement is already a PDF'}), 400
         
         try:
-            from weasyprint import HTML
-            
             # Read the text content
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
@@ -7097,37 +6456,22 @@ def convert_agreement_to_pdf(agreement_id):
                 </div>
                 <div class="content">{content}</div>
                 <div class="footer">
-                    <p>Converted to PDF on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
+                    <p>Converted to PDF on {datetime.now().strftime('%B %d, %Y')}</p>
                 </div>
             </body>
             </html>
             """
             
             # Generate PDF
-            html_doc = HTML(string=html_content)
-            pdf_bytes = html_doc.write_pdf()
+            pdf_bytes = render_service.render('html_pdf', template_assets.inline_assets(html_content))
             
-            # Create new PDF file path
+            # Save the PDF in the blob store and point the agreement at it
             pdf_filename = agreement['filename'].replace('.txt', '.pdf')
-            pdf_file_path = file_path.replace('.txt', '.pdf')
-            
-            # Save PDF file
-            with open(pdf_file_path, 'wb') as f:
-                f.write(pdf_bytes)
-            
-            # Update agreement metadata
-            updated_metadata = {
-                'filename': pdf_filename,
-                'file_path': pdf_file_path,
-                'file_size': len(pdf_bytes),
-                'converted_at': datetime.now(),
-                'original_file': file_path
-            }
-            
-            # Update in MongoDB
-            generated_agreements.collection.update_one(
-                {'_id': agreement['_id']},
-                {'$set': updated_metadata}
+            pdf_file_path = generated_agreements.replace_agreement_content(
+                agreement, pdf_bytes,
+                filename=pdf_filename,
+                converted_at=datetime.now(),
+                original_file=file_path
             )
             
             print(f"✅ Agreement converted to PDF: {pdf_filename}")
@@ -7194,18 +6538,12 @@ def submit_client_feedback():
                 'message': 'Decision must be one of: accepted, rejected, needs_changes'
             }), 400
         
-        # Verify workflow exists and belongs to this client
-        workflow = approval_workflows.get_workflow_by_client_email(client_email, workflow_id)
-        if not workflow:
-            return jsonify({
-                'success': False,
-                'message': 'Workflow not found or access denied'
-            }), 404
-        
-        # Submit client feedback
-        success = approval_workflows.submit_client_feedback(workflow_id, client_comments, client_decision)
+        # Submit client feedback; the filter also verifies the workflow belongs to this client
+        workflow = approval_workflows.transition(
+            workflow_id, 'client', client_decision, client_comments, client_email=client_email
+        )
         
-        if success:
+        if workflow:
             # Send notification email to manager/CEO about client feedback
             try:
                 email_service = EmailService()
@@ -7259,10 +6597,7 @@ def submit_client_feedback():
                 'message': 'Client feedback submitted successfully'
             }), 200
         else:
-            return jsonify({
-                'success': False,
-                'message': 'Failed to submit client feedback'
-            }), 500
+            return _workflow_transition_failed(workflow_id, client_email=client_email)
             
     except Exception as e:
         print(f"❌ Error submitting client feedback: {str(e)}")
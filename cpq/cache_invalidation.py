@@ -0,0 +1,337 @@
+import os
+import threading
+from datetime import datetime
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+# Server error codes meaning "change streams are not available on this deployment"
+# (standalone server, or a storage engine / tier that does not support them)
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 40415, 136}
+
+
+class ProcessCache:
+    """Thread-safe per-process cache of MongoDB documents.
+
+    Entries are grouped by collection name. Documents cached by key are also
+    indexed by their ``_id`` so that a change event (which only carries the
+    ``_id``) can evict every key pointing at that document. Entries stored with
+    ``query=True`` hold the result of a query (e.g. "the active pricing config")
+    and are dropped on any change in their collection.
+
+    The cache stays disabled (every ``get`` misses) until an invalidation bus
+    is running, so a worker never serves entries it cannot invalidate. A
+    collection whose watcher lost its stream is suspended the same way until
+    it is watched again.
+
+    Every eviction bumps the collection's generation. Readers take
+    ``generation()`` before querying and pass it to ``set``, which refuses to
+    store a result read before an eviction that raced with it.
+    """
+
+    def __init__(self, max_entries_per_collection=500):
+        self.max_entries_per_collection = max_entries_per_collection
+        self.enabled = False
+        self._lock = threading.RLock()
+        self._entries = {}      # collection -> {key: document}
+        self._keys_by_id = {}   # collection -> {str(_id): set(keys)}
+        self._query_keys = {}   # collection -> set(keys)
+        self._generations = {}  # collection -> evictions so far
+        self._suspended = set()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def generation(self, collection_name):
+        """Current generation of collection_name, to pass to set()"""
+        with self._lock:
+            return self._generations.get(collection_name, 0)
+
+    def get(self, collection_name, key):
+        """Return the cached document or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if collection_name in self._suspended:
+                self._misses += 1
+                return None
+            value = self._entries.get(collection_name, {}).get(key)
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return value
+
+    def set(self, collection_name, key, document, query=False, generation=None):
+        """Cache a document under key. None results are never cached.
+
+        With generation (from ``generation()`` before the read), a document
+        read before a later eviction of its collection is not cached.
+        """
+        if not self.enabled or document is None:
+            return
+        with self._lock:
+            if collection_name in self._suspended:
+                return
+            if generation is not None and generation != self._generations.get(collection_name, 0):
+                return
+            entries = self._entries.setdefault(collection_name, {})
+            if key not in entries and len(entries) >= self.max_entries_per_collection:
+                # Simple bound: drop the whole collection rather than track recency
+                self._clear_collection(collection_name)
+                entries = self._entries.setdefault(collection_name, {})
+            entries[key] = document
+            if query:
+                self._query_keys.setdefault(collection_name, set()).add(key)
+            doc_id = document.get('_id') if isinstance(document, dict) else None
+            if doc_id is not None:
+                self._keys_by_id.setdefault(collection_name, {}).setdefault(str(doc_id), set()).add(key)
+
+    def evict(self, collection_name, document_id=None):
+        """Evict entries affected by a change to document_id in collection_name.
+
+        Query entries of the collection are always dropped because any write
+        may change their result.
+        """
+        with self._lock:
+            self._bump(collection_name)
+            entries = self._entries.get(collection_name)
+            if not entries:
+                return
+            keys = set(self._query_keys.pop(collection_name, set()))
+            if document_id is not None:
+                keys |= self._keys_by_id.get(collection_name, {}).pop(str(document_id), set())
+            for key in keys:
+                if entries.pop(key, None) is not None:
+                    self._evictions += 1
+
+    def evict_collection(self, collection_name):
+        """Drop every entry cached for collection_name"""
+        with self._lock:
+            self._bump(collection_name)
+            self._clear_collection(collection_name)
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            for collection_name in set(self._entries) | set(self._generations):
+                self._bump(collection_name)
+                self._clear_collection(collection_name)
+
+    def suspend(self, collection_name):
+        """Drop and stop caching collection_name until resume(), e.g. while its changes can't be seen"""
+        with self._lock:
+            self._suspended.add(collection_name)
+            self._bump(collection_name)
+            self._clear_collection(collection_name)
+
+    def resume(self, collection_name):
+        """Cache collection_name again; reads started while it was suspended are still not stored"""
+        with self._lock:
+            if collection_name in self._suspended:
+                self._suspended.discard(collection_name)
+                self._bump(collection_name)
+
+    def get_stats(self):
+        """Get cache statistics"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'entries': {name: len(entries) for name, entries in self._entries.items()},
+                'suspended': sorted(self._suspended)
+            }
+
+    def _bump(self, collection_name):
+        self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+
+    def _clear_collection(self, collection_name):
+        entries = self._entries.pop(collection_name, {})
+        self._evictions += len(entries)
+        self._keys_by_id.pop(collection_name, None)
+        self._query_keys.pop(collection_name, None)
+
+
+class CacheInvalidationBus:
+    """Evicts ProcessCache entries when documents change in another worker.
+
+    Each watched collection gets a daemon thread that tails a change stream
+    and evicts the ``_id`` of every changed document. When change streams are
+    unavailable (standalone server), the thread falls back to polling the
+    collection's watermark field (``updated_at`` by default) and evicts
+    documents whose watermark moved past the last one seen.
+    """
+
+    def __init__(self, cache, collections, poll_interval=5.0, max_await_ms=1000):
+        """
+        Args:
+            cache (ProcessCache): Cache to evict from
+            collections (dict): pymongo Collection -> watermark field name
+            poll_interval (float): Seconds between polls in fallback mode
+            max_await_ms (int): How long a change stream read blocks before
+                the thread re-checks for shutdown
+        """
+        self.cache = cache
+        self.collections = collections
+        self.poll_interval = poll_interval
+        self.max_await_ms = max_await_ms
+        self.modes = {}
+        self._resume_tokens = {}
+        self._ready = set()
+        self._ready_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start one watcher thread per collection.
+
+        The cache is enabled once every collection is being watched, so no
+        entry can be cached before its invalidation source is live.
+        """
+        if self._threads:
+            return
+        self._stop.clear()
+        for collection, watermark_field in self.collections.items():
+            thread = threading.Thread(
+                target=self._run,
+                args=(collection, watermark_field),
+                name=f"cache-invalidation-{collection.name}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        """Stop all watcher threads and disable the cache"""
+        self.cache.enabled = False
+        self.cache.clear()
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._ready.clear()
+
+    def _mark_ready(self, collection_name, mode):
+        self.modes[collection_name] = mode
+        with self._ready_lock:
+            self._ready.add(collection_name)
+            if len(self._ready) == len(self.collections) and not self._stop.is_set():
+                self.cache.enabled = True
+
+    def get_status(self):
+        """Get the watch mode of each collection ('change_stream' or 'polling')"""
+        return dict(self.modes)
+
+    def _run(self, collection, watermark_field):
+        # Long-polling getMores would otherwise dominate the slow-query log
+        from cpq.mongo_monitoring import command_monitor
+        command_monitor.ignore_current_thread()
+
+        while not self._stop.is_set():
+            try:
+                self._watch(collection)
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    print(f"⚠️ Change streams unavailable for {collection.name}, polling '{watermark_field}' instead")
+                    self._poll(collection, watermark_field)
+                    return
+                # Unknown server error (e.g. resume token expired): events may
+                # have been missed, so start over clean and read through the
+                # cache until a new stream is open
+                print(f"⚠️ Change stream error on {collection.name}: {e}")
+                self.cache.suspend(collection.name)
+                self._resume_tokens.pop(collection.name, None)
+                self._stop.wait(self.poll_interval)
+            except PyMongoError as e:
+                print(f"⚠️ Change stream interrupted on {collection.name}: {e}")
+                self.cache.suspend(collection.name)
+                self._stop.wait(self.poll_interval)
+
+    def _watch(self, collection):
+        """Tail the change stream until stopped, remembering the resume token"""
+        resume_token = self._resume_tokens.get(collection.name)
+        with collection.watch(resume_after=resume_token, max_await_time_ms=self.max_await_ms) as stream:
+            self.cache.resume(collection.name)
+            self._mark_ready(collection.name, 'change_stream')
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if stream.resume_token is not None:
+                    self._resume_tokens[collection.name] = stream.resume_token
+                if change is not None:
+                    self._apply_change(collection.name, change)
+
+    def _apply_change(self, collection_name, change):
+        operation = change.get('operationType')
+        if operation in ('insert', 'update', 'replace', 'delete'):
+            self.cache.evict(collection_name, change.get('documentKey', {}).get('_id'))
+        else:
+            # drop, rename, invalidate, ... - nothing cached can be trusted
+            self.cache.evict_collection(collection_name)
+
+    def _poll(self, collection, watermark_field):
+        """Fallback: evict documents whose watermark advanced since the last poll.
+
+        Hard deletes do not move a watermark, so a drop in the document count
+        evicts the whole collection.
+        """
+        watermark = datetime.now()
+        self._mark_ready(collection.name, 'polling')
+        last_count = None
+        while not self._stop.wait(self.poll_interval):
+            try:
+                changed = collection.find(
+                    {watermark_field: {'$gt': watermark}},
+                    {'_id': 1, watermark_field: 1}
+                ).sort(watermark_field, 1)
+                for doc in changed:
+                    self.cache.evict(collection.name, doc['_id'])
+                    watermark = max(watermark, doc[watermark_field])
+
+                count = collection.estimated_document_count()
+                if last_count is not None and count < last_count:
+                    self.cache.evict_collection(collection.name)
+                last_count = count
+                self.cache.resume(collection.name)
+            except PyMongoError as e:
+                print(f"⚠️ Cache invalidation poll failed on {collection.name}: {e}")
+                self.cache.suspend(collection.name)
+
+
+# Global instance shared by the collection classes of this worker
+process_cache = ProcessCache()
+
+# Collections whose reads are cached, with the field their writes bump
+CACHED_COLLECTIONS = {
+    'agreement_templates': 'updated_at',
+    'template_builder_documents': 'updated',
+    'pricing_configs': 'updated_at',
+    'quotes': 'updated_at',
+}
+
+_bus = None
+
+
+def start_invalidation_bus(db, collections=None):
+    """Start the invalidation bus for this worker (idempotent).
+
+    Disabled with CACHE_INVALIDATION_ENABLED=false, in which case the cache
+    stays off and every read goes to MongoDB.
+    """
+    global _bus
+    if os.getenv('CACHE_INVALIDATION_ENABLED', 'true').lower() in ('0', 'false', 'no'):
+        return None
+    if _bus is None:
+        watched = collections or CACHED_COLLECTIONS
+        _bus = CacheInvalidationBus(
+            process_cache,
+            {db[name]: field for name, field in watched.items()},
+            poll_interval=float(os.getenv('CACHE_INVALIDATION_POLL_SECONDS', '5'))
+        )
+        _bus.start()
+    return _bus
+
+
+def get_invalidation_bus():
+    """Get the running bus of this worker, if any"""
+    return _bus
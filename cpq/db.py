@@ -1,36 +1,59 @@
 import pymongo
 import os
 from dotenv import load_dotenv
+from cpq.mongo_monitoring import command_monitor
 
 load_dotenv()  # load variables from .env
 
 MONGO_URI = os.getenv("MONGO_URI")
+# "mongo" (default) or "memory"; the in-memory backend needs no server and is
+# meant for tests and benchmarks
+STORAGE_BACKEND = os.getenv("CPQ_STORAGE_BACKEND", "mongo").lower()
 
-if not MONGO_URI:
-    raise ValueError("MONGO_URI environment variable is not set. Please check your .env file.")
-
-try:
-    client = pymongo.MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    # Test the connection
-    client.admin.command('ping')
-    print("MongoDB connection successful!")
-    
-    db = client["cpq_db"]
-    quotes_collection = db["quotes"]
-    clients_collection = db["clients"]  # New collection for client information
-    hubspot_contacts_collection = db["hubspot_contacts"]  # New collection for HubSpot contacts
-    quote_status_collection = db["quote_status"]  # New collection for quote status tracking
-    
-    # Add missing collections that are referenced in the code
-    generated_pdfs_collection = db["storinggenratedpdfinqotemangamnet"]
-    generated_agreements_collection = db["storinggenratedaggremntfromquotemangnt"]
-    
-except pymongo.errors.ServerSelectionTimeoutError:
-    print("MongoDB connection failed: Server not reachable")
-    raise
-except pymongo.errors.ConnectionFailure:
-    print("MongoDB connection failed: Connection error")
-    raise
-except Exception as e:
-    print(f"MongoDB connection failed: {str(e)}")
-    raise
+
+def connect_mongo():
+    """Connect to MongoDB and return (client, db)"""
+    if not MONGO_URI:
+        raise ValueError("MONGO_URI environment variable is not set. Please check your .env file.")
+
+    try:
+        # command_monitor records round trips per request and explains slow queries
+        client = pymongo.MongoClient(
+            MONGO_URI,
+            serverSelectionTimeoutMS=5000,
+            event_listeners=[command_monitor]
+        )
+        command_monitor.attach(client)
+        # Test the connection
+        client.admin.command('ping')
+        print("MongoDB connection successful!")
+        return client, client["cpq_db"]
+
+    except pymongo.errors.ServerSelectionTimeoutError:
+        print("MongoDB connection failed: Server not reachable")
+        raise
+    except pymongo.errors.ConnectionFailure:
+        print("MongoDB connection failed: Connection error")
+        raise
+    except Exception as e:
+        print(f"MongoDB connection failed: {str(e)}")
+        raise
+
+
+if STORAGE_BACKEND == "memory":
+    from cpq.storage import MemoryDatabase
+
+    client = None
+    db = MemoryDatabase("cpq_db")
+    print("Using in-memory storage backend")
+else:
+    client, db = connect_mongo()
+
+quotes_collection = db["quotes"]
+clients_collection = db["clients"]  # New collection for client information
+hubspot_contacts_collection = db["hubspot_contacts"]  # New collection for HubSpot contacts
+quote_status_collection = db["quote_status"]  # New collection for quote status tracking
+
+# Add missing collections that are referenced in the code
+generated_pdfs_collection = db["storinggenratedpdfinqotemangamnet"]
+generated_agreements_collection = db["storinggenratedaggremntfromquotemangnt"]
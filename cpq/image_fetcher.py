@@ -0,0 +1,311 @@
+"""Fetching and decoding of remote images referenced by document templates.
+
+Templates often point at CDN-hosted logos. Exports used to download each one
+with a bare requests.get per image per document. Fetches now go through one
+pooled session and a cache of decoded images:
+
+    memory  decoded images for this worker     IMAGE_FETCH_MEMORY_MB (default 32)
+    disk    response bodies and validators,    IMAGE_FETCH_DISK_MB (default 128,
+            shared by the workers on this host  0 disables) under IMAGE_FETCH_CACHE_DIR
+
+An entry younger than IMAGE_FETCH_MAX_AGE_SECONDS is served as-is. Older
+entries are revalidated with If-None-Match / If-Modified-Since, so an
+unchanged image costs a 304 instead of a download. If revalidation fails,
+the cached copy is served. prefetch() fetches every image of a template in
+parallel before a document build starts.
+
+Each fetch is counted once in get_stats(): a memory hit, a disk hit, a
+revalidation, a download, a stale copy served after a failure, or an error.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+IMAGE_FETCH_TIMEOUT_SECONDS = float(os.getenv('IMAGE_FETCH_TIMEOUT_SECONDS', '10'))
+IMAGE_FETCH_WORKERS = int(os.getenv('IMAGE_FETCH_WORKERS', '8'))
+IMAGE_FETCH_MAX_AGE_SECONDS = float(os.getenv('IMAGE_FETCH_MAX_AGE_SECONDS', '300'))
+IMAGE_FETCH_MEMORY_MB = float(os.getenv('IMAGE_FETCH_MEMORY_MB', '32'))
+IMAGE_FETCH_DISK_MB = float(os.getenv('IMAGE_FETCH_DISK_MB', '128'))
+IMAGE_FETCH_CACHE_DIR = os.getenv('IMAGE_FETCH_CACHE_DIR', 'image_cache')
+
+# Some CDNs block requests without a browser user agent
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+# Formats Word embeds directly; anything else is converted to PNG
+DOCX_IMAGE_FORMATS = ('PNG', 'JPEG', 'JPG', 'GIF', 'BMP', 'TIFF')
+
+
+class DecodedImage:
+    """Image bytes ready to embed, with the format and pixel size read once"""
+
+    def __init__(self, data, format=None, width=None, height=None):
+        self.data = data
+        self.format = format
+        self.width = width
+        self.height = height
+
+
+def decode_image(data):
+    """Open image bytes once: format, size, and bytes in a DOCX-friendly format.
+
+    Bytes PIL can't read are returned unchanged with no format or size.
+    """
+    try:
+        img = Image.open(BytesIO(data))
+        fmt = (img.format or '').upper()
+        width, height = img.size
+        if fmt not in DOCX_IMAGE_FORMATS:
+            # e.g. WebP → PNG
+            buffer = BytesIO()
+            img.convert('RGBA').save(buffer, format='PNG')
+            data, fmt = buffer.getvalue(), 'PNG'
+        return DecodedImage(data, fmt, width, height)
+    except Exception:
+        return DecodedImage(data)
+
+
+class _Entry:
+    """A cached response: decoded image plus what is needed to revalidate it"""
+
+    def __init__(self, image, etag=None, last_modified=None, fetched_at=None):
+        self.image = image
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+
+    @property
+    def size(self):
+        return len(self.image.data)
+
+
+class ImageFetcher:
+    """Pooled, cached HTTP image fetching"""
+
+    def __init__(self, max_age=IMAGE_FETCH_MAX_AGE_SECONDS, memory_bytes=int(IMAGE_FETCH_MEMORY_MB * 1024 * 1024),
+                 disk_bytes=int(IMAGE_FETCH_DISK_MB * 1024 * 1024), directory=IMAGE_FETCH_CACHE_DIR,
+                 workers=IMAGE_FETCH_WORKERS, timeout=IMAGE_FETCH_TIMEOUT_SECONDS):
+        self.max_age = max_age
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        self.workers = workers
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._size = 0
+        self._disk_size = None  # estimate, rescanned when it passes the budget
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+        self._pid = None
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._revalidated = 0
+        self._downloads = 0
+        self._stale_served = 0
+        self._errors = 0
+
+    def _connections(self):
+        """Session and prefetch pool, created per process (gunicorn forks after import)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = USER_AGENT
+                self._session = session
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-fetch')
+                self._pid = os.getpid()
+            return self._session, self._executor
+
+    def fetch(self, url):
+        """DecodedImage for an http(s) URL, or None if it can't be fetched"""
+        hit = '_hits'
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+        if entry is None:
+            hit = '_disk_hits'
+            entry = self._read_disk(url)
+            if entry is not None:
+                self._remember(url, entry)
+        if entry is not None and time.time() - entry.fetched_at < self.max_age:
+            self._count(hit)
+            return entry.image
+
+        session, _ = self._connections()
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        try:
+            resp = session.get(url, timeout=self.timeout, headers=headers)
+        except Exception as e:
+            print(f"⚠️ Image fetch failed for {url}: {str(e)}")
+            return self._fallback(entry)
+
+        if resp.status_code == 304 and entry is not None:
+            self._count('_revalidated')
+            entry.fetched_at = time.time()
+            self._write_meta(url, entry)
+            return entry.image
+        if resp.status_code != 200:
+            print(f"⚠️ Image fetch for {url} returned {resp.status_code}")
+            return self._fallback(entry)
+
+        self._count('_downloads')
+        entry = _Entry(decode_image(resp.content), resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+        self._remember(url, entry)
+        self._write_disk(url, entry, resp.content)
+        return entry.image
+
+    def prefetch(self, urls):
+        """Fetch every http(s) URL in parallel; returns {url: DecodedImage} for those fetched"""
+        urls = list(dict.fromkeys(u for u in urls if u and u.startswith(('http://', 'https://'))))
+        if not urls:
+            return {}
+        _, executor = self._connections()
+        images = dict(zip(urls, executor.map(self.fetch, urls)))
+        return {url: image for url, image in images.items() if image is not None}
+
+    def _fallback(self, entry):
+        if entry is None:
+            self._count('_errors')
+            return None
+        self._count('_stale_served')
+        return entry.image
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _remember(self, url, entry):
+        if entry.size > self.memory_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous is not None:
+                self._size -= previous.size
+            self._entries[url] = entry
+            self._size += entry.size
+            while self._size > self.memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return f"{base}.img", f"{base}.json"
+
+    def _read_disk(self, url):
+        if self.disk_bytes <= 0:
+            return None
+        data_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(data_path, 'rb') as f:
+                data = f.read()
+            os.utime(data_path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Image cache read failed for {url}: {str(e)}")
+            return None
+        return _Entry(decode_image(data), meta.get('etag'), meta.get('last_modified'), meta.get('fetched_at'))
+
+    def _write_meta(self, url, entry):
+        if self.disk_bytes <= 0:
+            return
+        _, meta_path = self._paths(url)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({'url': url, 'etag': entry.etag, 'last_modified': entry.last_modified,
+                           'fetched_at': entry.fetched_at}, f)
+            os.replace(temp_path, meta_path)
+        except Exception as e:
+            print(f"⚠️ Image cache write failed for {url}: {str(e)}")
+
+    def _write_disk(self, url, entry, data):
+        if self.disk_bytes <= 0 or len(data) > self.disk_bytes:
+            return
+        data_path, _ = self._paths(url)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, data_path)
+            self._write_meta(url, entry)
+            with self._lock:
+                if self._disk_size is not None:
+                    self._disk_size += len(data)
+            self._evict_disk()
+        except Exception as e:
+            print(f"⚠️ Image cache write failed for {url}: {str(e)}")
+
+    def _evict_disk(self):
+        """Delete least recently used images until the directory fits the budget.
+
+        Other workers write to the same directory, so the size is an estimate
+        that is corrected by a rescan whenever it exceeds the budget.
+        """
+        with self._lock:
+            if self._disk_size is not None and self._disk_size <= self.disk_bytes:
+                return
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith('.img'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.disk_bytes:
+                    break
+                for victim in (path, path[:-len('.img')] + '.json'):
+                    try:
+                        os.remove(victim)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+            self._disk_size = total
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'memory_bytes': self._size,
+                'memory_limit_bytes': self.memory_bytes,
+                'disk_bytes': self._disk_size,
+                'disk_limit_bytes': self.disk_bytes,
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'revalidated': self._revalidated,
+                'downloads': self._downloads,
+                'stale_served': self._stale_served,
+                'errors': self._errors,
+            }
+
+
+# Global instance shared by the request threads of this worker
+image_fetcher = ImageFetcher()
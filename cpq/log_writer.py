@@ -0,0 +1,266 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+# What to do when the queue is still full after the back-pressure wait
+DROP_NEWEST = 'drop_newest'   # reject the incoming record
+DROP_OLDEST = 'drop_oldest'   # evict the oldest queued record to make room
+
+
+class BufferedLogWriter:
+    """Background writer for fire-and-forget log records.
+
+    Request threads enqueue documents to insert or pymongo write operations
+    (``UpdateOne`` etc.) and return immediately. A daemon thread flushes the
+    queue when it holds ``batch_size`` records or ``flush_interval`` seconds
+    have passed, using
+    ``insert_many`` for pure-insert batches and an ordered ``bulk_write``
+    otherwise, so updates to the same document keep their order.
+
+    Under overload a writer first blocks for up to ``put_timeout`` seconds
+    (back-pressure), then applies ``drop_policy``. Dropped and failed records
+    are counted and exposed through ``get_metrics``.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval=1.0,
+                 put_timeout=0.05, drop_policy=DROP_NEWEST, max_retries=2):
+        if drop_policy not in (DROP_NEWEST, DROP_OLDEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.drop_policy = drop_policy
+        self.max_retries = max_retries
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread = None
+
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._flushes = 0
+        self._max_depth = 0
+        self._last_flush_at = None
+        self._last_error = None
+
+    # --- Producer side ------------------------------------------------------
+
+    def insert(self, collection, document):
+        """Queue a document insert. Returns False if the record was dropped."""
+        return self.write(collection, document)
+
+    def write(self, collection, operation):
+        """Queue a pymongo write operation (or a plain document to insert).
+
+        Returns False if the record was dropped.
+        """
+        with self._lock:
+            if not self._closed:
+                return self._enqueue(collection, operation)
+        # After shutdown there is no flusher; write through, outside the lock
+        return self._write_through(collection, operation)
+
+    def _enqueue(self, collection, operation):
+        """Append to the queue, applying back-pressure and the drop policy. Called with the lock held."""
+        if len(self._queue) >= self.max_queue:
+            deadline = time.monotonic() + self.put_timeout
+            while len(self._queue) >= self.max_queue and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._not_full.wait(remaining)
+
+            if len(self._queue) >= self.max_queue:
+                self._dropped += 1
+                if self.drop_policy == DROP_NEWEST:
+                    return False
+                self._queue.popleft()
+
+        self._queue.append((collection, operation))
+        self._enqueued += 1
+        self._max_depth = max(self._max_depth, len(self._queue))
+        self._ensure_thread()
+        if len(self._queue) >= self.batch_size:
+            self._not_empty.notify()
+        return True
+
+    # --- Lifecycle ----------------------------------------------------------
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is written. Returns True if drained."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._flush_requested = True
+            self._not_empty.notify()
+            while self._queue or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None:
+                    return False
+                self._idle.wait(remaining)
+            return True
+
+    def close(self, timeout=5.0):
+        """Flush pending records and stop the background thread"""
+        drained = self.flush(timeout)
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        if not drained:
+            print(f"⚠️ Log writer closed with {len(self._queue)} unwritten records")
+        return drained
+
+    def get_metrics(self):
+        """Queue depth and throughput counters"""
+        with self._lock:
+            return {
+                'queue_depth': len(self._queue),
+                'in_flight': self._in_flight,
+                'max_queue': self.max_queue,
+                'max_depth_seen': self._max_depth,
+                'enqueued': self._enqueued,
+                'written': self._written,
+                'dropped': self._dropped,
+                'failed': self._failed,
+                'flushes': self._flushes,
+                'drop_policy': self.drop_policy,
+                'last_flush_at': self._last_flush_at,
+                'last_error': self._last_error
+            }
+
+    # --- Flusher side -------------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='buffered-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self._queue) < self.batch_size and not self._closed
+                       and not self._flush_requested):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+                if not self._queue:
+                    self._flush_requested = False
+                if self._closed and not self._queue:
+                    self._idle.notify_all()
+                    return
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._in_flight = len(batch)
+                self._not_full.notify_all()
+
+            if batch:
+                self._write_batch(batch)
+
+            with self._lock:
+                self._in_flight = 0
+                if not self._queue:
+                    self._idle.notify_all()
+
+    def _write_batch(self, batch):
+        # Group by collection, keeping each collection's operations in order
+        grouped = {}
+        for collection, operation in batch:
+            key = (collection.database.name, collection.name)
+            grouped.setdefault(key, (collection, []))[1].append(operation)
+
+        for collection, operations in grouped.values():
+            for attempt in range(self.max_retries + 1):
+                try:
+                    failed = self._execute(collection, operations)
+                    self._record_result(len(operations) - failed, failed)
+                    break
+                except ConnectionFailure as e:
+                    if attempt < self.max_retries:
+                        time.sleep(0.1 * (2 ** attempt))
+                        continue
+                    print(f"❌ Log writer dropped {len(operations)} records for {collection.name}: {e}")
+                    self._record_result(0, len(operations), str(e))
+                except Exception as e:
+                    print(f"❌ Log writer dropped {len(operations)} records for {collection.name}: {e}")
+                    self._record_result(0, len(operations), str(e))
+                    break
+
+    def _record_result(self, written, failed, error=None):
+        with self._lock:
+            self._written += written
+            self._failed += failed
+            self._flushes += 1
+            self._last_flush_at = time.time()
+            if error:
+                self._last_error = error
+
+    def _execute(self, collection, operations):
+        """Write operations to collection. Returns the number of records rejected by the server."""
+        if all(isinstance(op, dict) for op in operations):
+            # Unordered: one bad record must not block the rest of the batch
+            try:
+                collection.insert_many(operations, ordered=False)
+                return 0
+            except BulkWriteError as e:
+                self._last_error = str(e.details.get('writeErrors', [{}])[0].get('errmsg'))
+                return len(e.details.get('writeErrors', []))
+
+        # Ordered so updates to one document apply in order; a rejected
+        # operation is skipped and the rest of the batch resumes after it
+        requests = [InsertOne(op) if isinstance(op, dict) else op for op in operations]
+        failed = 0
+        while requests:
+            try:
+                collection.bulk_write(requests, ordered=True)
+                break
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors', [])
+                if not errors:
+                    raise
+                failed += 1
+                self._last_error = str(errors[0].get('errmsg'))
+                requests = requests[errors[0]['index'] + 1:]
+        return failed
+
+    def _write_through(self, collection, operation):
+        try:
+            failed = self._execute(collection, [operation])
+            error = None
+        except Exception as e:
+            failed, error = 1, str(e)
+        with self._lock:
+            self._written += 1 - failed
+            self._failed += failed
+            if error:
+                self._last_error = error
+        return not failed
+
+
+# Global instance shared by the logging collections of this worker
+log_writer = BufferedLogWriter(
+    max_queue=int(os.getenv('LOG_WRITER_MAX_QUEUE', '10000')),
+    batch_size=int(os.getenv('LOG_WRITER_BATCH_SIZE', '500')),
+    flush_interval=float(os.getenv('LOG_WRITER_FLUSH_SECONDS', '1.0')),
+    drop_policy=os.getenv('LOG_WRITER_DROP_POLICY', DROP_NEWEST)
+)
+
+# Flush on interpreter exit (gunicorn worker shutdown, Ctrl+C in development)
+atexit.register(log_writer.close)
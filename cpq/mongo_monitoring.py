@@ -0,0 +1,393 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from pymongo import monitoring
+
+# Commands whose filter can be shaped and explained, mapped to where the filter lives
+EXPLAINABLE_COMMANDS = {
+    'find': 'filter',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+    'aggregate': 'pipeline',
+    'update': 'updates',
+    'delete': 'deletes',
+}
+
+# Fields pymongo adds to every command that explain must not receive
+_SESSION_FIELDS = {'lsid', '$clusterTime', '$db', '$readPreference', 'txnNumber',
+                   'readConcern', 'writeConcern', 'maxTimeMS', 'comment', 'cursor'}
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Upper bounds of the commands-per-request histogram
+COMMAND_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def filter_shape(value):
+    """Replace literal values with '?' so filters group by structure, not data.
+
+    {'client.email': 'a@b.com', 'status': {'$in': ['x', 'y']}}
+        -> {'client.email': '?', 'status': {'$in': '?'}}
+    """
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, dict) for item in value):
+        return [filter_shape(item) for item in value]
+    return '?'
+
+
+def extract_filter(command_name, command):
+    """Get the query filter of a command (first $match stage for aggregations)"""
+    field = EXPLAINABLE_COMMANDS.get(command_name)
+    if not field:
+        return None
+    value = command.get(field)
+    if command_name == 'aggregate':
+        for stage in value or []:
+            if '$match' in stage:
+                return stage['$match']
+        return {}
+    if command_name in ('update', 'delete'):
+        statements = value or []
+        return statements[0].get('q', {}) if statements else {}
+    return value or {}
+
+
+def summarize_plan(explain_result):
+    """Summarize an explain() result as the scan type and indexes of its winning plan"""
+    stages = []
+    indexes = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if 'stage' in node:
+                stages.append(node['stage'])
+            if 'indexName' in node:
+                indexes.append(node['indexName'])
+            for key, child in node.items():
+                if key in ('rejectedPlans',):
+                    continue
+                walk(child)
+        elif isinstance(node, list):
+            for child in node:
+                walk(child)
+
+    def find_winning_plans(node):
+        if isinstance(node, dict):
+            if 'winningPlan' in node:
+                walk(node['winningPlan'])
+            for key, child in node.items():
+                if key != 'winningPlan':
+                    find_winning_plans(child)
+        elif isinstance(node, list):
+            for child in node:
+                find_winning_plans(child)
+
+    find_winning_plans(explain_result)
+
+    if 'COLLSCAN' in stages:
+        scan = 'COLLSCAN'
+    elif 'IXSCAN' in stages or 'IDHACK' in stages or 'EXPRESS_IXSCAN' in stages:
+        scan = 'IXSCAN'
+    else:
+        scan = stages[-1] if stages else 'UNKNOWN'
+
+    return {'scan': scan, 'stages': stages, 'indexes': sorted(set(indexes))}
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and max"""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'avg': round(self.total / self.count, 3) if self.count else 0,
+            'max': round(self.max, 3),
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+
+class RequestMongoStats:
+    """Mongo activity of a single Flask request"""
+
+    def __init__(self):
+        self.command_count = 0
+        self.total_ms = 0.0
+        self.slowest = None
+
+    def record(self, command_name, collection, duration_ms, shape):
+        self.command_count += 1
+        self.total_ms += duration_ms
+        if self.slowest is None or duration_ms > self.slowest['duration_ms']:
+            self.slowest = {
+                'command': command_name,
+                'collection': collection,
+                'duration_ms': round(duration_ms, 3),
+                'filter_shape': shape
+            }
+
+
+class MongoCommandMonitor(monitoring.CommandListener):
+    """pymongo CommandListener recording round trips per Flask request.
+
+    pymongo publishes started/succeeded events on the thread that runs the
+    command, so per-request stats live in a thread-local opened by
+    ``begin_request`` and closed by ``end_request``. Commands slower than
+    ``slow_query_ms`` are explained on a background thread (once per
+    collection and filter shape) and logged with their plan summary.
+    """
+
+    def __init__(self, slow_query_ms=100.0, max_slow_queries=200, explain_ttl_seconds=600):
+        self.slow_query_ms = slow_query_ms
+        self.explain_ttl_seconds = explain_ttl_seconds
+        self.client = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._endpoint_stats = {}
+        self._collection_stats = {}
+        self._slow_queries = deque(maxlen=max_slow_queries)
+        self._explained = {}
+        self._explain_queue = queue.Queue(maxsize=100)
+        self._explain_thread = None
+
+    def attach(self, client):
+        """Give the monitor the client used to run explain() on slow commands"""
+        self.client = client
+
+    def ignore_current_thread(self):
+        """Stop recording commands issued by the calling (background) thread"""
+        self._local.suppressed = True
+
+    # --- CommandListener interface -------------------------------------
+
+    def started(self, event):
+        if getattr(self._local, 'suppressed', False):
+            return
+        pending = self._pending()
+        command = event.command
+        collection = command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = command.get('collection')
+        pending[(event.request_id, event.connection_id)] = (
+            collection if isinstance(collection, str) else None,
+            command if event.command_name in EXPLAINABLE_COMMANDS else None
+        )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    # --- Flask request scope -------------------------------------------
+
+    def begin_request(self):
+        self._local.request = RequestMongoStats()
+
+    def end_request(self, endpoint):
+        """Close the current request's stats and fold them into the endpoint histograms"""
+        stats = getattr(self._local, 'request', None)
+        self._local.request = None
+        if stats is None:
+            return None
+        endpoint = endpoint or 'unknown'
+        with self._lock:
+            entry = self._endpoint_stats.get(endpoint)
+            if entry is None:
+                entry = self._endpoint_stats[endpoint] = {
+                    'requests': 0,
+                    'mongo_ms': Histogram(),
+                    'commands': Histogram(COMMAND_COUNT_BUCKETS),
+                    'slowest': None
+                }
+            entry['requests'] += 1
+            entry['mongo_ms'].observe(stats.total_ms)
+            entry['commands'].observe(stats.command_count)
+            if stats.slowest and (entry['slowest'] is None or
+                                  stats.slowest['duration_ms'] > entry['slowest']['duration_ms']):
+                entry['slowest'] = stats.slowest
+        return stats
+
+    def init_app(self, app):
+        """Open and close request stats around every Flask request"""
+        from flask import request
+
+        @app.before_request
+        def _mongo_begin_request():
+            self.begin_request()
+
+        @app.after_request
+        def _mongo_end_request(response):
+            stats = self.end_request(request.endpoint)
+            if stats is not None:
+                response.headers['X-Mongo-Commands'] = str(stats.command_count)
+                response.headers['X-Mongo-Time-Ms'] = f"{stats.total_ms:.1f}"
+            return response
+
+    # --- Reporting ------------------------------------------------------
+
+    def get_metrics(self):
+        """Aggregated per-endpoint and per-collection histograms plus recent slow queries"""
+        with self._lock:
+            return {
+                'slow_query_ms': self.slow_query_ms,
+                'endpoints': {
+                    name: {
+                        'requests': entry['requests'],
+                        'mongo_ms': entry['mongo_ms'].to_dict(),
+                        'commands_per_request': entry['commands'].to_dict(),
+                        'slowest_command': entry['slowest']
+                    }
+                    for name, entry in self._endpoint_stats.items()
+                },
+                'collections': {
+                    name: {
+                        'commands': entry['commands'],
+                        'duration_ms': entry['duration_ms'].to_dict()
+                    }
+                    for name, entry in self._collection_stats.items()
+                },
+                'slow_queries': list(self._slow_queries)
+            }
+
+    def reset(self):
+        """Clear all aggregated metrics"""
+        with self._lock:
+            self._endpoint_stats.clear()
+            self._collection_stats.clear()
+            self._slow_queries.clear()
+            self._explained.clear()
+
+    # --- Internals --------------------------------------------------------
+
+    def _pending(self):
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            pending = self._local.pending = {}
+        return pending
+
+    def _finish(self, event):
+        if getattr(self._local, 'suppressed', False):
+            return
+        collection, command = self._pending().pop((event.request_id, event.connection_id), (None, None))
+        duration_ms = event.duration_micros / 1000.0
+        shape = None
+        if command is not None:
+            shape = filter_shape(extract_filter(event.command_name, command))
+
+        stats = getattr(self._local, 'request', None)
+        if stats is not None:
+            stats.record(event.command_name, collection, duration_ms, shape)
+
+        key = collection or f"<{event.command_name}>"
+        with self._lock:
+            entry = self._collection_stats.get(key)
+            if entry is None:
+                entry = self._collection_stats[key] = {'commands': {}, 'duration_ms': Histogram()}
+            entry['commands'][event.command_name] = entry['commands'].get(event.command_name, 0) + 1
+            entry['duration_ms'].observe(duration_ms)
+
+        if duration_ms >= self.slow_query_ms and command is not None:
+            self._queue_explain(event.database_name, event.command_name, collection, command, duration_ms, shape)
+
+    def _queue_explain(self, database_name, command_name, collection, command, duration_ms, shape):
+        slow_query = {
+            'command': command_name,
+            'collection': collection,
+            'duration_ms': round(duration_ms, 3),
+            'filter_shape': shape,
+            'plan': None,
+            'at': time.time()
+        }
+        explain_key = (collection, command_name, repr(shape))
+        with self._lock:
+            cached = self._explained.get(explain_key)
+            if cached and time.time() - cached['at'] < self.explain_ttl_seconds:
+                slow_query['plan'] = cached['plan']
+                self._slow_queries.append(slow_query)
+                self._log_slow_query(slow_query)
+                return
+
+        if self.client is None:
+            with self._lock:
+                self._slow_queries.append(slow_query)
+            self._log_slow_query(slow_query)
+            return
+
+        self._ensure_explain_thread()
+        explain_command = {k: v for k, v in command.items() if k not in _SESSION_FIELDS}
+        if command_name == 'aggregate':
+            explain_command['cursor'] = {}
+        elif command_name in ('update', 'delete'):
+            # Explained write batches must hold a single statement
+            field = EXPLAINABLE_COMMANDS[command_name]
+            explain_command[field] = list(explain_command.get(field) or [])[:1]
+        try:
+            self._explain_queue.put_nowait((database_name, explain_command, explain_key, slow_query))
+        except queue.Full:
+            # Never block the request thread on diagnostics
+            with self._lock:
+                self._slow_queries.append(slow_query)
+            self._log_slow_query(slow_query)
+
+    def _ensure_explain_thread(self):
+        if self._explain_thread is None or not self._explain_thread.is_alive():
+            self._explain_thread = threading.Thread(
+                target=self._explain_worker, name='mongo-slow-query-explain', daemon=True
+            )
+            self._explain_thread.start()
+
+    def _explain_worker(self):
+        # Commands issued by explain() itself must not be recorded
+        self.ignore_current_thread()
+        while True:
+            database_name, explain_command, explain_key, slow_query = self._explain_queue.get()
+            try:
+                result = self.client[database_name].command(
+                    {'explain': explain_command, 'verbosity': 'queryPlanner'}
+                )
+                slow_query['plan'] = summarize_plan(result)
+            except Exception as e:
+                slow_query['plan'] = {'scan': 'UNKNOWN', 'error': str(e)}
+            with self._lock:
+                self._explained[explain_key] = {'plan': slow_query['plan'], 'at': time.time()}
+                self._slow_queries.append(slow_query)
+            self._log_slow_query(slow_query)
+
+    def _log_slow_query(self, slow_query):
+        plan = slow_query.get('plan') or {}
+        indexes = f" via {', '.join(plan['indexes'])}" if plan.get('indexes') else ''
+        print(f"🐢 Slow Mongo {slow_query['command']} on {slow_query['collection']}: "
+              f"{slow_query['duration_ms']:.1f}ms filter={slow_query['filter_shape']} "
+              f"plan={plan.get('scan', 'n/a')}{indexes}")
+
+
+# Global instance registered on the shared MongoClient in cpq.db
+command_monitor = MongoCommandMonitor(
+    slow_query_ms=float(os.getenv('MONGO_SLOW_QUERY_MS', '100'))
+)
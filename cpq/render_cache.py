@@ -0,0 +1,210 @@
+"""Cache of rendered PDFs, keyed by a hash of everything the render depends on.
+
+A key is the SHA-256 of the render job's name, its normalized inputs (or an
+explicit key such as template id + version + template data + plan), the
+renderer version and today's date, since several layouts print the date.
+The same inputs therefore map to the same bytes, and anything relevant
+changing produces a new key; stale entries simply age out.
+
+Two tiers, each evicting least-recently-used entries by total bytes:
+
+    memory  hot entries for this worker   RENDER_CACHE_MEMORY_MB (default 64)
+    disk    warm entries shared by the    RENDER_CACHE_DISK_MB (default 512,
+            workers on this host          0 disables) under RENDER_CACHE_DIR
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+from templates.pdf_renderer import RENDERER_VERSION
+
+RENDER_CACHE_MEMORY_MB = float(os.getenv('RENDER_CACHE_MEMORY_MB', '64'))
+RENDER_CACHE_DISK_MB = float(os.getenv('RENDER_CACHE_DISK_MB', '512'))
+RENDER_CACHE_DIR = os.getenv('RENDER_CACHE_DIR', 'render_cache')
+
+
+def _normalize(value):
+    """JSON fallback for values in render inputs"""
+    if isinstance(value, (bytes, bytearray)):
+        return hashlib.sha256(value).hexdigest()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, set):
+        return sorted(value, key=str)
+    return str(value)
+
+
+def render_key(job, inputs):
+    """Cache key for a render job and its inputs"""
+    payload = json.dumps([job, inputs, RENDERER_VERSION, date.today().isoformat()],
+                         sort_keys=True, default=_normalize, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """Two-tier LRU cache of rendered PDF bytes"""
+
+    def __init__(self, memory_bytes=int(RENDER_CACHE_MEMORY_MB * 1024 * 1024),
+                 disk_bytes=int(RENDER_CACHE_DISK_MB * 1024 * 1024), directory=RENDER_CACHE_DIR):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._size = 0
+        self._disk_size = None  # estimate, rescanned when it passes the budget
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._disk_evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key):
+        """Cached bytes for key, or None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+        if data is not None:
+            self._touch(key)
+            return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._remember(key, data)
+        self._write_disk(key, data)
+
+    def _remember(self, key, data):
+        """Add to the memory tier; caller holds the lock"""
+        if len(data) > self.memory_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._evictions += 1
+
+    def _touch(self, key):
+        """Mark a disk entry as recently used; mtime is the disk tier's LRU clock"""
+        if self.disk_bytes > 0:
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+
+    def _read_disk(self, key):
+        if self.disk_bytes <= 0:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Render cache read failed for {key}: {str(e)}")
+            return None
+
+    def _write_disk(self, key, data):
+        if self.disk_bytes <= 0 or len(data) > self.disk_bytes:
+            return
+        path = self._path(key)
+        try:
+            if os.path.exists(path):
+                os.utime(path)
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            with self._lock:
+                if self._disk_size is not None:
+                    self._disk_size += len(data)
+            self._evict_disk()
+        except Exception as e:
+            print(f"⚠️ Render cache write failed for {key}: {str(e)}")
+
+    def _evict_disk(self):
+        """Delete least recently used files until the directory fits the budget.
+
+        Other workers write to the same directory, so the size is an estimate
+        that is corrected by a rescan whenever it exceeds the budget.
+        """
+        with self._lock:
+            if self._disk_size is not None and self._disk_size <= self.disk_bytes:
+                return
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith('.pdf'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    self._disk_evictions += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._disk_size = total
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._disk_size = None
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith('.pdf'):
+                    os.remove(entry.path)
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'memory_bytes': self._size,
+                'memory_limit_bytes': self.memory_bytes,
+                'disk_bytes': self._disk_size,
+                'disk_limit_bytes': self.disk_bytes,
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'hit_rate': round((self._hits + self._disk_hits) / lookups, 3) if lookups else None,
+                'evictions': self._evictions,
+                'disk_evictions': self._disk_evictions,
+            }
+
+
+# Global instance used by the render service of this worker
+render_cache = RenderCache()
@@ -0,0 +1,351 @@
+"""Process pool for PDF rendering.
+
+ReportLab and WeasyPrint are pure CPU work that holds the GIL for the whole
+render, so a render on a gunicorn worker thread stalls every other request
+that worker is serving. Renders run in a small pool of pre-warmed worker
+processes instead: the web side sends the job's inputs, waits for the PDF
+bytes and stays free to serve other requests.
+
+Workers are separate interpreters started with ``python -m
+cpq.render_service --worker``, so they never re-import app.py or inherit its
+threads and sockets. Each one imports the renderers before taking its first
+job. A worker that runs past its job's timeout is killed and replaced.
+Output of jobs that depend only on their inputs is kept in the render cache
+(cpq/render_cache.py), so repeated renders skip the pool entirely.
+
+    RENDER_POOL_SIZE        worker processes per web worker (default 1,
+                            0 renders inline)
+    RENDER_TIMEOUT_SECONDS  default per-job timeout
+
+The pool is per web worker: app.py starts one at import, so every gunicorn
+worker has its own and a host runs workers × RENDER_POOL_SIZE render
+processes (4 with the Procfile's --workers 4). Size it against the host's
+cores with that in mind.
+"""
+
+import argparse
+import atexit
+import importlib
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import Connection
+
+from cpq.render_cache import render_cache, render_key
+
+RENDER_POOL_SIZE = int(os.getenv('RENDER_POOL_SIZE', '1'))
+RENDER_TIMEOUT_SECONDS = float(os.getenv('RENDER_TIMEOUT_SECONDS', '60'))
+# How long a new worker may take to import the renderers
+WORKER_STARTUP_SECONDS = 60
+
+# The only jobs a worker will run, by name
+RENDER_JOBS = {
+    'template_pdf': 'templates.pdf_renderer:render_template_pdf',
+    'template_plan_pdf': 'templates.pdf_renderer:render_template_plan_pdf',
+    'quote_pdf': 'templates.pdf_renderer:render_quote_pdf',
+    'html_pdf': 'templates.pdf_renderer:render_html_pdf',
+    'signature_certificate_pdf': 'templates.pdf_renderer:render_signature_certificate_pdf',
+}
+
+# Jobs whose output depends only on their inputs (and the date), so their
+# bytes can be served from the render cache
+CACHED_JOBS = {'template_pdf', 'template_plan_pdf', 'quote_pdf', 'html_pdf'}
+
+# Optional heavy dependencies imported up front so the first job doesn't pay for them
+PREWARM_MODULES = ('weasyprint',)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RenderError(Exception):
+    """A render worker died or could not be started"""
+
+
+class RenderTimeout(RenderError):
+    """A render job did not finish within its timeout"""
+
+
+def _load_job(name):
+    module_name, function_name = RENDER_JOBS[name].split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class _Worker:
+    """One render process and the pipes to it"""
+
+    def __init__(self):
+        jobs_read, jobs_write = os.pipe()
+        results_read, results_write = os.pipe()
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [PROJECT_ROOT, env.get('PYTHONPATH')]))
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, '-m', 'cpq.render_service', '--worker', str(jobs_read), str(results_write)],
+                pass_fds=(jobs_read, results_write),
+                cwd=PROJECT_ROOT,
+                env=env
+            )
+        except Exception:
+            os.close(jobs_write)
+            os.close(results_read)
+            raise
+        finally:
+            # The child holds its own copies of these ends
+            os.close(jobs_read)
+            os.close(results_write)
+        self.jobs = Connection(jobs_write, readable=False)
+        self.results = Connection(results_read, writable=False)
+        self.ready = False
+
+    def _receive(self, timeout):
+        if not self.results.poll(max(timeout, 0)):
+            raise RenderTimeout(f"Render worker {self.process.pid} did not answer within {timeout:.1f}s")
+        try:
+            return self.results.recv()
+        except (EOFError, OSError) as e:
+            raise RenderError(f"Render worker {self.process.pid} exited: {e}")
+
+    def call(self, job, args, kwargs, timeout):
+        """Run a job; returns ('ok', bytes) or ('error', exception)"""
+        if not self.ready:
+            self._receive(WORKER_STARTUP_SECONDS)
+            self.ready = True
+        try:
+            self.jobs.send((job, args, kwargs))
+        except (BrokenPipeError, OSError) as e:
+            raise RenderError(f"Render worker {self.process.pid} exited: {e}")
+        return self._receive(timeout)
+
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                # Closing the job pipe makes the worker exit after its current job
+                self.jobs.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+        for conn in (self.jobs, self.results):
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+class RenderService:
+    """Dispatches render jobs to a pool of worker processes.
+
+    ``render`` blocks the calling thread until the job's bytes come back,
+    raising RenderTimeout if that takes longer than the timeout. An exception
+    raised by the job itself is re-raised in the caller, so callers keep
+    their existing ``except ImportError`` fallbacks.
+    """
+
+    def __init__(self, size=RENDER_POOL_SIZE, timeout=RENDER_TIMEOUT_SECONDS, cache=None):
+        self.size = size
+        self.timeout = timeout
+        self.cache = cache
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._pid = None
+        self._inline = size <= 0
+
+        self._jobs = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._restarts = 0
+        self._total_seconds = 0.0
+        self._last_error = None
+
+    def start(self):
+        """Start and pre-warm the workers (once per process)"""
+        if self._inline or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._inline or self._pid == os.getpid():
+                return
+            # Workers started before a fork belong to the parent
+            self._idle = queue.Queue()
+            self._workers = []
+            try:
+                for _ in range(self.size):
+                    worker = _Worker()
+                    self._workers.append(worker)
+                    self._idle.put(worker)
+            except Exception as e:
+                print(f"⚠️ Render workers unavailable, rendering inline: {str(e)}")
+                for worker in self._workers:
+                    worker.stop(kill=True)
+                self._workers = []
+                self._inline = True
+                return
+            self._pid = os.getpid()
+            atexit.register(self.close)
+            print(f"🖨️ Started {self.size} render workers for pid {self._pid}")
+
+    def render(self, job, *args, timeout=None, cache_key=None, **kwargs):
+        """Run a render job in a worker and return its bytes.
+
+        Cacheable jobs are served from the render cache when their inputs
+        match an earlier render. cache_key, if given, stands in for the
+        inputs when computing the key (e.g. a template's id and version
+        instead of its blocks).
+        """
+        if job not in RENDER_JOBS:
+            raise ValueError(f"Unknown render job: {job}")
+        if self.cache is None or job not in CACHED_JOBS:
+            return self._render(job, args, kwargs, timeout)
+
+        key = render_key(job, cache_key if cache_key is not None else [args, kwargs])
+        pdf = self.cache.get(key)
+        if pdf is None:
+            pdf = self._render(job, args, kwargs, timeout)
+            self.cache.put(key, pdf)
+        return pdf
+
+    def _render(self, job, args, kwargs, timeout):
+        timeout = self.timeout if timeout is None else timeout
+        self.start()
+        started = time.monotonic()
+        try:
+            if self._inline:
+                return _load_job(job)(*args, **kwargs)
+            return self._dispatch(job, args, kwargs, timeout, started)
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+                self._last_error = f"{job}: {type(e).__name__}: {e}"
+            raise
+        finally:
+            with self._lock:
+                self._jobs += 1
+                self._total_seconds += time.monotonic() - started
+
+    def _dispatch(self, job, args, kwargs, timeout, started):
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise RenderTimeout(f"No render worker free within {timeout:.1f}s")
+        if worker is None:
+            # The last worker could not be restarted; pass the marker on to the next waiter
+            self._idle.put(None)
+            return _load_job(job)(*args, **kwargs)
+
+        try:
+            status, payload = worker.call(job, args, kwargs, timeout - (time.monotonic() - started))
+        except RenderError as e:
+            if isinstance(e, RenderTimeout):
+                with self._lock:
+                    self._timeouts += 1
+            print(f"⚠️ Replacing render worker {worker.process.pid}: {str(e)}")
+            worker = self._replace(worker)
+            raise
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+
+        if status == 'error':
+            raise payload
+        return payload
+
+    def _replace(self, worker):
+        """Start a worker in place of a dead one; None if that fails.
+
+        When no workers are left the service renders inline, the way
+        ``start`` does when the pool cannot be created. A None put on the
+        idle queue wakes requests already waiting for a worker.
+        """
+        worker.stop(kill=True)
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            try:
+                replacement = _Worker()
+            except Exception as e:
+                print(f"❌ Could not restart render worker: {str(e)}")
+                if not self._workers:
+                    print("⚠️ No render workers left, rendering inline")
+                    self._inline = True
+                    self._idle.put(None)
+                return None
+            self._workers.append(replacement)
+            self._restarts += 1
+            return replacement
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._pid = None
+        for worker in workers:
+            worker.stop()
+
+    def get_status(self):
+        with self._lock:
+            status = {
+                'mode': 'inline' if self._inline else 'pool',
+                'size': self.size,
+                'workers': [w.process.pid for w in self._workers],
+                'idle': self._idle.qsize(),
+                'timeout_seconds': self.timeout,
+                'jobs': self._jobs,
+                'failed': self._failed,
+                'timeouts': self._timeouts,
+                'restarts': self._restarts,
+                'avg_seconds': round(self._total_seconds / self._jobs, 3) if self._jobs else None,
+                'last_error': self._last_error,
+            }
+        status['cache'] = self.cache.get_stats() if self.cache is not None else None
+        return status
+
+
+def _run_worker(jobs_fd, results_fd):
+    """Worker loop: pre-warm, then run jobs until the job pipe closes"""
+    jobs = Connection(jobs_fd, writable=False)
+    results = Connection(results_fd, readable=False)
+
+    functions = {name: _load_job(name) for name in RENDER_JOBS}
+    for module_name in PREWARM_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except Exception:
+            pass
+    results.send(('ready', None))
+
+    while True:
+        try:
+            job, args, kwargs = jobs.recv()
+        except (EOFError, OSError):
+            return 0
+        try:
+            results.send(('ok', functions[job](*args, **kwargs)))
+        except Exception as e:
+            if not isinstance(e, ImportError):
+                traceback.print_exc()
+            try:
+                results.send(('error', e))
+            except Exception:
+                # The exception itself could not be pickled
+                results.send(('error', RenderError(f"{type(e).__name__}: {e}")))
+
+
+# Global instance shared by the request threads of this worker
+render_service = RenderService(cache=render_cache)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PDF render worker (started by RenderService)')
+    parser.add_argument('--worker', nargs=2, type=int, metavar=('JOBS_FD', 'RESULTS_FD'), required=True)
+    args = parser.parse_args(argv)
+    return _run_worker(*args.worker)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
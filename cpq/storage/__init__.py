@@ -0,0 +1,4 @@
+from .repository import Repository
+from .memory import MemoryDatabase, MemoryRepository
+
+__all__ = ["Repository", "MemoryDatabase", "MemoryRepository"]
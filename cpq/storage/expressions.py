@@ -0,0 +1,708 @@
+"""Query, update and aggregation semantics for the in-memory backend.
+
+Covers the MongoDB subset the collection classes use. Documents are plain
+dicts; nothing here knows about storage or locking.
+"""
+
+import copy
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from bson import ObjectId
+from bson.int64 import Int64
+from pymongo.errors import OperationFailure
+
+
+class _Missing:
+    """Marker for a path that does not exist in a document"""
+
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+# BSON comparison order between types (numbers compare with each other)
+_TYPE_ORDER = [
+    (type(None), 1), (bool, 8), (int, 2), (float, 2), (Int64, 2), (Decimal, 2), (str, 3),
+    (dict, 4), (list, 5), (bytes, 6), (ObjectId, 7), (datetime, 9), (re.Pattern, 11),
+]
+
+
+def _type_rank(value):
+    if value is MISSING:
+        return 1
+    for value_type, rank in _TYPE_ORDER:
+        if isinstance(value, value_type):
+            return rank
+    return 100
+
+
+def sort_key(value):
+    """Total order matching MongoDB's cross-type comparison"""
+    rank = _type_rank(value)
+    if rank == 1:
+        return (rank, 0)
+    if rank == 4:
+        return (rank, [(key, sort_key(item)) for key, item in value.items()])
+    if rank == 5:
+        return (rank, [sort_key(item) for item in value])
+    if rank == 8:
+        return (rank, int(value))
+    if rank == 11:
+        return (rank, value.pattern)
+    return (rank, value)
+
+
+def compare(a, b):
+    ka, kb = sort_key(a), sort_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+# --- Paths ---------------------------------------------------------------
+
+def get_path(doc, path):
+    """Value at a dotted path, or MISSING. Numeric parts index into lists."""
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else MISSING
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+def _query_values(doc, parts):
+    """Candidate values for a query path, descending into arrays like MongoDB does"""
+    if not parts:
+        return [doc]
+    head, rest = parts[0], parts[1:]
+    if isinstance(doc, dict):
+        if head not in doc:
+            return [MISSING]
+        return _query_values(doc[head], rest)
+    if isinstance(doc, list):
+        if head.isdigit():
+            index = int(head)
+            return _query_values(doc[index], rest) if index < len(doc) else [MISSING]
+        values = []
+        for item in doc:
+            if isinstance(item, (dict, list)):
+                values.extend(value for value in _query_values(item, parts) if value is not MISSING)
+        return values or [MISSING]
+    return [MISSING]
+
+
+def set_path(doc, path, value):
+    parts = path.split('.')
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+            continue
+        child = target.get(part)
+        if not isinstance(child, (dict, list)):
+            child = {}
+            target[part] = child
+        target = child
+    if isinstance(target, list):
+        index = int(parts[-1])
+        while len(target) <= index:
+            target.append(None)
+        target[index] = value
+    else:
+        target[parts[-1]] = value
+
+
+def unset_path(doc, path):
+    parts = path.split('.')
+    target = get_path(doc, '.'.join(parts[:-1])) if len(parts) > 1 else doc
+    if isinstance(target, dict):
+        target.pop(parts[-1], None)
+    elif isinstance(target, list) and parts[-1].isdigit() and int(parts[-1]) < len(target):
+        target[int(parts[-1])] = None
+
+
+# --- Query matching --------------------------------------------------------
+
+def matches(doc, query):
+    """Whether doc satisfies a find() filter"""
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$or':
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$nor':
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$expr':
+            if not truthy(evaluate(condition, doc)):
+                return False
+        elif key.startswith('$'):
+            raise OperationFailure(f"unknown top level operator: {key}", code=2)
+        elif not _match_field(doc, key, condition):
+            return False
+    return True
+
+
+def _is_operator_dict(condition):
+    return isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition)
+
+
+def _match_field(doc, path, condition):
+    values = _query_values(doc, path.split('.'))
+    if _is_operator_dict(condition):
+        options = condition.get('$options', '')
+        for operator, operand in condition.items():
+            if operator == '$options':
+                continue
+            if not _match_operator(values, operator, operand, options, doc, path):
+                return False
+        return True
+    return _match_equal(values, condition)
+
+
+def _values_with_arrays(values):
+    """Values plus the elements of any array values"""
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def _match_equal(values, expected):
+    if isinstance(expected, re.Pattern):
+        return any(isinstance(v, str) and expected.search(v) for v in _values_with_arrays(values))
+    for value in _values_with_arrays(values):
+        if expected is None and value in (None, MISSING):
+            return True
+        if value is not MISSING and compare(value, expected) == 0:
+            return True
+    return False
+
+
+def _compile_regex(pattern, options):
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    for option, flag in (('i', re.IGNORECASE), ('m', re.MULTILINE), ('s', re.DOTALL), ('x', re.VERBOSE)):
+        if option in options:
+            flags |= flag
+    return re.compile(pattern, flags)
+
+
+def _comparable(a, b):
+    return _type_rank(a) == _type_rank(b)
+
+
+def _bson_type(value):
+    """$type alias of a Python value"""
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, Int64):
+        return 'long'
+    if isinstance(value, int):
+        return 'int' if -2**31 <= value < 2**31 else 'long'
+    for kind, alias in ((float, 'double'), (str, 'string'), (dict, 'object'), (list, 'array'),
+                        (bytes, 'binData'), (ObjectId, 'objectId'), (datetime, 'date')):
+        if isinstance(value, kind):
+            return alias
+    return type(value).__name__
+
+
+def _match_operator(values, operator, operand, options, doc, path):
+    if operator == '$eq':
+        return _match_equal(values, operand)
+    if operator == '$ne':
+        return not _match_equal(values, operand)
+    if operator in ('$gt', '$gte', '$lt', '$lte'):
+        for value in _values_with_arrays(values):
+            if value is MISSING or not _comparable(value, operand):
+                continue
+            result = compare(value, operand)
+            if ((operator == '$gt' and result > 0) or (operator == '$gte' and result >= 0)
+                    or (operator == '$lt' and result < 0) or (operator == '$lte' and result <= 0)):
+                return True
+        return False
+    if operator == '$in':
+        return any(_match_equal(values, item) for item in operand)
+    if operator == '$nin':
+        return not any(_match_equal(values, item) for item in operand)
+    if operator == '$exists':
+        return any(value is not MISSING for value in values) == bool(operand)
+    if operator == '$regex':
+        regex = _compile_regex(operand, options)
+        return any(isinstance(v, str) and regex.search(v) for v in _values_with_arrays(values))
+    if operator == '$not':
+        if isinstance(operand, re.Pattern):
+            return not _match_equal(values, operand)
+        return not _match_field(doc, path, operand)
+    if operator == '$type':
+        types = operand if isinstance(operand, list) else [operand]
+        return any(value is not MISSING and _bson_type(value) in types for value in values)
+    if operator == '$size':
+        return any(isinstance(v, list) and len(v) == operand for v in values)
+    if operator == '$all':
+        return all(_match_equal(values, item) for item in operand)
+    if operator == '$elemMatch':
+        for value in values:
+            if isinstance(value, list):
+                for item in value:
+                    if _is_operator_dict(operand):
+                        if _match_field({'v': item}, 'v', operand):
+                            return True
+                    elif isinstance(item, dict) and matches(item, operand):
+                        return True
+        return False
+    raise OperationFailure(f"unknown operator: {operator}", code=2)
+
+
+# --- Updates -----------------------------------------------------------------
+
+def equality_fields(query):
+    """Fields an upsert copies from its filter (plain equalities, also inside $and)"""
+    fields = {}
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            for sub in condition:
+                fields.update(equality_fields(sub))
+        elif not key.startswith('$'):
+            if _is_operator_dict(condition):
+                if '$eq' in condition:
+                    fields[key] = condition['$eq']
+            else:
+                fields[key] = condition
+    return fields
+
+
+def is_pipeline_update(update):
+    return isinstance(update, list)
+
+
+def is_replacement(update):
+    return isinstance(update, dict) and not any(key.startswith('$') for key in update)
+
+
+def apply_update(doc, update, inserting=False):
+    """Apply an update document or pipeline to doc in place"""
+    if is_pipeline_update(update):
+        result = run_stages([doc], update, None)[0]
+        doc.clear()
+        doc.update(result)
+        return
+
+    for operator, fields in update.items():
+        if operator == '$setOnInsert' and not inserting:
+            continue
+        for path, value in fields.items():
+            if operator in ('$set', '$setOnInsert'):
+                set_path(doc, path, copy.deepcopy(value))
+            elif operator == '$unset':
+                unset_path(doc, path)
+            elif operator == '$inc':
+                current = get_path(doc, path)
+                set_path(doc, path, (0 if current in (MISSING, None) else current) + value)
+            elif operator == '$mul':
+                current = get_path(doc, path)
+                set_path(doc, path, (0 if current in (MISSING, None) else current) * value)
+            elif operator in ('$min', '$max'):
+                current = get_path(doc, path)
+                if current is MISSING or (compare(value, current) < 0) == (operator == '$min'):
+                    set_path(doc, path, copy.deepcopy(value))
+            elif operator in ('$push', '$addToSet'):
+                current = get_path(doc, path)
+                if current is MISSING:
+                    current = []
+                    set_path(doc, path, current)
+                if not isinstance(current, list):
+                    raise OperationFailure(f"The field '{path}' must be an array", code=2)
+                items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                for item in items:
+                    if operator == '$push' or not any(compare(item, existing) == 0 for existing in current):
+                        current.append(copy.deepcopy(item))
+            elif operator == '$pull':
+                current = get_path(doc, path)
+                if isinstance(current, list):
+                    if isinstance(value, dict):
+                        current[:] = [item for item in current
+                                      if not (matches(item, value) if isinstance(item, dict)
+                                              else _match_field({'v': item}, 'v', value))]
+                    else:
+                        current[:] = [item for item in current if compare(item, value) != 0]
+            elif operator == '$currentDate':
+                set_path(doc, path, datetime.now())
+            else:
+                raise OperationFailure(f"Unknown modifier: {operator}", code=9)
+
+
+# --- Projection ----------------------------------------------------------------
+
+def project(doc, projection):
+    """Apply a find() projection (inclusion or exclusion, dotted paths)"""
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    include_id = bool(projection.get('_id', 1))
+    fields = {key: value for key, value in projection.items() if key != '_id'}
+    inclusive = any(not (value in (0, False)) for value in fields.values())
+
+    if inclusive:
+        result = {}
+        if include_id and '_id' in doc:
+            result['_id'] = doc['_id']
+        for path, spec in fields.items():
+            if isinstance(spec, dict):
+                # Computed fields ($literal etc.) as in aggregation $project
+                result[path] = evaluate(spec, doc)
+                continue
+            value = get_path(doc, path)
+            if value is not MISSING:
+                set_path(result, path, value)
+        return result
+
+    # Removing a nested field must not touch the stored document
+    result = copy.deepcopy(doc) if any('.' in path for path in fields) else copy.copy(doc)
+    for path in fields:
+        unset_path(result, path)
+    if not include_id:
+        result.pop('_id', None)
+    return result
+
+
+def sort_documents(docs, sort_spec):
+    """Sort by [(field, direction), ...], stable like MongoDB's per-key ordering"""
+    for field, direction in reversed(list(sort_spec)):
+        docs.sort(key=lambda doc: sort_key(_sort_value(doc, field, direction)), reverse=direction < 0)
+    return docs
+
+
+def _sort_value(doc, field, direction):
+    value = get_path(doc, field)
+    if isinstance(value, list) and value:
+        # Arrays sort by their smallest (ascending) or largest (descending) element
+        keyed = sorted(value, key=sort_key)
+        return keyed[0] if direction > 0 else keyed[-1]
+    return None if value is MISSING else value
+
+
+def normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(key, value) for key, value in key_or_list]
+
+
+# --- Aggregation expressions ---------------------------------------------------
+
+REMOVE = object()
+
+
+def truthy(value):
+    return value not in (None, False, 0, MISSING) and value is not REMOVE
+
+
+def evaluate(expression, doc, variables=None):
+    """Evaluate an aggregation expression against doc"""
+    if isinstance(expression, str) and expression.startswith('$$'):
+        name, _, rest = expression[2:].partition('.')
+        if name == 'ROOT' or name == 'CURRENT':
+            base = doc
+        elif name == 'REMOVE':
+            return REMOVE
+        elif variables and name in variables:
+            base = variables[name]
+        else:
+            raise OperationFailure(f"Use of undefined variable: {name}", code=17276)
+        return get_path(base, rest) if rest else base
+    if isinstance(expression, str) and expression.startswith('$'):
+        return get_path(doc, expression[1:])
+    if isinstance(expression, list):
+        return [_plain(evaluate(item, doc, variables)) for item in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1:
+            operator, operand = next(iter(expression.items()))
+            if operator.startswith('$'):
+                return _evaluate_operator(operator, operand, doc, variables)
+        return {key: _plain(evaluate(value, doc, variables)) for key, value in expression.items()}
+    return expression
+
+
+def _plain(value):
+    return None if value is MISSING else value
+
+
+def _args(operand, doc, variables):
+    operands = operand if isinstance(operand, list) else [operand]
+    return [evaluate(item, doc, variables) for item in operands]
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _evaluate_operator(operator, operand, doc, variables):
+    if operator == '$literal':
+        return operand
+    if operator == '$cond':
+        if isinstance(operand, dict):
+            condition, then, otherwise = operand['if'], operand['then'], operand['else']
+        else:
+            condition, then, otherwise = operand
+        return evaluate(then if truthy(evaluate(condition, doc, variables)) else otherwise, doc, variables)
+    if operator == '$ifNull':
+        args = operand if isinstance(operand, list) else [operand]
+        for item in args[:-1]:
+            value = evaluate(item, doc, variables)
+            if value not in (None, MISSING):
+                return value
+        return evaluate(args[-1], doc, variables)
+    if operator == '$switch':
+        for branch in operand['branches']:
+            if truthy(evaluate(branch['case'], doc, variables)):
+                return evaluate(branch['then'], doc, variables)
+        return evaluate(operand.get('default'), doc, variables)
+
+    args = _args(operand, doc, variables)
+    if operator in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte', '$cmp'):
+        a, b = (_plain(arg) for arg in args)
+        result = compare(a, b)
+        return {'$eq': result == 0, '$ne': result != 0, '$gt': result > 0, '$gte': result >= 0,
+                '$lt': result < 0, '$lte': result <= 0, '$cmp': result}[operator]
+    if operator == '$and':
+        return all(truthy(arg) for arg in args)
+    if operator == '$or':
+        return any(truthy(arg) for arg in args)
+    if operator == '$not':
+        return not truthy(args[0])
+    if operator == '$in':
+        return any(compare(args[0], item) == 0 for item in (args[1] or []))
+    if operator in ('$sum', '$avg', '$min', '$max'):
+        items = args[0] if len(args) == 1 and isinstance(args[0], list) else args
+        return accumulate(operator, items)
+    if operator == '$add':
+        dates = [arg for arg in args if isinstance(arg, datetime)]
+        total = sum(_number(arg) or 0 for arg in args)
+        return dates[0] + timedelta(milliseconds=total) if dates else total
+    if operator == '$subtract':
+        a, b = args
+        if a in (None, MISSING) or b in (None, MISSING):
+            return None
+        if isinstance(a, datetime) and isinstance(b, datetime):
+            return int((a - b).total_seconds() * 1000)
+        if isinstance(a, datetime):
+            return a - timedelta(milliseconds=b)
+        return a - b
+    if operator == '$multiply':
+        result = 1
+        for arg in args:
+            if arg in (None, MISSING):
+                return None
+            result *= arg
+        return result
+    if operator == '$divide':
+        a, b = args
+        if a in (None, MISSING) or b in (None, MISSING):
+            return None
+        return a / b
+    if operator == '$toDouble':
+        value = args[0]
+        if value in (None, MISSING, ''):
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise OperationFailure(f"Failed to parse number '{value}' in $convert", code=241)
+    if operator == '$toString':
+        value = args[0]
+        return None if value in (None, MISSING) else str(value)
+    if operator == '$concat':
+        if any(arg in (None, MISSING) for arg in args):
+            return None
+        return ''.join(args)
+    if operator == '$size':
+        return len(args[0])
+    if operator in ('$toLower', '$toUpper'):
+        value = args[0] if args[0] not in (None, MISSING) else ''
+        return value.lower() if operator == '$toLower' else value.upper()
+    if operator == '$arrayElemAt':
+        array, index = args
+        try:
+            return array[index]
+        except (IndexError, TypeError):
+            return MISSING
+    raise OperationFailure(f"Unrecognized expression '{operator}'", code=168)
+
+
+def accumulate(operator, values):
+    values = [value for value in values if value not in (None, MISSING)]
+    if operator == '$sum':
+        return sum(_number(value) or 0 for value in values)
+    if operator == '$avg':
+        numbers = [value for value in values if _number(value) is not None]
+        return sum(numbers) / len(numbers) if numbers else None
+    if operator in ('$min', '$max'):
+        if not values:
+            return None
+        ordered = sorted(values, key=sort_key)
+        return ordered[0] if operator == '$min' else ordered[-1]
+    raise OperationFailure(f"Unknown accumulator {operator}", code=15952)
+
+
+# --- Aggregation pipeline ------------------------------------------------------
+
+def _set_fields(doc, spec):
+    result = copy.deepcopy(doc)
+    for path, expression in spec.items():
+        value = evaluate(expression, doc)
+        if value is REMOVE:
+            unset_path(result, path)
+        elif value is not MISSING:
+            set_path(result, path, copy.deepcopy(value))
+    return result
+
+
+def _project_stage(doc, spec):
+    exclusions = [key for key, value in spec.items() if value in (0, False)]
+    if exclusions and len(exclusions) == len(spec):
+        return project(doc, spec)
+
+    result = {}
+    if spec.get('_id', 1) not in (0, False) and '_id' in doc:
+        result['_id'] = doc['_id']
+    for path, expression in spec.items():
+        if path == '_id' and expression in (0, False, 1, True):
+            continue
+        if expression in (1, True):
+            value = get_path(doc, path)
+        else:
+            value = evaluate(expression, doc)
+        if value is not MISSING and value is not REMOVE:
+            set_path(result, path, copy.deepcopy(value))
+    return result
+
+
+def _group(docs, spec):
+    groups = {}
+    order = []
+    for doc in docs:
+        key = _plain(evaluate(spec['_id'], doc))
+        hashable = repr(sort_key(key))
+        if hashable not in groups:
+            groups[hashable] = (key, [])
+            order.append(hashable)
+        groups[hashable][1].append(doc)
+
+    results = []
+    for hashable in order:
+        key, members = groups[hashable]
+        result = {'_id': key}
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            operator, expression = next(iter(accumulator.items()))
+            values = [evaluate(expression, doc) for doc in members]
+            if operator == '$first':
+                result[field] = _plain(values[0]) if values else None
+            elif operator == '$last':
+                result[field] = _plain(values[-1]) if values else None
+            elif operator == '$push':
+                result[field] = [_plain(value) for value in values if value is not MISSING]
+            elif operator == '$addToSet':
+                unique = []
+                for value in values:
+                    if value is not MISSING and not any(compare(value, seen) == 0 for seen in unique):
+                        unique.append(value)
+                result[field] = unique
+            elif operator == '$count':
+                result[field] = len(members)
+            else:
+                result[field] = accumulate(operator, values)
+        results.append(result)
+    return results
+
+
+def _unwind(docs, spec):
+    if isinstance(spec, str):
+        spec = {'path': spec}
+    path = spec['path'][1:]
+    keep_empty = spec.get('preserveNullAndEmptyArrays', False)
+    results = []
+    for doc in docs:
+        value = get_path(doc, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                unwound = copy.deepcopy(doc)
+                set_path(unwound, path, item)
+                results.append(unwound)
+        elif isinstance(value, list) or value in (None, MISSING):
+            if keep_empty:
+                results.append(doc)
+        else:
+            results.append(doc)
+    return results
+
+
+def run_stages(docs, pipeline, database):
+    """Run an aggregation pipeline over docs. database resolves $unionWith/$lookup."""
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == '$match':
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name in ('$set', '$addFields'):
+            docs = [_set_fields(doc, spec) for doc in docs]
+        elif name == '$unset':
+            fields = [spec] if isinstance(spec, str) else spec
+            docs = [project(doc, {field: 0 for field in fields}) for doc in docs]
+        elif name == '$project':
+            docs = [_project_stage(doc, spec) for doc in docs]
+        elif name == '$sort':
+            docs = sort_documents(list(docs), normalize_sort(spec))
+        elif name == '$limit':
+            docs = docs[:spec]
+        elif name == '$skip':
+            docs = docs[spec:]
+        elif name == '$count':
+            docs = [{spec: len(docs)}] if docs else []
+        elif name == '$group':
+            docs = _group(docs, spec)
+        elif name == '$unwind':
+            docs = _unwind(docs, spec)
+        elif name in ('$replaceRoot', '$replaceWith'):
+            expression = spec['newRoot'] if name == '$replaceRoot' else spec
+            docs = [evaluate(expression, doc) for doc in docs]
+        elif name == '$facet':
+            docs = [{field: run_stages(list(docs), sub, database) for field, sub in spec.items()}]
+        elif name == '$unionWith':
+            if isinstance(spec, str):
+                spec = {'coll': spec}
+            other = database[spec['coll']].snapshot()
+            docs = list(docs) + run_stages(other, spec.get('pipeline', []), database)
+        elif name == '$lookup':
+            foreign = database[spec['from']].snapshot()
+            joined = []
+            for doc in docs:
+                local = _plain(get_path(doc, spec['localField']))
+                found = [other for other in foreign
+                         if _match_equal(_query_values(other, spec['foreignField'].split('.')), local)]
+                doc = copy.deepcopy(doc)
+                doc[spec['as']] = found
+                joined.append(doc)
+            docs = joined
+        else:
+            raise OperationFailure(f"Unrecognized pipeline stage name: '{name}'", code=40324)
+    return docs
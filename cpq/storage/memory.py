@@ -0,0 +1,480 @@
+import copy
+import threading
+from collections import OrderedDict
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import (
+    BulkWriteError, CollectionInvalid, DuplicateKeyError, InvalidOperation, OperationFailure
+)
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import (
+    BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+)
+
+from cpq.storage.expressions import (
+    MISSING, apply_update, equality_fields, get_path, is_replacement, matches, normalize_sort,
+    project, run_stages, sort_documents, sort_key
+)
+from cpq.storage.repository import Repository
+
+
+def _hashable(value):
+    try:
+        hash(value)
+        return (type(value).__name__, value)
+    except TypeError:
+        return repr(sort_key(value))
+
+
+def _index_name(keys):
+    return '_'.join(f'{field}_{direction}' for field, direction in keys)
+
+
+class MemoryCursor:
+    """Lazily evaluated result of MemoryRepository.find"""
+
+    def __init__(self, repository, filter, projection, sort=None, skip=0, limit=0):
+        self._repository = repository
+        self._filter = filter
+        self._projection = projection
+        self._sort = sort
+        self._skip = skip
+        self._limit = limit
+        self._results = None
+        self._closed = False
+
+    def _check_unstarted(self):
+        if self._results is not None:
+            raise InvalidOperation("cannot set options after executing query")
+
+    def sort(self, key_or_list, direction=None):
+        self._check_unstarted()
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip):
+        self._check_unstarted()
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._check_unstarted()
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def close(self):
+        self._closed = True
+        self._results = iter(())
+
+    @property
+    def alive(self):
+        return not self._closed
+
+    def _execute(self):
+        docs = self._repository._matching(self._filter)
+        if self._sort:
+            docs = sort_documents(docs, self._sort)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:abs(self._limit)]
+        return iter([copy.deepcopy(project(doc, self._projection)) for doc in docs])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._results is None:
+            self._results = self._execute()
+        return next(self._results)
+
+    next = __next__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemoryRepository(Repository):
+    """In-memory implementation of the Repository interface.
+
+    Documents are deep-copied on the way in and out, unique indexes are
+    enforced, and every operation holds the collection lock, so semantics
+    match a single MongoDB node closely enough for tests and benchmarks.
+    TTL indexes are recorded but documents never expire, and change streams
+    are unsupported (watch raises the same error as a standalone server).
+    """
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = f'{database.name}.{name}'
+        self._docs = OrderedDict()
+        self._indexes = {'_id_': {'key': [('_id', 1)], 'unique': True}}
+        self._unique_keys = {}
+        self._lock = threading.RLock()
+
+    # --- Internals ------------------------------------------------------------
+
+    def snapshot(self):
+        """Copies of all documents, for cross-collection pipeline stages"""
+        with self._lock:
+            return [copy.deepcopy(doc) for doc in self._docs.values()]
+
+    def _candidates(self, filter):
+        """Documents that can match filter, narrowed through _id or a unique index when possible"""
+        if not isinstance(filter, dict):
+            return list(self._docs.values())
+        doc_id = filter.get('_id', MISSING)
+        if doc_id is not MISSING and not (isinstance(doc_id, dict) and any(k.startswith('$') for k in doc_id)):
+            doc = self._docs.get(_hashable(doc_id))
+            return [doc] if doc is not None else []
+        for name, spec in self._unique_indexes():
+            fields = [field for field, _ in spec['key']]
+            values = [filter.get(field, MISSING) for field in fields]
+            if any(value is MISSING or isinstance(value, (dict, list)) for value in values):
+                continue
+            owner = self._unique_keys.get(name, {}).get(tuple(_hashable(value) for value in values))
+            doc = self._docs.get(owner) if owner is not None else None
+            return [doc] if doc is not None else []
+        return list(self._docs.values())
+
+    def _matching(self, filter):
+        with self._lock:
+            return [doc for doc in self._candidates(filter) if matches(doc, filter)]
+
+    def _first_match(self, filter, sort=None):
+        docs = self._matching(filter)
+        if sort:
+            docs = sort_documents(docs, normalize_sort(sort))
+        return docs[0] if docs else None
+
+    def _unique_indexes(self):
+        return [(name, spec) for name, spec in self._indexes.items()
+                if spec.get('unique') and name != '_id_']
+
+    def _index_key(self, doc, spec):
+        values = []
+        for field, _ in spec['key']:
+            value = get_path(doc, field)
+            values.append(_hashable(None if value is MISSING else value))
+        return tuple(values)
+
+    def _check_unique(self, doc, replacing=None):
+        doc_id = _hashable(doc['_id'])
+        if doc_id in self._docs and (replacing is None or _hashable(replacing['_id']) != doc_id):
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.full_name} index: _id_ dup key",
+                11000, {'keyPattern': {'_id': 1}, 'keyValue': {'_id': doc['_id']}}
+            )
+        for name, spec in self._unique_indexes():
+            key = self._index_key(doc, spec)
+            owner = self._unique_keys.get(name, {}).get(key)
+            if owner is not None and owner != doc_id:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.full_name} index: {name} dup key",
+                    11000, {'keyPattern': dict(spec['key'])}
+                )
+
+    def _store(self, doc, replacing=None):
+        """Validate unique constraints, then write doc (replacing a previous version)"""
+        self._check_unique(doc, replacing)
+        if replacing is not None:
+            self._unindex(replacing)
+        self._docs[_hashable(doc['_id'])] = doc
+        for name, spec in self._unique_indexes():
+            self._unique_keys.setdefault(name, {})[self._index_key(doc, spec)] = _hashable(doc['_id'])
+
+    def _unindex(self, doc):
+        for name, spec in self._unique_indexes():
+            self._unique_keys.get(name, {}).pop(self._index_key(doc, spec), None)
+
+    def _insert(self, document):
+        if '_id' not in document:
+            # Like pymongo, the caller's document receives the generated _id
+            document['_id'] = ObjectId()
+        self._store(copy.deepcopy(document))
+        return document['_id']
+
+    def _update(self, filter, update, upsert, multi, replace=False, sort=None):
+        """Returns (matched, modified, upserted_id, before, after) for the first/only document"""
+        with self._lock:
+            targets = self._matching(filter) if multi else [self._first_match(filter, sort)]
+            targets = [doc for doc in targets if doc is not None]
+
+            if not targets:
+                if not upsert:
+                    return 0, 0, None, None, None
+                doc = equality_fields(filter)
+                doc = copy.deepcopy(doc)
+                if replace:
+                    doc = {'_id': doc['_id']} if '_id' in doc else {}
+                    doc.update(copy.deepcopy(update))
+                else:
+                    apply_update(doc, update, inserting=True)
+                doc.setdefault('_id', ObjectId())
+                self._store(doc)
+                return 0, 0, doc['_id'], None, doc
+
+            modified = 0
+            before = after = None
+            for current in targets:
+                updated = copy.deepcopy(current)
+                if replace:
+                    updated = {'_id': current['_id'], **copy.deepcopy(update)}
+                else:
+                    apply_update(updated, update)
+                if updated.get('_id') != current['_id']:
+                    raise OperationFailure("Performing an update on the path '_id' would modify "
+                                           "the immutable field '_id'", code=66)
+                if updated != current:
+                    self._store(updated, replacing=current)
+                    modified += 1
+                if before is None:
+                    before, after = current, updated
+            return len(targets), modified, None, before, after
+
+    @staticmethod
+    def _update_result(matched, modified, upserted_id):
+        raw = {'n': matched + (1 if upserted_id is not None else 0), 'nModified': modified,
+               'updatedExisting': matched > 0}
+        if upserted_id is not None:
+            raw['upserted'] = upserted_id
+        return UpdateResult(raw, True)
+
+    @staticmethod
+    def _check_update(update):
+        if not update or (isinstance(update, dict) and is_replacement(update)):
+            raise ValueError('update only works with $ operators')
+
+    # --- Reads ----------------------------------------------------------------
+
+    def find(self, filter=None, projection=None, skip=0, limit=0, sort=None, **kwargs):
+        return MemoryCursor(self, filter or {}, projection,
+                            normalize_sort(sort) if sort else None, skip, limit)
+
+    def find_one(self, filter=None, projection=None, *args, sort=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+        doc = self._first_match(filter or {}, sort)
+        return copy.deepcopy(project(doc, projection)) if doc is not None else None
+
+    def count_documents(self, filter, skip=0, limit=0, **kwargs):
+        count = max(len(self._matching(filter)) - skip, 0)
+        return min(count, limit) if limit else count
+
+    def estimated_document_count(self, **kwargs):
+        return len(self._docs)
+
+    def distinct(self, key, filter=None, **kwargs):
+        values = []
+        for doc in self._matching(filter or {}):
+            value = get_path(doc, key)
+            for item in (value if isinstance(value, list) else [value]):
+                if item is not MISSING and not any(sort_key(item) == sort_key(seen) for seen in values):
+                    values.append(copy.deepcopy(item))
+        return values
+
+    def aggregate(self, pipeline, **kwargs):
+        return iter(run_stages(self.snapshot(), pipeline, self.database))
+
+    # --- Writes ---------------------------------------------------------------
+
+    def insert_one(self, document, **kwargs):
+        with self._lock:
+            return InsertOneResult(self._insert(document), True)
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        documents = list(documents)
+        result = self.bulk_write([InsertOne(doc) for doc in documents], ordered=ordered)
+        # bulk_write copied the documents; hand the generated ids back like pymongo
+        return InsertManyResult([doc['_id'] for doc in documents if '_id' in doc], result.acknowledged)
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        self._check_update(update)
+        matched, modified, upserted_id, _, _ = self._update(filter, update, upsert, multi=False)
+        return self._update_result(matched, modified, upserted_id)
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        self._check_update(update)
+        matched, modified, upserted_id, _, _ = self._update(filter, update, upsert, multi=True)
+        return self._update_result(matched, modified, upserted_id)
+
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        matched, modified, upserted_id, _, _ = self._update(filter, replacement, upsert,
+                                                            multi=False, replace=True)
+        return self._update_result(matched, modified, upserted_id)
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, **kwargs):
+        self._check_update(update)
+        _, _, _, before, after = self._update(filter, update, upsert, multi=False, sort=sort)
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return copy.deepcopy(project(doc, projection)) if doc is not None else None
+
+    def _delete(self, filter, multi):
+        with self._lock:
+            targets = self._matching(filter)
+            if not multi:
+                targets = targets[:1]
+            for doc in targets:
+                self._unindex(doc)
+                del self._docs[_hashable(doc['_id'])]
+            return len(targets)
+
+    def delete_one(self, filter, **kwargs):
+        return DeleteResult({'n': self._delete(filter, multi=False)}, True)
+
+    def delete_many(self, filter, **kwargs):
+        return DeleteResult({'n': self._delete(filter, multi=True)}, True)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        summary = {'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0,
+                   'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []}
+        with self._lock:
+            for index, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        self._insert(request._doc)
+                        summary['nInserted'] += 1
+                    elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                        matched, modified, upserted_id, _, _ = self._update(
+                            request._filter, request._doc, request._upsert,
+                            multi=isinstance(request, UpdateMany), replace=isinstance(request, ReplaceOne)
+                        )
+                        summary['nMatched'] += matched
+                        summary['nModified'] += modified
+                        if upserted_id is not None:
+                            summary['nUpserted'] += 1
+                            summary['upserted'].append({'index': index, '_id': upserted_id})
+                    elif isinstance(request, (DeleteOne, DeleteMany)):
+                        summary['nRemoved'] += self._delete(request._filter, isinstance(request, DeleteMany))
+                    else:
+                        raise TypeError(f"{request!r} is not a valid request")
+                except (DuplicateKeyError, OperationFailure) as e:
+                    summary['writeErrors'].append({'index': index, 'code': e.code, 'errmsg': str(e),
+                                                   'op': getattr(request, '_doc', None)})
+                    if ordered:
+                        break
+        if summary['writeErrors']:
+            raise BulkWriteError(summary)
+        return BulkWriteResult(summary, True)
+
+    # --- Indexes and administration -------------------------------------------
+
+    def create_index(self, keys, **kwargs):
+        keys = normalize_sort(keys, 1)
+        name = kwargs.get('name') or _index_name(keys)
+        spec = {'key': keys}
+        for option in ('unique', 'expireAfterSeconds', 'sparse'):
+            if option in kwargs:
+                spec[option] = kwargs[option]
+        with self._lock:
+            existing = self._indexes.get(name)
+            if existing is not None:
+                if existing != spec:
+                    raise OperationFailure(f"An existing index has the same name as the requested "
+                                           f"index but different options: {name}", code=86)
+                return name
+            if spec.get('unique'):
+                keys_seen = {}
+                for doc in self._docs.values():
+                    key = self._index_key(doc, spec)
+                    if key in keys_seen:
+                        raise DuplicateKeyError(
+                            f"E11000 duplicate key error collection: {self.full_name} index: {name}",
+                            11000
+                        )
+                    keys_seen[key] = _hashable(doc['_id'])
+                self._unique_keys[name] = keys_seen
+            self._indexes[name] = spec
+        return name
+
+    def index_information(self):
+        with self._lock:
+            return {name: {**copy.deepcopy(spec), 'v': 2} for name, spec in self._indexes.items()}
+
+    def drop_index(self, index_or_name):
+        name = index_or_name if isinstance(index_or_name, str) else _index_name(normalize_sort(index_or_name))
+        with self._lock:
+            if name not in self._indexes or name == '_id_':
+                raise OperationFailure(f"index not found with name [{name}]", code=27)
+            del self._indexes[name]
+            self._unique_keys.pop(name, None)
+
+    def drop(self, **kwargs):
+        self.database.drop_collection(self.name)
+
+    def watch(self, pipeline=None, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+
+class MemoryDatabase:
+    """In-memory stand-in for a pymongo Database, handing out MemoryRepository collections"""
+
+    def __init__(self, name):
+        self.name = name
+        self.client = None
+        self._collections = {}
+        self._options = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._collections[name] = MemoryRepository(self, name)
+            return collection
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name, **kwargs):
+        return self[name]
+
+    def _exists(self, name):
+        # Like MongoDB, a collection only exists once created, written to or indexed
+        collection = self._collections.get(name)
+        return name in self._options or (
+            collection is not None and (collection._docs or len(collection._indexes) > 1)
+        )
+
+    def create_collection(self, name, **options):
+        with self._lock:
+            if self._exists(name):
+                raise CollectionInvalid(f"collection {name} already exists")
+            self._options[name] = options
+        return self[name]
+
+    def list_collection_names(self, filter=None, **kwargs):
+        return [info['name'] for info in self.list_collections(filter)]
+
+    def list_collections(self, filter=None, **kwargs):
+        with self._lock:
+            infos = [{'name': name,
+                      'type': 'timeseries' if 'timeseries' in self._options.get(name, {}) else 'collection',
+                      'options': copy.deepcopy(self._options.get(name, {}))}
+                     for name in list(self._collections) if self._exists(name)]
+        return iter([info for info in infos if matches(info, filter or {})])
+
+    def drop_collection(self, name, **kwargs):
+        with self._lock:
+            self._collections.pop(name, None)
+            self._options.pop(name, None)
+
+    def command(self, command, value=1, **kwargs):
+        if command == 'ping':
+            return {'ok': 1.0}
+        if command == 'collMod':
+            with self._lock:
+                options = self._options.setdefault(value, {})
+                options.update(kwargs)
+            return {'ok': 1.0}
+        raise OperationFailure(f"no such command: '{command}'", code=59)
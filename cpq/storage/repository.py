@@ -0,0 +1,96 @@
+from abc import ABC, abstractmethod
+
+from pymongo.collection import Collection
+
+
+class Repository(ABC):
+    """Storage interface the collection classes are written against.
+
+    It is the subset of pymongo's Collection API used in this codebase, with
+    the same signatures, return types (pymongo.results) and exceptions
+    (pymongo.errors). pymongo's Collection is the MongoDB implementation;
+    cpq.storage.memory.MemoryRepository is the in-memory one.
+    """
+
+    name = None
+    database = None
+
+    @abstractmethod
+    def find(self, filter=None, projection=None, **kwargs):
+        """Cursor supporting sort, skip, limit, batch_size and close"""
+
+    @abstractmethod
+    def find_one(self, filter=None, projection=None, **kwargs):
+        pass
+
+    @abstractmethod
+    def insert_one(self, document, **kwargs):
+        pass
+
+    @abstractmethod
+    def insert_many(self, documents, ordered=True, **kwargs):
+        pass
+
+    @abstractmethod
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        pass
+
+    @abstractmethod
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        pass
+
+    @abstractmethod
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        pass
+
+    @abstractmethod
+    def delete_one(self, filter, **kwargs):
+        pass
+
+    @abstractmethod
+    def delete_many(self, filter, **kwargs):
+        pass
+
+    @abstractmethod
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=False, **kwargs):
+        pass
+
+    @abstractmethod
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        pass
+
+    @abstractmethod
+    def count_documents(self, filter, **kwargs):
+        pass
+
+    @abstractmethod
+    def estimated_document_count(self, **kwargs):
+        pass
+
+    @abstractmethod
+    def distinct(self, key, filter=None, **kwargs):
+        pass
+
+    @abstractmethod
+    def aggregate(self, pipeline, **kwargs):
+        pass
+
+    @abstractmethod
+    def create_index(self, keys, **kwargs):
+        pass
+
+    @abstractmethod
+    def index_information(self):
+        pass
+
+    @abstractmethod
+    def drop(self, **kwargs):
+        pass
+
+    @abstractmethod
+    def watch(self, pipeline=None, **kwargs):
+        pass
+
+
+Repository.register(Collection)
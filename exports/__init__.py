@@ -0,0 +1,226 @@
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+
+from bson import Decimal128, ObjectId
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from mongodb_collections import (
+    QuoteCollection, ClientCollection, HubSpotDealCollection, GeneratedAgreementCollection
+)
+
+
+export_bp = Blueprint('exports', __name__, url_prefix='/api/export')
+
+# Documents fetched from the server per round trip
+EXPORT_BATCH_SIZE = 1000
+
+# Lines are grouped into chunks of roughly this many characters per write
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Per dataset: owning collection class, date field for from/to, status field
+# (None if the dataset has no status) and exported columns (dotted paths).
+# Columns double as the projection, so heavy fields such as the agreements'
+# base64 content are never read.
+EXPORT_DATASETS = {
+    'quotes': {
+        'collection': QuoteCollection,
+        'date_field': 'created_at',
+        'status_field': 'status',
+        'columns': [
+            '_id', 'client.name', 'client.email', 'client.company', 'client.phone', 'client.serviceType',
+            'configuration.users', 'configuration.instanceType', 'configuration.instances',
+            'configuration.duration', 'configuration.migrationType', 'configuration.dataSize',
+            'configuration.selectedPlan', 'quote.basic.totalCost', 'quote.standard.totalCost',
+            'quote.advanced.totalCost', 'status', 'created_at', 'updated_at'
+        ]
+    },
+    'clients': {
+        'collection': ClientCollection,
+        'date_field': 'created_at',
+        'status_field': None,
+        'columns': [
+            '_id', 'clientName', 'companyName', 'email', 'phoneNumber', 'serviceType',
+            'requirements', 'created_at', 'updated_at'
+        ]
+    },
+    'hubspot_deals': {
+        'collection': HubSpotDealCollection,
+        'date_field': 'fetched_at',
+        'status_field': 'status',
+        'columns': [
+            '_id', 'hubspot_id', 'dealname', 'amount', 'closedate', 'dealstage', 'dealtype',
+            'pipeline', 'hubspot_owner_id', 'company', 'source', 'status', 'fetched_at',
+            'created_at', 'updated_at'
+        ]
+    },
+    'agreements': {
+        'collection': GeneratedAgreementCollection,
+        'date_field': 'generated_at',
+        'status_field': 'status',
+        'columns': [
+            '_id', 'quote_id', 'filename', 'file_path', 'client_name', 'company_name',
+            'client_email', 'template_id', 'status', 'generated_at', 'created_at', 'updated_at'
+        ]
+    },
+}
+
+
+def _parse_date(value, end_of_range=False):
+    """Parse an ISO date/datetime query parameter. A bare date used as the
+    end of a range covers that whole day."""
+    parsed = datetime.fromisoformat(value)
+    if end_of_range and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def _build_query(dataset, args):
+    """Build the Mongo filter from from/to/status query parameters"""
+    query = {}
+    date_range = {}
+    if args.get('from'):
+        date_range['$gte'] = _parse_date(args['from'])
+    if args.get('to'):
+        date_range['$lt'] = _parse_date(args['to'], end_of_range=True)
+    if date_range:
+        query[dataset['date_field']] = date_range
+
+    statuses = [status for value in args.getlist('status') for status in value.split(',') if status]
+    if statuses:
+        if not dataset['status_field']:
+            raise ValueError('This dataset has no status to filter on')
+        query[dataset['status_field']] = statuses[0] if len(statuses) == 1 else {'$in': statuses}
+    return query
+
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _to_json_value(value):
+    """JSON form of values json can't encode.
+
+    The response is already streaming when a document is serialized, so
+    types without a dedicated form fall back to str() instead of raising.
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, bytes):
+        # Includes bson.Binary
+        return base64.b64encode(value).decode('ascii')
+    return str(value)
+
+
+def _to_csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_to_json_value)
+    return _to_json_value(value)
+
+
+def _chunked(lines, chunk_size=EXPORT_CHUNK_SIZE):
+    """Group lines into chunks so the response is not written one row at a time"""
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_ndjson(cursor):
+    """Yield one JSON line per document"""
+    for doc in cursor:
+        yield json.dumps(doc, default=_to_json_value) + '\n'
+
+
+def iter_csv(cursor, columns):
+    """Yield a header line, then one CSV line per document"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return line
+
+    writer.writerow(columns)
+    yield flush()
+    for doc in cursor:
+        writer.writerow([_to_csv_value(_get_path(doc, column)) for column in columns])
+        yield flush()
+
+
+@export_bp.route('/<dataset_name>', methods=['GET'])
+def export_dataset(dataset_name):
+    """Stream a dataset as NDJSON (default) or CSV.
+
+    Query parameters: format=ndjson|csv, from/to (ISO dates, on the dataset's
+    date field), status (repeatable or comma-separated), limit.
+    """
+    dataset = EXPORT_DATASETS.get(dataset_name)
+    if not dataset:
+        return jsonify({'success': False, 'message': f'Unknown dataset: {dataset_name}',
+                        'datasets': list(EXPORT_DATASETS)}), 404
+
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'success': False, 'message': 'format must be ndjson or csv'}), 400
+
+    try:
+        query = _build_query(dataset, request.args)
+        limit = int(request.args.get('limit', 0))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid filter: {str(e)}'}), 400
+
+    projection = {column: 1 for column in dataset['columns']}
+    # Sorting on _id walks the primary index, so the server never buffers a sort
+    cursor = dataset['collection']().collection.find(
+        query, projection, batch_size=EXPORT_BATCH_SIZE
+    ).sort('_id', 1)
+    if limit > 0:
+        cursor = cursor.limit(limit)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if export_format == 'csv':
+        body = iter_csv(cursor, dataset['columns'])
+        mimetype = 'text/csv'
+    else:
+        body = iter_ndjson(cursor)
+        mimetype = 'application/x-ndjson'
+
+    def generate():
+        try:
+            yield from _chunked(body)
+        finally:
+            cursor.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={dataset_name}_{timestamp}.{export_format}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -172,20 +172,57 @@ class HubSpotBasic:
             if not results:
                 return {"success": False, "error": "not_found"}
 
-            contact = results[0]
-            props = contact.get('properties', {})
-            normalized = {
-                "hubspot_id": contact.get('id'),
-                "name": f"{props.get('firstname','')} {props.get('lastname','')}".strip(),
-                "email": props.get('email',''),
-                "phone": props.get('phone',''),
-                "company": props.get('company',''),
-                "job_title": props.get('jobtitle','')
-            }
-            return {"success": True, "contact": normalized}
+            return {"success": True, "contact": self._normalize_contact(results[0])}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def get_contacts_by_emails(self, emails):
+        """Fetch contacts for a list of emails, 100 per search request.
+
+        Returns contacts plus the emails HubSpot has no contact for.
+        """
+        try:
+            emails = [email for email in dict.fromkeys(emails) if email]
+            url = f"{self.base_url}/crm/v3/objects/contacts/search"
+            contacts = []
+            for start in range(0, len(emails), 100):
+                payload = {
+                    "filterGroups": [
+                        {
+                            "filters": [
+                                {
+                                    "propertyName": "email",
+                                    "operator": "IN",
+                                    "values": emails[start:start + 100]
+                                }
+                            ]
+                        }
+                    ],
+                    "properties": ["firstname", "lastname", "email", "phone", "company", "jobtitle"],
+                    "limit": 100
+                }
+                response = requests.post(url, headers=self.headers, data=json.dumps(payload))
+                if response.status_code != 200:
+                    return {"success": False, "error": f"HTTP {response.status_code}", "details": response.text}
+                contacts.extend(self._normalize_contact(c) for c in response.json().get('results', []))
+
+            found = {contact['email'].lower() for contact in contacts if contact['email']}
+            missing = [email for email in emails if email.strip().lower() not in found]
+            return {"success": True, "contacts": contacts, "missing": missing}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _normalize_contact(self, contact):
+        props = contact.get('properties', {})
+        return {
+            "hubspot_id": contact.get('id'),
+            "name": f"{props.get('firstname','')} {props.get('lastname','')}".strip(),
+            "email": props.get('email',''),
+            "phone": props.get('phone',''),
+            "company": props.get('company',''),
+            "job_title": props.get('jobtitle','')
+        }
+
     def get_recent_deals(self, limit=50):
         """Fetch most recently updated deals using the CRM search API sorted by lastmodifieddate."""
         try:
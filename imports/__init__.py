@@ -0,0 +1,301 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from mongodb_collections import ClientCollection, QuoteCollection
+from mongodb_collections.client_collection import email_filter
+
+
+import_bp = Blueprint('imports', __name__, url_prefix='/api/import')
+
+# Rows sent to the server per bulk_write; also bounds how many rows are held in memory
+IMPORT_BATCH_SIZE = 1000
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+
+
+def iter_rows(stream, import_format):
+    """Parse a binary or text stream incrementally.
+
+    Yields (row_number, record) pairs; a row that cannot be parsed yields its
+    ValueError in place of the record so the caller can report it and go on.
+    CSV columns with dotted names (as written by the export endpoint) become
+    nested documents.
+    """
+    if isinstance(stream, io.TextIOBase):
+        text = stream
+    else:
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if import_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Header is line 1
+            row_number = reader.line_num
+            if None in row:
+                yield row_number, ValueError('Row has more fields than the header')
+                continue
+            yield row_number, _unflatten(row)
+        return
+
+    for row_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f'Invalid JSON: {e}')
+            continue
+        if not isinstance(record, dict):
+            yield row_number, ValueError('Each line must be a JSON object')
+            continue
+        yield row_number, record
+
+
+def _unflatten(row):
+    record = {}
+    for key, value in row.items():
+        if value is None or value == '':
+            continue
+        target = record
+        parts = key.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+            if not isinstance(target, dict):
+                break
+        else:
+            target[parts[-1]] = value
+    return record
+
+
+def _parse_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+# CSV cells arrive as strings. Only these columns are converted back (to the
+# types the export wrote them from); names, phone numbers and the like stay
+# strings even when they look like numbers.
+CSV_COLUMN_PARSERS = {
+    'number': _parse_number,
+    'json': json.loads,
+}
+
+QUOTE_CSV_COLUMNS = {
+    'configuration.users': 'number',
+    'configuration.instances': 'number',
+    'configuration.duration': 'number',
+    'configuration.dataSize': 'number',
+    'quote.basic.totalCost': 'number',
+    'quote.standard.totalCost': 'number',
+    'quote.advanced.totalCost': 'number',
+}
+
+
+def _parse_csv_columns(record, column_types):
+    """Convert the declared (dotted) columns of an unflattened CSV row in place.
+
+    Raises ValueError naming the column when a cell doesn't parse.
+    """
+    for column, column_type in column_types.items():
+        parts = column.split('.')
+        target = record
+        for part in parts[:-1]:
+            target = target.get(part)
+            if not isinstance(target, dict):
+                break
+        else:
+            value = target.get(parts[-1])
+            if isinstance(value, str):
+                try:
+                    target[parts[-1]] = CSV_COLUMN_PARSERS[column_type](value)
+                except ValueError:
+                    raise ValueError(f'{column} must be {column_type}, got {value!r}')
+    return record
+
+
+def _parse_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return None
+
+
+def build_client_operation(clients, record, now):
+    """Upsert keyed on email, normalized with the same rules as create_client.
+
+    Returns (dedupe_key, operation). Raises ValueError for invalid rows.
+    """
+    normalized = clients.normalize_client_data(record)
+    normalized['updated_at'] = now
+    return normalized['email'], UpdateOne(
+        email_filter(normalized['email']),
+        {'$set': normalized, '$setOnInsert': {'created_at': now}},
+        upsert=True
+    )
+
+
+def build_quote_operation(quotes, record, now, from_csv=False):
+    """Insert a quote, or upsert by _id when the row carries one (re-importing an export).
+
+    Returns (dedupe_key, operation). Raises ValueError for invalid rows.
+    """
+    if from_csv:
+        record = _parse_csv_columns(record, QUOTE_CSV_COLUMNS)
+    if not quotes._validate_quote_data(record):
+        raise ValueError('Invalid quote data: client and configuration are required')
+
+    quote = dict(record)
+    quote_id = quote.pop('_id', None)
+    quote.setdefault('status', 'draft')
+    created_at = _parse_datetime(quote.pop('created_at', None)) or now
+    quote['updated_at'] = now
+
+    if quote_id is None:
+        quote['created_at'] = created_at
+        return None, InsertOne(quote)
+
+    if not ObjectId.is_valid(str(quote_id)):
+        raise ValueError(f'Invalid quote _id: {quote_id}')
+    quote_id = ObjectId(str(quote_id))
+    return quote_id, UpdateOne(
+        {'_id': quote_id},
+        {'$set': quote, '$setOnInsert': {'created_at': created_at}},
+        upsert=True
+    )
+
+
+IMPORT_DATASETS = {
+    'clients': {
+        'collection': ClientCollection,
+        'build_operation': lambda clients, record, now, from_csv: build_client_operation(clients, record, now)
+    },
+    'quotes': {
+        'collection': QuoteCollection,
+        'build_operation': build_quote_operation
+    },
+}
+
+
+def iter_import(dataset_name, rows, batch_size=IMPORT_BATCH_SIZE, from_csv=False):
+    """Import rows in batches with unordered bulk_write.
+
+    Yields a progress event after every batch, carrying that batch's per-row
+    errors, and finally a summary event. Only one batch is held at a time.
+    """
+    dataset = IMPORT_DATASETS[dataset_name]
+    store = dataset['collection']()
+    collection = store.collection
+    build_operation = dataset['build_operation']
+
+    totals = {'processed': 0, 'inserted': 0, 'upserted': 0, 'modified': 0, 'matched': 0, 'failed': 0}
+    batch = {}
+    errors = []
+    batch_number = 0
+
+    def write_batch():
+        # Operations are keyed so a record repeated within a batch collapses
+        # into its last occurrence instead of racing itself in an unordered write
+        row_numbers = [row_number for row_number, _ in batch.values()]
+        operations = [operation for _, operation in batch.values()]
+        batch.clear()
+        if not operations:
+            return
+        try:
+            result = collection.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+            for write_error in result.get('writeErrors', []):
+                errors.append({'row': row_numbers[write_error['index']], 'error': write_error.get('errmsg')})
+            totals['failed'] += len(result.get('writeErrors', []))
+        totals['inserted'] += result.get('nInserted', 0)
+        totals['upserted'] += result.get('nUpserted', 0)
+        totals['modified'] += result.get('nModified', 0)
+        totals['matched'] += result.get('nMatched', 0)
+
+    def progress_event():
+        event = dict(totals, event='progress', batch=batch_number, errors=list(errors))
+        errors.clear()
+        return event
+
+    for row_number, record in rows:
+        totals['processed'] += 1
+        if isinstance(record, Exception):
+            errors.append({'row': row_number, 'error': str(record)})
+            totals['failed'] += 1
+        else:
+            try:
+                key, operation = build_operation(store, record, datetime.now(), from_csv)
+                batch[key if key is not None else ('row', row_number)] = (row_number, operation)
+            except ValueError as e:
+                errors.append({'row': row_number, 'error': str(e)})
+                totals['failed'] += 1
+
+        if len(batch) >= batch_size or len(errors) >= batch_size:
+            batch_number += 1
+            write_batch()
+            yield progress_event()
+
+    if batch or errors:
+        batch_number += 1
+        write_batch()
+        yield progress_event()
+
+    yield dict(totals, event='summary', batches=batch_number)
+
+
+@import_bp.route('/<dataset_name>', methods=['POST'])
+def import_dataset(dataset_name):
+    """Bulk import clients or quotes from NDJSON (default) or CSV.
+
+    The file is read from a multipart 'file' field or the raw request body.
+    Query parameters: format=ndjson|csv (inferred from the upload's file
+    name or content type when omitted), batch_size.
+    Responds with NDJSON progress events per batch and a final summary.
+    """
+    if dataset_name not in IMPORT_DATASETS:
+        return jsonify({'success': False, 'message': f'Unknown dataset: {dataset_name}',
+                        'datasets': list(IMPORT_DATASETS)}), 404
+
+    upload = request.files.get('file')
+    import_format = request.args.get('format')
+    if not import_format:
+        filename = upload.filename if upload else ''
+        content_type = upload.mimetype if upload else request.mimetype
+        is_csv = filename.lower().endswith('.csv') or content_type == 'text/csv'
+        import_format = 'csv' if is_csv else 'ndjson'
+    import_format = import_format.lower()
+    if import_format not in IMPORT_FORMATS:
+        return jsonify({'success': False, 'message': 'format must be ndjson or csv'}), 400
+
+    try:
+        batch_size = max(1, int(request.args.get('batch_size', IMPORT_BATCH_SIZE)))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'batch_size must be an integer'}), 400
+
+    # Uploads are spooled to disk by Werkzeug; raw bodies are read straight off the socket
+    stream = upload.stream if upload else request.stream
+    rows = iter_rows(stream, import_format)
+
+    def generate():
+        for event in iter_import(dataset_name, rows, batch_size, from_csv=import_format == 'csv'):
+            yield json.dumps(event) + '\n'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,48 @@
+"""Bulk import from the command line.
+
+    python -m imports clients resellers.csv
+    python -m imports quotes quotes.ndjson --batch-size 500
+    cat clients.ndjson | python -m imports clients -
+"""
+
+import argparse
+import sys
+
+from imports import IMPORT_BATCH_SIZE, IMPORT_DATASETS, IMPORT_FORMATS, iter_import, iter_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import clients or quotes from CSV/NDJSON')
+    parser.add_argument('dataset', choices=sorted(IMPORT_DATASETS))
+    parser.add_argument('path', help="Input file, or '-' for stdin")
+    parser.add_argument('--format', choices=IMPORT_FORMATS,
+                        help='Input format (default: inferred from the file extension, else ndjson)')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    import_format = args.format or ('csv' if args.path.lower().endswith('.csv') else 'ndjson')
+    stream = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+
+    try:
+        failed = 0
+        for event in iter_import(args.dataset, iter_rows(stream, import_format),
+                                 max(1, args.batch_size), from_csv=import_format == 'csv'):
+            for error in event.get('errors', []):
+                print(f"❌ Row {error['row']}: {error['error']}", file=sys.stderr)
+            if event['event'] == 'progress':
+                print(f"📦 Batch {event['batch']}: {event['processed']} rows processed, "
+                      f"{event['failed']} failed")
+            else:
+                failed = event['failed']
+                print(f"✅ Imported {args.dataset}: {event['processed']} rows, "
+                      f"{event['inserted'] + event['upserted']} new, {event['modified']} updated, "
+                      f"{event['failed']} failed")
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,6 +16,8 @@ from .signature_collection import SignatureCollection
 from .generated_pdf_collection import GeneratedPDFCollection
 from .generated_agreement_collection import GeneratedAgreementCollection
 from .approval_workflow_collection import ApprovalWorkflowCollection
+from .document_view_collection import DocumentViewCollection
+from .template_version_collection import TemplateVersionCollection
 
 
 
@@ -35,4 +37,6 @@ __all__ = [
     'GeneratedPDFCollection',
     'GeneratedAgreementCollection',
     'ApprovalWorkflowCollection',
+    'DocumentViewCollection',
+    'TemplateVersionCollection',
 ]
@@ -1,12 +1,86 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
 from cpq.db import db
+from .archive_collection import ArchiveCollection
+
+# Normalize action values to consistent statuses
+ACTION_STATUSES = {
+    "approve": "approved",
+    "deny": "denied",
+    "approved": "approved",
+    "denied": "denied"
+}
+
+# Approval state machine: manager -> ceo -> client.
+# (role, outcome) -> "expect": the state the workflow must be in for the
+# transition to apply (part of the update filter), "set": the new state.
+WORKFLOW_TRANSITIONS = {
+    ("manager", "approved"): {
+        "expect": {"workflow_status": "active", "manager_status": "pending"},
+        "set": {"manager_status": "approved", "current_stage": "ceo"}
+    },
+    ("manager", "denied"): {
+        "expect": {"workflow_status": "active", "manager_status": "pending"},
+        "set": {"manager_status": "denied", "workflow_status": "cancelled",
+                "final_status": "denied_by_manager"}
+    },
+    ("ceo", "approved"): {
+        "expect": {"workflow_status": "active", "manager_status": "approved", "ceo_status": "pending"},
+        "set": {"ceo_status": "approved", "workflow_status": "client_review", "current_stage": "client",
+                "client_status": "pending_feedback", "final_status": "pending_client_feedback"}
+    },
+    ("ceo", "denied"): {
+        "expect": {"workflow_status": "active", "manager_status": "approved", "ceo_status": "pending"},
+        "set": {"ceo_status": "denied", "workflow_status": "cancelled", "final_status": "denied_by_ceo"}
+    },
+    ("client", "accepted"): {
+        "expect": {"workflow_status": "client_review", "client_status": "pending_feedback"},
+        "set": {"client_status": "accepted", "workflow_status": "completed",
+                "final_status": "accepted_by_client"}
+    },
+    ("client", "rejected"): {
+        "expect": {"workflow_status": "client_review", "client_status": "pending_feedback"},
+        "set": {"client_status": "rejected", "workflow_status": "client_rejected",
+                "final_status": "rejected_by_client"}
+    },
+    ("client", "needs_changes"): {
+        "expect": {"workflow_status": "client_review", "client_status": "pending_feedback"},
+        "set": {"client_status": "needs_changes", "workflow_status": "needs_revision",
+                "final_status": "client_requested_changes"}
+    },
+}
+
+# Filters behind the approval dashboard panels, shared by the per-panel
+# methods and the single-query dashboard
+ACTIVE_WORKFLOWS_QUERY = {"workflow_status": {"$nin": ["completed", "cancelled"]}}
+PENDING_APPROVAL_QUERY = {
+    "workflow_status": "active",
+    "$or": [{"manager_status": "pending"}, {"ceo_status": "pending"}]
+}
+APPROVAL_QUEUE_QUERIES = {
+    "manager": {"workflow_status": "active", "manager_status": "pending"},
+    "ceo": {"workflow_status": "active", "manager_status": "approved", "ceo_status": "pending"},
+}
+HISTORY_QUERY = {"workflow_status": {"$in": ["completed", "cancelled", "client_rejected"]}}
+DENIED_QUERY = {
+    "workflow_status": {"$in": ["cancelled", "client_rejected"]},
+    "$or": [{"manager_status": "denied"}, {"ceo_status": "denied"}, {"client_status": "rejected"}]
+}
+# Fields the dashboard panels and stats read; the rest of each workflow is left out
+DASHBOARD_FIELDS = [
+    "document_id", "document_name", "document_type", "client_name", "company_name", "current_stage",
+    "workflow_status", "final_status", "manager_status", "ceo_status", "client_status", "client_decision",
+    "manager_comments", "ceo_comments", "client_comments", "comments", "denied_by_email",
+    "manager_updated_at", "ceo_updated_at", "client_updated_at", "created_at", "updated_at", "completed_at",
+]
 
 class ApprovalWorkflowCollection:
     """Handles approval workflow MongoDB operations"""
     
     def __init__(self):
         self.collection = db["approval_workflows"]
+        self.archive = ArchiveCollection("approval_workflows")
     
     def create_workflow(self, workflow_data):
         """Create a new approval workflow"""
@@ -24,7 +98,8 @@ class ApprovalWorkflowCollection:
     def get_workflow_by_id(self, workflow_id):
         """Get workflow by MongoDB ObjectId"""
         try:
-            return self.collection.find_one({"_id": ObjectId(workflow_id)})
+            query = {"_id": ObjectId(workflow_id)}
+            return self.collection.find_one(query) or self.archive.find_one(query)
         except:
             return None
     
@@ -34,12 +109,6 @@ class ApprovalWorkflowCollection:
     
     def get_pending_workflows(self, limit=100):
         """Get all pending workflows"""
-        # First, let's see ALL workflows to understand what's in the database
-        all_workflows = list(self.collection.find({}).sort("created_at", -1).limit(10))
-        print(f"🔍 All workflows in database (last 10):")
-        for workflow in all_workflows:
-            print(f"  - Workflow {workflow.get('_id')}: status={workflow.get('workflow_status')}, manager={workflow.get('manager_status')}, ceo={workflow.get('ceo_status')}, client={workflow.get('client_status')}")
-        
         query = {
             "workflow_status": {"$in": ["active", "client_review"]},
             "$or": [
@@ -48,159 +117,78 @@ class ApprovalWorkflowCollection:
                 {"client_status": {"$in": ["pending", "pending_feedback"]}}
             ]
         }
-        
-        print(f"🔍 Pending workflows query: {query}")
-        
-        workflows = list(self.collection.find(query).sort("created_at", -1).limit(limit))
-        
-        print(f"🔍 Found {len(workflows)} pending workflows")
-        for workflow in workflows:
-            print(f"  - Workflow {workflow.get('_id')}: status={workflow.get('workflow_status')}, manager={workflow.get('manager_status')}, ceo={workflow.get('ceo_status')}, client={workflow.get('client_status')}")
-        
-        return workflows
+        return list(self.collection.find(query).sort("created_at", -1).limit(limit))
     
     def get_all_active_workflows(self, limit=100):
-        """Get all workflows that are not completed or cancelled - for debugging"""
-        query = {
-            "workflow_status": {"$nin": ["completed", "cancelled"]}
-        }
-        
-        print(f"🔍 All active workflows query: {query}")
-        
-        workflows = list(self.collection.find(query).sort("created_at", -1).limit(limit))
-        
-        print(f"🔍 Found {len(workflows)} all active workflows")
-        for workflow in workflows:
-            print(f"  - Workflow {workflow.get('_id')}: status={workflow.get('workflow_status')}, manager={workflow.get('manager_status')}, ceo={workflow.get('ceo_status')}, client={workflow.get('client_status')}")
-        
-        return workflows
+        """Get all workflows that are not completed or cancelled"""
+        return list(self.collection.find(ACTIVE_WORKFLOWS_QUERY).sort("created_at", -1).limit(limit))
     
     def get_my_approval_queue(self, user_role, user_email, limit=100):
         """Get approval queue for specific user role"""
-        if user_role == "manager":
-            return list(self.collection.find({
-                "workflow_status": "active",
-                "manager_status": "pending"
-            }).sort("created_at", -1).limit(limit))
-        elif user_role == "ceo":
-            return list(self.collection.find({
-                "workflow_status": "active",
-                "manager_status": "approved",
-                "ceo_status": "pending"
-            }).sort("created_at", -1).limit(limit))
-        else:
+        query = APPROVAL_QUEUE_QUERIES.get(user_role)
+        if query is None:
             return []
+        return list(self.collection.find(query).sort("created_at", -1).limit(limit))
     
     def get_workflow_status(self, limit=100):
         """Get all active workflows with status"""
         query = {
             "workflow_status": {"$in": ["active", "client_review"]}
         }
-        
-        print(f"🔍 Workflow status query: {query}")
-        
-        workflows = list(self.collection.find(query).sort("created_at", -1).limit(limit))
-        
-        print(f"🔍 Found {len(workflows)} workflow status workflows")
-        for workflow in workflows:
-            print(f"  - Workflow {workflow.get('_id')}: status={workflow.get('workflow_status')}, manager={workflow.get('manager_status')}, ceo={workflow.get('ceo_status')}, client={workflow.get('client_status')}")
-        
-        return workflows
+        return list(self.collection.find(query).sort("created_at", -1).limit(limit))
     
     def get_approval_history(self, limit=100):
         """Get completed approval history"""
-        return list(self.collection.find({
-            "workflow_status": {"$in": ["completed", "cancelled", "client_rejected"]}
-        }).sort("updated_at", -1).limit(limit))
+        return list(self.collection.find(HISTORY_QUERY).sort("updated_at", -1).limit(limit))
     
-    def update_workflow_status(self, workflow_id, role, action, comments):
-        """Update workflow status based on role and action"""
-        try:
-            # Normalize action values to consistent statuses
-            normalized_action = {
-                "approve": "approved",
-                "deny": "denied",
-                "approved": "approved",
-                "denied": "denied"
-            }.get(action, action)
+    def transition(self, workflow_id, role, action, comments="", client_email=None):
+        """Apply a WORKFLOW_TRANSITIONS entry in one conditional find_one_and_update.
 
-            update_data = {
-                "updated_at": datetime.now()
-            }
-            
-            if role == "manager":
-                update_data["manager_status"] = normalized_action
-                update_data["manager_comments"] = comments
-                update_data["manager_approval_date"] = datetime.now()
-                print(f"🔍 Manager approval - Comments being saved: '{comments}'")
-                
-                if normalized_action == "denied":
-                    update_data["workflow_status"] = "cancelled"
-                    update_data["final_status"] = "denied_by_manager"
-                elif normalized_action == "approved":
-                    # Advance to CEO stage when manager approves
-                    update_data["current_stage"] = "ceo"
-                    
-            elif role == "ceo":
-                update_data["ceo_status"] = normalized_action
-                update_data["ceo_comments"] = comments
-                update_data["ceo_approval_date"] = datetime.now()
-                print(f"🔍 CEO approval - Comments being saved: '{comments}'")
-                
-                if normalized_action == "approved":
-                    update_data["workflow_status"] = "client_review"
-                    update_data["current_stage"] = "client"
-                    update_data["client_status"] = "pending_feedback"
-                    update_data["final_status"] = "pending_client_feedback"
-                elif normalized_action == "denied":
-                    update_data["workflow_status"] = "cancelled"
-                    update_data["final_status"] = "denied_by_ceo"
-            
-            result = self.collection.update_one(
-                {"_id": ObjectId(workflow_id)},
-                {"$set": update_data}
+        Returns the workflow after the update, or None if it does not exist
+        or is not in the state the transition expects (e.g. already approved
+        by a concurrent request).
+        """
+        try:
+            query, update = self.build_transition(workflow_id, role, action, comments, client_email)
+            return self.collection.find_one_and_update(
+                query, update, return_document=ReturnDocument.AFTER
             )
-            
-            return result.modified_count > 0
-            
         except Exception as e:
-            print(f"Error updating workflow status: {e}")
-            return False
+            print(f"Error applying workflow transition: {e}")
+            return None
+
+    def build_transition(self, workflow_id, role, action, comments="", client_email=None):
+        """Filter and update for a transition. Raises ValueError if there is none for role/action."""
+        outcome = ACTION_STATUSES.get(action, action)
+        rule = WORKFLOW_TRANSITIONS.get((role, outcome))
+        if rule is None:
+            raise ValueError(f"No transition for {role} {action}")
+
+        now = datetime.now()
+        query = {"_id": ObjectId(workflow_id), **rule["expect"]}
+        update_data = {**rule["set"], "updated_at": now}
+
+        if role == "client":
+            if client_email:
+                query["client_email"] = client_email
+            update_data["client_comments"] = comments
+            update_data["client_decision"] = outcome
+            update_data["client_feedback_date"] = now
+            if outcome == "accepted":
+                update_data["completed_at"] = now
+        else:
+            update_data[f"{role}_comments"] = comments
+            update_data[f"{role}_approval_date"] = now
+
+        return query, {"$set": update_data}
+
+    def update_workflow_status(self, workflow_id, role, action, comments):
+        """Update workflow status based on role and action"""
+        return self.transition(workflow_id, role, action, comments) is not None
 
     def submit_client_feedback(self, workflow_id, client_comments, client_decision):
         """Submit client feedback on the approved document"""
-        try:
-            update_data = {
-                "updated_at": datetime.now(),
-                "client_comments": client_comments,
-                "client_decision": client_decision,  # "accepted", "rejected", "needs_changes"
-                "client_feedback_date": datetime.now()
-            }
-            
-            if client_decision == "accepted":
-                update_data["client_status"] = "accepted"
-                update_data["workflow_status"] = "completed"
-                update_data["final_status"] = "accepted_by_client"
-                update_data["completed_at"] = datetime.now()
-            elif client_decision == "rejected":
-                update_data["client_status"] = "rejected"
-                update_data["workflow_status"] = "client_rejected"
-                update_data["final_status"] = "rejected_by_client"
-            elif client_decision == "needs_changes":
-                update_data["client_status"] = "needs_changes"
-                update_data["workflow_status"] = "needs_revision"
-                update_data["final_status"] = "client_requested_changes"
-            
-            result = self.collection.update_one(
-                {"_id": ObjectId(workflow_id)},
-                {"$set": update_data}
-            )
-            
-            return result.modified_count > 0
-            
-        except Exception as e:
-            print(f"Error submitting client feedback: {e}")
-            return False
+        return self.transition(workflow_id, "client", client_decision, client_comments) is not None
 
     def get_client_feedback_workflows(self, limit=100):
         """Get workflows waiting for client feedback"""
@@ -220,27 +208,16 @@ class ApprovalWorkflowCollection:
         except:
             return None
     
-    def get_workflow_stats(self):
-        """Get workflow statistics"""
-        try:
-            # Count pending approvals
-            pending_count = self.collection.count_documents({
-                "workflow_status": "active",
-                "$or": [
-                    {"manager_status": "pending"},
-                    {"ceo_status": "pending"}
-                ]
-            })
-            
-            # Count completed today
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            completed_today = self.collection.count_documents({
-                "workflow_status": "completed",
-                "completed_at": {"$gte": today}
-            })
-            
-            # Calculate average approval time
-            pipeline = [
+    def _stats_facets(self):
+        """$facet branches computing the workflow statistics"""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return {
+            "pending_count": [{"$match": PENDING_APPROVAL_QUERY}, {"$count": "n"}],
+            "completed_today": [
+                {"$match": {"workflow_status": "completed", "completed_at": {"$gte": today}}},
+                {"$count": "n"}
+            ],
+            "avg_approval_time": [
                 {
                     "$match": {
                         "workflow_status": "completed",
@@ -248,33 +225,35 @@ class ApprovalWorkflowCollection:
                         "created_at": {"$exists": True}
                     }
                 },
-                {
-                    "$addFields": {
-                        "approval_time": {
-                            "$divide": [
-                                {"$subtract": ["$completed_at", "$created_at"]},
-                                1000 * 60 * 60  # Convert to hours
-                            ]
-                        }
-                    }
-                },
                 {
                     "$group": {
                         "_id": None,
-                        "avg_time": {"$avg": "$approval_time"}
+                        "avg_time": {"$avg": {"$divide": [
+                            {"$subtract": ["$completed_at", "$created_at"]},
+                            1000 * 60 * 60  # Convert to hours
+                        ]}}
                     }
                 }
-            ]
-            
-            avg_time_result = list(self.collection.aggregate(pipeline))
-            avg_time = avg_time_result[0]["avg_time"] if avg_time_result else 0
-            
-            return {
-                "pending": pending_count,
-                "completed_today": completed_today,
-                "avg_approval_time": f"{avg_time:.1f}h"
-            }
-            
+            ],
+        }
+
+    @staticmethod
+    def _facet_count(result, name):
+        return result[name][0]["n"] if result.get(name) else 0
+
+    def _stats_from_facets(self, result):
+        avg_time = result["avg_approval_time"][0]["avg_time"] if result.get("avg_approval_time") else 0
+        return {
+            "pending": self._facet_count(result, "pending_count"),
+            "completed_today": self._facet_count(result, "completed_today"),
+            "avg_approval_time": f"{avg_time or 0:.1f}h"
+        }
+
+    def get_workflow_stats(self):
+        """Get workflow statistics"""
+        try:
+            result = next(self.collection.aggregate([{"$facet": self._stats_facets()}]))
+            return self._stats_from_facets(result)
         except Exception as e:
             print(f"Error getting workflow stats: {e}")
             return {
@@ -282,6 +261,45 @@ class ApprovalWorkflowCollection:
                 "completed_today": 0,
                 "avg_approval_time": "0h"
             }
+
+    def get_dashboard(self, user_role, limit=100):
+        """Stats plus count and first page of every dashboard panel in one aggregation.
+
+        Returns {"stats": ..., "active" / "my_queue" / "history" / "denied":
+        {"count": n, "workflows": [...]}}.
+        """
+        panels = {
+            "active": (ACTIVE_WORKFLOWS_QUERY, "created_at"),
+            "history": (HISTORY_QUERY, "updated_at"),
+            "denied": (DENIED_QUERY, "updated_at"),
+        }
+        queue_query = APPROVAL_QUEUE_QUERIES.get(user_role)
+        if queue_query is not None:
+            panels["my_queue"] = (queue_query, "created_at")
+
+        facets = self._stats_facets()
+        for name, (query, sort_field) in panels.items():
+            facets[name] = [{"$match": query}, {"$sort": {sort_field: -1}}, {"$limit": limit}]
+            facets[f"{name}_count"] = [{"$match": query}, {"$count": "n"}]
+
+        try:
+            result = next(self.collection.aggregate([
+                {"$project": {field: 1 for field in DASHBOARD_FIELDS}},
+                {"$facet": facets}
+            ]))
+        except Exception as e:
+            print(f"Error getting approval dashboard: {e}")
+            return {
+                "stats": {"pending": 0, "completed_today": 0, "avg_approval_time": "0h"},
+                **{name: {"count": 0, "workflows": []} for name in ("active", "my_queue", "history", "denied")}
+            }
+        dashboard = {"stats": self._stats_from_facets(result)}
+        for name in ("active", "my_queue", "history", "denied"):
+            dashboard[name] = {
+                "count": self._facet_count(result, f"{name}_count"),
+                "workflows": result.get(name, [])
+            }
+        return dashboard
     
     def cancel_workflow(self, workflow_id, reason):
         """Cancel a workflow"""
@@ -322,42 +340,6 @@ class ApprovalWorkflowCollection:
         
         return list(self.collection.find(search_query).sort("created_at", -1).limit(limit))
 
-    def get_denied_workflows(self, limit=100):
-        """Get all denied workflows with comments and feedback"""
-        try:
-            # Find workflows that were denied by manager or CEO
-            denied_workflows = list(self.collection.find({
-                "$or": [
-                    {"manager_status": "denied"},
-                    {"ceo_status": "denied"}
-                ]
-            }).sort("updated_at", -1).limit(limit))
-            
-            # Format the data to include denial information
-            formatted_workflows = []
-            for workflow in denied_workflows:
-                formatted_workflow = workflow.copy()
-                
-                # Determine who denied the workflow
-                if workflow.get("manager_status") == "denied":
-                    formatted_workflow["denied_by_role"] = "Manager"
-                    formatted_workflow["denied_by_email"] = workflow.get("manager_email", "Unknown")
-                    formatted_workflow["denied_at"] = workflow.get("manager_approval_date")
-                    formatted_workflow["comments"] = workflow.get("manager_comments", "No comments provided")
-                elif workflow.get("ceo_status") == "denied":
-                    formatted_workflow["denied_by_role"] = "CEO"
-                    formatted_workflow["denied_by_email"] = workflow.get("ceo_email", "Unknown")
-                    formatted_workflow["denied_at"] = workflow.get("ceo_approval_date")
-                    formatted_workflow["comments"] = workflow.get("ceo_comments", "No comments provided")
-                
-                formatted_workflows.append(formatted_workflow)
-            
-            return formatted_workflows
-            
-        except Exception as e:
-            print(f"Error getting denied workflows: {e}")
-            return []
-
     def get_approval_comments(self, limit=100):
         """Get approval comments for completed workflows"""
         try:
@@ -389,14 +371,7 @@ class ApprovalWorkflowCollection:
     
     def get_denied_workflows(self, limit=100):
         """Get all denied workflows (manager denied, CEO denied, or client rejected)"""
-        return list(self.collection.find({
-            "workflow_status": {"$in": ["cancelled", "client_rejected"]},
-            "$or": [
-                {"manager_status": "denied"},
-                {"ceo_status": "denied"},
-                {"client_status": "rejected"}
-            ]
-        }).sort("updated_at", -1).limit(limit))
+        return list(self.collection.find(DENIED_QUERY).sort("updated_at", -1).limit(limit))
 
     def update_workflow_custom(self, workflow_id, update_data):
         """Update workflow with custom data"""
@@ -0,0 +1,205 @@
+"""Cold tier for records that are old and in a terminal state.
+
+Archived records move to "<collection>_archive" as one zlib-compressed BSON
+blob each, next to a few uncompressed lookup keys. Lookups by id fall through
+from the hot collection to the archive; listings only read the hot tier, so
+indexes and caches stay sized to active business.
+
+    python -m mongodb_collections.archive_collection --days 365 --dry-run
+"""
+
+import argparse
+import os
+import sys
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+import bson
+from bson import Binary
+from pymongo import DeleteOne, ReplaceOne
+from cpq.db import db
+from cpq.cache_invalidation import process_cache
+
+# Records untouched for this long (and in a terminal state) are archived
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = 500
+
+# Per collection: the age field, what counts as terminal, and the fields
+# besides _id that lookups (and the document cleanup job) may use on the archive
+ARCHIVE_POLICIES = {
+    "quotes": {
+        "age_field": "updated_at",
+        "terminal": {"status": {"$in": ["accepted", "rejected"]}},
+        "keys": [],
+    },
+    "storinggenratedpdfinqotemangamnet": {
+        "age_field": "generated_at",
+        "terminal": {},
+        "keys": ["quote_id", "file_path", "generated_at"],
+    },
+    "storinggenratedaggremntfromquotemangnt": {
+        "age_field": "generated_at",
+        "terminal": {"status": "completed"},
+        "keys": ["quote_id", "file_path"],
+    },
+    "approval_workflows": {
+        "age_field": "updated_at",
+        "terminal": {"workflow_status": {"$in": ["completed", "cancelled", "client_rejected"]}},
+        "keys": ["document_id"],
+    },
+}
+
+_indexes_ensured = set()
+_index_lock = threading.Lock()
+
+
+def archive_name(collection_name):
+    return f"{collection_name}_archive"
+
+
+def pack(doc, keys, archived_at):
+    """Archive entry for doc: _id, lookup keys and the compressed document"""
+    entry = {"_id": doc["_id"], "archived_at": archived_at,
+             "data": Binary(zlib.compress(bson.encode(doc)))}
+    for key in keys:
+        if key in doc:
+            entry[key] = doc[key]
+    return entry
+
+
+def unpack(entry, projection=None):
+    """The original document from an archive entry, or None"""
+    if not entry:
+        return None
+    doc = bson.decode(zlib.decompress(entry["data"]))
+    if projection:
+        # Only exclusions are used on fall-through reads (e.g. large base64 fields)
+        for field, include in projection.items():
+            if not include:
+                doc.pop(field, None)
+    return doc
+
+
+class ArchiveCollection:
+    """Archive tier of one hot collection"""
+
+    def __init__(self, collection_name):
+        self.policy = ARCHIVE_POLICIES[collection_name]
+        self.source = db[collection_name]
+        self.collection = db[archive_name(collection_name)]
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Lookup keys of the archive, created once per process"""
+        name = self.collection.name
+        if name in _indexes_ensured:
+            return
+        with _index_lock:
+            if name in _indexes_ensured:
+                return
+            try:
+                for key in self.policy["keys"]:
+                    self.collection.create_index(key)
+                _indexes_ensured.add(name)
+            except Exception as e:
+                print(f"Error creating archive indexes on {name}: {str(e)}")
+
+    def find_one(self, query, projection=None):
+        """Archived document matching query on _id or the lookup keys, newest first"""
+        try:
+            entry = self.collection.find_one(query, sort=[("archived_at", -1)])
+            return unpack(entry, projection)
+        except Exception as e:
+            print(f"Error reading archive {self.collection.name}: {str(e)}")
+            return None
+
+    def archive(self, days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+        """Move old terminal records to the archive in batches.
+
+        Each batch is written to the archive first and only then deleted from
+        the hot collection, so an interrupted run loses nothing and can simply
+        be repeated. A record modified since it was read stays hot.
+        """
+        age_field = self.policy["age_field"]
+        query = {age_field: {"$lt": datetime.now() - timedelta(days=days)}, **self.policy["terminal"]}
+        summary = {"collection": self.source.name, "candidates": 0, "archived": 0, "kept": 0}
+
+        if dry_run:
+            summary["candidates"] = self.source.count_documents(query)
+            return summary
+
+        cursor = self.source.find(query).sort("_id", 1).batch_size(batch_size)
+        batch = []
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                self._archive_batch(batch, summary)
+                batch = []
+        if batch:
+            self._archive_batch(batch, summary)
+        return summary
+
+    def _archive_batch(self, docs, summary):
+        age_field = self.policy["age_field"]
+        now = datetime.now()
+        summary["candidates"] += len(docs)
+
+        self.collection.bulk_write([
+            ReplaceOne({"_id": doc["_id"]}, pack(doc, self.policy["keys"], now), upsert=True)
+            for doc in docs
+        ], ordered=False)
+
+        # The age field doubles as a version check: a concurrent update moves it
+        result = self.source.bulk_write([
+            DeleteOne({"_id": doc["_id"], age_field: doc.get(age_field), **self.policy["terminal"]})
+            for doc in docs
+        ], ordered=False)
+        summary["archived"] += result.deleted_count
+
+        ids = [doc["_id"] for doc in docs]
+        if result.deleted_count < len(docs):
+            # Changed while archiving: the hot copy stays authoritative
+            kept = [doc["_id"] for doc in self.source.find({"_id": {"$in": ids}}, {"_id": 1})]
+            self.collection.delete_many({"_id": {"$in": kept}})
+            summary["kept"] += len(kept)
+        for doc_id in ids:
+            process_cache.evict(self.source.name, doc_id)
+
+
+def run_archival(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False, collections=None):
+    """Archive every configured collection; returns one summary per collection"""
+    summaries = []
+    for name in collections or ARCHIVE_POLICIES:
+        try:
+            summaries.append(ArchiveCollection(name).archive(days, batch_size, dry_run))
+        except Exception as e:
+            print(f"❌ Archival of {name} failed: {str(e)}")
+            summaries.append({"collection": name, "error": str(e)})
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old terminal records to the archive tier')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help='Archive records older than this many days')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--collection', action='append', choices=sorted(ARCHIVE_POLICIES),
+                        help='Only archive this collection (repeatable)')
+    parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for summary in run_archival(args.days, max(1, args.batch_size), args.dry_run, args.collection):
+        if "error" in summary:
+            failed = True
+        elif args.dry_run:
+            print(f"🔎 {summary['collection']}: {summary['candidates']} records would be archived")
+        else:
+            print(f"📦 {summary['collection']}: {summary['archived']} archived, "
+                  f"{summary['kept']} kept (changed during the run)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
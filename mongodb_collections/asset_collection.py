@@ -0,0 +1,186 @@
+import base64
+import binascii
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from bson import Binary
+from pymongo import UpdateOne
+from cpq.db import db
+
+# Inline raster images as saved by the template builder editor. SVG is left
+# inline: served from our origin it could carry script
+DATA_URI_PATTERN = re.compile(r"data:(image/(?:png|jpeg|jpg|webp|gif));base64,([A-Za-z0-9+/=]+)")
+
+# Blocks reference extracted images by URL, served by the assets blueprint
+ASSET_URL_PREFIX = "/assets/"
+ASSET_REF_PATTERN = re.compile(r"/assets/([0-9a-f]{64})")
+
+# Assets never change, so decoded bytes can be kept without invalidation
+ASSET_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+class _AssetBytesCache:
+    """LRU of asset bytes by hash, bounded by total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, asset_hash):
+        with self._lock:
+            entry = self._entries.get(asset_hash)
+            if entry is not None:
+                self._entries.move_to_end(asset_hash)
+            return entry
+
+    def set(self, asset_hash, entry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if asset_hash in self._entries:
+                return
+            self._entries[asset_hash] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (data, _) = self._entries.popitem(last=False)
+                self._size -= len(data)
+
+
+_asset_cache = _AssetBytesCache(ASSET_CACHE_MAX_BYTES)
+
+
+def asset_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class AssetCollection:
+    """Content-addressed store for images extracted from template builder blocks.
+
+    Each asset is stored once under the SHA-256 of its bytes, however many
+    templates use it.
+    """
+
+    def __init__(self):
+        self.collection = db["template_assets"]
+
+    def extract_images(self, html, pending):
+        """Replace inline base64 images in html with asset URLs.
+
+        Decoded images are added to pending (hash -> (bytes, mime type)) to be
+        written with store_assets. Returns (html, hashes referenced by html).
+        """
+        hashes = []
+
+        def replace(match):
+            try:
+                data = base64.b64decode(match.group(2), validate=True)
+            except (binascii.Error, ValueError):
+                # Not valid base64; leave it inline rather than lose the image
+                return match.group(0)
+            mime_type = match.group(1).replace("image/jpg", "image/jpeg")
+            digest = asset_hash(data)
+            pending[digest] = (data, mime_type)
+            hashes.append(digest)
+            return ASSET_URL_PREFIX + digest
+
+        html = DATA_URI_PATTERN.sub(replace, html or "")
+        # Images extracted by earlier saves stay referenced
+        for digest in ASSET_REF_PATTERN.findall(html):
+            if digest not in hashes:
+                hashes.append(digest)
+        return html, hashes
+
+    def extract_block_assets(self, blocks):
+        """Move inline images of every block into the store; returns the rewritten blocks"""
+        pending = {}
+        rewritten = []
+        for block in blocks or []:
+            if not isinstance(block, dict):
+                rewritten.append(block)
+                continue
+            content, hashes = self.extract_images(block.get("content"), pending)
+            block = {**block, "content": content}
+            if hashes:
+                block["assets"] = hashes
+            else:
+                block.pop("assets", None)
+            rewritten.append(block)
+        self.store_assets(pending)
+        return rewritten
+
+    def store_assets(self, assets):
+        """Insert assets (hash -> (bytes, mime type)) that are not stored yet, in one round trip"""
+        if not assets:
+            return
+        now = datetime.now()
+        self.collection.bulk_write([
+            UpdateOne(
+                {"_id": digest},
+                {"$setOnInsert": {"data": Binary(data), "mime_type": mime_type,
+                                  "size": len(data), "created_at": now}},
+                upsert=True
+            )
+            for digest, (data, mime_type) in assets.items()
+        ], ordered=False)
+
+    def get_asset(self, digest):
+        """(bytes, mime type) of an asset, or None"""
+        return self.get_assets([digest]).get(digest)
+
+    def get_assets(self, hashes):
+        """Decoded assets by hash, fetching the uncached ones in a single query"""
+        found = {}
+        missing = []
+        for digest in hashes:
+            entry = _asset_cache.get(digest)
+            if entry is not None:
+                found[digest] = entry
+            elif digest not in missing:
+                missing.append(digest)
+        if missing:
+            try:
+                for doc in self.collection.find({"_id": {"$in": missing}}):
+                    entry = (bytes(doc["data"]), doc.get("mime_type", "application/octet-stream"))
+                    _asset_cache.set(doc["_id"], entry)
+                    found[doc["_id"]] = entry
+            except Exception as e:
+                print(f"Error loading assets: {str(e)}")
+        return found
+
+    def inline_assets(self, html):
+        """html with every /assets/<hash> URL replaced by a data URI of the asset.
+
+        For renderers that have no base URL to resolve the relative asset URLs
+        against. References to unknown assets are left as they are.
+        """
+        hashes = ASSET_REF_PATTERN.findall(html or "")
+        if not hashes:
+            return html
+        assets = self.get_assets(hashes)
+
+        def replace(match):
+            asset = assets.get(match.group(1))
+            if asset is None:
+                return match.group(0)
+            data, mime_type = asset
+            return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+        return ASSET_REF_PATTERN.sub(replace, html)
+
+    def get_block_images(self, block):
+        """Image bytes used by a block, in document order, ready for a renderer"""
+        hashes = block.get("assets") or ASSET_REF_PATTERN.findall(block.get("content") or "")
+        assets = self.get_assets(hashes)
+        images = [assets[digest][0] for digest in hashes if digest in assets]
+        # Documents saved before asset extraction still carry inline images
+        for _, b64 in DATA_URI_PATTERN.findall(block.get("content") or ""):
+            try:
+                images.append(base64.b64decode(b64))
+            except (binascii.Error, ValueError):
+                continue
+        return images
@@ -1,27 +1,75 @@
+import argparse
+import re
+import sys
+import threading
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from cpq.db import db
 
+# maintenance_checkpoints entry written once normalize_client_emails has run
+MIGRATION_CHECKPOINT_ID = "client_email_migration"
+
+_indexes_ensured = False
+_index_lock = threading.Lock()
+# Whether stored emails are known to be normalized, read when the indexes are ensured
+_emails_normalized = False
+
+
+def normalize_email(email):
+    """Emails are matched case-insensitively and without surrounding whitespace"""
+    return email.strip().lower() if isinstance(email, str) else email
+
+
+def email_filter(email):
+    """Filter for the client with this email.
+
+    Until normalize_client_emails has run, legacy records may still hold
+    the address as it was typed, so the match is case-insensitive.
+    """
+    email = normalize_email(email)
+    if _emails_normalized or not isinstance(email, str):
+        return {"email": email}
+    return {"email": {"$regex": f"^\\s*{re.escape(email)}\\s*$", "$options": "i"}}
+
+
+def client_email_migration_completed():
+    """Whether normalize_client_emails has finished a full pass"""
+    try:
+        return db["maintenance_checkpoints"].count_documents({"_id": MIGRATION_CHECKPOINT_ID}, limit=1) > 0
+    except Exception as e:
+        print(f"Error reading client email migration status: {str(e)}")
+        return False
+
+
 class ClientCollection:
     """Handles client-related MongoDB operations"""
     
     def __init__(self):
         self.collection = db["clients"]
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Unique index on the normalized email, created once per process"""
+        global _indexes_ensured, _emails_normalized
+        if _indexes_ensured:
+            return
+        with _index_lock:
+            if _indexes_ensured:
+                return
+            _emails_normalized = client_email_migration_completed()
+            try:
+                self.collection.create_index("email", unique=True)
+                _indexes_ensured = True
+            except Exception as e:
+                # Typically legacy duplicates; retried by the next instance, e.g. after
+                # normalize_client_emails has merged them
+                print(f"⚠️ Could not create unique email index on clients: {str(e)}")
     
     def create_client(self, client_data):
         """Create a new client with validation"""
-        # Normalize incoming keys from frontend
-        normalized = {
-            'clientName': client_data.get('clientName') or client_data.get('name'),
-            'companyName': client_data.get('companyName') or client_data.get('company'),
-            'email': client_data.get('email'),
-            'phoneNumber': client_data.get('phoneNumber') or client_data.get('phone'),
-            'serviceType': client_data.get('serviceType'),
-            'requirements': client_data.get('requirements')
-        }
-
-        if not self._validate_client_data(normalized):
-            raise ValueError("Invalid client data")
+        normalized = self.normalize_client_data(client_data)
 
         normalized["created_at"] = datetime.now()
         normalized["updated_at"] = datetime.now()
@@ -37,7 +85,7 @@ class ClientCollection:
     
     def get_client_by_email(self, email):
         """Get client by email address"""
-        return self.collection.find_one({"email": email})
+        return self.collection.find_one(email_filter(email))
     
     def get_all_clients(self, limit=100):
         """Get all clients with pagination"""
@@ -45,17 +93,7 @@ class ClientCollection:
     
     def update_client(self, client_id, client_data):
         """Update existing client"""
-        normalized = {
-            'clientName': client_data.get('clientName') or client_data.get('name'),
-            'companyName': client_data.get('companyName') or client_data.get('company'),
-            'email': client_data.get('email'),
-            'phoneNumber': client_data.get('phoneNumber') or client_data.get('phone'),
-            'serviceType': client_data.get('serviceType'),
-            'requirements': client_data.get('requirements')
-        }
-
-        if not self._validate_client_data(normalized):
-            raise ValueError("Invalid client data")
+        normalized = self.normalize_client_data(client_data)
 
         normalized["updated_at"] = datetime.now()
 
@@ -64,6 +102,75 @@ class ClientCollection:
             {"$set": normalized}
         )
     
+    def upsert_client_by_email(self, client_data):
+        """Create or update the client with this email in one round trip.
+
+        Returns (client, created) where client is the stored document after the write.
+        """
+        normalized = self.normalize_client_data(client_data)
+        now = datetime.now()
+        normalized["updated_at"] = now
+        # The _id is only applied on insert, so it tells whether this call created the client
+        new_id = ObjectId()
+        update = {"$set": normalized, "$setOnInsert": {"_id": new_id, "created_at": now}}
+
+        try:
+            client = self.collection.find_one_and_update(
+                email_filter(normalized["email"]), update,
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert inserted the same email first; ours is now a plain update
+            client = self.collection.find_one_and_update(
+                email_filter(normalized["email"]), update,
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        return client, client["_id"] == new_id
+
+    def upsert_clients_by_email(self, clients_data):
+        """Batch variant of upsert_client_by_email using a single unordered bulk_write.
+
+        Invalid entries are skipped and reported. Returns a dict with the
+        bulk write counts, the stored clients keyed by email and the errors.
+        """
+        now = datetime.now()
+        operations = {}
+        errors = []
+        for client_data in clients_data:
+            try:
+                normalized = self.normalize_client_data(client_data)
+            except ValueError as e:
+                errors.append({"email": client_data.get("email"), "error": str(e)})
+                continue
+            normalized["updated_at"] = now
+            # Last entry wins when an email repeats
+            operations[normalized["email"]] = UpdateOne(
+                email_filter(normalized["email"]),
+                {"$set": normalized, "$setOnInsert": {"created_at": now}},
+                upsert=True
+            )
+
+        summary = {"upserted": 0, "modified": 0, "matched": 0, "clients": {}, "errors": errors}
+        if not operations:
+            return summary
+
+        emails = list(operations)
+        try:
+            result = self.collection.bulk_write(list(operations.values()), ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+            for write_error in result.get("writeErrors", []):
+                errors.append({"email": emails[write_error["index"]], "error": write_error.get("errmsg")})
+
+        summary["upserted"] = result.get("nUpserted", 0)
+        summary["modified"] = result.get("nModified", 0)
+        summary["matched"] = result.get("nMatched", 0)
+        summary["clients"] = {
+            client["email"]: client
+            for client in self.collection.find({"email": {"$in": emails}})
+        }
+        return summary
+
     def delete_client(self, client_id):
         """Delete client by ID"""
         try:
@@ -95,7 +202,89 @@ class ClientCollection:
         ]
         return list(self.collection.aggregate(pipeline))
     
+    def normalize_client_data(self, client_data):
+        """Normalize incoming keys from frontend/imports and validate. Raises ValueError if invalid."""
+        normalized = {
+            'clientName': client_data.get('clientName') or client_data.get('name'),
+            'companyName': client_data.get('companyName') or client_data.get('company'),
+            'email': normalize_email(client_data.get('email')),
+            'phoneNumber': client_data.get('phoneNumber') or client_data.get('phone'),
+            'serviceType': client_data.get('serviceType'),
+            'requirements': client_data.get('requirements')
+        }
+
+        if not self._validate_client_data(normalized):
+            raise ValueError("Invalid client data")
+
+        return normalized
+    
     def _validate_client_data(self, data):
         """Validate client data before saving"""
         required_fields = ["clientName", "email", "companyName", "phoneNumber"]
         return all(data.get(field) for field in required_fields)
+
+
+def normalize_client_emails(dry_run=False):
+    """Lower-case stored client emails and merge clients that differ only by case.
+
+    Run once before relying on exact email lookups:
+
+        python -m mongodb_collections.client_collection --dry-run
+
+    The oldest client of each address keeps its _id. Each field takes the
+    most recently updated non-empty value among the duplicates, which are
+    then deleted. Returns a summary.
+    """
+    global _emails_normalized, _indexes_ensured
+    collection = db["clients"]
+    groups = {}
+    for client in collection.find({"email": {"$type": "string"}}):
+        groups.setdefault(normalize_email(client["email"]), []).append(client)
+
+    summary = {"clients": 0, "normalized": 0, "merged": 0}
+    for email, group in groups.items():
+        summary["clients"] += len(group)
+        group.sort(key=lambda client: client.get("created_at") or datetime.min)
+        keep, duplicates = group[0], group[1:]
+        if not duplicates and keep["email"] == email:
+            continue
+        summary["normalized"] += 1
+        summary["merged"] += len(duplicates)
+        if dry_run:
+            continue
+
+        merged = {}
+        for client in sorted(group, key=lambda client: client.get("updated_at") or client.get("created_at")
+                             or datetime.min):
+            merged.update({field: value for field, value in client.items() if value not in (None, "")})
+        merged.update({"_id": keep["_id"], "email": email, "created_at": keep.get("created_at")})
+        # Duplicates go first, so the unique index (if any) accepts the normalized email
+        if duplicates:
+            collection.delete_many({"_id": {"$in": [client["_id"] for client in duplicates]}})
+        collection.replace_one({"_id": keep["_id"]}, merged)
+
+    if not dry_run:
+        db["maintenance_checkpoints"].update_one(
+            {"_id": MIGRATION_CHECKPOINT_ID}, {"$set": {"completed_at": datetime.now(), "summary": summary}},
+            upsert=True
+        )
+        _emails_normalized = True
+        _indexes_ensured = False
+        ClientCollection()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Normalize client emails and merge case-only duplicates')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+    args = parser.parse_args(argv)
+
+    summary = normalize_client_emails(args.dry_run)
+    verb = "would be" if args.dry_run else "were"
+    print(f"📇 {summary['normalized']} of {summary['clients']} client emails {verb} normalized, "
+          f"{summary['merged']} duplicates {verb} merged")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
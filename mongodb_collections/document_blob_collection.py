@@ -0,0 +1,239 @@
+"""Content-addressed storage for generated PDFs and agreements.
+
+Each distinct output is stored once, keyed by the SHA-256 of its bytes, with a
+reference count of the metadata records pointing at it. The bytes live in
+MongoDB; "documents/<sha256>.<ext>" is a local copy that is rewritten on
+demand, since the file system may be ephemeral.
+
+    python -m mongodb_collections.document_blob_collection --dry-run
+"""
+
+import argparse
+import base64
+import hashlib
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from bson import Binary
+from pymongo import ReturnDocument
+from cpq.db import db
+
+DOCUMENTS_DIR = 'documents'
+
+# Metadata collections whose records point at blobs, with the legacy
+# base64 field each one used to embed
+BLOB_OWNERS = {
+    "storinggenratedpdfinqotemangamnet": "pdf_data",
+    "storinggenratedaggremntfromquotemangnt": "agreement_data",
+}
+
+# maintenance_checkpoints entry written once deduplicate_documents has run
+MIGRATION_CHECKPOINT_ID = "document_blob_migration"
+
+_indexes_ensured = False
+_index_lock = threading.Lock()
+# Documents stored by the current thread while track_generated_documents() is active
+_generated = threading.local()
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def blob_path(digest, extension='.pdf'):
+    return os.path.join(DOCUMENTS_DIR, f"{digest}{extension}")
+
+
+class DocumentBlobCollection:
+    """Reference-counted document bytes keyed by SHA-256"""
+
+    def __init__(self):
+        self.collection = db["generated_document_blobs"]
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Index for finding unreferenced blobs, created once per process"""
+        global _indexes_ensured
+        if _indexes_ensured:
+            return
+        with _index_lock:
+            if _indexes_ensured:
+                return
+            try:
+                self.collection.create_index("ref_count")
+                _indexes_ensured = True
+            except Exception as e:
+                print(f"Error creating document blob indexes: {str(e)}")
+
+    def store(self, content, extension='.pdf'):
+        """Store content (or take another reference to it); returns (sha256, file path)"""
+        digest = content_hash(content)
+        path = self.write_file(digest, content, extension)
+        self.collection.update_one(
+            {"_id": digest},
+            {
+                "$inc": {"ref_count": 1},
+                "$setOnInsert": {
+                    "data": Binary(content),
+                    "size": len(content),
+                    "extension": extension,
+                    "created_at": datetime.now()
+                }
+            },
+            upsert=True
+        )
+        return digest, path
+
+    def write_file(self, digest, content, extension='.pdf'):
+        """Local copy of a blob, written only if it is not already there"""
+        path = blob_path(digest, extension)
+        if not os.path.exists(path):
+            os.makedirs(DOCUMENTS_DIR, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        return path
+
+    def get_content(self, digest):
+        """Bytes of a blob, or None"""
+        try:
+            blob = self.collection.find_one({"_id": digest}, {"data": 1})
+            return bytes(blob["data"]) if blob else None
+        except Exception as e:
+            print(f"Error reading document blob {digest}: {str(e)}")
+            return None
+
+    def release(self, digest):
+        """Drop one reference; the blob and its file go with the last one"""
+        if not digest:
+            return False
+        try:
+            blob = self.collection.find_one_and_update(
+                {"_id": digest},
+                {"$inc": {"ref_count": -1}},
+                projection={"ref_count": 1, "extension": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if not blob or blob["ref_count"] > 0:
+                return False
+            # Conditional, so a reference taken in the meantime keeps the blob
+            if self.collection.delete_one({"_id": digest, "ref_count": {"$lte": 0}}).deleted_count:
+                path = blob_path(digest, blob.get("extension", ".pdf"))
+                if os.path.exists(path):
+                    os.remove(path)
+                return True
+            return False
+        except Exception as e:
+            print(f"Error releasing document blob {digest}: {str(e)}")
+            return False
+
+
+@contextmanager
+def track_generated_documents():
+    """Collect {collection, id} for every PDF or agreement stored by this thread"""
+    previous = getattr(_generated, "documents", None)
+    _generated.documents = documents = []
+    try:
+        yield documents
+    finally:
+        _generated.documents = previous
+
+
+def note_generated_document(collection_name, document_id):
+    documents = getattr(_generated, "documents", None)
+    if documents is not None:
+        documents.append({"collection": collection_name, "id": str(document_id)})
+
+
+def document_content(record, legacy_field, blobs=None):
+    """Bytes of a generated document record, from its blob or the legacy base64 field"""
+    if record.get("content_hash"):
+        return (blobs or DocumentBlobCollection()).get_content(record["content_hash"])
+    legacy = record.get(legacy_field)
+    if isinstance(legacy, str) and legacy:
+        try:
+            return base64.b64decode(legacy)
+        except Exception:
+            return None
+    return None
+
+
+def blob_migration_completed():
+    """Whether deduplicate_documents has finished a full pass"""
+    try:
+        return db["maintenance_checkpoints"].count_documents({"_id": MIGRATION_CHECKPOINT_ID}, limit=1) > 0
+    except Exception as e:
+        print(f"Error reading blob migration status: {str(e)}")
+        return False
+
+
+def deduplicate_documents(dry_run=False):
+    """Move embedded base64 and loose files under documents/ into shared blobs.
+
+    Records that already have a content_hash are skipped, so the migration
+    can be re-run after an interruption. Returns one summary per collection.
+    """
+    blobs = DocumentBlobCollection()
+    summaries = []
+    for name, legacy_field in BLOB_OWNERS.items():
+        source = db[name]
+        summary = {"collection": name, "records": 0, "migrated": 0, "duplicates": 0}
+        seen = set()
+        for record in source.find({"content_hash": {"$exists": False}}):
+            summary["records"] += 1
+            file_path = record.get("file_path") or ''
+            local_path = os.path.join(DOCUMENTS_DIR, os.path.basename(file_path)) if file_path else None
+            content = document_content(record, legacy_field, blobs)
+            if content is None and local_path and os.path.exists(local_path):
+                with open(local_path, 'rb') as f:
+                    content = f.read()
+            if content is None:
+                continue
+
+            digest = content_hash(content)
+            if digest in seen or blobs.collection.count_documents({"_id": digest}, limit=1):
+                summary["duplicates"] += 1
+            seen.add(digest)
+            if dry_run:
+                summary["migrated"] += 1
+                continue
+
+            extension = os.path.splitext(file_path)[1] or '.pdf'
+            digest, path = blobs.store(content, extension)
+            update = {"$set": {"content_hash": digest, "file_path": path, "file_size": len(content)}}
+            if isinstance(record.get(legacy_field), str):
+                # Only the base64 copy; some agreements keep structured data here
+                update["$unset"] = {legacy_field: ""}
+            if not source.update_one({"_id": record["_id"], "content_hash": {"$exists": False}}, update).modified_count:
+                blobs.release(digest)
+                continue
+            if local_path and local_path != path and os.path.exists(local_path):
+                os.remove(local_path)
+            summary["migrated"] += 1
+        summaries.append(summary)
+    if not dry_run:
+        db["maintenance_checkpoints"].update_one(
+            {"_id": MIGRATION_CHECKPOINT_ID}, {"$set": {"completed_at": datetime.now(), "summaries": summaries}},
+            upsert=True
+        )
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Deduplicate generated documents into shared blobs')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be migrated')
+    args = parser.parse_args(argv)
+
+    for summary in deduplicate_documents(args.dry_run):
+        verb = "would be migrated" if args.dry_run else "migrated"
+        print(f"📦 {summary['collection']}: {summary['migrated']} of {summary['records']} records {verb}, "
+              f"{summary['duplicates']} of them duplicates of an existing blob")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,394 @@
+"""Retention and orphan cleanup for generated documents.
+
+Each run handles one batch and stores where it stopped, so the job works
+through documents/ and the metadata collections a slice at a time.
+documents/ is listed once per pass, into a queue of file names; the runs
+of that pass read their batch from the queue instead of the directory.
+The job cleans up:
+
+- files under documents/ that no PDF, agreement, signature certificate or
+  blob refers to
+- PDF and agreement records whose content is gone (no blob, no embedded
+  copy, no stored text, no file). Until the blob migration
+  (``python -m mongodb_collections.document_blob_collection``) has
+  completed, records without a blob are never treated as dangling: on an
+  ephemeral file system their legacy file may simply not exist yet
+- PDFs, and agreements nobody has signed, older than DOCUMENT_RETENTION_DAYS
+
+Signed agreements and signature certificates are never deleted. Anything
+younger than the grace period is left alone, since files are written before
+their metadata.
+
+    python -m mongodb_collections.document_cleanup --dry-run
+"""
+
+import argparse
+import heapq
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from cpq.db import db
+from . import document_blob_collection
+from .archive_collection import ArchiveCollection, unpack
+from .document_blob_collection import BLOB_OWNERS, DocumentBlobCollection, blob_migration_completed
+
+DOCUMENT_RETENTION_DAYS = int(os.getenv("DOCUMENT_RETENTION_DAYS", "730"))
+CLEANUP_GRACE_HOURS = int(os.getenv("DOCUMENT_CLEANUP_GRACE_HOURS", "24"))
+CLEANUP_INTERVAL_MINUTES = int(os.getenv("DOCUMENT_CLEANUP_INTERVAL_MINUTES", "60"))
+CLEANUP_BATCH_SIZE = 200
+
+CHECKPOINT_ID = "document_cleanup"
+# Names under documents/ still to be checked in the current pass
+FILE_QUEUE_COLLECTION = "document_cleanup_files"
+FILE_QUEUE_CHUNK = 1000
+LEASE_SECONDS = 600
+
+# Agreements in these states carry signatures and are kept regardless of age
+SIGNED_STATUSES = ["client_signed", "ceo_signed", "completed"]
+
+# Records the retention policy may delete, per metadata collection
+RETENTION_FILTERS = {
+    "storinggenratedpdfinqotemangamnet": {},
+    "storinggenratedaggremntfromquotemangnt": {"status": {"$nin": SIGNED_STATUSES}},
+}
+
+BLOB_FILE_PATTERN = re.compile(r'^([0-9a-f]{64})\.\w+$')
+
+# Fields holding a document's text, from which download_document rebuilds the file
+TEXT_CONTENT_FIELDS = ["content", "agreement_content"]
+
+_indexes_ensured = False
+_index_lock = threading.Lock()
+_scheduler = None
+
+
+class DocumentCleanupJob:
+    """One incremental pass over generated documents, resumed from a checkpoint"""
+
+    def __init__(self):
+        self.checkpoints = db["maintenance_checkpoints"]
+        self.file_queue = db[FILE_QUEUE_COLLECTION]
+        self.blobs = DocumentBlobCollection()
+        self.sources = {name: db[name] for name in BLOB_OWNERS}
+        self.archives = {name: ArchiveCollection(name) for name in BLOB_OWNERS}
+        self.certificates = db["signature_certificates"]
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """file_path and generated_at lookups, created once per process"""
+        global _indexes_ensured
+        if _indexes_ensured:
+            return
+        with _index_lock:
+            if _indexes_ensured:
+                return
+            try:
+                for source in self.sources.values():
+                    source.create_index("file_path")
+                    source.create_index("generated_at")
+                self.certificates.create_index("file_path")
+                _indexes_ensured = True
+            except Exception as e:
+                print(f"Error creating document cleanup indexes: {str(e)}")
+
+    def _file_owners(self):
+        """Collections whose records may point at a file under documents/"""
+        return [*self.sources.values(), *(a.collection for a in self.archives.values()), self.certificates]
+
+    # --- Checkpoint and lease -----------------------------------------------
+
+    def get_checkpoint(self):
+        return self.checkpoints.find_one({"_id": CHECKPOINT_ID}) or {}
+
+    def reset_checkpoint(self):
+        """Start the next run from the beginning of every scan"""
+        self.checkpoints.update_one({"_id": CHECKPOINT_ID},
+                                    {"$set": {"files_after": None, "records_after": {}}})
+
+    def _acquire_lease(self, now):
+        """Only one worker (of any process) cleans at a time"""
+        self.checkpoints.update_one({"_id": CHECKPOINT_ID}, {"$setOnInsert": {"lease_until": None}}, upsert=True)
+        result = self.checkpoints.update_one(
+            {"_id": CHECKPOINT_ID, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"lease_until": now + timedelta(seconds=LEASE_SECONDS),
+                      "lease_owner": f"{socket.gethostname()}:{os.getpid()}"}}
+        )
+        return result.modified_count == 1
+
+    # --- Run ----------------------------------------------------------------
+
+    def run(self, dry_run=False, batch_size=CLEANUP_BATCH_SIZE):
+        """Clean the next batch; returns a report, or None if another worker is running.
+
+        A dry run reports what the next run would delete and leaves the
+        checkpoint where it is.
+        """
+        now = datetime.now()
+        if not dry_run and not self._acquire_lease(now):
+            return None
+
+        checkpoint = self.get_checkpoint()
+        report = {"dry_run": dry_run, "files_scanned": 0, "records_scanned": 0,
+                  "orphan_files": [], "dangling": [], "expired": []}
+        try:
+            files_after = self._clean_files(checkpoint.get("files_after"), batch_size, now, report, dry_run)
+            records_after = {}
+            for name in self.sources:
+                after = (checkpoint.get("records_after") or {}).get(name)
+                records_after[name] = self._clean_records(name, after, batch_size, now, report, dry_run)
+                self._expire(name, batch_size, now, report, dry_run)
+        finally:
+            if not dry_run:
+                self.checkpoints.update_one({"_id": CHECKPOINT_ID}, {"$set": {"lease_until": None}})
+
+        if not dry_run:
+            self.checkpoints.update_one({"_id": CHECKPOINT_ID}, {"$set": {
+                "files_after": files_after,
+                "records_after": records_after,
+                "last_run_at": now,
+                "last_report": {key: len(value) if isinstance(value, list) else value
+                                for key, value in report.items()}
+            }})
+        return report
+
+    # --- Orphaned files -----------------------------------------------------
+
+    def _clean_files(self, after, batch_size, now, report, dry_run):
+        """Next batch of files by name; returns the cursor for the next run"""
+        documents_dir = document_blob_collection.DOCUMENTS_DIR
+        if not os.path.isdir(documents_dir):
+            return None
+        names = self._next_files(after, batch_size, dry_run)
+        report["files_scanned"] += len(names)
+
+        cutoff = (now - timedelta(hours=CLEANUP_GRACE_HOURS)).timestamp()
+        candidates = []
+        for name in names:
+            try:
+                if os.path.getmtime(os.path.join(documents_dir, name)) < cutoff:
+                    candidates.append(name)
+            except FileNotFoundError:
+                continue
+
+        referenced = self._referenced_files(candidates)
+        for name in candidates:
+            if name in referenced:
+                continue
+            report["orphan_files"].append(name)
+            if not dry_run:
+                try:
+                    os.remove(os.path.join(documents_dir, name))
+                except FileNotFoundError:
+                    pass
+        if names and not dry_run:
+            self.file_queue.delete_many({"_id": {"$lte": names[-1]}})
+        # A short batch means the end of the directory: start over next time
+        return names[-1] if len(names) == batch_size else None
+
+    def _next_files(self, after, batch_size, dry_run):
+        """Next batch of file names after the cursor, from this pass's queue"""
+        if after is None:
+            if dry_run:
+                # A dry run leaves the queue alone; its one batch comes from the directory
+                with os.scandir(document_blob_collection.DOCUMENTS_DIR) as entries:
+                    return heapq.nsmallest(batch_size, (entry.name for entry in entries if entry.is_file()))
+            self._queue_files()
+        query = {"_id": {"$gt": after}} if after else {}
+        return [doc["_id"] for doc in self.file_queue.find(query).sort("_id", 1).limit(batch_size)]
+
+    def _queue_files(self):
+        """Start a pass: replace the queue with the current listing of documents/"""
+        self.file_queue.delete_many({})
+        chunk = []
+        with os.scandir(document_blob_collection.DOCUMENTS_DIR) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                chunk.append({"_id": entry.name})
+                if len(chunk) >= FILE_QUEUE_CHUNK:
+                    self.file_queue.insert_many(chunk, ordered=False)
+                    chunk = []
+        if chunk:
+            self.file_queue.insert_many(chunk, ordered=False)
+
+    def _referenced_files(self, names):
+        """Subset of names under documents/ that a blob or a metadata record refers to"""
+        referenced = set()
+        by_hash = {}
+        for name in names:
+            match = BLOB_FILE_PATTERN.match(name)
+            if match:
+                by_hash[match.group(1)] = name
+        if by_hash:
+            for blob in self.blobs.collection.find({"_id": {"$in": list(by_hash)}}, {"_id": 1}):
+                referenced.add(by_hash[blob["_id"]])
+
+        remaining = [name for name in names if name not in referenced]
+        if not remaining:
+            return referenced
+
+        # Paths are stored relative or absolute depending on the code that wrote them
+        documents_dir = document_blob_collection.DOCUMENTS_DIR
+        variants = {}
+        for name in remaining:
+            for path in (os.path.join('documents', name), os.path.join(documents_dir, name),
+                         os.path.abspath(os.path.join(documents_dir, name))):
+                variants[path] = name
+        for collection in self._file_owners():
+            for doc in collection.find({"file_path": {"$in": list(variants)}}, {"file_path": 1}):
+                referenced.add(variants[doc["file_path"]])
+
+        # Anything else written from another working directory: match the file name
+        remaining = [name for name in remaining if name not in referenced]
+        if remaining:
+            pattern = r'(?:^|[\\/])(?:' + '|'.join(re.escape(name) for name in remaining) + r')$'
+            for collection in self._file_owners():
+                for doc in collection.find({"file_path": {"$regex": pattern}}, {"file_path": 1}):
+                    referenced.add(os.path.basename(doc["file_path"].replace('\\', '/')))
+        return referenced
+
+    # --- Dangling metadata --------------------------------------------------
+
+    def _clean_records(self, name, after, batch_size, now, report, dry_run):
+        """Next batch of records by _id; returns the cursor for the next run"""
+        source = self.sources[name]
+        query = {"_id": {"$gt": after}} if after else {}
+        records = list(source.find(query, {"file_path": 1, "content_hash": 1, "generated_at": 1, "status": 1})
+                       .sort("_id", 1).limit(batch_size))
+        report["records_scanned"] += len(records)
+        if not records:
+            return None
+
+        ids = [record["_id"] for record in records]
+        # Checked by type so the embedded base64 or stored text itself is never loaded
+        embedded = {doc["_id"] for doc in source.find(
+            {"_id": {"$in": ids}, "$or": [{field: {"$type": "string", "$ne": ""}}
+                                          for field in [BLOB_OWNERS[name], *TEXT_CONTENT_FIELDS]]},
+            {"_id": 1}
+        )}
+        migrated = blob_migration_completed()
+        hashes = [record["content_hash"] for record in records if record.get("content_hash")]
+        stored = {blob["_id"] for blob in self.blobs.collection.find({"_id": {"$in": hashes}}, {"_id": 1})}
+
+        grace_cutoff = now - timedelta(hours=CLEANUP_GRACE_HOURS)
+        for record in records:
+            if record.get("generated_at") and record["generated_at"] > grace_cutoff:
+                continue
+            if record.get("status") in SIGNED_STATUSES:
+                continue
+            if (record.get("content_hash") in stored or record["_id"] in embedded
+                    or self._file_exists(record.get("file_path"))):
+                continue
+            if not record.get("content_hash") and not migrated:
+                # A legacy record whose file is missing here; the migration decides
+                continue
+            report["dangling"].append({"collection": name, "_id": str(record["_id"])})
+            if not dry_run:
+                # Unless content was attached since the batch was read
+                source.delete_one({"_id": record["_id"], "content_hash": record.get("content_hash")})
+        return records[-1]["_id"] if len(records) == batch_size else None
+
+    def _file_exists(self, file_path):
+        if not file_path:
+            return False
+        local_path = os.path.join(document_blob_collection.DOCUMENTS_DIR, os.path.basename(file_path))
+        return os.path.exists(file_path) or os.path.exists(local_path)
+
+    # --- Retention ----------------------------------------------------------
+
+    def _expire(self, name, batch_size, now, report, dry_run):
+        """Delete up to one batch of records past retention, hot tier first"""
+        if DOCUMENT_RETENTION_DAYS <= 0:
+            return
+        cutoff = now - timedelta(days=DOCUMENT_RETENTION_DAYS)
+        source = self.sources[name]
+        query = {"generated_at": {"$lt": cutoff}, **RETENTION_FILTERS[name]}
+        expired = 0
+        for record in source.find(query, {"content_hash": 1, "file_path": 1}).limit(batch_size):
+            expired += 1
+            report["expired"].append({"collection": name, "_id": str(record["_id"])})
+            if not dry_run and source.delete_one({"_id": record["_id"]}).deleted_count:
+                self._release_content(record)
+
+        # Archived records only carry generated_at where the archive keeps it
+        archive = self.archives[name]
+        if "generated_at" not in archive.policy["keys"]:
+            return
+        if expired >= batch_size:
+            return
+        for entry in archive.collection.find({"generated_at": {"$lt": cutoff}}).limit(batch_size - expired):
+            report["expired"].append({"collection": archive.collection.name, "_id": str(entry["_id"])})
+            if not dry_run and archive.collection.delete_one({"_id": entry["_id"]}).deleted_count:
+                self._release_content(unpack(entry))
+
+    def _release_content(self, record):
+        """Drop a deleted record's blob reference, or its own file for legacy records"""
+        if record.get("content_hash"):
+            self.blobs.release(record["content_hash"])
+        elif record.get("file_path"):
+            local_path = os.path.join(document_blob_collection.DOCUMENTS_DIR, os.path.basename(record["file_path"]))
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+
+def start_cleanup_scheduler(interval_minutes=CLEANUP_INTERVAL_MINUTES):
+    """Run one cleanup batch per interval in a daemon thread (idempotent).
+
+    Every worker may start one; the lease lets a single one run at a time.
+    Disabled with DOCUMENT_CLEANUP_INTERVAL_MINUTES=0.
+    """
+    global _scheduler
+    if interval_minutes <= 0 or _scheduler is not None:
+        return _scheduler
+
+    def run():
+        while True:
+            time.sleep(interval_minutes * 60)
+            try:
+                report = DocumentCleanupJob().run()
+                if report and (report["orphan_files"] or report["dangling"] or report["expired"]):
+                    print(f"🧹 Document cleanup: {len(report['orphan_files'])} files, "
+                          f"{len(report['dangling'])} dangling and {len(report['expired'])} expired records removed")
+            except Exception as e:
+                print(f"❌ Document cleanup failed: {str(e)}")
+
+    _scheduler = threading.Thread(target=run, name='document-cleanup', daemon=True)
+    _scheduler.start()
+    return _scheduler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Delete orphaned and expired generated documents')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what the next batch would delete')
+    parser.add_argument('--batch-size', type=int, default=CLEANUP_BATCH_SIZE)
+    parser.add_argument('--batches', type=int, default=1, help='Number of batches to run')
+    parser.add_argument('--reset', action='store_true', help='Restart every scan from the beginning')
+    args = parser.parse_args(argv)
+
+    job = DocumentCleanupJob()
+    if args.reset and not args.dry_run:
+        job.reset_checkpoint()
+
+    for _ in range(1 if args.dry_run else max(1, args.batches)):
+        report = job.run(args.dry_run, max(1, args.batch_size))
+        if report is None:
+            print("⏳ Another worker is running the cleanup; try again later")
+            return 1
+        verb = "would be deleted" if args.dry_run else "deleted"
+        print(f"🧹 Scanned {report['files_scanned']} files and {report['records_scanned']} records")
+        for key, label in (("orphan_files", "orphaned files"), ("dangling", "records without content"),
+                           ("expired", "records past retention")):
+            print(f"   {len(report[key])} {label} {verb}")
+            if args.dry_run:
+                for item in report[key]:
+                    print(f"     - {item if isinstance(item, str) else item['collection'] + ' ' + item['_id']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
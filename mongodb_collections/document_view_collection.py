@@ -0,0 +1,128 @@
+import base64
+import json
+import threading
+from datetime import datetime
+from bson import ObjectId
+from cpq.db import db
+
+# Fields returned for each document in listings; heavy base64 content is never read
+LISTING_FIELDS = ["filename", "client_name", "company_name", "client_email", "quote_id",
+                  "file_path", "status", "generated_at"]
+
+# Equality filters accepted by list_documents, mapped to document fields
+LISTING_FILTERS = {
+    "client": "client_name",
+    "client_email": "client_email",
+    "company": "company_name",
+    "quote_id": "quote_id",
+}
+
+_indexes_ensured = False
+_index_lock = threading.Lock()
+
+
+class DocumentViewCollection:
+    """Read-only view over generated PDFs and agreements as one document list"""
+
+    def __init__(self):
+        self.pdfs = db["storinggenratedpdfinqotemangamnet"]
+        self.agreements = db["storinggenratedaggremntfromquotemangnt"]
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Indexes backing the listing sort and each filter, created once per process"""
+        global _indexes_ensured
+        if _indexes_ensured:
+            return
+        with _index_lock:
+            if _indexes_ensured:
+                return
+            for collection in (self.pdfs, self.agreements):
+                try:
+                    collection.create_index([("generated_at", -1), ("_id", -1)])
+                    for field in LISTING_FILTERS.values():
+                        collection.create_index([(field, 1), ("generated_at", -1), ("_id", -1)])
+                except Exception as e:
+                    print(f"Error creating listing indexes on {collection.name}: {str(e)}")
+            _indexes_ensured = True
+
+    def list_documents(self, filters=None, cursor=None, limit=50):
+        """Newest-first page of PDFs and agreements.
+
+        filters: client, client_email, company, quote_id (exact matches) and
+        from/to datetimes on generated_at. cursor is the next_cursor of the
+        previous page. Returns (documents, next_cursor); next_cursor is None
+        on the last page.
+        """
+        query = self._build_query(filters or {})
+        if cursor:
+            query = {"$and": [query, self._after(cursor)]} if query else self._after(cursor)
+
+        def branch(document_type):
+            # Each branch sorts and limits on its own index before the merge
+            return [
+                {"$match": query},
+                {"$sort": {"generated_at": -1, "_id": -1}},
+                {"$limit": limit + 1},
+                {"$project": {**{field: 1 for field in LISTING_FIELDS},
+                              "document_type": {"$literal": document_type}}},
+            ]
+
+        pipeline = branch("PDF") + [
+            {"$unionWith": {"coll": self.agreements.name, "pipeline": branch("Agreement")}},
+            {"$sort": {"generated_at": -1, "_id": -1}},
+            {"$limit": limit + 1},
+        ]
+        documents = list(self.pdfs.aggregate(pipeline))
+
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = self.encode_cursor(documents[-1])
+        return documents, next_cursor
+
+    def _build_query(self, filters):
+        query = {}
+        for name, field in LISTING_FILTERS.items():
+            if filters.get(name):
+                query[field] = filters[name]
+
+        date_range = {}
+        if filters.get("from"):
+            date_range["$gte"] = filters["from"]
+        if filters.get("to"):
+            date_range["$lt"] = filters["to"]
+        if date_range:
+            query["generated_at"] = date_range
+        return query
+
+    def _after(self, cursor):
+        """Keyset condition for documents that sort after the cursor position"""
+        generated_at, document_id = self.decode_cursor(cursor)
+        if generated_at is None:
+            # Documents without generated_at sort last, ordered by _id
+            return {"generated_at": None, "_id": {"$lt": document_id}}
+        return {"$or": [
+            {"generated_at": {"$lt": generated_at}},
+            {"generated_at": generated_at, "_id": {"$lt": document_id}},
+            {"generated_at": None},
+        ]}
+
+    @staticmethod
+    def encode_cursor(document):
+        generated_at = document.get("generated_at")
+        payload = {
+            "g": generated_at.isoformat() if isinstance(generated_at, datetime) else None,
+            "i": str(document["_id"]),
+        }
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Returns (generated_at, _id). Raises ValueError for a malformed cursor."""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            generated_at = datetime.fromisoformat(payload["g"]) if payload["g"] else None
+            return generated_at, ObjectId(payload["i"])
+        except Exception:
+            raise ValueError("Invalid cursor")
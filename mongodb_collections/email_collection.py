@@ -1,25 +1,45 @@
 from datetime import datetime
 from bson import ObjectId
 from cpq.db import db
+from cpq.log_writer import log_writer
+from .timeseries_utils import ensure_timeseries_collection, get_retention_days, status_counts_pipeline
 
 class EmailCollection:
-    """Handles email-related MongoDB operations"""
+    """Handles email-related MongoDB operations
+
+    Logs live in a time-series collection keyed on ``timestamp`` with
+    ``meta.service`` / ``meta.operation`` / ``meta.status`` metadata, and
+    expire after EMAIL_LOG_RETENTION_DAYS (or LOG_RETENTION_DAYS).
+    """
     
     def __init__(self):
-        self.collection = db["email_logs"]
+        self.collection = ensure_timeseries_collection(
+            "email_logs_ts",
+            get_retention_days("EMAIL_LOG_RETENTION_DAYS")
+        )
+    
+    def _log(self, data, status):
+        """Stamp a log record with the time-series fields and queue it for the background writer"""
+        data["timestamp"] = data["sent_at"]
+        data["meta"] = {
+            "service": "email",
+            "operation": "send",
+            "status": status
+        }
+        return log_writer.insert(self.collection, data)
     
     def log_email_sent(self, email_data):
         """Log successful email sending"""
         email_data["sent_at"] = datetime.now()
         email_data["status"] = "sent"
-        return self.collection.insert_one(email_data)
+        return self._log(email_data, "sent")
     
     def log_email_failed(self, email_data, error_message):
         """Log failed email sending"""
         email_data["sent_at"] = datetime.now()
         email_data["status"] = "failed"
         email_data["error"] = error_message
-        return self.collection.insert_one(email_data)
+        return self._log(email_data, "failed")
     
     def get_email_history(self, recipient_email=None, limit=50):
         """Get email sending history"""
@@ -27,7 +47,7 @@ class EmailCollection:
         if recipient_email:
             filter_query["recipient_email"] = recipient_email
         
-        return list(self.collection.find(filter_query).sort("sent_at", -1).limit(limit))
+        return list(self.collection.find(filter_query).sort("timestamp", -1).limit(limit))
     
     def get_email_by_id(self, email_id):
         """Get email log by ID"""
@@ -37,9 +57,14 @@ class EmailCollection:
             return None
     
     def update_email_status(self, email_id, new_status, notes=""):
-        """Update email status"""
+        """Update email status
+
+        Updating measurements of a time-series collection by _id needs
+        MongoDB 7.0 or later.
+        """
         update_data = {
             "status": new_status,
+            "meta.status": new_status,
             "updated_at": datetime.now()
         }
         if notes:
@@ -50,17 +75,9 @@ class EmailCollection:
             {"$set": update_data}
         )
     
-    def get_email_stats(self):
-        """Get email sending statistics"""
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$status",
-                    "count": {"$sum": 1}
-                }
-            }
-        ]
-        return list(self.collection.aggregate(pipeline))
+    def get_email_stats(self, days=30):
+        """Get email sending statistics over the last `days` days"""
+        return list(self.collection.aggregate(status_counts_pipeline(days)))
     
     def send_email(self, to_email, subject, body):
         """Send email using the email service"""
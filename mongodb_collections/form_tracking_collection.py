@@ -1,6 +1,8 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo import UpdateOne
 from cpq.db import db
+from cpq.log_writer import log_writer
 
 class FormTrackingCollection:
     """Handles form tracking MongoDB operations"""
@@ -43,7 +45,7 @@ class FormTrackingCollection:
             "ip_address": ip_address
         }
         
-        result = self.collection.update_one(
+        return log_writer.write(self.collection, UpdateOne(
             {"session_id": session_id},
             {
                 "$inc": {"interactions.page_views": 1},
@@ -53,8 +55,7 @@ class FormTrackingCollection:
                     "updated_at": datetime.now()
                 }
             }
-        )
-        return result
+        ))
     
     def log_field_interaction(self, session_id, action, field_name=None, details=None):
         """Log field interactions (focus, blur, change, etc.)"""
@@ -66,7 +67,7 @@ class FormTrackingCollection:
             "details": details
         }
         
-        result = self.collection.update_one(
+        return log_writer.write(self.collection, UpdateOne(
             {"session_id": session_id},
             {
                 "$inc": {"interactions.field_interactions": 1},
@@ -76,8 +77,7 @@ class FormTrackingCollection:
                     "updated_at": datetime.now()
                 }
             }
-        )
-        return result
+        ))
     
     def log_click(self, session_id, element_id, element_type, details=None):
         """Log button clicks and other click events"""
@@ -89,7 +89,7 @@ class FormTrackingCollection:
             "details": details
         }
         
-        result = self.collection.update_one(
+        return log_writer.write(self.collection, UpdateOne(
             {"session_id": session_id},
             {
                 "$inc": {"interactions.clicks": 1},
@@ -99,8 +99,7 @@ class FormTrackingCollection:
                     "updated_at": datetime.now()
                 }
             }
-        )
-        return result
+        ))
     
     def log_error(self, session_id, error_type, error_details, stack_trace=None):
         """Log form errors and validation failures"""
@@ -112,7 +111,7 @@ class FormTrackingCollection:
             "stack_trace": stack_trace
         }
         
-        result = self.collection.update_one(
+        return log_writer.write(self.collection, UpdateOne(
             {"session_id": session_id},
             {
                 "$inc": {"interactions.errors": 1},
@@ -122,12 +121,11 @@ class FormTrackingCollection:
                     "updated_at": datetime.now()
                 }
             }
-        )
-        return result
+        ))
     
     def log_time_spent(self, session_id, time_spent_seconds):
         """Log time spent on form"""
-        result = self.collection.update_one(
+        return log_writer.write(self.collection, UpdateOne(
             {"session_id": session_id},
             {
                 "$inc": {"interactions.time_spent": time_spent_seconds},
@@ -136,8 +134,7 @@ class FormTrackingCollection:
                     "updated_at": datetime.now()
                 }
             }
-        )
-        return result
+        ))
     
     def log_form_data(self, session_id, form_data, data_type="submission"):
         """Log form data capture"""
@@ -192,7 +189,7 @@ class FormTrackingCollection:
             "final_stats": final_stats
         }
         
-        result = self.collection.update_one(
+        return log_writer.write(self.collection, UpdateOne(
             {"session_id": session_id},
             {
                 "$push": {"interactions.page_exits": exit_info},
@@ -201,8 +198,7 @@ class FormTrackingCollection:
                     "updated_at": datetime.now()
                 }
             }
-        )
-        return result
+        ))
     
     def get_session_by_id(self, session_id):
         """Get form session by session ID"""
@@ -1,15 +1,28 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
 from cpq.db import db
+from .archive_collection import ArchiveCollection
+from .document_blob_collection import DocumentBlobCollection, document_content, note_generated_document
+import os
+
+# Status after a role signs while the other party has not signed yet
+SIGNED_STATUSES = {"client": "client_signed", "ceo": "ceo_signed"}
 
 class GeneratedAgreementCollection:
     """Handles generated agreement metadata storage in MongoDB"""
     
     def __init__(self):
         self.collection = db["storinggenratedaggremntfromquotemangnt"]
+        self.archive = ArchiveCollection(self.collection.name)
+        self.blobs = DocumentBlobCollection()
     
     def store_agreement_metadata(self, agreement_data, agreement_content=None):
-        """Store agreement metadata after generation with optional content for regeneration"""
+        """Store agreement metadata after generation with optional content for regeneration.
+
+        The content goes to the shared blob store; file_path is set to the
+        blob's file, so identical agreements share one copy.
+        """
         if not self._validate_agreement_data(agreement_data):
             raise ValueError("Invalid agreement data")
         
@@ -17,32 +30,113 @@ class GeneratedAgreementCollection:
         agreement_data["created_at"] = datetime.now()
         agreement_data["updated_at"] = datetime.now()
         
-        # Store agreement content as base64 for regeneration if provided
-        if agreement_content:
-            import base64
-            agreement_data["agreement_data"] = base64.b64encode(agreement_content).decode('utf-8')
-        
-        return self.collection.insert_one(agreement_data)
+        if not agreement_content:
+            return self._insert(agreement_data)
+
+        extension = os.path.splitext(agreement_data["filename"])[1] or ".pdf"
+        digest, path = self.blobs.store(agreement_content, extension)
+        agreement_data.update({"content_hash": digest, "file_path": path, "file_size": len(agreement_content)})
+        try:
+            return self._insert(agreement_data)
+        except Exception:
+            self.blobs.release(digest)
+            raise
+
+    def _insert(self, record):
+        result = self.collection.insert_one(record)
+        note_generated_document(self.collection.name, result.inserted_id)
+        return result
+
+    def get_agreement_content(self, agreement):
+        """File bytes of an agreement record, or None if none were stored"""
+        return document_content(agreement, "agreement_data", self.blobs)
+
+    def replace_agreement_content(self, agreement, content, extension=".pdf", **fields):
+        """Point an agreement at new content, releasing the old blob; returns the new file path"""
+        digest, path = self.blobs.store(content, extension)
+        update = {"$set": {"content_hash": digest, "file_path": path, "file_size": len(content),
+                           "updated_at": datetime.now(), **fields}}
+        if isinstance(agreement.get("agreement_data"), str):
+            update["$unset"] = {"agreement_data": ""}
+        self.collection.update_one({"_id": agreement["_id"]}, update)
+        if agreement.get("content_hash") != digest:
+            self.blobs.release(agreement.get("content_hash"))
+        return path
     
-    def get_agreement_by_id(self, agreement_id):
-        """Get agreement metadata by MongoDB ObjectId or quote_id"""
+    def get_agreement_by_id(self, agreement_id, include_content=True):
+        """Get agreement metadata by MongoDB ObjectId or quote_id.
+
+        include_content=False leaves out the base64 agreement_data.
+        """
+        projection = None if include_content else {"agreement_data": 0}
         try:
             # First try to find by MongoDB ObjectId
             if ObjectId.is_valid(agreement_id):
-                agreement = self.collection.find_one({"_id": ObjectId(agreement_id)})
+                agreement = self.collection.find_one({"_id": ObjectId(agreement_id)}, projection)
                 if agreement:
                     return agreement
             
             # If not found by ObjectId, try to find by quote_id
-            agreement = self.collection.find_one({"quote_id": agreement_id})
+            agreement = self.collection.find_one({"quote_id": agreement_id}, projection)
             if agreement:
                 return agreement
             
-            return None
+            # Completed agreements may have moved to the archive
+            if ObjectId.is_valid(agreement_id):
+                agreement = self.archive.find_one({"_id": ObjectId(agreement_id)}, projection)
+                if agreement:
+                    return agreement
+            return self.archive.find_one({"quote_id": agreement_id}, projection)
         except Exception as e:
             print(f"Error looking up agreement {agreement_id}: {e}")
             return None
     
+    def sign_agreement(self, agreement_id, role, signature):
+        """Record the client or CEO signature in one conditional update.
+
+        The "not already signed" check is part of the filter and the new
+        status is derived server-side from the other party's signature, so
+        concurrent submissions cannot overwrite each other. Returns the
+        agreement after the update (without agreement_data), or None if it
+        does not exist or this role has already signed.
+        """
+        try:
+            query, pipeline = self.build_signature_update(agreement_id, role, signature)
+            return self.collection.find_one_and_update(
+                query,
+                pipeline,
+                projection={"agreement_data": 0},
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            print(f"Error signing agreement {agreement_id}: {e}")
+            return None
+
+    def build_signature_update(self, agreement_id, role, signature):
+        """Filter and pipeline update used by sign_agreement"""
+        other_role = "ceo" if role == "client" else "client"
+        now = datetime.now()
+        other_signed = {"$ne": [{"$ifNull": [f"$signatures.{other_role}.data", ""]}, ""]}
+
+        if ObjectId.is_valid(agreement_id):
+            query = {"$or": [{"_id": ObjectId(agreement_id)}, {"quote_id": agreement_id}]}
+        else:
+            query = {"quote_id": agreement_id}
+        query[f"signatures.{role}.data"] = {"$in": [None, ""]}
+
+        pipeline = [
+            {"$set": {
+                f"signatures.{role}": {"$literal": signature},
+                f"{role}_signed_at": now,
+                "updated_at": now
+            }},
+            {"$set": {
+                "status": {"$cond": [other_signed, "completed", SIGNED_STATUSES[role]]},
+                "completed_at": {"$cond": [other_signed, now, "$completed_at"]}
+            }}
+        ]
+        return query, pipeline
+    
     def get_agreements_by_quote_id(self, quote_id, limit=50):
         """Get all agreements for a specific quote"""
         return list(self.collection.find(
@@ -73,9 +167,14 @@ class GeneratedAgreementCollection:
         return list(self.collection.find().sort("generated_at", -1).limit(limit))
     
     def delete_agreement(self, agreement_id):
-        """Delete agreement metadata"""
+        """Delete agreement metadata and release its stored content"""
         try:
-            return self.collection.delete_one({"_id": ObjectId(agreement_id)})
+            query = {"_id": ObjectId(agreement_id)}
+            agreement = self.collection.find_one(query, {"content_hash": 1})
+            result = self.collection.delete_one(query)
+            if agreement and result.deleted_count:
+                self.blobs.release(agreement.get("content_hash"))
+            return result
         except:
             return None
     
@@ -1,16 +1,25 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
 from cpq.db import db
-import base64
+from .archive_collection import ArchiveCollection
+from .document_blob_collection import DocumentBlobCollection, document_content, note_generated_document
+import os
 
 class GeneratedPDFCollection:
     """Handles generated PDF metadata storage in MongoDB"""
     
     def __init__(self):
         self.collection = db["storinggenratedpdfinqotemangamnet"]
+        self.archive = ArchiveCollection(self.collection.name)
+        self.blobs = DocumentBlobCollection()
     
     def store_pdf_metadata(self, pdf_data, pdf_content=None):
-        """Store PDF metadata after generation with optional PDF content for regeneration"""
+        """Store PDF metadata after generation with optional PDF content for regeneration.
+
+        The content goes to the shared blob store; file_path is set to the
+        blob's file, so identical PDFs share one copy.
+        """
         if not self._validate_pdf_data(pdf_data):
             raise ValueError("Invalid PDF data")
         
@@ -18,17 +27,32 @@ class GeneratedPDFCollection:
         pdf_data["created_at"] = datetime.now()
         pdf_data["updated_at"] = datetime.now()
         
-        # Store PDF content as base64 for regeneration if provided
-        if pdf_content:
-            import base64
-            pdf_data["pdf_data"] = base64.b64encode(pdf_content).decode('utf-8')
-        
-        return self.collection.insert_one(pdf_data)
+        if not pdf_content:
+            return self._insert(pdf_data)
+
+        extension = os.path.splitext(pdf_data["filename"])[1] or ".pdf"
+        digest, path = self.blobs.store(pdf_content, extension)
+        pdf_data.update({"content_hash": digest, "file_path": path, "file_size": len(pdf_content)})
+        try:
+            return self._insert(pdf_data)
+        except Exception:
+            self.blobs.release(digest)
+            raise
+
+    def _insert(self, record):
+        result = self.collection.insert_one(record)
+        note_generated_document(self.collection.name, result.inserted_id)
+        return result
+
+    def get_pdf_content(self, pdf):
+        """PDF bytes of a metadata record, or None if none were stored"""
+        return document_content(pdf, "pdf_data", self.blobs)
     
     def get_pdf_by_id(self, pdf_id):
         """Get PDF metadata by MongoDB ObjectId"""
         try:
-            return self.collection.find_one({"_id": ObjectId(pdf_id)})
+            query = {"_id": ObjectId(pdf_id)}
+            return self.collection.find_one(query) or self.archive.find_one(query)
         except:
             return None
     
@@ -55,9 +79,14 @@ class GeneratedPDFCollection:
         return list(self.collection.find().sort("generated_at", -1).limit(limit))
     
     def delete_pdf(self, pdf_id):
-        """Delete PDF metadata"""
+        """Delete PDF metadata and release its stored content"""
         try:
-            return self.collection.delete_one({"_id": ObjectId(pdf_id)})
+            query = {"_id": ObjectId(pdf_id)}
+            pdf = self.collection.find_one(query, {"content_hash": 1})
+            result = self.collection.delete_one(query)
+            if pdf and result.deleted_count:
+                self.blobs.release(pdf.get("content_hash"))
+            return result
         except:
             return None
     
@@ -70,7 +99,6 @@ class GeneratedPDFCollection:
             from reportlab.lib import colors
             from reportlab.lib.units import inch
             from io import BytesIO
-            import os
             
             # Create PDF buffer
             buffer = BytesIO()
@@ -130,25 +158,28 @@ class GeneratedPDFCollection:
             if not pdf_metadata:
                 return None, "PDF metadata not found"
             
-            # Save regenerated PDF
-            file_path = pdf_metadata.get('file_path')
-            if file_path:
-                # Ensure documents directory exists
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                
-                # Save the regenerated PDF
-                with open(file_path, 'wb') as f:
-                    f.write(buffer.getvalue())
-                
-                # Update the PDF data in database
+            # Save regenerated PDF in the blob store and point the record at it
+            if pdf_metadata.get('file_path'):
                 pdf_content = buffer.getvalue()
-                self.collection.update_one(
+                digest, file_path = self.blobs.store(pdf_content)
+                # The record's previous hash is read in the same write, so its
+                # reference is released exactly once, even if it is this digest
+                previous = self.collection.find_one_and_update(
                     {"_id": ObjectId(pdf_id)},
                     {"$set": {
-                        "pdf_data": base64.b64encode(pdf_content).decode('utf-8'),
+                        "content_hash": digest,
+                        "file_path": file_path,
+                        "file_size": len(pdf_content),
                         "updated_at": datetime.now()
-                    }}
+                    }, "$unset": {"pdf_data": ""}},
+                    projection={"content_hash": 1},
+                    return_document=ReturnDocument.BEFORE
                 )
+                if previous is None:
+                    # Archived (or just deleted): the record still points at its old blob
+                    self.blobs.release(digest)
+                    return None, "PDF record is archived and cannot be regenerated"
+                self.blobs.release(previous.get("content_hash"))
                 
                 return file_path, "PDF regenerated successfully"
             else:
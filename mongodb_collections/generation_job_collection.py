@@ -0,0 +1,238 @@
+"""Background document-generation jobs.
+
+Generating a PDF or agreement can take longer than a client wants to hold a
+request open. A job records the generation request, its progress and the
+documents it produced. The web request returns the job id at once and a
+worker thread does the work; clients poll the job for its status.
+
+Jobs live in MongoDB, so they survive restarts. A worker claims a queued job
+with an atomic update and holds a lease on it; a job whose worker died is
+picked up again once the lease runs out, up to JOB_MAX_ATTEMPTS times. Every
+web worker runs one in-process worker, so a single node needs nothing else.
+"""
+
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from cpq.db import db
+
+JOB_LEASE_SECONDS = int(os.getenv("GENERATION_JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("GENERATION_JOB_POLL_SECONDS", "2"))
+# Finished jobs are removed by a TTL index after this long
+JOB_RETENTION_DAYS = 7
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+_indexes_ensured = False
+_index_lock = threading.Lock()
+_worker = None
+
+
+class GenerationJobCollection:
+    """Queue and status of document-generation jobs"""
+
+    def __init__(self):
+        self.collection = db["generation_jobs"]
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Claim order and TTL indexes, created once per process"""
+        global _indexes_ensured
+        if _indexes_ensured:
+            return
+        with _index_lock:
+            if _indexes_ensured:
+                return
+            try:
+                self.collection.create_index([("status", 1), ("created_at", 1)])
+                self.collection.create_index("finished_at", expireAfterSeconds=JOB_RETENTION_DAYS * 24 * 3600)
+                _indexes_ensured = True
+            except Exception as e:
+                print(f"Error creating generation job indexes: {str(e)}")
+
+    def create_job(self, job_type, payload, email=None):
+        """Queue a job; returns its id"""
+        now = datetime.now()
+        result = self.collection.insert_one({
+            "job_type": job_type,
+            "payload": payload,
+            "email": email,
+            "status": QUEUED,
+            "stage": QUEUED,
+            "progress": 0,
+            "attempts": 0,
+            "documents": [],
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        })
+        return str(result.inserted_id)
+
+    def get_job(self, job_id):
+        try:
+            return self.collection.find_one({"_id": ObjectId(job_id)})
+        except Exception:
+            return None
+
+    def claim_next(self, worker_id):
+        """Take the oldest queued job, or a running one whose lease expired"""
+        now = datetime.now()
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED},
+                {"status": RUNNING, "lease_expires_at": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "stage": "starting",
+                    "worker": worker_id,
+                    "started_at": now,
+                    "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def update_progress(self, job_id, progress, stage):
+        """Record progress and extend the lease"""
+        now = datetime.now()
+        self.collection.update_one(
+            {"_id": job_id, "status": RUNNING},
+            {"$set": {
+                "progress": progress,
+                "stage": stage,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                "updated_at": now
+            }}
+        )
+
+    def complete_job(self, job_id, documents, result=None):
+        now = datetime.now()
+        self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "status": COMPLETED,
+                "stage": COMPLETED,
+                "progress": 100,
+                "documents": documents,
+                "result": result,
+                "finished_at": now,
+                "updated_at": now
+            }, "$unset": {"lease_expires_at": ""}}
+        )
+
+    def fail_job(self, job_id, error):
+        now = datetime.now()
+        self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "status": FAILED,
+                "stage": FAILED,
+                "error": error,
+                "finished_at": now,
+                "updated_at": now
+            }, "$unset": {"lease_expires_at": ""}}
+        )
+
+
+def format_job(job):
+    """JSON-friendly job status"""
+    documents = job.get("documents") or []
+    return {
+        "job_id": str(job["_id"]),
+        "type": job.get("job_type"),
+        "status": job.get("status"),
+        "stage": job.get("stage"),
+        "progress": job.get("progress", 0),
+        "attempts": job.get("attempts", 0),
+        "document_id": documents[-1]["id"] if documents else None,
+        "documents": documents,
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job["created_at"].isoformat() if job.get("created_at") else None,
+        "started_at": job["started_at"].isoformat() if job.get("started_at") else None,
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None,
+    }
+
+
+class GenerationJobWorker:
+    """Runs queued jobs in a daemon thread.
+
+    ``handler(job, report_progress)`` does the work and returns
+    ``(documents, result)``; report_progress(percent, stage) updates the job.
+    An exception fails the job with its message.
+    """
+
+    def __init__(self, handler, jobs=None, poll_interval=JOB_POLL_SECONDS):
+        self.handler = handler
+        self.jobs = jobs or GenerationJobCollection()
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def notify(self):
+        """Wake the worker for a job just queued by this process"""
+        self._wakeup.set()
+
+    def run_once(self):
+        """Claim and run one job; returns False if there was nothing to do"""
+        job = self.jobs.claim_next(self.worker_id)
+        if not job:
+            return False
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            self.jobs.fail_job(job["_id"], f"Gave up after {JOB_MAX_ATTEMPTS} attempts")
+            return True
+
+        def report_progress(progress, stage):
+            self.jobs.update_progress(job["_id"], progress, stage)
+
+        try:
+            documents, result = self.handler(job, report_progress)
+            self.jobs.complete_job(job["_id"], documents, result)
+            print(f"✅ Generation job {job['_id']} ({job['job_type']}) completed")
+        except Exception as e:
+            print(f"❌ Generation job {job['_id']} ({job['job_type']}) failed: {str(e)}")
+            self.jobs.fail_job(job["_id"], str(e))
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                while self.run_once():
+                    pass
+            except Exception as e:
+                print(f"❌ Generation job worker error: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='generation-jobs', daemon=True)
+            self._thread.start()
+        return self
+
+
+def start_generation_worker(handler):
+    """Start this process's job worker (idempotent)"""
+    global _worker
+    if _worker is None:
+        _worker = GenerationJobWorker(handler).start()
+    return _worker
+
+
+def get_generation_worker():
+    return _worker
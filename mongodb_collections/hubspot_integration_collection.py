@@ -1,85 +1,81 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from bson import ObjectId
 from cpq.db import db
+from cpq.log_writer import log_writer
+from .timeseries_utils import ensure_timeseries_collection, get_retention_days, status_counts_pipeline
 
 class HubSpotIntegrationCollection:
-    """Handles HubSpot integration MongoDB operations"""
+    """Handles HubSpot integration MongoDB operations
+
+    Logs live in a time-series collection keyed on ``timestamp`` with
+    ``meta.service`` / ``meta.operation`` / ``meta.status`` metadata, and
+    expire after HUBSPOT_LOG_RETENTION_DAYS (or LOG_RETENTION_DAYS).
+    """
     
     def __init__(self):
-        self.collection = db["hubspot_integrations"]
+        self.collection = ensure_timeseries_collection(
+            "hubspot_integrations_ts",
+            get_retention_days("HUBSPOT_LOG_RETENTION_DAYS")
+        )
+    
+    def _log(self, data, operation, status, timestamp):
+        """Stamp a log record with the time-series fields and queue it for the background writer"""
+        data["timestamp"] = timestamp
+        data["meta"] = {
+            "service": "hubspot",
+            "operation": operation,
+            "status": status
+        }
+        return log_writer.insert(self.collection, data)
     
     def log_api_call(self, api_data):
         """Log HubSpot API call"""
         api_data["timestamp"] = datetime.now()
         api_data["status"] = "success"
-        return self.collection.insert_one(api_data)
+        return self._log(api_data, api_data.get("operation", "api_call"), "success", api_data["timestamp"])
     
     def log_api_error(self, api_data, error_message):
         """Log HubSpot API error"""
         api_data["timestamp"] = datetime.now()
         api_data["status"] = "error"
         api_data["error"] = error_message
-        return self.collection.insert_one(api_data)
+        return self._log(api_data, api_data.get("operation", "api_call"), "error", api_data["timestamp"])
     
     def log_contact_sync(self, sync_data):
         """Log contact synchronization activity"""
         sync_data["synced_at"] = datetime.now()
         sync_data["sync_type"] = "contact_sync"
-        return self.collection.insert_one(sync_data)
+        return self._log(sync_data, "contact_sync", sync_data.get("status"), sync_data["synced_at"])
     
     def log_integration_test(self, test_data):
         """Log integration test results"""
         test_data["tested_at"] = datetime.now()
-        return self.collection.insert_one(test_data)
+        return self._log(test_data, "integration_test", test_data.get("status"), test_data["tested_at"])
     
     def get_integration_history(self, limit=100):
         """Get integration activity history"""
         return list(self.collection.find({}).sort("timestamp", -1).limit(limit))
     
-    def get_api_call_stats(self):
-        """Get API call statistics"""
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$status",
-                    "count": {"$sum": 1}
-                }
-            }
-        ]
-        return list(self.collection.aggregate(pipeline))
+    def get_api_call_stats(self, days=30):
+        """Get API call statistics over the last `days` days"""
+        return list(self.collection.aggregate(status_counts_pipeline(days)))
     
     def get_sync_history(self, sync_type=None, limit=50):
         """Get synchronization history"""
         filter_query = {}
         if sync_type:
-            filter_query["sync_type"] = sync_type
+            filter_query["meta.operation"] = sync_type
         
-        return list(self.collection.find(filter_query).sort("synced_at", -1).limit(limit))
+        return list(self.collection.find(filter_query).sort("timestamp", -1).limit(limit))
     
     def get_last_successful_sync(self):
         """Get the last successful synchronization"""
         return self.collection.find_one(
-            {"status": "success", "sync_type": "contact_sync"},
-            sort=[("synced_at", -1)]
+            {"meta.status": "success", "meta.operation": "contact_sync"},
+            sort=[("timestamp", -1)]
         )
     
     def get_integration_health(self):
         """Get integration health status"""
-        # Get last 24 hours of activity
-        yesterday = datetime.now() - timedelta(days=1)
-        
-        pipeline = [
-            {
-                "$match": {
-                    "timestamp": {"$gte": yesterday}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$status",
-                    "count": {"$sum": 1}
-                }
-            }
-        ]
-        
-        return list(self.collection.aggregate(pipeline))
+        # Last 24 hours of activity
+        return list(self.collection.aggregate(status_counts_pipeline(1)))
@@ -1,6 +1,8 @@
+import copy
 from datetime import datetime
 from bson import ObjectId
 from cpq.db import db
+from cpq.cache_invalidation import process_cache
 
 class PricingCollection:
     """Handles CPQ pricing-related MongoDB operations"""
@@ -17,7 +19,9 @@ class PricingCollection:
         config_data["updated_at"] = datetime.now()
         config_data["is_active"] = True
         
-        return self.collection.insert_one(config_data)
+        result = self.collection.insert_one(config_data)
+        process_cache.evict(self.collection.name)
+        return result
     
     def get_pricing_config_by_id(self, config_id):
         """Get pricing configuration by ID"""
@@ -28,7 +32,13 @@ class PricingCollection:
     
     def get_active_pricing_config(self):
         """Get the currently active pricing configuration"""
-        return self.collection.find_one({"is_active": True})
+        cached = process_cache.get(self.collection.name, "active")
+        if cached is not None:
+            return copy.deepcopy(cached)
+        generation = process_cache.generation(self.collection.name)
+        config = self.collection.find_one({"is_active": True})
+        process_cache.set(self.collection.name, "active", config, query=True, generation=generation)
+        return copy.deepcopy(config)
     
     def update_pricing_config(self, config_id, config_data):
         """Update existing pricing configuration"""
@@ -41,17 +51,21 @@ class PricingCollection:
         if '_id' in config_data:
             del config_data['_id']
         
-        return self.collection.update_one(
+        result = self.collection.update_one(
             {"_id": ObjectId(config_id)},
             {"$set": config_data}
         )
+        process_cache.evict(self.collection.name, config_id)
+        return result
     
     def deactivate_pricing_config(self, config_id):
         """Deactivate a pricing configuration"""
-        return self.collection.update_one(
+        result = self.collection.update_one(
             {"_id": ObjectId(config_id)},
             {"$set": {"is_active": False, "updated_at": datetime.now()}}
         )
+        process_cache.evict(self.collection.name, config_id)
+        return result
     
     def activate_pricing_config(self, config_id):
         """Activate a pricing configuration (deactivates others)"""
@@ -62,10 +76,13 @@ class PricingCollection:
         )
         
         # Then activate this one
-        return self.collection.update_one(
+        result = self.collection.update_one(
             {"_id": ObjectId(config_id)},
             {"$set": {"is_active": True, "updated_at": datetime.now()}}
         )
+        # Every config may have changed, so drop the whole collection
+        process_cache.evict_collection(self.collection.name)
+        return result
     
     def get_all_pricing_configs(self, limit=100):
         """Get all pricing configurations"""
@@ -74,7 +91,9 @@ class PricingCollection:
     def delete_pricing_config(self, config_id):
         """Delete pricing configuration by ID"""
         try:
-            return self.collection.delete_one({"_id": ObjectId(config_id)})
+            result = self.collection.delete_one({"_id": ObjectId(config_id)})
+            process_cache.evict(self.collection.name, config_id)
+            return result
         except:
             return None
     
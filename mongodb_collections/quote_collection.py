@@ -1,12 +1,16 @@
+import copy
 from datetime import datetime
 from bson import ObjectId
 from cpq.db import db
+from cpq.cache_invalidation import process_cache
+from .archive_collection import ArchiveCollection
 
 class QuoteCollection:
     """Handles quote-related MongoDB operations"""
     
     def __init__(self):
         self.collection = db["quotes"]
+        self.archive = ArchiveCollection("quotes")
     
     def create_quote(self, quote_data):
         """Create a new quote with validation"""
@@ -23,7 +27,15 @@ class QuoteCollection:
     def get_quote_by_id(self, quote_id):
         """Get quote by MongoDB ObjectId"""
         try:
-            return self.collection.find_one({"_id": ObjectId(quote_id)})
+            cached = process_cache.get(self.collection.name, str(quote_id))
+            if cached is not None:
+                return copy.deepcopy(cached)
+            generation = process_cache.generation(self.collection.name)
+            quote = self.collection.find_one({"_id": ObjectId(quote_id)})
+            if quote is None:
+                quote = self.archive.find_one({"_id": ObjectId(quote_id)})
+            process_cache.set(self.collection.name, str(quote_id), quote, generation=generation)
+            return copy.deepcopy(quote)
         except:
             return None
     
@@ -42,10 +54,12 @@ class QuoteCollection:
         if notes:
             update_data["notes"] = notes
         
-        return self.collection.update_one(
+        result = self.collection.update_one(
             {"_id": ObjectId(quote_id)},
             {"$set": update_data}
         )
+        process_cache.evict(self.collection.name, quote_id)
+        return result
     
     def get_quotes_by_status(self, status, limit=50):
         """Get quotes by status"""
@@ -60,7 +74,9 @@ class QuoteCollection:
     def delete_quote(self, quote_id):
         """Delete quote by ID"""
         try:
-            return self.collection.delete_one({"_id": ObjectId(quote_id)})
+            result = self.collection.delete_one({"_id": ObjectId(quote_id)})
+            process_cache.evict(self.collection.name, quote_id)
+            return result
         except:
             return None
     
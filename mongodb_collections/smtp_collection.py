@@ -1,50 +1,62 @@
 from datetime import datetime
 from bson import ObjectId
 from cpq.db import db
+from cpq.log_writer import log_writer
+from .timeseries_utils import ensure_timeseries_collection, get_retention_days, status_counts_pipeline
 
 class SMTPCollection:
-    """Handles SMTP connection and testing logs"""
+    """Handles SMTP connection and testing logs
+
+    Logs live in a time-series collection keyed on ``timestamp`` with
+    ``meta.service`` / ``meta.operation`` / ``meta.status`` metadata, and
+    expire after SMTP_LOG_RETENTION_DAYS (or LOG_RETENTION_DAYS).
+    """
     
     def __init__(self):
-        self.collection = db["smtp_logs"]
+        self.collection = ensure_timeseries_collection(
+            "smtp_logs_ts",
+            get_retention_days("SMTP_LOG_RETENTION_DAYS")
+        )
+    
+    def _log(self, data, operation, status, timestamp):
+        """Stamp a log record with the time-series fields and queue it for the background writer"""
+        data["timestamp"] = timestamp
+        data["meta"] = {
+            "service": "smtp",
+            "operation": operation,
+            "status": status
+        }
+        return log_writer.insert(self.collection, data)
     
     def log_connection_test(self, test_data):
         """Log SMTP connection test results"""
         test_data["tested_at"] = datetime.now()
-        return self.collection.insert_one(test_data)
+        return self._log(test_data, "connection_test", test_data.get("status"), test_data["tested_at"])
     
     def log_connection_success(self, connection_data):
         """Log successful SMTP connection"""
         connection_data["connected_at"] = datetime.now()
         connection_data["status"] = "success"
-        return self.collection.insert_one(connection_data)
+        return self._log(connection_data, "connection", "success", connection_data["connected_at"])
     
     def log_connection_failed(self, connection_data, error_message):
         """Log failed SMTP connection"""
         connection_data["attempted_at"] = datetime.now()
         connection_data["status"] = "failed"
         connection_data["error"] = error_message
-        return self.collection.insert_one(connection_data)
+        return self._log(connection_data, "connection", "failed", connection_data["attempted_at"])
     
     def get_connection_history(self, limit=50):
         """Get SMTP connection history"""
-        return list(self.collection.find({}).sort("tested_at", -1).limit(limit))
-    
-    def get_connection_stats(self):
-        """Get SMTP connection statistics"""
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$status",
-                    "count": {"$sum": 1}
-                }
-            }
-        ]
-        return list(self.collection.aggregate(pipeline))
+        return list(self.collection.find({}).sort("timestamp", -1).limit(limit))
+    
+    def get_connection_stats(self, days=30):
+        """Get SMTP connection statistics over the last `days` days"""
+        return list(self.collection.aggregate(status_counts_pipeline(days)))
     
     def get_last_successful_connection(self):
         """Get the last successful SMTP connection"""
         return self.collection.find_one(
-            {"status": "success"},
-            sort=[("connected_at", -1)]
+            {"meta.status": "success"},
+            sort=[("timestamp", -1)]
         )
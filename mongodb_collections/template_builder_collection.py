@@ -1,16 +1,27 @@
+import copy
 from datetime import datetime
 from bson import ObjectId
 import json
 from cpq.db import db
+from cpq.cache_invalidation import process_cache
+from templates.render_plan import template_plans
+from .asset_collection import AssetCollection
 
 class TemplateBuilderCollection:
     def __init__(self):
         # Use a separate collection for template builder documents
         self.collection = db["template_builder_documents"]
+        self.assets = AssetCollection()
     
     def save_document(self, document_data):
         """Save a template builder document"""
         try:
+            # Embedded images are stored once as assets; blocks keep /assets/<hash> URLs
+            document_data['blocks'] = self.assets.extract_block_assets(document_data['blocks'])
+            # Mongo keeps milliseconds; truncate so the plan cache key matches what is read back
+            now = datetime.now()
+            updated = now.replace(microsecond=now.microsecond // 1000 * 1000)
+            
             # Check if document already exists (by id)
             existing_doc = None
             if 'id' in document_data:
@@ -20,7 +31,7 @@ class TemplateBuilderCollection:
                 # Update existing document
                 update_data = {
                     'title': document_data['title'],
-                    'updated': datetime.now(),
+                    'updated': updated,
                     'blocks': document_data['blocks'],
                     'metadata': document_data['metadata']
                 }
@@ -29,8 +40,10 @@ class TemplateBuilderCollection:
                     {'id': document_data['id']},
                     {'$set': update_data}
                 )
+                process_cache.evict(self.collection.name, existing_doc['_id'])
                 
                 if result.modified_count > 0:
+                    self._compile_plan(document_data['id'], updated, document_data['blocks'])
                     return {
                         'success': True,
                         'id': document_data['id'],
@@ -47,14 +60,15 @@ class TemplateBuilderCollection:
                 document = {
                     'id': document_data['id'],
                     'title': document_data['title'],
-                    'created': datetime.now(),
-                    'updated': datetime.now(),
+                    'created': updated,
+                    'updated': updated,
                     'blocks': document_data['blocks'],
                     'metadata': document_data['metadata'],
                     'is_active': True
                 }
                 
                 result = self.collection.insert_one(document)
+                self._compile_plan(document_data['id'], updated, document_data['blocks'])
                 
                 return {
                     'success': True,
@@ -70,10 +84,23 @@ class TemplateBuilderCollection:
                 'message': f'Error saving document: {str(e)}'
             }
     
+    def _compile_plan(self, document_id, updated, blocks):
+        """Compile the saved version's render plan now rather than on its first PDF"""
+        try:
+            template_plans.compile(document_id, updated.isoformat(), blocks)
+        except Exception as e:
+            print(f"⚠️ Could not compile render plan for {document_id}: {str(e)}")
+    
     def get_document_by_id(self, document_id):
         """Get document by ID"""
         try:
-            document = self.collection.find_one({'id': document_id, 'is_active': True})
+            document = process_cache.get(self.collection.name, document_id)
+            if document is None:
+                generation = process_cache.generation(self.collection.name)
+                document = self.collection.find_one({'id': document_id, 'is_active': True})
+                process_cache.set(self.collection.name, document_id, document, generation=generation)
+            # Callers receive their own copy so the cached entry stays pristine
+            document = copy.deepcopy(document)
             if document:
                 # Convert datetime objects to ISO strings
                 document['created'] = document['created'].isoformat()
@@ -101,6 +128,19 @@ class TemplateBuilderCollection:
             print(f"Error getting documents: {str(e)}")
             return []
     
+    def migrate_embedded_images(self):
+        """Move inline images of documents saved before asset extraction into the asset store"""
+        migrated = 0
+        for doc in self.collection.find({'blocks.content': {'$regex': 'data:image/'}}, {'blocks': 1}):
+            try:
+                blocks = self.assets.extract_block_assets(doc['blocks'])
+                self.collection.update_one({'_id': doc['_id']}, {'$set': {'blocks': blocks}})
+                process_cache.evict(self.collection.name, doc['_id'])
+                migrated += 1
+            except Exception as e:
+                print(f"Error migrating images of document {doc['_id']}: {str(e)}")
+        return migrated
+    
     def delete_document(self, document_id):
         """Soft delete a document"""
         try:
@@ -108,6 +148,9 @@ class TemplateBuilderCollection:
                 {'id': document_id},
                 {'$set': {'is_active': False, 'updated': datetime.now()}}
             )
+            cached = process_cache.get(self.collection.name, document_id)
+            if cached is not None:
+                process_cache.evict(self.collection.name, cached['_id'])
             
             return result.modified_count > 0
         except Exception as e:
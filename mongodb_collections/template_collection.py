@@ -1,12 +1,18 @@
+import copy
 from datetime import datetime
 from bson import ObjectId
 import json
+from pymongo.errors import DuplicateKeyError
 from cpq.db import db
+from cpq.cache_invalidation import process_cache
+from .template_version_collection import TemplateVersionCollection
 
 class TemplateCollection:
     def __init__(self):
         # Reuse the shared MongoDB connection configured in cpq.db
         self.collection = db["agreement_templates"]
+        # History of past versions; this collection only ever holds the current one
+        self.versions = TemplateVersionCollection()
     
     def create_template(self, template_data):
         """Create a new agreement template"""
@@ -32,19 +38,40 @@ class TemplateCollection:
                 'created_by': template_data.get('created_by', 'admin'),
                 'tags': template_data.get('tags', [])
             }
+            template['_id'] = ObjectId()
+            template['history_base_version'] = self._record_version(template, None, template['created_by'])
             
             result = self.collection.insert_one(template)
             return str(result.inserted_id)
         except Exception as e:
             print(f"Error creating template: {str(e)}")
             return None
+
+    def _record_version(self, template, previous, user_id):
+        """Add template to the version history; returns its history_base_version.
+
+        None (the next version starts from a snapshot) if the history could not be written.
+        """
+        try:
+            return self.versions.record_version(template, previous, user_id)['base_version']
+        except DuplicateKeyError:
+            raise
+        except Exception as e:
+            print(f"Error recording template version: {str(e)}")
+            return None
     
     def get_template_by_id(self, template_id):
         """Get template by ID"""
         try:
             if isinstance(template_id, str):
                 template_id = ObjectId(template_id)
-            return self.collection.find_one({'_id': template_id})
+            cached = process_cache.get(self.collection.name, str(template_id))
+            if cached is not None:
+                return copy.deepcopy(cached)
+            generation = process_cache.generation(self.collection.name)
+            template = self.collection.find_one({'_id': template_id})
+            process_cache.set(self.collection.name, str(template_id), template, generation=generation)
+            return copy.deepcopy(template)
         except Exception as e:
             print(f"Error getting template: {str(e)}")
             return None
@@ -69,31 +96,49 @@ class TemplateCollection:
             print(f"Error getting templates: {str(e)}")
             return []
     
-    def update_template(self, template_id, update_data):
-        """Update an existing template"""
+    def update_template(self, template_id, update_data, user_id='admin'):
+        """Update an existing template, recording the new version in its history"""
         try:
             if isinstance(template_id, str):
                 template_id = ObjectId(template_id)
             
-            # Increment version
             current_template = self.collection.find_one({'_id': template_id})
-            if current_template:
-                new_version = current_template.get('version', 1) + 1
-            else:
-                new_version = 1
+            if not current_template:
+                return False
             
-            update_data['version'] = new_version
+            # Increment version
+            update_data['version'] = current_template.get('version', 1) + 1
             update_data['updated_at'] = datetime.now()
             
+            try:
+                update_data['history_base_version'] = self._record_version(
+                    {**current_template, **update_data}, current_template, user_id
+                )
+            except DuplicateKeyError:
+                print(f"⚠️ Template {template_id} was updated concurrently; version {update_data['version']} exists")
+                return False
+            
+            # Only apply on top of the version the delta was computed against
             result = self.collection.update_one(
-                {'_id': template_id},
+                {'_id': template_id, 'version': current_template.get('version')},
                 {'$set': update_data}
             )
+            process_cache.evict(self.collection.name, template_id)
+            if result.matched_count == 0 and update_data['history_base_version'] is not None:
+                self.versions.discard_version(template_id, update_data['version'])
             
             return result.modified_count > 0
         except Exception as e:
             print(f"Error updating template: {str(e)}")
             return False
+
+    def get_template_versions(self, template_id):
+        """List the stored versions of a template, newest first"""
+        return self.versions.get_versions(template_id)
+
+    def get_template_version(self, template_id, version):
+        """Rebuild a past version of a template from its history"""
+        return self.versions.get_version(template_id, version)
     
     def delete_template(self, template_id):
         """Soft delete a template (mark as inactive)"""
@@ -105,6 +150,7 @@ class TemplateCollection:
                 {'_id': template_id},
                 {'$set': {'is_active': False, 'updated_at': datetime.now()}}
             )
+            process_cache.evict(self.collection.name, template_id)
             
             return result.modified_count > 0
         except Exception as e:
@@ -158,34 +204,6 @@ class TemplateCollection:
     
     def create_template_version(self, template_id, new_content, user_id='admin'):
         """Create a new version of an existing template"""
-        try:
-            if isinstance(template_id, str):
-                template_id = ObjectId(template_id)
-            
-            # Get current template
-            current_template = self.collection.find_one({'_id': template_id})
-            if not current_template:
-                return None
-            
-            # Create new version
-            new_version = {
-                'name': current_template['name'],
-                'description': current_template.get('description', ''),
-                'content': new_content,
-                'placeholders': current_template.get('placeholders', []),
-                'clauses': current_template.get('clauses', []),
-                'category': current_template.get('category', 'general'),
-                'is_active': True,
-                'version': current_template.get('version', 1) + 1,
-                'created_at': datetime.now(),
-                'updated_at': datetime.now(),
-                'created_by': user_id,
-                'tags': current_template.get('tags', []),
-                'parent_template_id': template_id
-            }
-            
-            result = self.collection.insert_one(new_version)
-            return str(result.inserted_id)
-        except Exception as e:
-            print(f"Error creating template version: {str(e)}")
-            return None
+        if self.update_template(template_id, {'content': new_content}, user_id):
+            return str(template_id)
+        return None
@@ -0,0 +1,196 @@
+import difflib
+import json
+import re
+import threading
+import zlib
+from datetime import datetime
+from bson import Binary, ObjectId
+from cpq.db import db
+
+# A full snapshot is written at least every SNAPSHOT_INTERVAL versions, so
+# rebuilding any version applies at most SNAPSHOT_INTERVAL - 1 deltas
+SNAPSHOT_INTERVAL = 10
+
+# Template fields kept with every version next to the delta-compressed content
+VERSIONED_FIELDS = ['name', 'description', 'placeholders', 'clauses', 'category', 'tags']
+
+# Diff on tag and line boundaries: HTML from the editor is often a single line
+_TOKEN_SPLIT = re.compile(r'(?<=[>\n])')
+
+_indexes_ensured = False
+_index_lock = threading.Lock()
+
+
+def _tokenize(content):
+    return [token for token in _TOKEN_SPLIT.split(content or '') if token]
+
+
+def compute_delta(old_content, new_content):
+    """Compressed edit script turning old_content into new_content.
+
+    Ops are [n] to copy n tokens, [-n] to skip n tokens and a string to insert text.
+    """
+    old_tokens, new_tokens = _tokenize(old_content), _tokenize(new_content)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i2 - i1])
+            continue
+        if i2 > i1:
+            ops.append([-(i2 - i1)])
+        if j2 > j1:
+            ops.append(''.join(new_tokens[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(',', ':')).encode('utf-8'))
+
+
+def apply_delta(old_content, delta):
+    """Rebuild the newer content from old_content and a delta from compute_delta"""
+    old_tokens = _tokenize(old_content)
+    position = 0
+    parts = []
+    for op in json.loads(zlib.decompress(delta).decode('utf-8')):
+        if isinstance(op, str):
+            parts.append(op)
+        elif op[0] >= 0:
+            parts.extend(old_tokens[position:position + op[0]])
+            position += op[0]
+        else:
+            position -= op[0]
+    return ''.join(parts)
+
+
+def compress_content(content):
+    return zlib.compress((content or '').encode('utf-8'))
+
+
+def decompress_content(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+class TemplateVersionCollection:
+    """Version history of agreement templates, stored as snapshots plus deltas.
+
+    The template document itself always holds the current version, so reads
+    never touch this collection. Each history entry is either a compressed
+    snapshot of the content or a compressed delta against the previous version.
+    """
+
+    def __init__(self):
+        self.collection = db["agreement_template_versions"]
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """One entry per (template, version); also serves history lookups"""
+        global _indexes_ensured
+        if _indexes_ensured:
+            return
+        with _index_lock:
+            if _indexes_ensured:
+                return
+            try:
+                self.collection.create_index([('template_id', 1), ('version', 1)], unique=True)
+                _indexes_ensured = True
+            except Exception as e:
+                print(f"Error creating template version indexes: {str(e)}")
+
+    def record_version(self, template, previous=None, user_id='admin'):
+        """Store template (the new current version) in the history.
+
+        previous is the template document before the change. A delta against
+        it is stored unless a snapshot is due or the delta would not be
+        smaller. Returns the stored entry, whose base_version the template
+        document keeps as history_base_version. Raises DuplicateKeyError if
+        this version was recorded concurrently.
+        """
+        version = template.get('version', 1)
+        base_version = (previous or {}).get('history_base_version')
+        content = template.get('content', '')
+
+        entry = {
+            'template_id': template['_id'],
+            'version': version,
+            'fields': {field: template.get(field) for field in VERSIONED_FIELDS},
+            'created_at': datetime.now(),
+            'created_by': user_id,
+        }
+        snapshot = compress_content(content)
+        delta = None
+        # The previous version must itself be in the history for a delta to rebuild
+        if base_version is not None and previous.get('version') == version - 1 \
+                and version - base_version < SNAPSHOT_INTERVAL:
+            delta = compute_delta(previous.get('content', ''), content)
+            if len(delta) >= len(snapshot):
+                delta = None
+
+        if delta is None:
+            entry.update({'kind': 'snapshot', 'data': Binary(snapshot), 'base_version': version})
+        else:
+            entry.update({'kind': 'delta', 'data': Binary(delta), 'base_version': base_version})
+        entry['stored_bytes'] = len(entry['data'])
+
+        self.collection.insert_one(entry)
+        return entry
+
+    def discard_version(self, template_id, version):
+        """Remove an entry whose template write did not go through"""
+        self.collection.delete_one({'template_id': template_id, 'version': version})
+
+    def get_versions(self, template_id):
+        """List the recorded versions of a template, newest first, without content"""
+        try:
+            if isinstance(template_id, str):
+                template_id = ObjectId(template_id)
+            versions = list(self.collection.find(
+                {'template_id': template_id},
+                {'data': 0}
+            ).sort('version', -1))
+            for version in versions:
+                version['_id'] = str(version['_id'])
+                version['template_id'] = str(version['template_id'])
+                version['created_at'] = version['created_at'].isoformat()
+            return versions
+        except Exception as e:
+            print(f"Error getting template versions: {str(e)}")
+            return []
+
+    def get_version(self, template_id, version):
+        """Rebuild one version from its nearest snapshot; None if it is not in the history"""
+        try:
+            if isinstance(template_id, str):
+                template_id = ObjectId(template_id)
+            target = self.collection.find_one(
+                {'template_id': template_id, 'version': version},
+                {'data': 0}
+            )
+            if not target:
+                return None
+
+            entries = self.collection.find({
+                'template_id': template_id,
+                'version': {'$gte': target['base_version'], '$lte': version}
+            }).sort('version', 1)
+
+            content = None
+            expected = target['base_version']
+            for entry in entries:
+                if entry['version'] != expected:
+                    print(f"⚠️ Template {template_id} history is missing version {expected}")
+                    return None
+                if entry['kind'] == 'snapshot':
+                    content = decompress_content(entry['data'])
+                else:
+                    content = apply_delta(content, entry['data'])
+                expected += 1
+
+            return {
+                **target['fields'],
+                'template_id': template_id,
+                'version': version,
+                'content': content,
+                'created_at': target['created_at'],
+                'created_by': target.get('created_by'),
+            }
+        except Exception as e:
+            print(f"Error rebuilding template version: {str(e)}")
+            return None
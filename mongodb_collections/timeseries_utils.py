@@ -0,0 +1,102 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from pymongo.errors import CollectionInvalid, OperationFailure
+from cpq.db import db
+
+# Default retention for log collections, overridable per collection
+DEFAULT_LOG_RETENTION_DAYS = 90
+
+_ensured = set()
+_ensure_lock = threading.Lock()
+
+
+def get_retention_days(env_var):
+    """Retention in days from env_var, then LOG_RETENTION_DAYS, then the default (0 disables expiry)"""
+    value = os.getenv(env_var) or os.getenv('LOG_RETENTION_DAYS')
+    try:
+        return int(value) if value is not None else DEFAULT_LOG_RETENTION_DAYS
+    except ValueError:
+        return DEFAULT_LOG_RETENTION_DAYS
+
+
+def ensure_timeseries_collection(name, retention_days, time_field='timestamp',
+                                 meta_field='meta', granularity='seconds'):
+    """Get a time-series collection, creating it with TTL retention on first use.
+
+    Runs once per process and collection name. An existing time-series
+    collection gets its expireAfterSeconds brought in line with
+    retention_days. Servers without time-series support (MongoDB < 5.0) get
+    a regular collection with a TTL index on time_field instead, so the
+    collection classes work the same either way.
+    """
+    collection = db[name]
+    if name in _ensured:
+        return collection
+
+    with _ensure_lock:
+        if name in _ensured:
+            return collection
+
+        expire_after = int(retention_days * 86400) if retention_days else None
+        try:
+            existing = next(db.list_collections(filter={'name': name}), None)
+            if existing is None:
+                options = {'timeseries': {'timeField': time_field, 'metaField': meta_field,
+                                          'granularity': granularity}}
+                if expire_after:
+                    options['expireAfterSeconds'] = expire_after
+                try:
+                    db.create_collection(name, **options)
+                except CollectionInvalid:
+                    # Created concurrently by another worker
+                    pass
+            elif existing.get('type') == 'timeseries':
+                current = existing.get('options', {}).get('expireAfterSeconds', 'off')
+                wanted = expire_after or 'off'
+                if current != wanted:
+                    db.command('collMod', name, expireAfterSeconds=wanted)
+            else:
+                _ensure_ttl_index(collection, time_field, expire_after)
+        except OperationFailure as e:
+            print(f"⚠️ Time-series collection unavailable for {name} ({e}), using TTL index")
+            _ensure_ttl_index(collection, time_field, expire_after)
+        except Exception as e:
+            print(f"Error preparing log collection {name}: {str(e)}")
+
+        try:
+            # Stats and history queries filter on operation/status within a time window
+            collection.create_index([(f'{meta_field}.operation', 1), (f'{meta_field}.status', 1),
+                                     (time_field, -1)])
+        except Exception as e:
+            print(f"Error creating index on {name}: {str(e)}")
+
+        _ensured.add(name)
+    return collection
+
+
+def _ensure_ttl_index(collection, time_field, expire_after):
+    if not expire_after:
+        return
+    try:
+        collection.create_index([(time_field, 1)], expireAfterSeconds=expire_after,
+                                name=f'{time_field}_ttl')
+    except Exception as e:
+        print(f"Error creating TTL index on {collection.name}: {str(e)}")
+
+
+def window_start(days):
+    """Start of a trailing window of the given number of days"""
+    return datetime.now() - timedelta(days=days)
+
+
+def status_counts_pipeline(days, meta_field='meta', time_field='timestamp', match=None):
+    """Aggregation grouping a trailing window by status, in the legacy {_id: status, count} shape"""
+    query = {time_field: {'$gte': window_start(days)}}
+    if match:
+        query.update(match)
+    return [
+        {'$match': query},
+        {'$group': {'_id': f'${meta_field}.status', 'count': {'$sum': 1}}},
+        {'$sort': {'count': -1}}
+    ]
@@ -1,9 +1,35 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
+from mongodb_collections.asset_collection import ASSET_REF_PATTERN, AssetCollection
 from mongodb_collections.template_builder_collection import TemplateBuilderCollection
 
 
 template_builder_bp = Blueprint('template_builder', __name__, url_prefix='/api/template-builder')
 
+# Images extracted from template blocks, addressed by the SHA-256 of their bytes
+assets_bp = Blueprint('assets', __name__, url_prefix='/assets')
+
+
+@assets_bp.route('/<asset_hash>', methods=['GET'])
+def get_asset(asset_hash):
+    etag = f'"{asset_hash}"'
+    headers = {
+        # The URL names the content, so it can be cached forever
+        'Cache-Control': 'public, max-age=31536000, immutable',
+        'ETag': etag,
+        # Assets are user uploads; never let one run as a page or be sniffed into one
+        'Content-Security-Policy': "sandbox; default-src 'none'",
+        'X-Content-Type-Options': 'nosniff',
+    }
+    if not ASSET_REF_PATTERN.fullmatch(f'/assets/{asset_hash}'):
+        return jsonify({'success': False, 'message': 'Asset not found'}), 404
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers=headers)
+    asset = AssetCollection().get_asset(asset_hash)
+    if not asset:
+        return jsonify({'success': False, 'message': 'Asset not found'}), 404
+    data, mime_type = asset
+    return Response(data, mimetype=mime_type, headers=headers)
+
 
 @template_builder_bp.route('/save', methods=['POST'])
 def save_template_builder_document():
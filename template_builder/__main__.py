@@ -0,0 +1,24 @@
+"""Template builder maintenance from the command line.
+
+    python -m template_builder migrate-assets
+"""
+
+import argparse
+import sys
+
+from mongodb_collections.template_builder_collection import TemplateBuilderCollection
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Template builder maintenance tasks')
+    parser.add_argument('task', choices=['migrate-assets'],
+                        help='migrate-assets: move inline base64 images of saved documents into the asset store')
+    parser.parse_args(argv)
+
+    migrated = TemplateBuilderCollection().migrate_embedded_images()
+    print(f"✅ Moved inline images of {migrated} documents into the asset store")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,12 +6,18 @@ from docx.oxml.shared import OxmlElement, qn
 import re
 from datetime import datetime
 import base64
-import requests
-from PIL import Image
+from cpq.image_fetcher import decode_image, image_fetcher
+
+# Relative URL of a template builder asset (see mongodb_collections/asset_collection.py)
+ASSET_SRC_PATTERN = re.compile(r'/assets/[0-9a-f]{64}')
 
 class DocxGenerator:
     def __init__(self):
         self.document = None
+        # Remote images fetched ahead of the build, by URL
+        self._images = {}
+        # Template builder assets (/assets/<hash>) loaded ahead of the build, by hash
+        self._assets = {}
     
     def create_document(self, template_content, template_data):
         """Create a DOCX document from template content and data"""
@@ -26,6 +32,9 @@ class DocxGenerator:
             cleaned_html = self._preprocess_html(template_content)
             processed_content = self._replace_placeholders(cleaned_html, template_data)
             
+            # Download every remote image in parallel before building
+            self._prefetch_images(processed_content)
+            
             # Convert HTML content to DOCX
             self._convert_html_to_docx(processed_content)
             
@@ -367,28 +376,46 @@ class DocxGenerator:
         except Exception:
             return None, None, None
 
+    def _prefetch_images(self, html: str):
+        """Fetch all http(s) <img> sources of the document at once, and load its assets in one query."""
+        try:
+            srcs = [self._parse_img_attrs(m.group(0))[0] for m in re.finditer(r'<img[^>]*>', html, flags=re.IGNORECASE)]
+            hashes = [src[len('/assets/'):] for src in srcs if src and ASSET_SRC_PATTERN.fullmatch(src)]
+            if hashes:
+                # Imported here so the generator doesn't need a database until a template uses assets
+                from mongodb_collections.asset_collection import AssetCollection
+                self._assets = AssetCollection().get_assets(hashes)
+            self._images = image_fetcher.prefetch(srcs)
+        except Exception as e:
+            print(f"Error prefetching images: {str(e)}")
+
     def _process_image(self, img_html: str):
-        """Process <img> tag: supports http(s) URLs and data URIs. Optional width/height attrs in px.
+        """Process <img> tag: supports http(s) URLs, data URIs and template assets. Optional width/height attrs in px.
         """
         try:
             src, width_px, height_px = self._parse_img_attrs(img_html)
             if not src:
                 return
 
+            image = None
             image_bytes = None
             if src.startswith('data:image/'):
                 # data URI
                 b64_match = re.search(r'base64,([A-Za-z0-9+/=]+)', src)
                 if b64_match:
                     image_bytes = base64.b64decode(b64_match.group(1))
+            elif ASSET_SRC_PATTERN.fullmatch(src):
+                # Image extracted by the template builder; served from the asset store
+                asset_hash = src[len('/assets/'):]
+                asset = self._assets.get(asset_hash)
+                if asset is None:
+                    from mongodb_collections.asset_collection import AssetCollection
+                    asset = AssetCollection().get_asset(asset_hash)
+                if asset:
+                    image_bytes = asset[0]
             elif src.startswith('http://') or src.startswith('https://'):
-                # Some CDNs block requests without UA; include a common UA header
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-                }
-                resp = requests.get(src, timeout=10, headers=headers)
-                if resp.status_code == 200:
-                    image_bytes = resp.content
+                # Usually prefetched; otherwise fetched through the shared cache
+                image = self._images.get(src) or image_fetcher.fetch(src)
             else:
                 # treat as local file path or app-served uploads (/uploads/..)
                 try:
@@ -403,34 +430,17 @@ class DocxGenerator:
                 except Exception:
                     image_bytes = None
 
-            if not image_bytes:
+            if image is None and image_bytes:
+                image = decode_image(image_bytes)
+            if image is None:
                 return
 
+            # One decode gave the format (non-Word formats already converted to PNG)
+            # and the intrinsic size in pixels
             from io import BytesIO
-            stream = BytesIO(image_bytes)
-
-            # Normalize to a docx-friendly format if needed (e.g., WebP → PNG)
-            try:
-                img = Image.open(BytesIO(image_bytes))
-                fmt = (img.format or '').upper()
-                if fmt not in ('PNG', 'JPEG', 'JPG', 'GIF', 'BMP', 'TIFF'):
-                    buf = BytesIO()
-                    img.convert('RGBA').save(buf, format='PNG')
-                    buf.seek(0)
-                    stream = buf
-            except Exception:
-                # If PIL can't open, fall back to raw bytes (may fail silently)
-                pass
-
-            # Determine target size and auto-fit to page width
-            # Read intrinsic image size (pixels)
-            img_w_px = None
-            img_h_px = None
-            try:
-                meta_img = Image.open(BytesIO(image_bytes))
-                img_w_px, img_h_px = meta_img.size
-            except Exception:
-                pass
+            stream = BytesIO(image.data)
+            img_w_px = image.width
+            img_h_px = image.height
 
             # Compute requested size in inches (default from intrinsic size)
             width_in = width_px / 96.0 if width_px else (img_w_px / 96.0 if img_w_px else None)
@@ -0,0 +1,118 @@
+"""Decoded template images shared by every render in this process.
+
+Logos arrive at the renderer as encoded bytes. Wrapping them in a fresh
+``Image(BytesIO(...))`` made ReportLab decode each one with PIL and convert
+it to raw RGB on every PDF. The cache keeps one ImageReader per image,
+keyed by the SHA-256 of its bytes, with its size and pixel data decoded
+up front. Renders read the handle and never decode or touch the disk.
+JPEGs are embedded in the PDF as they are, so their handle only keeps the
+bytes and each render gets its own reader over them.
+
+    IMAGE_CACHE_MB  decoded pixel data kept per process (default 32)
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image as PILImage
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Flowable
+
+IMAGE_CACHE_MB = float(os.getenv('IMAGE_CACHE_MB', '32'))
+
+
+class ImageHandle:
+    """A decoded image: its reader and intrinsic size in pixels"""
+
+    def __init__(self, digest, data):
+        self.digest = digest
+        self.data = data
+        with PILImage.open(BytesIO(data)) as probe:
+            self.is_jpeg = probe.format == 'JPEG'
+            self.width, self.height = probe.size
+            alpha = self.width * self.height if 'A' in probe.getbands() else 0
+        self.size = len(data)
+        if not self.is_jpeg:
+            # Decode now so renders only copy the cached pixels into the PDF
+            self._reader = ImageReader(BytesIO(data))
+            self.size += len(self._reader.getRGBData()) + alpha
+
+    def reader(self):
+        """ImageReader for one render"""
+        if self.is_jpeg:
+            # Read from a file handle of its own, so concurrent renders don't share a position
+            return ImageReader(BytesIO(self.data))
+        return self._reader
+
+
+class ImageHandleCache:
+    """LRU of decoded images, bounded by their total decoded size"""
+
+    def __init__(self, max_bytes=int(IMAGE_CACHE_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, data):
+        """Handle for encoded image bytes, decoding them on first use"""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            handle = self._entries.get(digest)
+            if handle is not None:
+                self._entries.move_to_end(digest)
+                self._hits += 1
+                return handle
+            self._misses += 1
+
+        handle = ImageHandle(digest, data)
+        if handle.size > self.max_bytes:
+            return handle
+        with self._lock:
+            if digest not in self._entries:
+                self._entries[digest] = handle
+                self._size += handle.size
+                while self._size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= evicted.size
+                    self._evictions += 1
+        return handle
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+            }
+
+
+class CachedImage(Flowable):
+    """Image flowable drawing a cached handle instead of reading a file"""
+
+    def __init__(self, handle, width=None, height=None, hAlign='CENTER'):
+        super().__init__()
+        self.handle = handle
+        self.hAlign = hAlign
+        self.imageWidth, self.imageHeight = handle.width, handle.height
+        self.drawWidth = width or handle.width
+        self.drawHeight = height or handle.height
+
+    def wrap(self, availWidth, availHeight):
+        return self.drawWidth, self.drawHeight
+
+    def draw(self):
+        self.canv.drawImage(self.handle.reader(), 0, 0, self.drawWidth, self.drawHeight, mask='auto')
+
+
+# Global instance shared by the renders of this process
+image_handles = ImageHandleCache()
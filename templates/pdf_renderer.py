@@ -0,0 +1,583 @@
+"""PDF rendering jobs.
+
+Each function takes plain, picklable data and returns the PDF bytes, so it
+can run in a render worker process (see cpq/render_service.py) as well as
+inline. Nothing here touches the database or the file system.
+"""
+
+import re
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab import Version as REPORTLAB_VERSION
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+from .image_cache import CachedImage, image_handles
+from .pdf_generator import PDFGenerator
+
+# Part of every render cache key (cpq/render_cache.py); bump it whenever a
+# change here or in PDFGenerator alters the output for the same inputs
+RENDERER_VERSION = f"2/reportlab-{REPORTLAB_VERSION}"
+
+
+# Table style of the purchase agreement table, shared by every render
+AGREEMENT_TABLE_STYLE = TableStyle([
+    # Header row - white background
+    ('BACKGROUND', (0, 0), (-1, 0), colors.white),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    # Data rows - light blue background like template preview
+    ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#E3F2FD')),  # Light blue
+    ('TEXTCOLOR', (0, 1), (-1, -2), colors.black),
+    ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -2), 10),
+    # Total row - white background
+    ('BACKGROUND', (0, -1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, -1), (-1, -1), 10),
+    # Alignment - left for job/description, right for price
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),   # job column
+    ('ALIGN', (1, 0), (1, -1), 'LEFT'),   # description column
+    ('ALIGN', (2, 0), (2, -1), 'RIGHT'),  # price column
+    # Padding
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+    # Borders
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+AGREEMENT_TABLE_WIDTHS = [2.5*inch, 2.5*inch, 1.5*inch]
+
+LOGO_TEXT = """
+                <para align="center">
+                <b>CloudFuze</b> - Microsoft Partner<br/>
+                Gold Cloud Productivity
+                </para>
+                """
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+@lru_cache(maxsize=1)
+def _stylesheet():
+    """Sample stylesheet, built once per process"""
+    return getSampleStyleSheet()
+
+
+def render_template_pdf(blocks, logo_images, template_data, client_company, selected_plan='standard',
+                        debug_info=None):
+    """Purchase agreement PDF from template builder blocks.
+
+    Compiles the blocks on every call; callers rendering the same template
+    repeatedly should send a cached plan to render_template_plan_pdf.
+    """
+    from .render_plan import compile_template
+    return render_template_plan_pdf(compile_template(blocks), logo_images, template_data, client_company,
+                                    selected_plan, debug_info)
+
+
+def render_template_plan_pdf(plan, logo_images, template_data, client_company, selected_plan='standard',
+                             debug_info=None):
+    """Purchase agreement PDF from a compiled template plan (templates/render_plan.py).
+
+    logo_images holds the raw bytes of the first image block's images.
+    """
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        leftMargin=0.75*inch,
+        rightMargin=0.75*inch,
+        topMargin=0.6*inch,
+        bottomMargin=0.75*inch
+    )
+    doc.build(build_template_story(plan, logo_images, template_data, client_company, selected_plan, debug_info))
+    return buffer.getvalue()
+
+
+def build_template_story(plan, logo_images, template_data, client_company, selected_plan='standard',
+                         debug_info=None):
+    """Flowables for a compiled template plan filled with one quote's data"""
+    from .render_plan import fill
+
+    styles = _stylesheet()
+    story = []
+    
+    # Logos (up to two) come from the first image block; decoded once per process
+    extracted_logo_images = [image_handles.get(img_bytes) for img_bytes in (logo_images or [])[:2]]
+    logo_images_added = bool(extracted_logo_images)
+    debug_info = list(debug_info or [])
+    
+    # Build a table with the logos if we have at least one
+    if extracted_logo_images:
+        imgs = []
+        if len(extracted_logo_images) == 1:
+            # Single centered logo, larger size with preserved aspect ratio
+            img = CachedImage(extracted_logo_images[0])
+            target_h = 1.4*inch  # Increased height
+            aspect = img.imageWidth / float(img.imageHeight)
+            img.drawHeight = target_h
+            img.drawWidth = min(4.5*inch, target_h * aspect)  # Increased max width
+            img.hAlign = 'CENTER'
+            imgs = [[img]]
+            tbl_col_widths = [6.5*inch]  # Wider table
+            tbl_style = [('ALIGN', (0,0), (-1,-1), 'CENTER'),
+                         ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+                         ('LEFTPADDING', (0,0), (-1,-1), 0),
+                         ('RIGHTPADDING', (0,0), (-1,-1), 0),
+                         ('TOPPADDING', (0,0), (-1,-1), 0),
+                         ('BOTTOMPADDING', (0,0), (-1,-1), 0)]
+        else:
+            # Two logos: left (CloudFuze), right (Microsoft Partner) - bigger with preserved aspect
+            img_left = CachedImage(extracted_logo_images[0])
+            img_right = CachedImage(extracted_logo_images[1])
+            target_h_left = 1.5*inch   # Increased height
+            target_h_right = 1.4*inch  # Increased height
+            aspect_left = img_left.imageWidth / float(img_left.imageHeight)
+            aspect_right = img_right.imageWidth / float(img_right.imageHeight)
+            img_left.drawHeight = target_h_left
+            img_left.drawWidth = min(4.0*inch, target_h_left * aspect_left)  # Increased max width
+            img_right.drawHeight = target_h_right
+            img_right.drawWidth = min(3.8*inch, target_h_right * aspect_right)  # Increased max width
+            img_left.hAlign = 'LEFT'
+            img_right.hAlign = 'RIGHT'
+            imgs = [[img_left, img_right]]
+            tbl_col_widths = [4.0*inch, 4.0*inch]  # Wider columns
+            tbl_style = [
+                ('ALIGN', (0,0), (0,0), 'LEFT'),
+                ('ALIGN', (1,0), (1,0), 'RIGHT'),
+                ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+                ('LEFTPADDING', (0,0), (-1,-1), 0),
+                ('RIGHTPADDING', (0,0), (-1,-1), 0),
+                ('TOPPADDING', (0,0), (-1,-1), 0),
+                ('BOTTOMPADDING', (0,0), (-1,-1), 0),
+                ('INNERGRID', (0,0), (-1,-1), 0, colors.white),
+                ('BOX', (0,0), (-1,-1), 0, colors.white),
+            ]
+        logo_table = Table(imgs, colWidths=tbl_col_widths, hAlign='CENTER')
+        logo_table.setStyle(TableStyle(tbl_style))
+        story.append(logo_table)
+        story.append(Spacer(1, 15))
+
+    if not logo_images_added:
+        # Show debug information instead of logos
+        debug_section = f"""
+        <para align="center" fontSize="12" spaceAfter="20" textColor="red">
+        <b>DEBUG LOGS - Logo Processing:</b><br/>
+        {chr(10).join(debug_info) if debug_info else 'No debug info available'}<br/>
+        <br/>
+        <b>Fallback:</b> CloudFuze - Microsoft Partner<br/>
+        <font color="gold">Gold Cloud Productivity</font>
+        </para>
+        """
+        story.append(Paragraph(debug_section, styles['Normal']))
+        story.append(Spacer(1, 30))
+    
+    # Add main title
+    title_text = f"CloudFuze Purchase Agreement for {client_company}"
+    story.append(Paragraph(title_text, styles['Title']))
+    story.append(Spacer(1, 30))
+
+    # Determine plan prefix based on selected plan to pull matching values
+    plan_prefix = selected_plan if selected_plan in ('basic', 'advanced') else 'standard'
+
+    for step in plan['steps']:
+        kind = step[0]
+
+        if kind == 'logo_text':
+            story.append(Paragraph(LOGO_TEXT, styles['Normal']))
+            story.append(Spacer(1, 20))
+
+        elif kind == 'text':
+            processed_content = fill(step[1], template_data, client_company, plan_prefix)
+            # Skip duplicate titles
+            if 'CloudFuze Purchase Agreement for' in processed_content and processed_content != title_text:
+                continue
+            
+            # Convert HTML to plain text and add to PDF
+            plain_text = TAG_PATTERN.sub('', processed_content)
+            if plain_text.strip():
+                story.append(Paragraph(plain_text, styles['Normal']))
+                story.append(Spacer(1, 12))
+        
+        elif kind == 'table':
+            _, table_kind, content = step
+            table_data = None
+            if table_kind == 'html':
+                table_data = [[fill(cell, template_data, client_company, plan_prefix).strip() for cell in row]
+                              for row in content]
+            elif table_kind == 'text':
+                processed_content = fill(content, template_data, client_company, plan_prefix)
+                if 'job' in processed_content.lower() and 'description' in processed_content.lower():
+                    table_data = parse_table_content(processed_content)
+            
+            # Fallback to default table if no table content found
+            if not table_data:
+                table_data = create_purchase_agreement_table(template_data, selected_plan)
+            
+            if table_data:
+                table = Table(table_data, colWidths=AGREEMENT_TABLE_WIDTHS)
+                table.setStyle(AGREEMENT_TABLE_STYLE)
+                story.append(table)
+                story.append(Spacer(1, 20))
+
+    return story
+
+
+def render_quote_pdf(client_data, quote_data, configuration, selected_plan='standard'):
+    """Quote PDF from the standard ReportLab quote template"""
+    return PDFGenerator().create_quote_pdf(client_data, quote_data, configuration, selected_plan).getvalue()
+
+
+def render_html_pdf(html):
+    """PDF from an HTML string via WeasyPrint (ImportError if it is not installed).
+
+    There is no base URL, so /assets/<hash> images must already be inlined
+    (AssetCollection.inline_assets).
+    """
+    from weasyprint import HTML
+    return HTML(string=html).write_pdf()
+
+
+def render_signature_certificate_pdf(certificate_data):
+    """Signature certificate PDF bytes, built with ReportLab"""
+    try:
+        buffer = BytesIO()
+        
+        # Create PDF document with custom styling
+        doc = SimpleDocTemplate(buffer, pagesize=letter, 
+                              topMargin=72, bottomMargin=72, 
+                              leftMargin=72, rightMargin=72)
+        story = []
+        
+        # Get styles
+        styles = getSampleStyleSheet()
+        
+        # Title style - matches your image
+        title_style = ParagraphStyle(
+            'SignatureCertificateTitle',
+            parent=styles['Heading1'],
+            fontSize=28,
+            spaceAfter=20,
+            alignment=TA_CENTER,
+            textColor=colors.darkblue,
+            fontName='Helvetica-Bold'
+        )
+        
+        # Reference number style
+        ref_style = ParagraphStyle(
+            'ReferenceNumber',
+            parent=styles['Normal'],
+            fontSize=14,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=colors.black,
+            fontName='Helvetica'
+        )
+        
+        # Document info style
+        doc_info_style = ParagraphStyle(
+            'DocumentInfo',
+            parent=styles['Normal'],
+            fontSize=12,
+            spaceAfter=20,
+            alignment=TA_LEFT,
+            textColor=colors.black,
+            fontName='Helvetica'
+        )
+        
+        # Add title - matches your image format
+        story.append(Paragraph("Signature Certificate", title_style))
+        story.append(Spacer(1, 15))
+        
+        # Add reference number - matches your image format
+        story.append(Paragraph(f"Reference number: {certificate_data['reference_number']}", ref_style))
+        story.append(Spacer(1, 25))
+        
+        # Create signers table - matches your image format exactly
+        table_data = [['Signer', 'Timestamp', 'Signature']]
+        
+        for signer in certificate_data['signers']:
+            # Format timestamps to match your image
+            current_time = datetime.now().strftime('%d %b %Y %H:%M:%S UTC')
+            sent_time = current_time
+            viewed_time = current_time
+            signed_time = signer['signed_at'] if signer['signed_at'] else current_time
+            
+            # Create signer info - matches your image format
+            signer_info = f"""
+            <b>{signer['name']}</b><br/>
+            {signer['email']}<br/><br/>
+            <b>Sent:</b> {sent_time}<br/>
+            <b>Viewed:</b> {viewed_time}<br/>
+            <b>Signed:</b> {signed_time}<br/><br/>
+            <b>Recipient Verification:</b><br/>
+            ✓ Email verified
+            """
+            
+            # Create timestamp info - matches your image format
+            timestamp_info = f"""
+            <b>Sent:</b> {sent_time}<br/>
+            <b>Viewed:</b> {viewed_time}<br/>
+            <b>Signed:</b> {signed_time}<br/><br/>
+            <b>Recipient Verification:</b><br/>
+            ✓ Email verified<br/>
+            {viewed_time}<br/><br/>
+            <b>IP address:</b> {signer['ip_address'] or 'N/A'}<br/>
+            <b>Location:</b> {signer['location'] or 'N/A'}
+            """
+            
+            # Create signature display - matches your image format
+            signature_display = f"""
+            ✓ Digital Signature<br/>
+            {signer['signature_data'] or signer['name']}
+            """
+            
+            table_data.append([
+                signer_info,
+                timestamp_info,
+                signature_display
+            ])
+        
+        # Create table with 3 columns to match your image
+        # Convert HTML content to Paragraph objects for proper rendering
+        formatted_table_data = []
+        for row_idx, row in enumerate(table_data):
+            formatted_row = []
+            for col_idx, cell_content in enumerate(row):
+                if row_idx == 0:  # Header row
+                    formatted_row.append(cell_content)
+                else:  # Data rows
+                    if isinstance(cell_content, str) and '<' in cell_content:
+                        # Convert HTML to Paragraph
+                        formatted_row.append(Paragraph(cell_content, styles['Normal']))
+                    else:
+                        formatted_row.append(cell_content)
+            formatted_table_data.append(formatted_row)
+        
+        table = Table(formatted_table_data, colWidths=[2.5*inch, 2.0*inch, 2.0*inch])
+        table.setStyle(TableStyle([
+            # Header styling - matches your image
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('TOPPADDING', (0, 0), (-1, 0), 12),
+            
+            # Data row styling - matches your image
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            
+            # Alignment and spacing - matches your image
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 6),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+            ('TOPPADDING', (0, 1), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+            
+            # Borders - matches your image
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ]))
+        
+        story.append(table)
+        story.append(Spacer(1, 30))
+        
+        # Add completion info - matches your image format
+        completion_date = certificate_data.get('completion_date', datetime.now())
+        if isinstance(completion_date, str):
+            try:
+                completion_date = datetime.fromisoformat(completion_date.replace('Z', '+00:00'))
+            except:
+                completion_date = datetime.now()
+        
+        # Create completion section - matches your image format
+        completion_style = ParagraphStyle(
+            'Completion',
+            parent=styles['Normal'],
+            fontSize=12,
+            spaceAfter=20,
+            alignment=TA_LEFT,
+            textColor=colors.black,
+            fontName='Helvetica'
+        )
+        
+        completion_text = f"""
+        <b>Document completed by all parties on:</b> {completion_date.strftime('%d %b %Y %H:%M:%S UTC')}<br/>
+        Page 1 of 1
+        """
+        story.append(Paragraph(completion_text, completion_style))
+        
+        # Build PDF
+        doc.build(story)
+        
+        return buffer.getvalue()
+        
+    except Exception as e:
+        print(f"Error generating signature certificate PDF: {str(e)}")
+        raise
+
+
+def parse_html_table(table_html):
+    """Parse HTML table and return table data for ReportLab"""
+    try:
+        # Extract table rows
+        rows = re.findall(r'<tr[^>]*>(.*?)</tr>', table_html, re.IGNORECASE | re.DOTALL)
+        table_data = []
+        
+        for row in rows:
+            # Extract table cells (both th and td)
+            cells = re.findall(r'<(?:th|td)[^>]*>(.*?)</(?:th|td)>', row, re.IGNORECASE | re.DOTALL)
+            if cells:
+                # Clean cell content
+                clean_cells = []
+                for cell in cells:
+                    cell_text = re.sub(r'<[^>]+>', '', cell).strip()
+                    clean_cells.append(cell_text)
+                table_data.append(clean_cells)
+        
+        return table_data if table_data else None
+    except Exception as e:
+        print(f"Error parsing HTML table: {str(e)}")
+        return None
+
+def parse_table_content(content):
+    """Parse table content and return table data for ReportLab"""
+    try:
+        # First try to parse HTML table
+        if '<table' in content.lower():
+            return parse_html_table(content)
+        
+        # If not HTML, try to parse structured text
+        lines = content.split('\n')
+        table_data = []
+        
+        # Look for common table patterns
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+                
+            # Check if line contains table-like structure
+            if '|' in line or '\t' in line or '  ' in line:
+                # Split by common separators
+                row = re.split(r'[|\t]+|\s{2,}', line)
+                if len(row) >= 2:  # At least 2 columns
+                    clean_row = [cell.strip() for cell in row if cell.strip()]
+                    if clean_row:
+                        table_data.append(clean_row)
+            elif any(keyword in line.lower() for keyword in ['job', 'description', 'price', 'amount', 'total']):
+                # This might be a header or data row
+                if 'job' in line.lower() and 'description' in line.lower() and 'price' in line.lower():
+                    # This is likely a header row
+                    table_data.append(['Job', 'Description', 'Price'])
+                elif any(keyword in line.lower() for keyword in ['cloudfuze', 'migration', 'managed', 'total']):
+                    # This might be a data row, try to extract meaningful content
+                    # For now, add as a single cell row
+                    table_data.append([line])
+        
+        # If we found structured data, return it
+        if table_data:
+            return table_data
+        
+        # Fallback: create a simple table from the content
+        # Look for lines that might be table rows
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith('<') and not line.startswith('{'):
+                # This might be table content
+                if any(keyword in line.lower() for keyword in ['cloudfuze', 'migration', 'managed', 'total', 'amount']):
+                    table_data.append([line])
+        
+        return table_data if table_data else None
+    except Exception as e:
+        print(f"Error parsing table content: {str(e)}")
+        return None
+
+def create_purchase_agreement_table(template_data, selected_plan='standard'):
+    """Create a professional purchase agreement table based on template data and selected plan"""
+    try:
+        # Extract relevant data based on selected plan
+        client_company = template_data.get('client_company', 'Client Company')
+        config_users = template_data.get('config_users', 1)
+        config_duration = template_data.get('config_duration_months', 1)
+        
+        # Get pricing based on selected plan
+        if selected_plan == 'basic':
+            plan_prefix = 'basic'
+        elif selected_plan == 'advanced':
+            plan_prefix = 'advanced'
+        else:
+            plan_prefix = 'standard'
+
+        # Totals for table (both numeric and formatted)
+        total_cost_num = float(template_data.get(f'{plan_prefix}_total_cost', 0) or 0)
+        total_cost = template_data.get(f'{plan_prefix}_total_cost_formatted', '$0.00')
+
+        # Compute combined (migration + instance) for the selected plan
+        try:
+            mig_val = float(template_data.get(f'{plan_prefix}_migration_cost', 0) or 0)
+            inst_val = float(template_data.get(f'{plan_prefix}_instance_cost', 0) or 0)
+        except Exception:
+            mig_val = 0.0
+            inst_val = 0.0
+        combined_val = (mig_val + inst_val)
+        combined_formatted = f"${combined_val:,.2f}"
+
+        # Formatted single migration cost for row 2
+        migration_formatted = template_data.get(f'{plan_prefix}_migration_cost_formatted', '$0.00')
+
+        # Row 1 amount: total cost - (migration + instance)
+        row1_val = max(0.0, total_cost_num - combined_val)
+        row1_formatted = f"${row1_val:,.2f}"
+        
+        # Get migration type, default to "slack to teams" to match template preview
+        config_migration_type = template_data.get('config_migration_type', 'slack to teams')
+        if config_migration_type == 'content':
+            config_migration_type = 'slack to teams'  # Map content to slack to teams
+        
+        print(f"Creating table with {selected_plan} plan:")
+        print(f"  Client company: {client_company}")
+        print(f"  Total cost: {total_cost}")
+        print(f"  Migration cost: {mig_val}")
+        print(f"  Migration type: {config_migration_type}")
+        print(f"  Duration: {config_duration} months")
+        
+        # Create table data exactly as shown in template preview
+        table_data = [
+            ['job', 'Description', 'price'],
+            [
+                'CloudFuze X-Change Data Migration',
+                f'{config_migration_type} (Up to {config_users} users)',  # Include user count
+                row1_formatted  # total - (migration + instance)
+            ],
+            [
+                'Managed Migration Service',
+                f'valid for {config_duration} month{"s" if config_duration > 1 else ""}',
+                migration_formatted  # migration cost only
+            ],
+            [
+                'total',
+                'price',
+                total_cost  # Use total cost for the total row
+            ]
+        ]
+        
+        print(f"Table data: {table_data}")
+        return table_data
+    except Exception as e:
+        print(f"Error creating purchase agreement table: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
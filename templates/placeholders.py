@@ -0,0 +1,70 @@
+"""Single-pass placeholder substitution for template content.
+
+Placeholders are ``{{key}}``, ``[key]`` and ``{key}``, matched
+case-insensitively against the template_data keys, plus a few fixed aliases
+such as ``[Client Name]`` that are matched exactly. One regex finds every
+bracketed name in a single scan and each match is resolved with a dict
+lookup, instead of three full-text ``re.sub`` passes per key.
+
+Each placeholder in the original content is replaced once: values are
+inserted literally and are not themselves searched for placeholders.
+"""
+
+import re
+from functools import lru_cache
+
+# Placeholders that always resolve, to a template_data key or a default
+PLACEHOLDER_ALIASES = {
+    '[Client.Company]': ('client_company', 'Client Company'),
+    '[Client Company]': ('client_company', 'Client Company'),
+    '[client_company]': ('client_company', 'Client Company'),
+    '[Client.Name]': ('client_name', 'Client Name'),
+    '[Client Name]': ('client_name', 'Client Name'),
+    '[client_name]': ('client_name', 'Client Name'),
+    '[company name]': ('company_name', 'CloudFuze'),
+    '[company_name]': ('company_name', 'CloudFuze'),
+}
+
+_ALIAS_LENGTH = max(len(alias) for alias in PLACEHOLDER_ALIASES) - 2
+
+
+@lru_cache(maxsize=16)
+def compile_placeholder_pattern(max_length):
+    """Regex matching any bracketed name of up to max_length characters.
+
+    Names can't contain brackets or braces, so an unknown outer placeholder
+    never hides a known inner one, and the length bound keeps a stray
+    ``[`` from scanning the rest of the content.
+    """
+    name = rf"[^{{}}\[\]]{{1,{max_length}}}"
+    return re.compile(rf"\{{\{{(?P<double>{name})\}}\}}|\[(?P<square>{name})\]|\{{(?P<single>{name})\}}")
+
+
+def replace_placeholders(content, template_data):
+    """Content with every placeholder replaced by its template_data value"""
+    if not content:
+        return content
+
+    values = {}
+    folded = {}
+    for key, value in template_data.items():
+        key = str(key)
+        # The first of several keys differing only in case wins
+        values.setdefault(key.lower(), str(value))
+        folded.setdefault(key.casefold(), values[key.lower()])
+
+    def substitute(match):
+        name = match.group('double') or match.group('square') or match.group('single')
+        value = values.get(name.lower())
+        if value is None:
+            value = folded.get(name.casefold())
+        if value is not None:
+            return value
+        alias = PLACEHOLDER_ALIASES.get(match.group(0))
+        if alias is not None:
+            key, default = alias
+            return str(template_data.get(key, default))
+        return match.group(0)
+
+    max_length = max([len(key) for key in values] + [_ALIAS_LENGTH])
+    return compile_placeholder_pattern(max_length).sub(substitute, content)
@@ -0,0 +1,227 @@
+"""Compiled render plans for template builder documents.
+
+A template only changes when someone edits it, but rendering it used to
+re-run the content-extraction regexes over every block's builder HTML and
+re-parse its tables on each PDF. compile_template does that work once and
+returns a plan: plain lists and tuples (so it can be sent to a render
+worker) of static text fragments and placeholder slots. Filling the slots
+with a quote's data is all that is left per render (see
+pdf_renderer.render_template_plan_pdf).
+
+Plans are cached per worker by template id and ``updated`` timestamp,
+compiled when a template is saved or on its first render.
+
+    TEMPLATE_PLAN_CACHE_SIZE  plans kept per worker (default 128)
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from .pdf_renderer import parse_html_table
+
+TEMPLATE_PLAN_CACHE_SIZE = int(os.getenv('TEMPLATE_PLAN_CACHE_SIZE', '128'))
+
+# Bump when compile_template changes what a plan looks like
+PLAN_VERSION = 1
+
+# Tried in order; the longest match of the first pattern that matches is the block's content
+CONTENT_PATTERNS = [re.compile(p, re.DOTALL) for p in (
+    r'<div[^>]*class="[^"]*content[^"]*"[^>]*>(.*?)</div>',  # div with content class
+    r'<div[^>]*class="[^"]*block[^"]*"[^>]*>(.*?)</div>',   # div with block class
+    r'<p[^>]*>(.*?)</p>',                                   # paragraph tags
+    r'<h[1-6][^>]*>(.*?)</h[1-6]>',                        # heading tags
+    r'<span[^>]*>(.*?)</span>',                             # span tags
+    r'<div[^>]*>(.*?)</div>',                               # any div (fallback)
+)]
+
+# Used instead when the match is still the builder's toolbar wrapper
+INNER_CONTENT_PATTERNS = [re.compile(p, re.DOTALL) for p in (
+    r'<div[^>]*class="[^"]*editor[^"]*"[^>]*>(.*?)</div>',
+    r'<div[^>]*class="[^"]*prose[^"]*"[^>]*>(.*?)</div>',
+    r'<div[^>]*class="[^"]*document[^"]*"[^>]*>(.*?)</div>',
+    r'<div[^>]*>(.*?)</div>',
+)]
+
+TOOLBAR_MARKER = '<div class="block-toolbar"'
+
+# {{name}}, [name], {name} and the one unbracketed phrase templates use
+SLOT_PATTERN = re.compile(
+    r'\{\{(?P<double>[^{}\[\]]{1,200})\}\}'
+    r'|\[(?P<square>[^{}\[\]]{1,200})\]'
+    r'|\{(?P<single>[^{}\[\]]{1,200})\}'
+    r'|(?P<phrase>Valid for how m,any Months i want tomention here)'
+)
+
+# Square-bracket aliases, resolved before template_data keys
+CLIENT_COMPANY_ALIASES = {'[Client.Company]', '[Client Company]', '[client_company]'}
+COMPANY_NAME_ALIASES = {'[company name]', '[company_name]'}
+
+# Free-text placeholders from existing templates: (template_data key, default);
+# {plan} is the selected plan's prefix
+PHRASE_SLOTS = {
+    '{Up to i want to keep here no of users}': ('config_users', 1),
+    '{up to i want to keep here no of users}': ('config_users', 1),
+    '{UP TO I WANT TO KEEP HERE NO OF USERS}': ('config_users', 1),
+    '{i want to mention here cost of migration only}': ('{plan}_migration_cost_formatted', '$0.00'),
+    '{i want to mention here cost of service here}': ('{plan}_migration_cost_formatted', '$0.00'),
+    '{i want to mention here total amount}': ('{plan}_total_cost_formatted', '$0.00'),
+    '{i want to mention total cost - (migration cost+if instance cost)}': ('{plan}_total_cost_formatted', '$0.00'),
+    '{I WANT TO MENTION TOTAL COST - (MIGRATION COST+IF INSTANCE COST)}': ('{plan}_total_cost_formatted', '$0.00'),
+    '{i want to mention total cost}': ('{plan}_total_cost_formatted', '$0.00'),
+    '{migration cost}': ('{plan}_migration_cost_formatted', '$0.00'),
+    '{MIGRATION COST}': ('{plan}_migration_cost_formatted', '$0.00'),
+    '{instance cost}': ('{plan}_instance_cost_formatted', '$0.00'),
+    '{INSTANCE COST}': ('{plan}_instance_cost_formatted', '$0.00'),
+    '{Valid for how m,any Months i want tomention here}': ('config_duration_months', '3'),
+    '{valid for how many months i want to mention here}': ('config_duration_months', '3'),
+    '{VALID FOR HOW MANY MONTHS I WANT TO MENTION HERE}': ('config_duration_months', '3'),
+    'Valid for how m,any Months i want tomention here': ('config_duration_months', '3'),
+}
+
+# Slot standing for the client_company argument itself
+CLIENT_COMPANY_SLOT = ('client', None, '')
+
+
+def _extract_content(content):
+    """The block's template text from inside the builder's HTML wrapper"""
+    actual_content = content
+    for pattern in CONTENT_PATTERNS:
+        matches = pattern.findall(content)
+        if matches:
+            actual_content = max(matches, key=len)
+            break
+
+    if TOOLBAR_MARKER in actual_content:
+        for pattern in INNER_CONTENT_PATTERNS:
+            matches = pattern.findall(actual_content)
+            if matches:
+                actual_content = max(matches, key=len)
+                break
+    return actual_content
+
+
+def tokenize(text):
+    """Split text into static strings and (form, name, raw) slots"""
+    fragments = []
+    position = 0
+    for match in SLOT_PATTERN.finditer(text):
+        if match.start() > position:
+            fragments.append(text[position:match.start()])
+        for form, group in (('{{', 'double'), ('[', 'square'), ('{', 'single'), ('phrase', 'phrase')):
+            name = match.group(group)
+            if name is not None:
+                fragments.append((form, name, match.group(0)))
+                break
+        position = match.end()
+    if position < len(text):
+        fragments.append(text[position:])
+    return fragments
+
+
+def _compile_block(block):
+    block_type = block.get('type', 'text')
+    actual_content = _extract_content(block.get('content', ''))
+    meaningful = (actual_content and len(actual_content.strip()) >= 10
+                  and TOOLBAR_MARKER not in actual_content)
+
+    if block_type == 'image':
+        # Only image blocks that mention the logos produce output
+        if meaningful and ('CloudFuze' in actual_content or 'Microsoft' in actual_content):
+            return ('logo_text',)
+        return None
+
+    if block_type == 'text':
+        if not meaningful:
+            return ('text', ['CloudFuze Purchase Agreement for ', CLIENT_COMPANY_SLOT])
+        return ('text', tokenize(actual_content))
+
+    if block_type == 'table':
+        if not meaningful:
+            return ('table', 'default', None)
+        if '<table' in actual_content or '<tr>' in actual_content:
+            rows = parse_html_table(actual_content)
+            if not rows:
+                return ('table', 'default', None)
+            return ('table', 'html', [[tokenize(cell) for cell in row] for row in rows])
+        return ('table', 'text', tokenize(actual_content))
+
+    # Other block types never produced output
+    return None
+
+
+def compile_template(blocks):
+    """Render plan for a template's blocks"""
+    steps = [step for step in (_compile_block(block) for block in blocks or []) if step is not None]
+    return {'version': PLAN_VERSION, 'steps': steps}
+
+
+def fill(fragments, template_data, client_company, plan_prefix):
+    """Text of a fragment list with every slot resolved"""
+    parts = []
+    for fragment in fragments:
+        if isinstance(fragment, str):
+            parts.append(fragment)
+            continue
+        form, name, raw = fragment
+        if form == 'client' or raw in CLIENT_COMPANY_ALIASES:
+            parts.append(str(client_company))
+        elif raw in COMPANY_NAME_ALIASES:
+            parts.append(str(template_data.get('company_name', 'CloudFuze')))
+        elif form != 'phrase' and name in template_data:
+            parts.append(str(template_data[name]))
+        elif raw in PHRASE_SLOTS:
+            key, default = PHRASE_SLOTS[raw]
+            parts.append(str(template_data.get(key.format(plan=plan_prefix), default)))
+        else:
+            parts.append(raw)
+    return ''.join(parts)
+
+
+class TemplatePlanCache:
+    """LRU of compiled plans keyed by (template id, updated)"""
+
+    def __init__(self, max_entries=TEMPLATE_PLAN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, template_id, updated, blocks):
+        """Plan for this version of the template, compiling it on first use"""
+        key = (template_id, str(updated))
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self._hits += 1
+                return plan
+            self._misses += 1
+        return self.compile(template_id, updated, blocks)
+
+    def compile(self, template_id, updated, blocks):
+        """Compile and cache a template version, e.g. right after it is saved"""
+        plan = compile_template(blocks)
+        key = (template_id, str(updated))
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        print(f"🧩 Compiled render plan for template {template_id} ({len(plan['steps'])} steps)")
+        return plan
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._plans),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+
+# Global instance shared by the request threads of this worker
+template_plans = TemplatePlanCache()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test script for recording client and CEO signatures on generated agreements.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from mongodb_collections.generated_agreement_collection import GeneratedAgreementCollection
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+
+@pytest.fixture
+def agreements():
+    collection = GeneratedAgreementCollection()
+    collection.collection.delete_many({})
+    yield collection
+    collection.collection.delete_many({})
+
+
+def _agreement(agreements, quote_id='q-sign-1', **extra):
+    return str(agreements.collection.insert_one({
+        'quote_id': quote_id, 'generated_at': datetime.now(), 'status': 'generated', **extra
+    }).inserted_id)
+
+
+@pytest.mark.parametrize('first, second', [('client', 'ceo'), ('ceo', 'client')])
+def test_either_party_can_sign_first(agreements, first, second):
+    """The first signature sets <role>_signed, the second completes the agreement"""
+    print(f"🧪 Testing {first} then {second}...")
+    agreement_id = _agreement(agreements)
+    signed = agreements.sign_agreement(agreement_id, first, {'data': f'{first}-sig', 'name': first})
+    assert signed['status'] == f'{first}_signed' and signed.get('completed_at') is None
+    assert signed['signatures'][first]['data'] == f'{first}-sig' and f'{first}_signed_at' in signed
+
+    completed = agreements.sign_agreement(agreement_id, second, {'data': f'{second}-sig'})
+    assert completed['status'] == 'completed' and completed['completed_at'] == completed[f'{second}_signed_at']
+    assert set(completed['signatures']) == {'client', 'ceo'}
+    print(f"✅ {first} then {second} completed")
+
+
+def test_double_signing_is_rejected(agreements):
+    """A role that has signed cannot sign again, before or after completion"""
+    print("🧪 Testing double signing...")
+    agreement_id = _agreement(agreements)
+    assert agreements.sign_agreement(agreement_id, 'client', {'data': 'first'})
+    assert agreements.sign_agreement(agreement_id, 'client', {'data': 'second'}) is None
+    assert agreements.sign_agreement(agreement_id, 'ceo', {'data': 'ceo'})['status'] == 'completed'
+    assert agreements.sign_agreement(agreement_id, 'ceo', {'data': 'again'}) is None
+    stored = agreements.get_agreement_by_id(agreement_id)
+    assert stored['signatures']['client']['data'] == 'first' and stored['signatures']['ceo']['data'] == 'ceo'
+    print("✅ Double signing rejected")
+
+
+def test_signing_by_quote_id_and_empty_signatures(agreements):
+    """Agreements can be signed through their quote_id; an empty signature doesn't count as signed"""
+    print("🧪 Testing lookup and empty signatures...")
+    _agreement(agreements, quote_id='q-sign-2', signatures={'client': {'data': ''}})
+    signed = agreements.sign_agreement('q-sign-2', 'client', {'data': 'client-sig'})
+    assert signed['status'] == 'client_signed'
+    assert agreements.sign_agreement('q-missing', 'client', {'data': 'x'}) is None
+    # Signature fields that look like operators are stored as given
+    signed = agreements.sign_agreement('q-sign-2', 'ceo', {'data': '$status', 'note': {'$literal': 1}})
+    assert signed['signatures']['ceo'] == {'data': '$status', 'note': {'$literal': 1}}
+    print("✅ Signed by quote id")
+
+
+def test_concurrent_signatures_both_count(agreements):
+    """Client and CEO signing at the same moment still end up completed, with both signatures"""
+    print("🧪 Testing concurrent signing...")
+    for attempt in range(20):
+        agreement_id = _agreement(agreements, quote_id=f'q-race-{attempt}')
+        barrier = threading.Barrier(2)
+        results = {}
+
+        def sign(role):
+            barrier.wait()
+            results[role] = agreements.sign_agreement(agreement_id, role, {'data': role})
+
+        threads = [threading.Thread(target=sign, args=(role,)) for role in ('client', 'ceo')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results['client'] and results['ceo']
+        stored = agreements.get_agreement_by_id(agreement_id)
+        assert stored['status'] == 'completed' and set(stored['signatures']) == {'client', 'ceo'}
+    print("✅ Concurrent signatures recorded")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script for the single-query approval dashboard.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from mongodb_collections.approval_workflow_collection import ApprovalWorkflowCollection
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+
+def _workflow(name, workflow_status, manager='pending', ceo='pending', client='pending', **extra):
+    now = datetime.now()
+    return {'document_name': name, 'workflow_status': workflow_status, 'manager_status': manager,
+            'ceo_status': ceo, 'client_status': client, 'created_at': now, 'updated_at': now, **extra}
+
+
+@pytest.fixture
+def workflows():
+    collection = ApprovalWorkflowCollection()
+    collection.collection.delete_many({})
+    now = datetime.now()
+    collection.collection.insert_many([
+        _workflow('awaiting-manager', 'active'),
+        _workflow('awaiting-ceo', 'active', manager='approved'),
+        _workflow('with-client', 'client_review', manager='approved', ceo='approved'),
+        _workflow('done', 'completed', manager='approved', ceo='approved', client='approved',
+                  created_at=now - timedelta(hours=4), completed_at=now),
+        _workflow('denied', 'cancelled', manager='denied'),
+        _workflow('client-rejected', 'client_rejected', manager='approved', ceo='approved', client='rejected'),
+    ])
+    yield collection
+    collection.collection.delete_many({})
+
+
+def test_dashboard_matches_individual_panels(workflows):
+    """Every panel from the single aggregation equals its standalone query"""
+    print("🧪 Testing dashboard panels...")
+    for role in ('manager', 'ceo', 'admin'):
+        dashboard = workflows.get_dashboard(role)
+
+        assert dashboard['stats'] == workflows.get_workflow_stats()
+        expected = {
+            'active': workflows.get_all_active_workflows(),
+            'my_queue': workflows.get_my_approval_queue(role, 'user@company.com'),
+            'history': workflows.get_approval_history(),
+            'denied': workflows.get_denied_workflows(),
+        }
+        for name, docs in expected.items():
+            assert dashboard[name]['count'] == len(docs)
+            assert [d['_id'] for d in dashboard[name]['workflows']] == [d['_id'] for d in docs]
+
+    assert [w['document_name'] for w in workflows.get_dashboard('ceo')['my_queue']['workflows']] == ['awaiting-ceo']
+    print("✅ Dashboard panels match")
+
+
+def test_dashboard_counts_are_independent_of_page_size(workflows):
+    """Counts cover all matches while lists stop at the limit"""
+    print("🧪 Testing dashboard limits...")
+    dashboard = workflows.get_dashboard('manager', limit=1)
+    assert dashboard['active']['count'] == 4
+    assert len(dashboard['active']['workflows']) == 1
+    assert dashboard['history']['count'] == 3
+    assert dashboard['stats'] == {'pending': 2, 'completed_today': 1, 'avg_approval_time': '4.0h'}
+    print("✅ Counts and pages are independent")
+
+
+def test_dashboard_returns_only_displayed_fields(workflows):
+    """Large fields the panels don't show stay out of the result"""
+    print("🧪 Testing dashboard projection...")
+    workflows.collection.update_many({}, {'$set': {'document_content': 'x' * 1000}})
+    dashboard = workflows.get_dashboard('manager')
+    for name in ('active', 'my_queue', 'history', 'denied'):
+        for workflow in dashboard[name]['workflows']:
+            assert 'document_content' not in workflow
+    print("✅ Dashboard projected")
+
+
+def test_legacy_statuses_count_as_active(workflows):
+    """Statuses no transition produces any more are active, as in get_all_active_workflows"""
+    print("🧪 Testing legacy statuses...")
+    workflows.collection.insert_one(_workflow('legacy', 'archived_by_hand'))
+    workflows.collection.insert_one({'document_name': 'no-status', 'created_at': datetime.now()})
+    dashboard = workflows.get_dashboard('manager')
+    active = workflows.get_all_active_workflows()
+    assert dashboard['active']['count'] == len(active) == 6
+    assert [d['_id'] for d in dashboard['active']['workflows']] == [d['_id'] for d in active]
+    print("✅ Legacy statuses active")
+
+
+def test_dashboard_falls_back_when_the_aggregation_fails(workflows, monkeypatch):
+    """An aggregation error gives empty panels, like get_workflow_stats"""
+    print("🧪 Testing dashboard fallback...")
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("aggregation failed")
+
+    monkeypatch.setattr(type(workflows.collection), 'aggregate', fail)
+    dashboard = workflows.get_dashboard('manager')
+    assert dashboard['stats'] == workflows.get_workflow_stats()
+    assert all(dashboard[name] == {'count': 0, 'workflows': []}
+               for name in ('active', 'my_queue', 'history', 'denied'))
+    print("✅ Dashboard fell back")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test script for the hot/cold archive tier.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from mongodb_collections.archive_collection import ArchiveCollection, run_archival
+from mongodb_collections.quote_collection import QuoteCollection
+from mongodb_collections.generated_agreement_collection import GeneratedAgreementCollection
+from mongodb_collections.approval_workflow_collection import ApprovalWorkflowCollection
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+OLD = datetime.now() - timedelta(days=400)
+
+
+def _quote(status, updated_at):
+    return {'client': {'name': 'Ada', 'email': 'ada@example.com'}, 'status': status,
+            'updated_at': updated_at, 'notes': 'x' * 2000}
+
+
+def test_archival_moves_only_old_terminal_records():
+    """Old accepted quotes move to the archive; active or recent ones stay hot"""
+    print("🧪 Testing quote archival...")
+    quotes = QuoteCollection()
+    quotes.collection.delete_many({})
+    quotes.archive.collection.delete_many({})
+    old_accepted = quotes.collection.insert_one(_quote('accepted', OLD)).inserted_id
+    old_draft = quotes.collection.insert_one(_quote('draft', OLD)).inserted_id
+    recent_rejected = quotes.collection.insert_one(_quote('rejected', datetime.now())).inserted_id
+
+    dry_run = run_archival(days=365, dry_run=True, collections=['quotes'])[0]
+    assert dry_run['candidates'] == 1
+    assert quotes.collection.count_documents({}) == 3
+
+    summary = run_archival(days=365, batch_size=1, collections=['quotes'])[0]
+    assert summary['archived'] == 1
+
+    hot_ids = {doc['_id'] for doc in quotes.collection.find({}, {'_id': 1})}
+    assert hot_ids == {old_draft, recent_rejected}
+
+    # Archived entries are compressed, and lookups by id fall through to them
+    entry = quotes.archive.collection.find_one({'_id': old_accepted})
+    assert len(entry['data']) < 2000
+    archived = quotes.get_quote_by_id(str(old_accepted))
+    assert archived['status'] == 'accepted' and archived['notes'] == 'x' * 2000
+
+    # Re-running is idempotent
+    assert run_archival(days=365, collections=['quotes'])[0]['archived'] == 0
+    print("✅ Archival respects age and status")
+
+
+def test_agreement_and_workflow_lookups_fall_through():
+    """Agreements by id or quote_id and workflows by id are found in the archive"""
+    print("🧪 Testing fall-through lookups...")
+    agreements = GeneratedAgreementCollection()
+    agreement_id = agreements.collection.insert_one({
+        'quote_id': 'archived-quote', 'status': 'completed', 'generated_at': OLD,
+        'agreement_data': 'base64-pdf'
+    }).inserted_id
+
+    workflows = ApprovalWorkflowCollection()
+    workflow_id = workflows.collection.insert_one({
+        'document_id': 'doc-archived', 'workflow_status': 'completed', 'updated_at': OLD
+    }).inserted_id
+
+    run_archival(days=365, collections=['storinggenratedaggremntfromquotemangnt', 'approval_workflows'])
+    assert agreements.collection.count_documents({'_id': agreement_id}) == 0
+
+    by_id = agreements.get_agreement_by_id(str(agreement_id), include_content=False)
+    assert by_id['quote_id'] == 'archived-quote' and 'agreement_data' not in by_id
+    assert agreements.get_agreement_by_id('archived-quote')['agreement_data'] == 'base64-pdf'
+    assert workflows.get_workflow_by_id(str(workflow_id))['document_id'] == 'doc-archived'
+    print("✅ Lookups fall through to the archive")
+
+
+def test_record_changed_during_archival_stays_hot():
+    """A record updated between read and delete is kept hot and not archived"""
+    print("🧪 Testing concurrent modification...")
+    archive = ArchiveCollection('quotes')
+    quote_id = archive.source.insert_one(_quote('accepted', OLD)).inserted_id
+    doc = archive.source.find_one({'_id': quote_id})
+
+    # Simulate an update landing after the archival job read the record
+    archive.source.update_one({'_id': quote_id}, {'$set': {'updated_at': OLD + timedelta(seconds=1)}})
+    summary = {'candidates': 0, 'archived': 0, 'kept': 0}
+    archive._archive_batch([doc], summary)
+
+    assert summary == {'candidates': 1, 'archived': 0, 'kept': 1}
+    assert archive.source.count_documents({'_id': quote_id}) == 1
+    assert archive.collection.count_documents({'_id': quote_id}) == 0
+    print("✅ Modified record kept hot")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Test script for the cross-worker cache invalidation bus.
+
+Change-stream tests need a local single-node replica set, e.g.:
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval "rs.initiate()"
+Point REPLICA_SET_URI elsewhere if needed. Tests that need a server are
+skipped when it is not reachable.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import pytest
+import pymongo
+from pymongo.errors import OperationFailure, PyMongoError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpq.cache_invalidation import ProcessCache, CacheInvalidationBus
+
+REPLICA_SET_URI = os.getenv(
+    'REPLICA_SET_URI',
+    'mongodb://localhost:27017/?replicaSet=rs0&directConnection=true'
+)
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def collection():
+    client = pymongo.MongoClient(REPLICA_SET_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        pytest.skip(f"No MongoDB replica set reachable at {REPLICA_SET_URI}")
+    coll = client['cpq_cache_test'][f"templates_{os.getpid()}"]
+    coll.drop()
+    yield coll
+    coll.drop()
+    client.close()
+
+
+def test_cache_evicts_by_id_and_queries():
+    """ProcessCache evicts keyed entries by _id and query entries on any change"""
+    print("🧪 Testing ProcessCache eviction rules...")
+    cache = ProcessCache()
+    cache.enabled = True
+
+    cache.set('templates', 'tpl-1', {'_id': 1, 'name': 'A'})
+    cache.set('templates', 'tpl-2', {'_id': 2, 'name': 'B'})
+    cache.set('templates', 'active', {'_id': 2, 'name': 'B'}, query=True)
+
+    cache.evict('templates', 1)
+    assert cache.get('templates', 'tpl-1') is None
+    assert cache.get('templates', 'tpl-2') is not None
+    # Query entries go on any change in the collection
+    assert cache.get('templates', 'active') is None
+
+    cache.enabled = False
+    assert cache.get('templates', 'tpl-2') is None
+    print("✅ ProcessCache eviction rules hold")
+
+
+def test_reads_racing_an_eviction_are_not_cached():
+    """A document read before an eviction of its collection is not stored afterwards"""
+    print("🧪 Testing cache generations...")
+    cache = ProcessCache()
+    cache.enabled = True
+
+    generation = cache.generation('templates')
+    stale = {'_id': 1, 'name': 'old'}           # read from MongoDB...
+    cache.evict('templates', 1)                 # ...then the change event arrives
+    cache.set('templates', 'tpl-1', stale, generation=generation)
+    assert cache.get('templates', 'tpl-1') is None
+
+    cache.set('templates', 'tpl-1', {'_id': 1, 'name': 'new'}, generation=cache.generation('templates'))
+    assert cache.get('templates', 'tpl-1')['name'] == 'new'
+    print("✅ Racing reads not cached")
+
+
+class _BrokenStream:
+    """Collection whose change stream fails like an expired resume token"""
+
+    name = 'templates'
+
+    def watch(self, **kwargs):
+        raise OperationFailure("resume token expired", code=286)
+
+
+def test_cache_is_bypassed_while_the_stream_is_down():
+    """After a stream error the collection's entries go and nothing is cached until it watches again"""
+    print("🧪 Testing stream outages...")
+    cache = ProcessCache()
+    cache.enabled = True
+    cache.set('templates', 'tpl-1', {'_id': 1, 'name': 'A'})
+    cache.set('quotes', 'q-1', {'_id': 2})
+
+    bus = CacheInvalidationBus(cache, {_BrokenStream(): 'updated_at'}, poll_interval=0.05)
+    bus.start()
+    try:
+        assert _wait_for(lambda: cache.get_stats()['suspended'] == ['templates'])
+        assert cache.get('templates', 'tpl-1') is None
+        cache.set('templates', 'tpl-1', {'_id': 1, 'name': 'B'})
+        assert cache.get('templates', 'tpl-1') is None
+        assert cache.get('quotes', 'q-1') is not None
+    finally:
+        bus.stop()
+
+    generation = cache.generation('templates')
+    cache.resume('templates')
+    assert cache.generation('templates') != generation
+    cache.enabled = True
+    cache.set('templates', 'tpl-1', {'_id': 1, 'name': 'C'})
+    assert cache.get('templates', 'tpl-1')['name'] == 'C'
+    print("✅ Cache bypassed during the outage")
+
+
+def test_change_stream_evicts_other_workers_writes(collection):
+    """A write from another client evicts the cached document via the change stream"""
+    print("🧪 Testing change stream invalidation...")
+    cache = ProcessCache()
+    bus = CacheInvalidationBus(cache, {collection: 'updated_at'}, max_await_ms=100)
+    bus.start()
+    try:
+        assert _wait_for(lambda: cache.enabled), "bus never became ready"
+        assert bus.get_status()[collection.name] == 'change_stream'
+
+        doc_id = collection.insert_one({'name': 'v1', 'updated_at': datetime.now()}).inserted_id
+        cache.set(collection.name, str(doc_id), collection.find_one({'_id': doc_id}))
+        assert cache.get(collection.name, str(doc_id))['name'] == 'v1'
+
+        # Simulates another gunicorn worker updating the template
+        collection.update_one({'_id': doc_id}, {'$set': {'name': 'v2', 'updated_at': datetime.now()}})
+
+        assert _wait_for(lambda: cache.get(collection.name, str(doc_id)) is None)
+        print("✅ Change stream evicted the stale entry")
+    finally:
+        bus.stop()
+
+
+class _PollingBus(CacheInvalidationBus):
+    """Bus that behaves as if the server were a standalone without change streams"""
+
+    def _watch(self, collection):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+
+def test_polling_fallback_evicts_on_watermark(collection):
+    """Without change streams the bus polls updated_at and still evicts"""
+    print("🧪 Testing updated_at polling fallback...")
+    cache = ProcessCache()
+    bus = _PollingBus(cache, {collection: 'updated_at'}, poll_interval=0.1)
+    bus.start()
+    try:
+        assert _wait_for(lambda: cache.enabled), "bus never became ready"
+        assert bus.get_status()[collection.name] == 'polling'
+
+        doc_id = collection.insert_one({'name': 'v1', 'updated_at': datetime.now()}).inserted_id
+        # Let the poller move its watermark past the insert before caching
+        time.sleep(0.3)
+        cache.set(collection.name, str(doc_id), collection.find_one({'_id': doc_id}))
+        time.sleep(0.3)
+        assert cache.get(collection.name, str(doc_id))['name'] == 'v1'
+
+        collection.update_one({'_id': doc_id}, {'$set': {'name': 'v2', 'updated_at': datetime.now()}})
+
+        assert _wait_for(lambda: cache.get(collection.name, str(doc_id)) is None)
+        print("✅ Polling fallback evicted the stale entry")
+    finally:
+        bus.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
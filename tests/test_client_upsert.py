@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Test script for email-keyed client upserts and the email normalization migration.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND, db
+from mongodb_collections import client_collection
+from mongodb_collections.client_collection import ClientCollection, normalize_client_emails
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    db['clients'].drop()
+    db['maintenance_checkpoints'].delete_many({'_id': client_collection.MIGRATION_CHECKPOINT_ID})
+    monkeypatch.setattr(client_collection, '_indexes_ensured', False)
+    monkeypatch.setattr(client_collection, '_emails_normalized', False)
+    yield ClientCollection()
+    db['clients'].drop()
+    db['maintenance_checkpoints'].delete_many({'_id': client_collection.MIGRATION_CHECKPOINT_ID})
+
+
+def _client(email, **extra):
+    return {'clientName': 'Ada Lovelace', 'companyName': 'Acme', 'email': email, 'phoneNumber': '555-0100',
+            **extra}
+
+
+def test_upsert_creates_then_updates(clients):
+    """The same address, however it is typed, is one client"""
+    print("🧪 Testing single upsert...")
+    created, was_created = clients.upsert_client_by_email(_client(' Ada@Example.com '))
+    assert was_created and created['email'] == 'ada@example.com'
+
+    updated, was_created = clients.upsert_client_by_email(_client('ADA@example.com', companyName='Initech'))
+    assert not was_created and updated['_id'] == created['_id']
+    assert updated['companyName'] == 'Initech' and updated['created_at'] == created['created_at']
+    assert clients.collection.count_documents({}) == 1
+    assert clients.get_client_by_email('ada@EXAMPLE.com')['_id'] == created['_id']
+    print("✅ Upserted by normalized email")
+
+
+def test_duplicate_create_is_rejected(clients):
+    """create_client hits the unique index; POST /api/clients answers that with a 409"""
+    print("🧪 Testing duplicate creation...")
+    clients.create_client(_client('grace@example.com'))
+    with pytest.raises(DuplicateKeyError):
+        clients.create_client(_client('Grace@Example.com'))
+    print("✅ Duplicate rejected")
+
+
+def test_failed_index_build_is_retried(clients, monkeypatch):
+    """A failed unique index build is attempted again by the next instance"""
+    print("🧪 Testing index retry...")
+    monkeypatch.setattr(client_collection, '_indexes_ensured', False)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("E11000 duplicate key error")
+
+    monkeypatch.setattr(type(clients.collection), 'create_index', fail)
+    ClientCollection()
+    assert not client_collection._indexes_ensured
+    monkeypatch.undo()
+    monkeypatch.setattr(client_collection, '_indexes_ensured', False)
+    ClientCollection()
+    assert client_collection._indexes_ensured
+    print("✅ Index build retried")
+
+
+def test_batch_upsert(clients):
+    """One bulk write: repeats collapse, invalid entries are reported, existing clients are updated"""
+    print("🧪 Testing batch upsert...")
+    existing, _ = clients.upsert_client_by_email(_client('ada@example.com'))
+    result = clients.upsert_clients_by_email([
+        _client('Ada@example.com', companyName='Initech'),
+        _client('grace@example.com'),
+        _client('GRACE@example.com', clientName='Grace Hopper'),
+        _client('broken@example.com', phoneNumber=None),
+    ])
+    assert (result['upserted'], result['matched']) == (1, 1)
+    assert result['errors'] == [{'email': 'broken@example.com', 'error': 'Invalid client data'}]
+    assert set(result['clients']) == {'ada@example.com', 'grace@example.com'}
+    assert result['clients']['ada@example.com']['_id'] == existing['_id']
+    assert result['clients']['ada@example.com']['companyName'] == 'Initech'
+    assert result['clients']['grace@example.com']['clientName'] == 'Grace Hopper'
+    assert clients.upsert_clients_by_email([])['clients'] == {}
+    print("✅ Batch upserted")
+
+
+def test_legacy_emails_are_normalized_and_merged(clients):
+    """Before the migration lookups ignore case; afterwards duplicates are merged into the oldest"""
+    print("🧪 Testing the email migration...")
+    now = datetime.now()
+    oldest = clients.collection.insert_one({
+        'clientName': 'Ada', 'email': 'Ada@Example.com', 'phoneNumber': '555-0100', 'companyName': '',
+        'created_at': now - timedelta(days=30), 'updated_at': now - timedelta(days=30),
+    }).inserted_id
+    clients.collection.insert_one({
+        'clientName': 'Ada Lovelace', 'email': 'ada@example.com ', 'companyName': 'Acme', 'phoneNumber': None,
+        'created_at': now - timedelta(days=2), 'updated_at': now - timedelta(days=2),
+    })
+    clients.collection.insert_one(_client('Grace@example.com', created_at=now))
+
+    # Not migrated yet: legacy spellings are still found and updated in place
+    assert clients.get_client_by_email('ada@example.com')['_id'] == oldest
+    grace, created = clients.upsert_client_by_email(_client('grace@example.com', companyName='Navy'))
+    assert not created and grace['email'] == 'grace@example.com'
+
+    assert normalize_client_emails(dry_run=True) == {'clients': 3, 'normalized': 1, 'merged': 1}
+    assert clients.collection.count_documents({}) == 3
+    normalize_client_emails()
+
+    ada = clients.collection.find_one({'_id': oldest})
+    assert (ada['email'], ada['clientName'], ada['companyName'], ada['phoneNumber']) == \
+        ('ada@example.com', 'Ada Lovelace', 'Acme', '555-0100')
+    assert clients.collection.count_documents({}) == 2
+    assert client_collection.email_filter('Ada@Example.com') == {'email': 'ada@example.com'}
+    assert client_collection._indexes_ensured
+    with pytest.raises(DuplicateKeyError):
+        clients.create_client(_client('ADA@example.com'))
+    print("✅ Emails normalized and duplicates merged")
+
+
+def _upsert_scenario(collection, upsert, lookup):
+    """Upserts over a legacy mixed-case record, with timestamps and new ids left out"""
+    legacy = collection.insert_one({**_client('Ada@Example.com', companyName=''),
+                                    'created_at': datetime(2024, 1, 1)}).inserted_id
+    results = []
+    for data in (_client(' ada@EXAMPLE.com '), _client('grace@example.com'),
+                 _client('GRACE@example.com', companyName='Navy')):
+        client, created = upsert(data)
+        results.append((created, client['_id'] == legacy,
+                        {key: value for key, value in client.items()
+                         if key not in ('_id', 'created_at', 'updated_at')}))
+    with pytest.raises(ValueError):
+        upsert(_client('broken@example.com', phoneNumber=None))
+    results.append(lookup('Grace@Example.com')['companyName'])
+    results.append(collection.count_documents({}))
+    return results
+
+
+def test_upsert_over_legacy_record(clients):
+    """A mixed-case legacy record is matched and updated in place"""
+    print("🧪 Testing upserts over a legacy record...")
+    results = _upsert_scenario(clients.collection, clients.upsert_client_by_email,
+                               clients.get_client_by_email)
+    assert [created for created, _, _ in results[:3]] == [False, True, False] and results[0][1]
+    assert results[0][2]['email'] == 'ada@example.com'
+    assert results[3:] == ['Navy', 2]
+    print("✅ Legacy record upserted")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
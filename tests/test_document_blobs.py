@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test script for content-hash deduplication of generated documents.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import base64
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from reportlab import rl_config
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from mongodb_collections import document_blob_collection
+from mongodb_collections.archive_collection import pack
+from mongodb_collections.document_blob_collection import content_hash, deduplicate_documents
+from mongodb_collections.generated_pdf_collection import GeneratedPDFCollection
+from mongodb_collections.generated_agreement_collection import GeneratedAgreementCollection
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+QUOTE_PDF = b'%PDF-1.4 quote' + b'0' * 5000
+OTHER_PDF = b'%PDF-1.4 other' + b'1' * 5000
+
+
+@pytest.fixture
+def documents_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_blob_collection, 'DOCUMENTS_DIR', str(tmp_path))
+    pdfs = GeneratedPDFCollection()
+    pdfs.collection.delete_many({})
+    pdfs.blobs.collection.delete_many({})
+    pdfs.archive.collection.delete_many({})
+    GeneratedAgreementCollection().collection.delete_many({})
+    return tmp_path
+
+
+def _metadata(filename):
+    return {'quote_id': 'q-1', 'filename': filename, 'file_path': f'documents/{filename}',
+            'client_name': 'Ada', 'company_name': 'Acme'}
+
+
+def test_identical_pdfs_share_one_blob(documents_dir):
+    """Regenerating the same PDF adds a reference, not a copy"""
+    print("🧪 Testing blob sharing...")
+    pdfs = GeneratedPDFCollection()
+    first = pdfs.store_pdf_metadata(_metadata('quote_Ada_1.pdf'), QUOTE_PDF).inserted_id
+    second = pdfs.store_pdf_metadata(_metadata('quote_Ada_2.pdf'), QUOTE_PDF).inserted_id
+
+    digest = content_hash(QUOTE_PDF)
+    records = list(pdfs.collection.find({}))
+    assert {r['content_hash'] for r in records} == {digest}
+    assert all('pdf_data' not in r for r in records)
+    assert os.listdir(documents_dir) == [f'{digest}.pdf']
+    assert pdfs.blobs.collection.find_one({'_id': digest})['ref_count'] == 2
+    assert pdfs.get_pdf_content(records[0]) == QUOTE_PDF
+
+    # The blob lives until its last reference is deleted
+    pdfs.delete_pdf(str(first))
+    assert pdfs.blobs.collection.find_one({'_id': digest})['ref_count'] == 1
+    pdfs.delete_pdf(str(second))
+    assert pdfs.blobs.collection.count_documents({}) == 0
+    assert os.listdir(documents_dir) == []
+    print("✅ Identical PDFs stored once")
+
+
+def test_migration_deduplicates_existing_records(documents_dir):
+    """Embedded base64 and loose files move into shared blobs"""
+    print("🧪 Testing deduplication migration...")
+    pdfs = GeneratedPDFCollection()
+    agreements = GeneratedAgreementCollection()
+    encoded = base64.b64encode(QUOTE_PDF).decode()
+    for i in range(3):
+        pdfs.collection.insert_one({**_metadata(f'quote_{i}.pdf'), 'pdf_data': encoded})
+    pdfs.collection.insert_one({**_metadata('quote_other.pdf'), 'pdf_data': base64.b64encode(OTHER_PDF).decode()})
+
+    # An agreement known only by its file, with structured agreement_data that must survive
+    (documents_dir / 'agreement_Ada.pdf').write_bytes(QUOTE_PDF)
+    agreements.collection.insert_one({**_metadata('agreement_Ada.pdf'), 'agreement_data': {'total': 100}})
+
+    dry_run = deduplicate_documents(dry_run=True)
+    assert [s['migrated'] for s in dry_run] == [4, 1]
+    assert pdfs.blobs.collection.count_documents({}) == 0
+
+    summaries = deduplicate_documents()
+    assert [(s['migrated'], s['duplicates']) for s in summaries] == [(4, 2), (1, 1)]
+    assert pdfs.blobs.collection.count_documents({}) == 2
+    assert pdfs.blobs.collection.find_one({'_id': content_hash(QUOTE_PDF)})['ref_count'] == 4
+    assert pdfs.collection.count_documents({'pdf_data': {'$exists': True}}) == 0
+    assert sorted(os.listdir(documents_dir)) == sorted(f'{content_hash(c)}.pdf' for c in (QUOTE_PDF, OTHER_PDF))
+
+    agreement = agreements.collection.find_one({})
+    assert agreement['agreement_data'] == {'total': 100}
+    assert agreements.get_agreement_content(agreement) == QUOTE_PDF
+
+    # Re-running finds nothing left to do
+    assert [s['records'] for s in deduplicate_documents()] == [0, 0]
+    print("✅ Existing records deduplicated")
+
+
+QUOTE_DATA = {'client': {'name': 'Ada', 'company': 'Acme'}, 'configuration': {'users': 10}}
+
+
+def test_regeneration_keeps_one_reference(documents_dir, monkeypatch):
+    """Regenerating the same quote again and again leaves the blob with a single reference"""
+    print("🧪 Testing regeneration references...")
+    # Without dates and random ids in the output, every regeneration gives identical bytes
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    pdfs = GeneratedPDFCollection()
+    pdf_id = str(pdfs.store_pdf_metadata(_metadata('quote_Ada.pdf'), QUOTE_PDF).inserted_id)
+
+    for _ in range(3):
+        path, message = pdfs.regenerate_pdf_from_quote(pdf_id, QUOTE_DATA)
+        assert path, message
+    record = pdfs.collection.find_one({})
+    assert pdfs.blobs.collection.count_documents({}) == 1
+    assert pdfs.blobs.collection.find_one({'_id': record['content_hash']})['ref_count'] == 1
+    assert os.listdir(documents_dir) == [os.path.basename(path)]
+    print("✅ One reference after regenerating")
+
+
+def test_regenerating_an_archived_record_keeps_its_blob(documents_dir):
+    """An archived record can't be updated, so neither its blob nor the new one gains or loses references"""
+    print("🧪 Testing regeneration of archived records...")
+    pdfs = GeneratedPDFCollection()
+    pdf_id = pdfs.store_pdf_metadata(_metadata('quote_Ada.pdf'), QUOTE_PDF).inserted_id
+    record = pdfs.collection.find_one({'_id': pdf_id})
+    pdfs.archive.collection.insert_one(pack(record, [], datetime.now()))
+    pdfs.collection.delete_one({'_id': pdf_id})
+
+    path, message = pdfs.regenerate_pdf_from_quote(str(pdf_id), QUOTE_DATA)
+    assert path is None and 'archived' in message
+    assert [(b['_id'], b['ref_count']) for b in pdfs.blobs.collection.find({})] == [(content_hash(QUOTE_PDF), 1)]
+    assert os.listdir(documents_dir) == [f'{content_hash(QUOTE_PDF)}.pdf']
+    print("✅ Archived record left alone")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Test script for the generated document retention and orphan cleanup job.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND, db
+from mongodb_collections import document_blob_collection, document_cleanup
+from mongodb_collections.archive_collection import ArchiveCollection
+from mongodb_collections.document_cleanup import DocumentCleanupJob
+from mongodb_collections.generated_pdf_collection import GeneratedPDFCollection
+from mongodb_collections.generated_agreement_collection import GeneratedAgreementCollection
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def documents_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_blob_collection, 'DOCUMENTS_DIR', str(tmp_path))
+    monkeypatch.setattr(document_cleanup, 'CLEANUP_GRACE_HOURS', 1)
+    for name in ('storinggenratedpdfinqotemangamnet', 'storinggenratedaggremntfromquotemangnt',
+                 'storinggenratedpdfinqotemangamnet_archive', 'generated_document_blobs',
+                 'signature_certificates', 'maintenance_checkpoints', 'document_cleanup_files'):
+        db[name].delete_many({})
+    return tmp_path
+
+
+def _old_file(directory, name, content=b'%PDF-1.4'):
+    path = directory / name
+    path.write_bytes(content)
+    old = time.time() - 2 * DAY
+    os.utime(path, (old, old))
+    return path
+
+
+def _metadata(filename, **extra):
+    return {'quote_id': 'q-1', 'filename': filename, 'file_path': f'documents/{filename}',
+            'client_name': 'Ada', 'company_name': 'Acme', **extra}
+
+
+def test_orphaned_files_are_removed_after_a_dry_run_report(documents_dir):
+    """Only old files nothing refers to are deleted, and a dry run deletes nothing"""
+    print("🧪 Testing orphaned file cleanup...")
+    pdfs = GeneratedPDFCollection()
+    pdfs.store_pdf_metadata(_metadata('quote.pdf'), b'%PDF-1.4 blob-backed')
+    blob_file = next(documents_dir.iterdir())
+    os.utime(blob_file, (time.time() - 2 * DAY,) * 2)
+
+    certificate = _old_file(documents_dir, 'signature_certificate_REF1.pdf')
+    db['signature_certificates'].insert_one({'file_path': str(certificate.resolve())})
+    legacy = _old_file(documents_dir, 'agreement_Ada_20240101.pdf')
+    GeneratedAgreementCollection().collection.insert_one(
+        _metadata('agreement_Ada_20240101.pdf', generated_at=datetime.now()))
+    _old_file(documents_dir, 'quote_orphan.pdf')
+    (documents_dir / 'quote_just_written.pdf').write_bytes(b'%PDF-1.4')
+
+    job = DocumentCleanupJob()
+    report = job.run(dry_run=True)
+    assert report['orphan_files'] == ['quote_orphan.pdf']
+    assert (documents_dir / 'quote_orphan.pdf').exists()
+    assert job.get_checkpoint() == {}
+
+    report = job.run()
+    assert report['orphan_files'] == ['quote_orphan.pdf']
+    assert sorted(p.name for p in documents_dir.iterdir()) == sorted(
+        [blob_file.name, certificate.name, legacy.name, 'quote_just_written.pdf'])
+    print("✅ Only orphaned files removed")
+
+
+def test_runs_resume_from_the_checkpoint(documents_dir):
+    """Each run handles one batch and picks up where the last one stopped"""
+    print("🧪 Testing incremental runs...")
+    for i in range(5):
+        _old_file(documents_dir, f'orphan_{i}.pdf')
+
+    job = DocumentCleanupJob()
+    assert job.run(batch_size=2)['orphan_files'] == ['orphan_0.pdf', 'orphan_1.pdf']
+    assert job.get_checkpoint()['files_after'] == 'orphan_1.pdf'
+    assert job.run(batch_size=2)['orphan_files'] == ['orphan_2.pdf', 'orphan_3.pdf']
+    assert job.run(batch_size=2)['orphan_files'] == ['orphan_4.pdf']
+
+    # The end of the directory wraps around to the start
+    assert job.get_checkpoint()['files_after'] is None
+    assert list(documents_dir.iterdir()) == []
+    print("✅ Runs resume from the checkpoint")
+
+
+def test_directory_is_listed_once_per_pass(documents_dir, monkeypatch):
+    """Only the first run of a pass lists documents/; the others read their batch from the queue"""
+    print("🧪 Testing the file queue...")
+    for i in range(5):
+        _old_file(documents_dir, f'orphan_{i}.pdf')
+    listings = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        listings.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(document_cleanup.os, 'scandir', counting_scandir)
+    job = DocumentCleanupJob()
+    job.run(batch_size=2)
+    # Files written during the pass wait for the next one
+    _old_file(documents_dir, 'orphan_late.pdf')
+    assert job.run(batch_size=2)['orphan_files'] == ['orphan_2.pdf', 'orphan_3.pdf']
+    assert job.run(batch_size=2)['orphan_files'] == ['orphan_4.pdf']
+    assert len(listings) == 1 and db['document_cleanup_files'].count_documents({}) == 0
+
+    assert job.run(batch_size=2)['orphan_files'] == ['orphan_late.pdf']
+    assert len(listings) == 2
+    print("✅ Directory listed once per pass")
+
+
+def test_dangling_and_expired_records(documents_dir, monkeypatch):
+    """Records without content and records past retention go; signed agreements stay"""
+    print("🧪 Testing dangling and expired records...")
+    monkeypatch.setattr(document_cleanup, 'DOCUMENT_RETENTION_DAYS', 365)
+    pdfs = GeneratedPDFCollection()
+    agreements = GeneratedAgreementCollection()
+    last_week = datetime.now() - timedelta(days=7)
+
+    dangling = pdfs.collection.insert_one(_metadata('missing.pdf', generated_at=last_week)).inserted_id
+    embedded = pdfs.collection.insert_one(
+        _metadata('embedded.pdf', generated_at=last_week, pdf_data='JVBERi0xLjQ=')).inserted_id
+    signed = agreements.collection.insert_one(
+        _metadata('signed.pdf', generated_at=last_week, status='completed')).inserted_id
+
+    expired = pdfs.store_pdf_metadata(_metadata('old.pdf'), b'%PDF-1.4 old').inserted_id
+    pdfs.collection.update_one({'_id': expired}, {'$set': {'generated_at': datetime.now() - timedelta(days=400)}})
+    archived = pdfs.store_pdf_metadata(_metadata('archived.pdf'), b'%PDF-1.4 archived').inserted_id
+    pdfs.collection.update_one({'_id': archived}, {'$set': {'generated_at': datetime.now() - timedelta(days=500)}})
+    ArchiveCollection(pdfs.collection.name).archive(days=450)
+
+    db['maintenance_checkpoints'].insert_one({'_id': document_blob_collection.MIGRATION_CHECKPOINT_ID})
+    report = DocumentCleanupJob().run()
+    assert report['dangling'] == [{'collection': pdfs.collection.name, '_id': str(dangling)}]
+    assert {item['_id'] for item in report['expired']} == {str(expired), str(archived)}
+
+    assert {doc['_id'] for doc in pdfs.collection.find({})} == {embedded}
+    assert pdfs.archive.collection.count_documents({}) == 0
+    assert agreements.collection.count_documents({'_id': signed}) == 1
+    # Expired records released their blobs
+    assert pdfs.blobs.collection.count_documents({}) == 0
+    print("✅ Dangling and expired records removed")
+
+
+def test_records_with_text_or_before_migration_are_kept(documents_dir):
+    """Stored agreement text counts as content; legacy files aren't judged before the migration"""
+    print("🧪 Testing records kept without a file...")
+    pdfs = GeneratedPDFCollection()
+    agreements = GeneratedAgreementCollection()
+    last_week = datetime.now() - timedelta(days=7)
+
+    with_text = agreements.collection.insert_one(
+        _metadata('text.docx', generated_at=last_week, content='<p>Agreement for Acme</p>')).inserted_id
+    empty_text = agreements.collection.insert_one(
+        _metadata('empty.docx', generated_at=last_week, agreement_content='')).inserted_id
+    legacy = pdfs.collection.insert_one(_metadata('legacy.pdf', generated_at=last_week)).inserted_id
+
+    assert DocumentCleanupJob().run()['dangling'] == []
+    assert pdfs.collection.count_documents({'_id': legacy}) == 1
+
+    document_blob_collection.deduplicate_documents(dry_run=True)
+    assert not document_blob_collection.blob_migration_completed()
+    document_blob_collection.deduplicate_documents()
+    assert document_blob_collection.blob_migration_completed()
+    db['maintenance_checkpoints'].delete_many({'_id': document_cleanup.CHECKPOINT_ID})
+
+    report = DocumentCleanupJob().run()
+    assert {item['_id'] for item in report['dangling']} == {str(legacy), str(empty_text)}
+    assert agreements.collection.count_documents({'_id': with_text}) == 1
+    print("✅ Text-backed and unmigrated records kept")
+
+
+def test_only_one_worker_runs_at_a_time(documents_dir):
+    """A second run while the lease is held does nothing"""
+    print("🧪 Testing the cleanup lease...")
+    job = DocumentCleanupJob()
+    assert job._acquire_lease(datetime.now())
+    assert job.run() is None
+    assert job.run(dry_run=True) is not None
+    print("✅ Lease respected")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
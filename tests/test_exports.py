@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming NDJSON/CSV dataset exports.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from bson import Binary, Decimal128, ObjectId, Timestamp
+from flask import Flask
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND, db
+from exports import _chunked, export_bp
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+
+@pytest.fixture
+def client():
+    db['quotes'].delete_many({})
+    app = Flask(__name__)
+    app.register_blueprint(export_bp)
+    yield app.test_client()
+    db['quotes'].delete_many({})
+
+
+def _quote(i, status='draft', **extra):
+    return {
+        '_id': ObjectId(), 'status': status, 'created_at': datetime(2025, 1, 1 + i, 9, 30),
+        'client': {'name': f'Client {i}', 'email': f'client{i}@example.com'},
+        'configuration': {'users': 10 * (i + 1), 'instanceType': 'small'},
+        'internal_notes': 'not exported', **extra,
+    }
+
+
+def test_ndjson_export_filters_and_projects(client):
+    """One JSON object per line, filtered by date and status, with only the exported columns"""
+    print("🧪 Testing NDJSON export...")
+    db['quotes'].insert_many([_quote(0), _quote(1, 'sent'), _quote(2, 'accepted'), _quote(3, 'sent')])
+
+    response = client.get('/api/export/quotes?from=2025-01-02&to=2025-01-03&status=sent,accepted')
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    assert 'attachment; filename=quotes_' in response.headers['Content-Disposition']
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['client']['name'] for row in rows] == ['Client 1', 'Client 2']
+    assert rows[0]['created_at'] == '2025-01-02T09:30:00' and 'internal_notes' not in rows[0]
+
+    assert len(client.get('/api/export/quotes?limit=3').data.decode().splitlines()) == 3
+    assert client.get('/api/export/unknown').status_code == 404
+    assert client.get('/api/export/quotes?format=xml').status_code == 400
+    assert client.get('/api/export/quotes?from=yesterday').status_code == 400
+    assert client.get('/api/export/clients?status=active').status_code == 400
+    print("✅ NDJSON exported")
+
+
+def test_csv_export_flattens_columns(client):
+    """A header of dotted column names, then one row per document"""
+    print("🧪 Testing CSV export...")
+    db['quotes'].insert_many([_quote(0), _quote(1, 'sent')])
+
+    response = client.get('/api/export/quotes?format=csv')
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+    assert len(rows) == 2
+    assert rows[0]['client.name'] == 'Client 0' and rows[0]['configuration.users'] == '10'
+    assert rows[1]['status'] == 'sent' and rows[1]['quote.basic.totalCost'] == ''
+    print("✅ CSV exported")
+
+
+def test_unusual_bson_types_do_not_abort_the_stream(client):
+    """Decimals, binaries and types without a JSON form are written instead of failing mid-stream"""
+    print("🧪 Testing unusual BSON values...")
+    db['quotes'].insert_many([
+        _quote(0),
+        _quote(1, status=Timestamp(1700000000, 1), quote={'basic': {'totalCost': Decimal128(Decimal('1999.99'))}},
+               configuration={'users': 5, 'dataSize': Binary(b'\x00\x01')}),
+        _quote(2),
+    ])
+
+    rows = [json.loads(line) for line in client.get('/api/export/quotes').data.decode().splitlines()]
+    assert len(rows) == 3
+    assert rows[1]['quote']['basic']['totalCost'] == '1999.99'
+    assert rows[1]['configuration']['dataSize'] == 'AAE='
+    assert rows[1]['status'] == str(Timestamp(1700000000, 1))
+
+    csv_rows = list(csv.DictReader(io.StringIO(client.get('/api/export/quotes?format=csv').data.decode())))
+    assert len(csv_rows) == 3
+    assert csv_rows[1]['quote.basic.totalCost'] == '1999.99'
+    assert csv_rows[1]['configuration.dataSize'] == 'AAE='
+    print("✅ Unusual values exported")
+
+
+def test_lines_are_grouped_into_chunks():
+    """Small lines are sent in chunks of about the configured size"""
+    print("🧪 Testing chunking...")
+    chunks = list(_chunked((f'{i:03d}\n' for i in range(10)), chunk_size=10))
+    assert chunks == ['000\n001\n002\n', '003\n004\n005\n', '006\n007\n008\n', '009\n']
+    print("✅ Lines chunked")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test script for persisted document-generation jobs.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from mongodb_collections import document_blob_collection, generation_job_collection
+from mongodb_collections.document_blob_collection import track_generated_documents
+from mongodb_collections.generated_pdf_collection import GeneratedPDFCollection
+from mongodb_collections.generation_job_collection import (
+    GenerationJobCollection, GenerationJobWorker, format_job
+)
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_blob_collection, 'DOCUMENTS_DIR', str(tmp_path))
+    collection = GenerationJobCollection()
+    collection.collection.delete_many({})
+    return collection
+
+
+def _generate_pdf(job, report_progress):
+    """Stands in for app.py's handler: stores a PDF and reports progress"""
+    report_progress(10, 'generating')
+    assert job['payload'] == {'quote_id': 'q-1'}
+    with track_generated_documents() as documents:
+        GeneratedPDFCollection().store_pdf_metadata(
+            {'quote_id': 'q-1', 'filename': 'quote.pdf', 'file_path': 'documents/quote.pdf',
+             'client_name': 'Ada', 'company_name': 'Acme'}, b'%PDF-1.4 job')
+    return documents, {'status_code': 200}
+
+
+def test_job_runs_to_completion(jobs):
+    """A queued job is claimed, run and reports the document it produced"""
+    print("🧪 Testing job lifecycle...")
+    job_id = jobs.create_job('pdf_by_lookup', {'quote_id': 'q-1'})
+    assert format_job(jobs.get_job(job_id))['status'] == 'queued'
+
+    worker = GenerationJobWorker(_generate_pdf, jobs)
+    assert worker.run_once()
+    assert not worker.run_once()
+
+    status = format_job(jobs.get_job(job_id))
+    assert status['status'] == 'completed' and status['progress'] == 100
+    assert status['attempts'] == 1
+    pdf = GeneratedPDFCollection().get_pdf_by_id(status['document_id'])
+    assert pdf['quote_id'] == 'q-1'
+    assert status['result'] == {'status_code': 200}
+    print("✅ Job completed with its document id")
+
+
+def test_failed_job_records_the_error(jobs):
+    """An exception in the handler fails the job with its message"""
+    print("🧪 Testing job failure...")
+    job_id = jobs.create_job('agreement_pdf', {})
+
+    def broken(job, report_progress):
+        raise RuntimeError('Quote not found')
+
+    GenerationJobWorker(broken, jobs).run_once()
+    status = format_job(jobs.get_job(job_id))
+    assert status['status'] == 'failed'
+    assert status['error'] == 'Quote not found'
+    assert status['document_id'] is None
+    print("✅ Failure recorded")
+
+
+def test_jobs_of_a_dead_worker_are_picked_up_again(jobs, monkeypatch):
+    """A running job whose lease expired is reclaimed, up to the attempt limit"""
+    print("🧪 Testing lease expiry...")
+    monkeypatch.setattr(generation_job_collection, 'JOB_MAX_ATTEMPTS', 2)
+    job_id = jobs.create_job('pdf_by_lookup', {'quote_id': 'q-1'})
+    claimed = jobs.claim_next('crashed-worker')
+    assert jobs.claim_next('other-worker') is None
+
+    # The crashed worker never finishes; its lease runs out
+    jobs.collection.update_one({'_id': claimed['_id']},
+                               {'$set': {'lease_expires_at': datetime.now() - timedelta(seconds=1)}})
+    assert GenerationJobWorker(_generate_pdf, jobs).run_once()
+    assert format_job(jobs.get_job(job_id))['status'] == 'completed'
+    assert jobs.get_job(job_id)['attempts'] == 2
+
+    # A job that keeps killing its worker is given up on
+    poison = jobs.create_job('pdf_by_lookup', {})
+    jobs.collection.update_one({'_id': jobs.get_job(poison)['_id']},
+                               {'$set': {'status': 'running', 'attempts': 2,
+                                         'lease_expires_at': datetime.now() - timedelta(seconds=1)}})
+    GenerationJobWorker(_generate_pdf, jobs).run_once()
+    assert format_job(jobs.get_job(poison))['error'] == 'Gave up after 2 attempts'
+    print("✅ Expired leases reclaimed")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
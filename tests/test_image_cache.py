@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test script and benchmark for the decoded template image cache.
+
+Images are generated in memory with Pillow.
+"""
+
+import builtins
+import os
+import sys
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image as PILImage
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import Image, SimpleDocTemplate
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from templates.image_cache import CachedImage, ImageHandleCache
+from templates.pdf_renderer import render_template_plan_pdf
+from templates.render_plan import compile_template
+
+
+def _image(size, mode='RGBA', fmt='PNG', color=(30, 90, 200, 255)):
+    buffer = BytesIO()
+    PILImage.new(mode, size, color[:len(mode)]).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+LOGO = _image((1200, 400))
+PARTNER = _image((900, 300), mode='RGB', fmt='JPEG')
+
+
+def test_handles_cached_by_content():
+    """Identical bytes share one decoded handle with its size precomputed"""
+    print("🧪 Testing image handles...")
+    cache = ImageHandleCache()
+    handle = cache.get(LOGO)
+    assert (handle.width, handle.height) == (1200, 400)
+    assert cache.get(bytes(LOGO)) is handle
+    assert cache.get(PARTNER).width == 900
+    stats = cache.get_stats()
+    assert stats['entries'] == 2 and stats['hits'] == 1 and stats['misses'] == 2
+    print("✅ Handles cached")
+
+
+def test_lru_eviction_by_decoded_size():
+    """The least recently used handle goes once decoded pixels pass the budget"""
+    print("🧪 Testing eviction...")
+    small = [_image((100, 100), color=(i, 0, 0, 255)) for i in range(3)]
+    cache = ImageHandleCache(max_bytes=2 * (100 * 100 * 4 + 500))
+    first = cache.get(small[0])
+    cache.get(small[1])
+    cache.get(small[0])
+    cache.get(small[2])
+    assert cache.get_stats()['evictions'] == 1
+    assert cache.get(small[0]) is first  # still cached; small[1] was evicted
+    assert cache.get_stats()['misses'] == 3
+    print("✅ Least recently used handle evicted")
+
+
+def test_render_writes_no_files(monkeypatch):
+    """Logos are drawn from memory: nothing is opened for writing"""
+    print("🧪 Testing file-free rendering...")
+    real_open = builtins.open
+
+    def guarded_open(file, mode='r', *args, **kwargs):
+        assert not any(flag in mode for flag in 'wax+'), f"render wrote to {file}"
+        return real_open(file, mode, *args, **kwargs)
+
+    plan = compile_template([{'type': 'text', 'content': '<p>Agreement for [Client.Company] and partners.</p>'}])
+    monkeypatch.setattr(builtins, 'open', guarded_open)
+    for logos in ([LOGO], [LOGO, PARTNER]):
+        assert render_template_plan_pdf(plan, logos, {}, 'Acme').startswith(b'%PDF')
+    print("✅ No files written")
+
+
+def test_jpeg_embedded_as_is_on_every_render():
+    """Each render embeds the JPEG bytes unchanged, however many share the handle"""
+    print("🧪 Testing JPEG handles...")
+    handle = ImageHandleCache().get(PARTNER)
+    assert handle.size == len(PARTNER)
+    for _ in range(2):
+        buffer = BytesIO()
+        SimpleDocTemplate(buffer, pagesize=letter).build([CachedImage(handle, 300, 100)])
+        assert b'/DCTDecode' in buffer.getvalue()
+    print("✅ JPEG embedded as-is")
+
+
+def test_benchmark_cached_handles():
+    """Drawing a cached handle beats decoding the logo on every render"""
+    print("🧪 Benchmarking logo rendering...")
+    cache = ImageHandleCache()
+    cache.get(LOGO)
+
+    def render(flowable):
+        SimpleDocTemplate(BytesIO(), pagesize=letter).build([flowable()])
+
+    def timed(flowable, iterations=10):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            render(flowable)
+        return (time.perf_counter() - start) / iterations
+
+    decoding = timed(lambda: Image(BytesIO(LOGO), width=300, height=100))
+    cached = timed(lambda: CachedImage(cache.get(LOGO), 300, 100))
+    print(f"✅ 1200x400 logo: decode per render {decoding * 1000:.2f} ms, "
+          f"cached handle {cached * 1000:.2f} ms ({decoding / cached:.1f}x faster)")
+    assert cached < decoding
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
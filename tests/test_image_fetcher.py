@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Test script and benchmark for cached remote image fetching.
+
+Serves images from a local HTTP server, so no network access is needed.
+"""
+
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+import requests
+from docx import Document
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpq.image_fetcher import ImageFetcher, decode_image
+from templates.docx_generator import generate_agreement_docx
+
+DELAY_SECONDS = 0.1
+
+
+def _image(fmt, size=(120, 40)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (20, 120, 200)).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+IMAGES = {'/logo.png': _image('PNG'), '/partner.webp': _image('WEBP', (60, 30))}
+
+
+class _ImageServer(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get('If-None-Match')))
+        time.sleep(DELAY_SECONDS)
+        path = self.path.split('?')[0]
+        data = IMAGES.get(path)
+        if data is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = f'"{len(data)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _ImageServer)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    _ImageServer.requests_seen = []
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_decode_once_normalizes_format():
+    """One open gives format, size and Word-friendly bytes"""
+    print("🧪 Testing image decoding...")
+    png = decode_image(IMAGES['/logo.png'])
+    assert (png.format, png.width, png.height) == ('PNG', 120, 40) and png.data == IMAGES['/logo.png']
+    webp = decode_image(IMAGES['/partner.webp'])
+    assert (webp.format, webp.width, webp.height) == ('PNG', 60, 30) and webp.data.startswith(b'\x89PNG')
+    assert decode_image(b'not an image').width is None
+    print("✅ Decoded once")
+
+
+def test_cache_and_revalidation(server, tmp_path):
+    """Fresh entries skip the network; stale ones revalidate with their ETag"""
+    print("🧪 Testing the fetch cache...")
+    fetcher = ImageFetcher(max_age=60, directory=str(tmp_path))
+    url = f"{server}/logo.png"
+    first = fetcher.fetch(url)
+    assert fetcher.fetch(url) is first
+    assert len(_ImageServer.requests_seen) == 1
+
+    # Another worker on the host, with everything considered stale: a 304, no download
+    other = ImageFetcher(max_age=0, directory=str(tmp_path))
+    assert other.fetch(url).data == first.data
+    assert _ImageServer.requests_seen[-1] == ('/logo.png', f'"{len(IMAGES["/logo.png"])}"')
+    stats = other.get_stats()
+    assert stats['disk_hits'] == 0 and stats['revalidated'] == 1 and stats['downloads'] == 0
+
+    assert other.fetch(f"{server}/missing.png") is None
+    assert other.get_stats()['errors'] == 1
+
+    # A fresh copy on disk is one disk hit, not a memory hit as well
+    third = ImageFetcher(max_age=60, directory=str(tmp_path))
+    assert third.fetch(url).data == first.data
+    stats = third.get_stats()
+    assert (stats['hits'], stats['disk_hits']) == (0, 1)
+    third.fetch(url)
+    assert (third.get_stats()['hits'], third.get_stats()['disk_hits']) == (1, 1)
+    print("✅ Cached and revalidated")
+
+
+def test_disk_is_rescanned_only_over_budget(server, tmp_path, monkeypatch):
+    """Writes add to a size estimate; the directory is listed only when it passes the budget"""
+    print("🧪 Testing disk eviction...")
+    scans = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        scans.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr('cpq.image_fetcher.os.scandir', counting_scandir)
+    png, webp = len(IMAGES['/logo.png']), len(IMAGES['/partner.webp'])
+    fetcher = ImageFetcher(directory=str(tmp_path), disk_bytes=png + webp)
+    fetcher.fetch(f"{server}/logo.png")
+    assert len(scans) == 1  # the first write sizes the directory
+    fetcher.fetch(f"{server}/partner.webp")
+    assert len(scans) == 1 and fetcher.get_stats()['disk_bytes'] == png + webp
+
+    fetcher.fetch(f"{server}/logo.png?v=2")
+    assert len(scans) == 2
+    assert fetcher.get_stats()['disk_bytes'] <= png + webp
+    assert len(list(tmp_path.glob('*.img'))) == 2
+    print("✅ Disk rescanned only over budget")
+
+
+def test_docx_prefetches_each_image_once(server, tmp_path, monkeypatch):
+    """A template's images are fetched once, in parallel, before the build"""
+    print("🧪 Testing DOCX image prefetch...")
+    fetcher = ImageFetcher(directory=str(tmp_path))
+    monkeypatch.setattr('templates.docx_generator.image_fetcher', fetcher)
+    html = (f'<p>Agreement</p><img src="{server}/logo.png" width="200">'
+            f'<p><img src="{server}/partner.webp"> and again <img src="{server}/logo.png"></p>')
+
+    success, docx_bytes = generate_agreement_docx(html, {'client_name': 'Ada'})
+    assert success
+    assert len(Document(BytesIO(docx_bytes)).inline_shapes) == 3
+    assert sorted(path for path, _ in _ImageServer.requests_seen) == ['/logo.png', '/partner.webp']
+    print("✅ Images prefetched once")
+
+
+def test_benchmark_prefetch_vs_sequential(server, tmp_path):
+    """Parallel prefetch over a pooled session beats one blocking get per image"""
+    print("🧪 Benchmarking image fetching...")
+    urls = [f"{server}/logo.png?v={i}" for i in range(8)]
+
+    start = time.perf_counter()
+    for url in urls:
+        requests.get(url, timeout=10)
+    sequential = time.perf_counter() - start
+
+    fetcher = ImageFetcher(directory=str(tmp_path))
+    start = time.perf_counter()
+    assert len(fetcher.prefetch(urls)) == len(urls)
+    parallel = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fetcher.prefetch(urls)
+    cached = time.perf_counter() - start
+    print(f"✅ {len(urls)} images: sequential {sequential * 1000:.0f} ms, prefetch {parallel * 1000:.0f} ms, "
+          f"cached {cached * 1000:.2f} ms")
+    assert parallel * 2 < sequential
+    assert cached < DELAY_SECONDS
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
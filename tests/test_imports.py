@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test script for streaming NDJSON/CSV imports of clients and quotes.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import io
+import json
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND, db
+from imports import import_bp, iter_import, iter_rows
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+QUOTES_CSV = (
+    'client.name,client.email,client.phone,configuration.users,configuration.duration,'
+    'configuration.instanceType,quote.standard.totalCost,status\n'
+    'True North,ada@example.com,0115550100,250,6,large,7500.50,draft\n'
+    'null,grace@example.com,5550100,12,3,small,1200,sent\n'
+    'Initech,bob@example.com,5550199,many,3,small,1200,draft\n'
+    'Acme,extra@example.com,1,2,3,small,4,draft,surplus\n'
+)
+
+
+@pytest.fixture(autouse=True)
+def collections():
+    db['quotes'].delete_many({})
+    db['clients'].delete_many({})
+    yield
+    db['quotes'].delete_many({})
+    db['clients'].delete_many({})
+
+
+def _events(dataset, data, import_format, batch_size=1000):
+    rows = iter_rows(io.BytesIO(data.encode()), import_format)
+    return list(iter_import(dataset, rows, batch_size, from_csv=import_format == 'csv'))
+
+
+def test_csv_only_parses_declared_columns():
+    """Numeric columns are converted; text that looks like JSON or a number stays text"""
+    print("🧪 Testing typed CSV columns...")
+    events = _events('quotes', QUOTES_CSV, 'csv')
+    summary = events[-1]
+    assert (summary['processed'], summary['inserted'], summary['failed']) == (4, 2, 2)
+    assert events[0]['errors'] == [
+        {'row': 4, 'error': "configuration.users must be number, got 'many'"},
+        {'row': 5, 'error': 'Row has more fields than the header'},
+    ]
+
+    ada = db['quotes'].find_one({'client.email': 'ada@example.com'})
+    assert ada['client'] == {'name': 'True North', 'email': 'ada@example.com', 'phone': '0115550100'}
+    assert ada['configuration'] == {'users': 250, 'duration': 6, 'instanceType': 'large'}
+    assert ada['quote']['standard']['totalCost'] == 7500.5
+    grace = db['quotes'].find_one({'client.email': 'grace@example.com'})
+    assert grace['client']['name'] == 'null' and grace['client']['phone'] == '5550100'
+    assert grace['status'] == 'sent'
+    print("✅ Only declared columns parsed")
+
+
+def test_ndjson_import_in_batches_with_reimport():
+    """NDJSON rows keep their JSON types; re-importing an exported _id updates in place"""
+    print("🧪 Testing NDJSON import...")
+    quotes = [{'client': {'name': f'Client {i}'}, 'configuration': {'users': i}} for i in range(5)]
+    data = '\n'.join(json.dumps(quote) for quote in quotes) + '\n\nnot json\n[1, 2]\n'
+    events = _events('quotes', data, 'ndjson', batch_size=2)
+    assert [event['event'] for event in events] == ['progress'] * 3 + ['summary']
+    assert events[-1]['inserted'] == 5 and events[-1]['failed'] == 2
+    assert [error['row'] for error in events[-2]['errors']] == [7, 8]
+
+    stored = db['quotes'].find_one({'client.name': 'Client 3'})
+    update = {'_id': str(stored['_id']), 'client': {'name': 'Client 3'}, 'configuration': {'users': 30},
+              'created_at': '2024-01-02T03:04:05'}
+    summary = _events('quotes', json.dumps(update), 'ndjson')[-1]
+    assert (summary['matched'], summary['modified']) == (1, 1)
+    assert db['quotes'].find_one({'_id': stored['_id']})['configuration']['users'] == 30
+    assert db['quotes'].count_documents({}) == 5
+    print("✅ NDJSON imported")
+
+
+def test_client_import_upserts_by_email():
+    """Client rows collapse by normalized email and invalid rows are reported"""
+    print("🧪 Testing client import...")
+    data = ('clientName,companyName,email,phoneNumber\n'
+            'Ada,Acme,Ada@Example.com,0115550100\n'
+            'Ada Lovelace,Acme,ada@example.com ,0115550100\n'
+            'Nobody,,nobody@example.com,\n')
+    summary = _events('clients', data, 'csv')[-1]
+    assert (summary['upserted'], summary['failed']) == (1, 1)
+    client = db['clients'].find_one({'email': 'ada@example.com'})
+    assert client['clientName'] == 'Ada Lovelace' and client['phoneNumber'] == '0115550100'
+    print("✅ Clients upserted")
+
+
+def test_import_endpoint_streams_progress():
+    """POST /api/import/<dataset> infers CSV from the upload and streams NDJSON events"""
+    print("🧪 Testing the import endpoint...")
+    app = Flask(__name__)
+    app.register_blueprint(import_bp)
+    client = app.test_client()
+
+    response = client.post('/api/import/quotes', data={'file': (io.BytesIO(QUOTES_CSV.encode()), 'quotes.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert events[-1]['event'] == 'summary' and events[-1]['inserted'] == 2
+
+    assert client.post('/api/import/unknown', data=b'').status_code == 404
+    assert client.post('/api/import/quotes?format=xml', data=b'').status_code == 400
+    print("✅ Endpoint streamed progress")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
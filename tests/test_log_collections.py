@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script for the time-series email, SMTP and HubSpot integration logs
+and their windowed statistics.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND, db
+from cpq.log_writer import log_writer
+from mongodb_collections import timeseries_utils
+from mongodb_collections.email_collection import EmailCollection
+from mongodb_collections.hubspot_integration_collection import HubSpotIntegrationCollection
+from mongodb_collections.smtp_collection import SMTPCollection
+from mongodb_collections.timeseries_utils import ensure_timeseries_collection, get_retention_days
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+LOG_COLLECTIONS = ('email_logs_ts', 'smtp_logs_ts', 'hubspot_integrations_ts')
+
+
+@pytest.fixture(autouse=True)
+def clean_logs():
+    for name in LOG_COLLECTIONS:
+        db[name].delete_many({})
+    yield
+    for name in LOG_COLLECTIONS:
+        db[name].delete_many({})
+
+
+def _backdate(collection, days, status, operation='send', count=1):
+    """Log records written directly, as if they had been logged `days` ago"""
+    timestamp = datetime.now() - timedelta(days=days)
+    collection.insert_many([{'timestamp': timestamp, 'status': status,
+                             'meta': {'service': 'test', 'operation': operation, 'status': status}}
+                            for _ in range(count)])
+
+
+def test_retention_days_from_environment(monkeypatch):
+    """Per-collection setting, then LOG_RETENTION_DAYS, then the default"""
+    print("🧪 Testing retention settings...")
+    monkeypatch.delenv('EMAIL_LOG_RETENTION_DAYS', raising=False)
+    monkeypatch.delenv('LOG_RETENTION_DAYS', raising=False)
+    assert get_retention_days('EMAIL_LOG_RETENTION_DAYS') == timeseries_utils.DEFAULT_LOG_RETENTION_DAYS
+    monkeypatch.setenv('LOG_RETENTION_DAYS', '30')
+    assert get_retention_days('EMAIL_LOG_RETENTION_DAYS') == 30
+    monkeypatch.setenv('EMAIL_LOG_RETENTION_DAYS', '0')
+    assert get_retention_days('EMAIL_LOG_RETENTION_DAYS') == 0
+    monkeypatch.setenv('EMAIL_LOG_RETENTION_DAYS', 'forever')
+    assert get_retention_days('EMAIL_LOG_RETENTION_DAYS') == timeseries_utils.DEFAULT_LOG_RETENTION_DAYS
+    print("✅ Retention resolved")
+
+
+def test_collections_are_created_as_time_series():
+    """New log collections are time-series with TTL; a changed retention is applied with collMod"""
+    print("🧪 Testing time-series creation...")
+    name = 'test_timeseries_logs'
+    db.drop_collection(name)
+    ensure_timeseries_collection(name, 7)
+    info = next(db.list_collections(filter={'name': name}))
+    assert info['type'] == 'timeseries'
+    assert info['options']['timeseries'] == {'timeField': 'timestamp', 'metaField': 'meta',
+                                             'granularity': 'seconds'}
+    assert info['options']['expireAfterSeconds'] == 7 * 86400
+
+    timeseries_utils._ensured.discard(name)
+    ensure_timeseries_collection(name, 0)
+    assert next(db.list_collections(filter={'name': name}))['options']['expireAfterSeconds'] == 'off'
+    timeseries_utils._ensured.discard(name)
+    db.drop_collection(name)
+    print("✅ Time-series collection created")
+
+
+def test_email_stats_cover_a_trailing_window():
+    """Logged emails are counted by status; records older than the window are not"""
+    print("🧪 Testing email stats...")
+    emails = EmailCollection()
+    emails.log_email_sent({'recipient_email': 'ada@example.com', 'subject': 'Quote'})
+    emails.log_email_sent({'recipient_email': 'grace@example.com', 'subject': 'Quote'})
+    emails.log_email_failed({'recipient_email': 'bob@example.com', 'subject': 'Quote'}, 'SMTP timeout')
+    assert log_writer.flush()
+    _backdate(emails.collection, 10, 'failed', count=3)
+    _backdate(emails.collection, 45, 'sent', count=5)
+
+    assert emails.get_email_stats() == [{'_id': 'failed', 'count': 4}, {'_id': 'sent', 'count': 2}]
+    assert emails.get_email_stats(days=7) == [{'_id': 'sent', 'count': 2}, {'_id': 'failed', 'count': 1}]
+    history = emails.get_email_history('bob@example.com')
+    assert len(history) == 1 and history[0]['meta'] == {'service': 'email', 'operation': 'send',
+                                                         'status': 'failed'}
+    print("✅ Email stats windowed")
+
+
+def test_smtp_and_hubspot_stats():
+    """SMTP connection and HubSpot API stats use the same windowed pipeline"""
+    print("🧪 Testing SMTP and HubSpot stats...")
+    smtp = SMTPCollection()
+    smtp.log_connection_success({'host': 'smtp.example.com'})
+    smtp.log_connection_failed({'host': 'smtp.example.com'}, 'auth failed')
+    smtp.log_connection_test({'host': 'smtp.example.com', 'status': 'success'})
+    hubspot = HubSpotIntegrationCollection()
+    hubspot.log_api_call({'operation': 'get_contacts'})
+    hubspot.log_api_error({'operation': 'get_contacts'}, 'rate limited')
+    hubspot.log_contact_sync({'status': 'success', 'contacts': 12})
+    assert log_writer.flush()
+    _backdate(smtp.collection, 40, 'failed', operation='connection', count=2)
+    _backdate(hubspot.collection, 2, 'error', operation='get_contacts')
+
+    assert smtp.get_connection_stats() == [{'_id': 'success', 'count': 2}, {'_id': 'failed', 'count': 1}]
+    assert smtp.get_last_successful_connection()['meta']['service'] == 'smtp'
+    assert {item['_id']: item['count'] for item in hubspot.get_api_call_stats()} == {'success': 2, 'error': 2}
+    assert {item['_id']: item['count'] for item in hubspot.get_integration_health()} == {'success': 2, 'error': 1}
+    assert [doc['contacts'] for doc in hubspot.get_sync_history('contact_sync')] == [12]
+    assert hubspot.get_last_successful_sync()['contacts'] == 12
+    print("✅ SMTP and HubSpot stats windowed")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Test script for the buffered background log writer.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+from pymongo import UpdateOne
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND, db
+from cpq.log_writer import DROP_NEWEST, DROP_OLDEST, BufferedLogWriter
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+
+@pytest.fixture
+def logs():
+    collection = db['test_log_writer']
+    collection.drop()
+    yield collection
+    collection.drop()
+
+
+class _BlockingCollection:
+    """Wraps a collection so writes wait until released"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.database = collection.database
+        self.name = collection.name
+        self.release = threading.Event()
+        self.writing = threading.Event()
+
+    def insert_many(self, documents, **kwargs):
+        self.writing.set()
+        self.release.wait(5)
+        return self._collection.insert_many(documents, **kwargs)
+
+
+def test_batches_inserts_and_ordered_updates(logs):
+    """Records are written in batches; updates to one document keep their order"""
+    print("🧪 Testing batching...")
+    writer = BufferedLogWriter(batch_size=3, flush_interval=10)
+    for i in range(7):
+        assert writer.insert(logs, {'event': i})
+    assert writer.flush()
+    assert logs.count_documents({}) == 7
+    metrics = writer.get_metrics()
+    assert (metrics['written'], metrics['flushes']) == (7, 3)
+
+    writer.write(logs, {'_id': 'form-1', 'views': 0})
+    for _ in range(4):
+        writer.write(logs, UpdateOne({'_id': 'form-1'}, {'$inc': {'views': 1}}))
+    writer.write(logs, UpdateOne({'_id': 'form-1'}, {'$set': {'views': 100}}))
+    assert writer.flush()
+    assert logs.find_one({'_id': 'form-1'})['views'] == 100
+    writer.close()
+    print("✅ Batched")
+
+
+def test_failed_records_do_not_block_the_batch(logs):
+    """A rejected record is counted; the rest of its batch is still written"""
+    print("🧪 Testing partial failures...")
+    writer = BufferedLogWriter(batch_size=10, flush_interval=10)
+    logs.insert_one({'_id': 'taken'})
+    for document in ({'_id': 'a'}, {'_id': 'taken'}, {'_id': 'b'}):
+        writer.insert(logs, document)
+    writer.write(logs, UpdateOne({'_id': 'a'}, {'$set': {'seen': True}}))
+    assert writer.flush()
+    assert logs.count_documents({}) == 3 and logs.find_one({'_id': 'a'})['seen']
+    metrics = writer.get_metrics()
+    assert (metrics['written'], metrics['failed']) == (3, 1) and metrics['last_error']
+    writer.close()
+    print("✅ Failures isolated")
+
+
+@pytest.mark.parametrize('policy', [DROP_NEWEST, DROP_OLDEST])
+def test_drop_policy_when_full(logs, policy):
+    """With the flusher stuck, a full queue drops the newest or the oldest record"""
+    print(f"🧪 Testing {policy}...")
+    blocking = _BlockingCollection(logs)
+    writer = BufferedLogWriter(max_queue=2, batch_size=1, flush_interval=10, put_timeout=0.01,
+                               drop_policy=policy)
+    writer.insert(blocking, {'event': 'in-flight'})
+    assert blocking.writing.wait(5)
+
+    assert writer.insert(blocking, {'event': 1}) and writer.insert(blocking, {'event': 2})
+    accepted = writer.insert(blocking, {'event': 3})
+    assert accepted == (policy == DROP_OLDEST)
+    assert writer.get_metrics()['dropped'] == 1
+
+    blocking.release.set()
+    assert writer.flush()
+    expected = {'in-flight', 1, 2} if policy == DROP_NEWEST else {'in-flight', 2, 3}
+    assert {doc['event'] for doc in logs.find({})} == expected
+    writer.close()
+    print(f"✅ {policy} applied")
+
+
+def test_close_flushes_then_writes_through(logs):
+    """close() drains the queue; later records are written synchronously"""
+    print("🧪 Testing close and write-through...")
+    writer = BufferedLogWriter(batch_size=100, flush_interval=10)
+    for i in range(5):
+        writer.insert(logs, {'event': i})
+    assert writer.close()
+    assert logs.count_documents({}) == 5
+
+    assert writer.insert(logs, {'event': 'late'})
+    assert logs.count_documents({'event': 'late'}) == 1
+    logs.insert_one({'_id': 'dup'})
+    assert not writer.insert(logs, {'_id': 'dup'})
+    metrics = writer.get_metrics()
+    assert (metrics['written'], metrics['failed'], metrics['queue_depth']) == (6, 1, 0)
+    print("✅ Flushed on close, then wrote through")
+
+
+def test_write_through_does_not_hold_the_lock(logs):
+    """A slow write-through doesn't block other threads reading metrics or writing"""
+    print("🧪 Testing write-through locking...")
+    blocking = _BlockingCollection(logs)
+    writer = BufferedLogWriter()
+    writer.close()
+
+    thread = threading.Thread(target=writer.insert, args=(blocking, {'event': 'slow'}))
+    thread.start()
+    assert blocking.writing.wait(5)
+    start = time.perf_counter()
+    writer.get_metrics()
+    assert writer.insert(logs, {'event': 'fast'})
+    assert time.perf_counter() - start < 1
+    blocking.release.set()
+    thread.join(5)
+    assert logs.count_documents({}) == 2
+    print("✅ Lock released during I/O")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test script for the in-memory storage backend.
+
+Runs the collection classes against cpq.storage.MemoryRepository, so no
+MongoDB server is needed. The same backend can be selected for the app
+or benchmarks with CPQ_STORAGE_BACKEND=memory.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from cpq.storage import MemoryDatabase, Repository
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+
+def _client(name, email):
+    return {"clientName": name, "email": email, "companyName": "Acme", "phoneNumber": "555-0100"}
+
+
+@pytest.fixture
+def repo():
+    return MemoryDatabase('cpq_test')['things']
+
+
+def test_repository_query_and_update_semantics(repo):
+    """Filters, update operators, projections and sorting behave like MongoDB"""
+    print("🧪 Testing MemoryRepository queries...")
+    assert isinstance(repo, Repository)
+
+    doc = {'name': 'a', 'qty': 5, 'tags': ['x', 'y'], 'nested': {'v': 1}}
+    inserted_id = repo.insert_one(doc).inserted_id
+    assert doc['_id'] == inserted_id
+    repo.insert_many([{'name': 'b', 'qty': 10, 'tags': ['y']}, {'name': 'c', 'qty': 1}])
+
+    assert repo.count_documents({'qty': {'$gte': 5}}) == 2
+    assert repo.count_documents({'tags': 'y'}) == 2
+    assert repo.count_documents({'tags': {'$exists': False}}) == 1
+    assert repo.find_one({'nested.v': 1})['name'] == 'a'
+    assert [d['name'] for d in repo.find({}, {'name': 1}).sort('qty', -1).limit(2)] == ['b', 'a']
+    assert repo.find_one({'name': 'a'}, {'tags': 0}).get('tags') is None
+
+    result = repo.update_one({'name': 'a'}, {'$inc': {'qty': 2}, '$push': {'tags': 'z'}})
+    assert (result.matched_count, result.modified_count) == (1, 1)
+    assert repo.find_one({'_id': inserted_id})['tags'] == ['x', 'y', 'z']
+
+    upserted = repo.update_one({'name': 'd'}, {'$set': {'qty': 3}, '$setOnInsert': {'new': True}}, upsert=True)
+    assert upserted.upserted_id is not None
+    assert repo.find_one({'name': 'd'})['new'] is True
+
+    after = repo.find_one_and_update({'name': 'c'}, {'$set': {'qty': 4}}, return_document=ReturnDocument.AFTER)
+    assert after['qty'] == 4
+
+    # Returned documents are copies, not live references
+    after['qty'] = 99
+    assert repo.find_one({'name': 'c'})['qty'] == 4
+
+    assert repo.delete_many({'qty': {'$lt': 5}}).deleted_count == 2
+    assert sorted(repo.distinct('name')) == ['a', 'b']
+    print("✅ Query and update semantics match")
+
+
+def test_unique_index_and_bulk_errors(repo):
+    """Unique indexes raise DuplicateKeyError; unordered bulk writes report per-op errors"""
+    print("🧪 Testing unique indexes...")
+    assert repo.create_index('email', unique=True) == 'email_1'
+    repo.insert_one({'email': 'a@x.com'})
+    with pytest.raises(DuplicateKeyError):
+        repo.insert_one({'email': 'a@x.com'})
+
+    with pytest.raises(BulkWriteError) as excinfo:
+        repo.bulk_write([
+            InsertOne({'email': 'b@x.com'}),
+            InsertOne({'email': 'a@x.com'}),
+            UpdateOne({'email': 'c@x.com'}, {'$set': {'n': 1}}, upsert=True),
+        ], ordered=False)
+    details = excinfo.value.details
+    assert [error['index'] for error in details['writeErrors']] == [1]
+    assert details['nInserted'] == 1 and details['nUpserted'] == 1
+    assert repo.count_documents({}) == 3
+    print("✅ Unique index enforced")
+
+
+def test_pipeline_update_and_aggregation(repo):
+    """Pipeline updates and aggregation stages used by the collection classes"""
+    print("🧪 Testing pipelines...")
+    repo.insert_many([{'status': 'a', 'amount': 10}, {'status': 'a', 'amount': 5}, {'status': 'b', 'amount': 1}])
+
+    repo.update_many({}, [{'$set': {'big': {'$gt': ['$amount', 4]}}}])
+    assert repo.count_documents({'big': True}) == 2
+
+    result = list(repo.aggregate([
+        {'$facet': {
+            'by_status': [{'$group': {'_id': '$status', 'total': {'$sum': '$amount'}}}, {'$sort': {'_id': 1}}],
+            'count': [{'$count': 'n'}],
+        }}
+    ]))[0]
+    assert result['by_status'] == [{'_id': 'a', 'total': 15}, {'_id': 'b', 'total': 1}]
+    assert result['count'] == [{'n': 3}]
+    print("✅ Pipelines evaluated")
+
+
+def test_collection_classes_on_memory_backend():
+    """The production collection classes run unchanged on the memory backend"""
+    print("🧪 Testing collection classes...")
+    from mongodb_collections.client_collection import ClientCollection
+    from mongodb_collections.approval_workflow_collection import ApprovalWorkflowCollection
+    from mongodb_collections.generated_agreement_collection import GeneratedAgreementCollection
+
+    clients = ClientCollection()
+    client, created = clients.upsert_client_by_email(_client("Ada", " Ada@Example.com "))
+    assert created and client['email'] == 'ada@example.com'
+    client, created = clients.upsert_client_by_email(_client("Ada L.", "ada@example.com"))
+    assert not created and client['clientName'] == "Ada L."
+
+    workflows = ApprovalWorkflowCollection()
+    workflow_id = str(workflows.create_workflow({'document_id': 'doc-1'}).inserted_id)
+    assert workflows.transition(workflow_id, 'manager', 'approve')['manager_status'] == 'approved'
+    # A second approval of the same step is rejected atomically
+    assert workflows.transition(workflow_id, 'manager', 'approve') is None
+
+    agreements = GeneratedAgreementCollection()
+    agreement_id = str(agreements.collection.insert_one({
+        'quote_id': 'q-1', 'generated_at': datetime.now(), 'agreement_data': b'pdf', 'signatures': {}
+    }).inserted_id)
+    assert agreements.sign_agreement(agreement_id, 'client', {'data': 'sig-1'})['status'] == 'client_signed'
+    signed = agreements.sign_agreement(agreement_id, 'ceo', {'data': 'sig-2'})
+    assert signed['status'] == 'completed' and 'agreement_data' not in signed
+    assert agreements.sign_agreement(agreement_id, 'ceo', {'data': 'again'}) is None
+    print("✅ Collection classes work without MongoDB")
+
+
+def test_document_listing_pages_across_collections():
+    """$unionWith keyset paging over PDFs and agreements"""
+    print("🧪 Testing document listing...")
+    from cpq.db import generated_pdfs_collection, generated_agreements_collection
+    from mongodb_collections.document_view_collection import DocumentViewCollection
+
+    generated_pdfs_collection.delete_many({})
+    generated_agreements_collection.delete_many({})
+    for day in range(1, 6):
+        collection = generated_pdfs_collection if day % 2 else generated_agreements_collection
+        collection.insert_one({'quote_id': f'list-{day}', 'generated_at': datetime(2024, 1, day),
+                               '_id': ObjectId()})
+
+    view = DocumentViewCollection()
+    first, cursor = view.list_documents({}, None, 3)
+    second, end = view.list_documents({}, cursor, 3)
+    assert [d['quote_id'] for d in first + second] == [f'list-{day}' for day in range(5, 0, -1)]
+    assert end is None
+    print("✅ Listing paged in order")
+
+
+def test_memory_backend_throughput(repo):
+    """Thousands of round trips per second with no external service"""
+    print("🧪 Measuring throughput...")
+    repo.create_index('email', unique=True)
+    iterations = 2000
+    start = time.perf_counter()
+    for i in range(iterations):
+        repo.update_one({'email': f'user{i % 200}@x.com'}, {'$set': {'n': i}}, upsert=True)
+        repo.find_one({'email': f'user{i % 200}@x.com'})
+    elapsed = time.perf_counter() - start
+    rate = iterations / elapsed
+    print(f"✅ {rate:,.0f} upsert+read iterations/sec")
+    assert rate > 1000
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
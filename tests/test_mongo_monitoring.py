@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for the MongoDB command monitor: filter shapes, plan summaries
+and latency histograms.
+
+Commands are fed to the listener as synthetic pymongo events, so no MongoDB
+server is needed.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpq.mongo_monitoring import (
+    COMMAND_COUNT_BUCKETS, Histogram, MongoCommandMonitor, extract_filter, filter_shape, summarize_plan
+)
+
+
+def test_filter_shape_hides_values():
+    """Literal values become '?', operators and nested clauses keep their structure"""
+    print("🧪 Testing filter shapes...")
+    assert filter_shape({'client.email': 'a@b.com', 'status': {'$in': ['x', 'y']}}) == \
+        {'client.email': '?', 'status': {'$in': '?'}}
+    assert filter_shape({'$or': [{'a': 1}, {'b': {'$gt': 2}}]}) == {'$or': [{'a': '?'}, {'b': {'$gt': '?'}}]}
+    # Lists of scalars, empty lists and None are values too
+    assert filter_shape({'tags': {'$all': []}, 'deleted': None}) == {'tags': {'$all': '?'}, 'deleted': '?'}
+    # Same structure, different data: same shape
+    assert filter_shape({'quote_id': 'q-1'}) == filter_shape({'quote_id': 'q-2'})
+    print("✅ Shapes hide values")
+
+
+def test_extract_filter_per_command():
+    """Filters are read from where each command keeps them"""
+    print("🧪 Testing filter extraction...")
+    assert extract_filter('find', {'find': 'quotes', 'filter': {'status': 'draft'}}) == {'status': 'draft'}
+    assert extract_filter('count', {'count': 'quotes'}) == {}
+    pipeline = [{'$sort': {'created_at': -1}}, {'$match': {'status': 'sent'}}, {'$match': {'x': 1}}]
+    assert extract_filter('aggregate', {'aggregate': 'quotes', 'pipeline': pipeline}) == {'status': 'sent'}
+    assert extract_filter('aggregate', {'aggregate': 'quotes', 'pipeline': [{'$count': 'n'}]}) == {}
+    assert extract_filter('update', {'update': 'quotes', 'updates': [{'q': {'_id': 1}, 'u': {}}]}) == {'_id': 1}
+    assert extract_filter('delete', {'delete': 'quotes', 'deletes': []}) == {}
+    assert extract_filter('insert', {'insert': 'quotes', 'documents': []}) is None
+    print("✅ Filters extracted")
+
+
+def test_summarize_plan():
+    """The winning plan decides the scan type; rejected plans are ignored"""
+    print("🧪 Testing plan summaries...")
+    collscan = {'queryPlanner': {'winningPlan': {'stage': 'COLLSCAN', 'filter': {}}, 'rejectedPlans': []}}
+    assert summarize_plan(collscan) == {'scan': 'COLLSCAN', 'stages': ['COLLSCAN'], 'indexes': []}
+
+    ixscan = {'queryPlanner': {
+        'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'status_1_created_at_-1'}},
+        'rejectedPlans': [{'stage': 'COLLSCAN'}, {'stage': 'IXSCAN', 'indexName': 'other_1'}],
+    }}
+    assert summarize_plan(ixscan) == {'scan': 'IXSCAN', 'stages': ['FETCH', 'IXSCAN'],
+                                      'indexes': ['status_1_created_at_-1']}
+
+    # Aggregations nest the planner under $cursor; sharded plans list one per shard
+    aggregate = {'stages': [{'$cursor': {'queryPlanner': {'winningPlan': {'stage': 'IDHACK'}}}}]}
+    assert summarize_plan(aggregate)['scan'] == 'IXSCAN'
+    sharded = {'queryPlanner': {'winningPlan': {'stage': 'SHARD_MERGE', 'shards': [
+        {'winningPlan': {'stage': 'IXSCAN', 'indexName': 'a_1'}},
+        {'winningPlan': {'stage': 'COLLSCAN'}},
+    ]}}}
+    assert summarize_plan(sharded)['scan'] == 'COLLSCAN'
+    assert summarize_plan({'queryPlanner': {'winningPlan': {'stage': 'EOF'}}})['scan'] == 'EOF'
+    assert summarize_plan({})['scan'] == 'UNKNOWN'
+    print("✅ Plans summarized")
+
+
+def test_histogram_buckets():
+    """Values land in the first bucket whose bound they don't exceed"""
+    print("🧪 Testing the histogram...")
+    histogram = Histogram(buckets=(1, 10, 100))
+    for value in (0.5, 1, 1.5, 10, 99.9, 100, 250):
+        histogram.observe(value)
+    assert histogram.to_dict() == {
+        'count': 7, 'sum': 462.9, 'avg': 66.129, 'max': 250,
+        'buckets': {'<=1': 2, '<=10': 2, '<=100': 2, '>100': 1},
+    }
+    assert Histogram().to_dict()['avg'] == 0
+    print("✅ Histogram bucketed")
+
+
+def _event(command_name, command, duration_ms, request_id):
+    return SimpleNamespace(command_name=command_name, command=command, request_id=request_id, connection_id=1,
+                           duration_micros=int(duration_ms * 1000), database_name='cpq')
+
+
+def test_monitor_records_requests_and_slow_queries():
+    """Commands are folded into per-request, per-endpoint and per-collection stats"""
+    print("🧪 Testing the command monitor...")
+    monitor = MongoCommandMonitor(slow_query_ms=50)
+    commands = [
+        ('find', {'find': 'quotes', 'filter': {'status': 'draft'}}, 4),
+        ('find', {'find': 'quotes', 'filter': {'client.email': 'a@b.com'}}, 120),
+        ('getMore', {'getMore': 1, 'collection': 'quotes'}, 2),
+    ]
+    monitor.begin_request()
+    for request_id, (name, command, duration_ms) in enumerate(commands):
+        event = _event(name, command, duration_ms, request_id)
+        monitor.started(event)
+        monitor.succeeded(event)
+    stats = monitor.end_request('list_quotes')
+    assert stats.command_count == 3 and stats.total_ms == pytest.approx(126)
+    assert stats.slowest['filter_shape'] == {'client.email': '?'}
+
+    metrics = monitor.get_metrics()
+    endpoint = metrics['endpoints']['list_quotes']
+    assert endpoint['requests'] == 1 and endpoint['commands_per_request']['count'] == 1
+    assert endpoint['commands_per_request']['buckets'][f'<={COMMAND_COUNT_BUCKETS[2]}'] == 1
+    assert metrics['collections']['quotes']['commands'] == {'find': 2, 'getMore': 1}
+    # No client attached: the slow query is logged without a plan
+    assert [(query['collection'], query['plan']) for query in metrics['slow_queries']] == [('quotes', None)]
+
+    monitor.reset()
+    assert monitor.get_metrics()['endpoints'] == {}
+    print("✅ Commands recorded")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
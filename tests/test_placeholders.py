@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test script and benchmark for the single-pass placeholder engine.
+
+Compares it with the previous implementation of
+replace_placeholders_in_content (one case-insensitive re.sub per key and
+form, then the alias replacements). The benchmark only prints its timings
+and runs when RUN_BENCHMARKS is set, as it is when this file is run as a
+script.
+"""
+
+import os
+import re
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from templates.placeholders import replace_placeholders
+
+
+def legacy_replace(content, template_data):
+    """The previous implementation, minus its logging"""
+    for key, value in template_data.items():
+        content = re.sub(r'\{\{' + re.escape(key) + r'\}\}', str(value), content, flags=re.IGNORECASE)
+        content = re.sub(r'\[' + re.escape(key) + r'\]', str(value), content, flags=re.IGNORECASE)
+        content = re.sub(r'\{' + re.escape(key) + r'\}', str(value), content, flags=re.IGNORECASE)
+    special_replacements = {
+        '[Client.Company]': template_data.get('client_company', 'Client Company'),
+        '[Client Company]': template_data.get('client_company', 'Client Company'),
+        '[client_company]': template_data.get('client_company', 'Client Company'),
+        '[Client.Name]': template_data.get('client_name', 'Client Name'),
+        '[Client Name]': template_data.get('client_name', 'Client Name'),
+        '[client_name]': template_data.get('client_name', 'Client Name'),
+        '[company name]': template_data.get('company_name', 'CloudFuze'),
+        '[company_name]': template_data.get('company_name', 'CloudFuze'),
+    }
+    for placeholder, value in special_replacements.items():
+        content = content.replace(placeholder, str(value))
+    return content
+
+
+def _template_data():
+    """Roughly the shape _build_template_data_from_quote produces"""
+    data = {'client_name': 'Ada Lovelace', 'client_company': 'Acme Corp', 'company_name': 'CloudFuze',
+            'Client.Company': 'Acme Corp', 'company name': 'CloudFuze', 'config_users': 250,
+            'config_duration_months': 6, 'generation_date': 'January 01, 2025'}
+    for plan in ('basic', 'standard', 'advanced'):
+        for item in ('migration', 'instance', 'total', 'user', 'data', 'per_user'):
+            data[f'{plan}_{item}_cost'] = 1234.5
+            data[f'{plan}_{item}_cost_formatted'] = '$1,234.50'
+    for i in range(70 - len(data)):
+        data[f'field_{i}'] = f'value {i}'
+    return data
+
+
+def _content(repeat=40):
+    prose = '<p>' + 'The migration covers users, mailboxes and shared drives as scoped below. ' * 8 + '</p>'
+    section = prose + (
+        '<h1>Purchase Agreement for [Client.Company]</h1>'
+        '<p>Prepared for {{client_name}} ({{CLIENT_NAME}}) at [client company] by [company name].</p>'
+        '<table><tr><td>Users</td><td>{config_users}</td><td>{{standard_total_cost_formatted}}</td></tr>'
+        '<tr><td>[Basic_Migration_Cost_Formatted]</td><td>{unknown}</td><td>[not a key]</td></tr></table>'
+        '<p>{{ {field_3} }} [[field_7]] {{{field_9}}} [Client Name] [client_name] $100.00</p>'
+        '<p>[see {Config_Users} above] {{client_company}</p>'
+    )
+    return section * repeat
+
+
+def test_matches_previous_replacement():
+    """Same output as the sequential re.sub implementation"""
+    print("🧪 Testing placeholder semantics...")
+    data = _template_data()
+    content = _content(repeat=3)
+    assert replace_placeholders(content, data) == legacy_replace(content, data)
+
+    # Aliases fall back to defaults when the data lacks the key
+    assert replace_placeholders('[Client Name] / [company_name]', {}) == 'Client Name / CloudFuze'
+    assert replace_placeholders('Hi {{Name}}, {{name}}', {'name': 'a', 'NAME': 'b'}) == 'Hi a, a'
+    assert replace_placeholders('', data) == ''
+    print("✅ Output matches")
+
+
+def test_values_are_inserted_literally():
+    """Backslashes in values are not treated as regex group references"""
+    print("🧪 Testing literal values...")
+    assert replace_placeholders('Path: {{path}}', {'path': r'C:\docs\1'}) == r'Path: C:\docs\1'
+    print("✅ Values inserted literally")
+
+
+@pytest.mark.skipif(not os.getenv('RUN_BENCHMARKS'), reason="set RUN_BENCHMARKS=1 to time the engines")
+def test_benchmark_single_pass():
+    """Times the single pass against ~210 full-text scans"""
+    print("🧪 Benchmarking placeholder replacement...")
+    data = _template_data()
+    content = _content()
+    replace_placeholders(content, data)  # compile the pattern once
+
+    def timed(replace, iterations=20):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            replace(content, data)
+        return (time.perf_counter() - start) / iterations
+
+    legacy = timed(legacy_replace)
+    single_pass = timed(replace_placeholders)
+    print(f"✅ {len(content):,} chars, {len(data)} keys: legacy {legacy * 1000:.2f} ms, "
+          f"single pass {single_pass * 1000:.2f} ms ({legacy / single_pass:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    os.environ.setdefault('RUN_BENCHMARKS', '1')
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
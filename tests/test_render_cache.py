@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test script for the rendered-PDF cache.
+
+Renders inline, so no worker processes or WeasyPrint are needed.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpq.render_cache import RenderCache, render_key
+from cpq.render_service import RenderService
+
+CLIENT = {'name': 'Ada', 'company': 'Acme'}
+CONFIGURATION = {'users': 50, 'duration': 6}
+
+
+def test_keys_follow_relevant_inputs():
+    """Key order and value types don't matter; changed values do"""
+    print("🧪 Testing render keys...")
+    updated = datetime(2025, 1, 1, 12, 0)
+    key = render_key('template_pdf', ['tpl-1', updated, {'a': 1, 'b': b'logo'}, 'standard'])
+    assert key == render_key('template_pdf', ['tpl-1', updated, {'b': b'logo', 'a': 1}, 'standard'])
+    assert key != render_key('template_pdf', ['tpl-1', updated, {'a': 1, 'b': b'logo'}, 'advanced'])
+    assert key != render_key('template_pdf', ['tpl-1', datetime(2025, 1, 2), {'a': 1, 'b': b'logo'}, 'standard'])
+    assert key != render_key('quote_pdf', ['tpl-1', updated, {'a': 1, 'b': b'logo'}, 'standard'])
+    print("✅ Keys normalized")
+
+
+def test_lru_eviction_by_bytes(tmp_path):
+    """Memory and disk tiers each stay within their byte budgets"""
+    print("🧪 Testing LRU eviction...")
+    cache = RenderCache(memory_bytes=250, disk_bytes=250, directory=str(tmp_path))
+    for age, name in ((20, 'a'), (10, 'b')):
+        cache.put(name, name.encode() * 100)
+        written = time.time() - age
+        os.utime(tmp_path / f'{name}.pdf', (written, written))
+    assert cache.get('a') == b'a' * 100  # 'a' is now the most recently used
+    cache.put('c', b'c' * 100)
+
+    stats = cache.get_stats()
+    assert stats['entries'] == 2 and stats['memory_bytes'] == 200
+    assert stats['evictions'] == 1 and stats['disk_evictions'] == 1
+
+    # 'b' was least recently used in both tiers
+    assert cache.get('b') is None
+    assert cache.get('a') == b'a' * 100
+    assert sorted(os.listdir(tmp_path)) == ['a.pdf', 'c.pdf']
+    print("✅ Least recently used entries evicted")
+
+
+def test_disk_tier_is_shared(tmp_path):
+    """A second cache (another worker) reads what the first one wrote"""
+    print("🧪 Testing the disk tier...")
+    RenderCache(directory=str(tmp_path)).put('key', b'%PDF-1.4')
+    other = RenderCache(directory=str(tmp_path))
+    assert other.get('key') == b'%PDF-1.4'
+    assert other.get_stats()['disk_hits'] == 1
+    assert other.get('key') == b'%PDF-1.4'
+    assert other.get_stats()['hits'] == 1
+    print("✅ Disk tier shared")
+
+
+def test_render_service_serves_cached_bytes(tmp_path):
+    """Identical inputs render once; the signature certificate is never cached"""
+    print("🧪 Testing cached renders...")
+    cache = RenderCache(directory=str(tmp_path))
+    service = RenderService(size=0, cache=cache)
+    first = service.render('quote_pdf', CLIENT, {}, CONFIGURATION)
+    assert service.render('quote_pdf', CLIENT, {}, CONFIGURATION) == first
+    assert service.render('quote_pdf', CLIENT, {}, CONFIGURATION, 'advanced') != first
+    assert service.get_status()['jobs'] == 2
+    assert cache.get_stats()['hits'] == 1
+
+    certificate = {'reference_number': 'REF1', 'signers': []}
+    service.render('signature_certificate_pdf', certificate)
+    service.render('signature_certificate_pdf', certificate)
+    assert service.get_status()['jobs'] == 4
+    print("✅ Cached bytes served")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
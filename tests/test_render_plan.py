@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Test script and benchmark for compiled template render plans.
+
+The save test runs on the in-memory storage backend, so no MongoDB server
+is needed.
+"""
+
+import os
+import pickle
+import sys
+import time
+
+import pytest
+from reportlab.platypus import Paragraph, Table
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from mongodb_collections.template_builder_collection import TemplateBuilderCollection
+from templates.pdf_renderer import build_template_story, render_template_plan_pdf
+from templates.render_plan import TemplatePlanCache, compile_template, fill, template_plans
+
+TEMPLATE_DATA = {
+    'client_name': 'Ada Lovelace', 'client_company': 'Acme', 'company_name': 'CloudFuze',
+    'config_users': 250, 'config_duration_months': 6,
+    'advanced_migration_cost_formatted': '$9,000.00', 'advanced_total_cost_formatted': '$12,500.00',
+    'standard_migration_cost_formatted': '$5,000.00', 'standard_total_cost_formatted': '$7,500.00',
+}
+
+
+def _builder_block(block_type, inner):
+    """Block content as the builder saves it: toolbar markup around the text"""
+    toolbar = ''.join(f'<button class="toolbar-btn" title="Action {i}" style="padding:2px 6px;border:0">'
+                      f'<svg width="14" height="14"><path d="M0 0h14v14H0z"/></svg></button>' for i in range(30))
+    return {
+        'type': block_type,
+        'content': f'<div class="block-toolbar" style="display:flex;gap:4px">{toolbar}</div>'
+                   f'<div class="block-content" contenteditable="true">{inner}</div>',
+    }
+
+
+BLOCKS = [
+    _builder_block('image', 'CloudFuze - Microsoft Partner logos'),
+    _builder_block('text', '<strong>CloudFuze Purchase Agreement for [Client.Company]</strong>'),
+    _builder_block('text', 'This agreement between [company name] and [Client.Company] ({{client_name}}) '
+                           'covers up to {Up to i want to keep here no of users} users for a total of '
+                           '{i want to mention total cost}. Valid for how m,any Months i want tomention here '
+                           'months. Reference [not a key].'),
+    _builder_block('table', '<table><tr><th>job</th><th>Description</th><th>price</th></tr>'
+                            '<tr><td>Managed Migration</td><td>For [Client.Company]</td>'
+                            '<td>{migration cost}</td></tr></table>'),
+    _builder_block('table', ''),
+    {'type': 'toc', 'content': '<div>Contents</div>'},
+]
+
+
+def _texts(story):
+    return [flowable.text for flowable in story if isinstance(flowable, Paragraph)]
+
+
+def test_plan_fills_slots_per_render():
+    """A compiled plan renders the quote's values and keeps unknown placeholders"""
+    print("🧪 Testing plan filling...")
+    plan = compile_template(BLOCKS)
+    assert pickle.loads(pickle.dumps(plan)) == plan  # plain data for the render workers
+    assert [step[0] for step in plan['steps']] == ['logo_text', 'text', 'text', 'table', 'table']
+
+    story = build_template_story(plan, [], TEMPLATE_DATA, 'Acme', 'advanced', ['no logos'])
+    texts = _texts(story)
+    assert texts[1] == 'CloudFuze Purchase Agreement for Acme'
+    # The block repeating the title with markup is skipped as a duplicate
+    assert not any('<strong>' in text for text in texts)
+    assert texts[-1] == ('This agreement between CloudFuze and Acme (Ada Lovelace) covers up to 250 users '
+                         'for a total of $12,500.00. 6 months. Reference [not a key].')
+
+    tables = [flowable for flowable in story if isinstance(flowable, Table)]
+    assert tables[0]._cellvalues[1] == ['Managed Migration', 'For Acme', '$9,000.00']
+    assert tables[1]._cellvalues[0] == ['job', 'Description', 'price']  # default agreement table
+
+    # Same plan, another quote
+    texts = _texts(build_template_story(plan, [], dict(TEMPLATE_DATA, client_name='Grace'), 'Initech'))
+    assert texts[-1].startswith('This agreement between CloudFuze and Initech (Grace) covers')
+    assert render_template_plan_pdf(plan, [], TEMPLATE_DATA, 'Acme').startswith(b'%PDF')
+    print("✅ Plan filled")
+
+
+def test_plans_cached_by_template_version():
+    """Plans are reused until the template's updated timestamp changes"""
+    print("🧪 Testing the plan cache...")
+    plans = TemplatePlanCache(max_entries=2)
+    first = plans.get('tpl-1', '2025-01-01T10:00:00', BLOCKS)
+    assert plans.get('tpl-1', '2025-01-01T10:00:00', BLOCKS) is first
+    edited = plans.get('tpl-1', '2025-01-02T10:00:00', BLOCKS[:2])
+    assert edited is not first and len(edited['steps']) == 2
+    plans.get('tpl-2', '2025-01-01T10:00:00', BLOCKS)
+    assert plans.get_stats() == {'entries': 2, 'max_entries': 2, 'hits': 1, 'misses': 3}
+    print("✅ Plans cached per version")
+
+
+@pytest.mark.skipif(STORAGE_BACKEND != 'memory', reason="cpq.db was already configured for MongoDB")
+def test_save_compiles_plan():
+    """Saving a template compiles the plan its next render will look up"""
+    print("🧪 Testing compile on save...")
+    builder = TemplateBuilderCollection()
+    assert builder.save_document({'id': 'tpl-plan-1', 'title': 'Plan', 'blocks': BLOCKS, 'metadata': {}})['success']
+    document = builder.get_document_by_id('tpl-plan-1')
+
+    misses = template_plans.get_stats()['misses']
+    template_plans.get('tpl-plan-1', document['updated'], document['blocks'])
+    assert template_plans.get_stats()['misses'] == misses
+    print("✅ Plan compiled on save")
+
+
+def _fill_plan(plan):
+    """The per-render text work: every slot of every step filled"""
+    for step in plan['steps']:
+        if step[0] == 'text' or (step[0] == 'table' and step[1] == 'text'):
+            fill(step[-1], TEMPLATE_DATA, 'Acme', 'standard')
+        elif step[0] == 'table' and step[1] == 'html':
+            [[fill(cell, TEMPLATE_DATA, 'Acme', 'standard') for cell in row] for row in step[2]]
+
+
+def test_benchmark_plan_fill_vs_compile():
+    """Filling a cached plan costs a fraction of extracting the blocks again"""
+    print("🧪 Benchmarking plan filling...")
+    blocks = BLOCKS * 10
+    plan = compile_template(blocks)
+
+    def timed(work, iterations=50):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            work()
+        return (time.perf_counter() - start) / iterations
+
+    compiling = timed(lambda: compile_template(blocks))
+    filling = timed(lambda: _fill_plan(plan))
+    size = sum(len(block['content']) for block in blocks)
+    print(f"✅ {len(blocks)} blocks ({size:,} chars): compile {compiling * 1000:.2f} ms, "
+          f"fill {filling * 1000:.2f} ms ({compiling / filling:.1f}x)")
+    assert filling * 3 < compiling
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for the PDF render worker pool.
+
+Starts real worker processes; WeasyPrint is not needed.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpq import render_service
+from cpq.render_service import RenderService, RenderTimeout
+
+CLIENT = {'name': 'Ada', 'company': 'Acme', 'email': 'ada@acme.test'}
+CONFIGURATION = {'users': 50, 'duration': 6, 'migrationType': 'content'}
+BLOCKS = [
+    {'type': 'text', 'content': '<p>This agreement is made with [Client.Company] for our services.</p>'},
+    {'type': 'table', 'content': '<table><tr><th>job</th><th>price</th></tr>'
+                                 '<tr><td>Migration</td><td>{migration cost}</td></tr></table>'},
+]
+TEMPLATE_DATA = {'client_company': 'Acme', 'standard_migration_cost_formatted': '$1,200.00'}
+
+
+@pytest.fixture
+def pool():
+    service = RenderService(size=1, timeout=30)
+    yield service
+    service.close()
+
+
+def test_pool_and_inline_render_the_same_pdf(pool):
+    """Jobs return PDF bytes from a worker process, same as rendering inline"""
+    print("🧪 Testing pooled rendering...")
+    inline = RenderService(size=0)
+    for job, args in [('quote_pdf', (CLIENT, {}, CONFIGURATION)),
+                      ('template_pdf', (BLOCKS, [], TEMPLATE_DATA, 'Acme'))]:
+        pdf = pool.render(job, *args)
+        assert pdf.startswith(b'%PDF')
+        assert len(pdf) == len(inline.render(job, *args))
+
+    status = pool.get_status()
+    assert status['mode'] == 'pool' and status['jobs'] == 2 and status['failed'] == 0
+    assert os.getpid() not in status['workers']
+    print("✅ Pooled render matches inline render")
+
+
+def test_job_errors_are_raised_in_the_caller(pool):
+    """An exception in a job reaches the caller and the worker keeps serving"""
+    print("🧪 Testing error propagation...")
+    with pytest.raises(KeyError):
+        pool.render('signature_certificate_pdf', {})
+    with pytest.raises(ValueError):
+        pool.render('not_a_job')
+    assert pool.render('quote_pdf', CLIENT, {}, CONFIGURATION).startswith(b'%PDF')
+    assert pool.get_status()['restarts'] == 0
+    print("✅ Errors propagated")
+
+
+def test_timeout_replaces_the_worker(pool):
+    """A job past its timeout is abandoned and its worker restarted"""
+    print("🧪 Testing render timeouts...")
+    pool.render('quote_pdf', CLIENT, {}, CONFIGURATION)
+    stuck = pool.get_status()['workers']
+
+    with pytest.raises(RenderTimeout):
+        pool.render('quote_pdf', CLIENT, {}, CONFIGURATION, timeout=0.001)
+
+    status = pool.get_status()
+    assert status['timeouts'] == 1 and status['restarts'] == 1
+    assert status['workers'] != stuck
+    assert pool.render('quote_pdf', CLIENT, {}, CONFIGURATION).startswith(b'%PDF')
+    print("✅ Worker replaced after timeout")
+
+
+def test_falls_back_inline_when_no_worker_can_start(pool, monkeypatch):
+    """Losing the last worker switches to inline rendering, including for requests already waiting"""
+    print("🧪 Testing inline fallback...")
+    pool.render('quote_pdf', CLIENT, {}, CONFIGURATION)
+
+    def fail():
+        raise OSError("fork failed")
+
+    monkeypatch.setattr(render_service, '_Worker', fail)
+    with pytest.raises(RenderTimeout):
+        pool.render('quote_pdf', CLIENT, {}, CONFIGURATION, timeout=0.001)
+
+    status = pool.get_status()
+    assert status['mode'] == 'inline' and status['workers'] == [] and status['restarts'] == 0
+    assert pool.render('quote_pdf', CLIENT, {}, CONFIGURATION).startswith(b'%PDF')
+    # A request that was waiting for a worker is woken instead of timing out
+    started = time.monotonic()
+    assert pool._dispatch('quote_pdf', (CLIENT, {}, CONFIGURATION), {}, 30, started).startswith(b'%PDF')
+    assert time.monotonic() - started < 10
+    print("✅ Rendered inline without workers")
+
+
+def test_counters_are_consistent_under_concurrency():
+    """Jobs and failures from many threads are all counted"""
+    print("🧪 Testing concurrent counters...")
+    service = RenderService(size=0)
+
+    def render(n):
+        for _ in range(n):
+            try:
+                service.render('signature_certificate_pdf', {})
+            except KeyError:
+                pass
+
+    threads = [threading.Thread(target=render, args=(50,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    status = service.get_status()
+    assert status['jobs'] == status['failed'] == 400
+    assert status['last_error'].startswith('signature_certificate_pdf: KeyError')
+    print("✅ Counters consistent")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test script for the content-addressed template asset store.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import base64
+import hashlib
+import os
+import sys
+
+from io import BytesIO
+
+import pytest
+from docx import Document
+from flask import Flask
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from mongodb_collections.template_builder_collection import TemplateBuilderCollection
+from template_builder import assets_bp
+from templates.docx_generator import generate_agreement_docx
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+LOGO = b'\x89PNG\r\n\x1a\n' + b'logo-bytes' * 200
+PARTNER = b'\x89PNG\r\n\x1a\n' + b'partner' * 300
+
+
+def _image_block(*images):
+    tags = ''.join(f'<img src="data:image/png;base64,{base64.b64encode(img).decode()}">' for img in images)
+    return {'type': 'image', 'content': f'<div class="image-block">{tags}</div>'}
+
+
+def _document(doc_id, *images):
+    return {
+        'id': doc_id,
+        'title': doc_id,
+        'blocks': [{'type': 'text', 'content': '<p>[Client.Company]</p>'}, _image_block(*images)],
+        'metadata': {'hasImages': True},
+    }
+
+
+def test_save_extracts_and_deduplicates_images():
+    """Inline images become /assets/<sha256> references stored once"""
+    print("🧪 Testing asset extraction...")
+    builder = TemplateBuilderCollection()
+    assert builder.save_document(_document('tpl-assets-1', LOGO, PARTNER))['success']
+    assert builder.save_document(_document('tpl-assets-2', LOGO))['success']
+
+    logo_hash = hashlib.sha256(LOGO).hexdigest()
+    partner_hash = hashlib.sha256(PARTNER).hexdigest()
+
+    document = builder.get_document_by_id('tpl-assets-1')
+    image_block = document['blocks'][1]
+    assert 'data:image' not in image_block['content']
+    assert f'/assets/{logo_hash}' in image_block['content']
+    assert image_block['assets'] == [logo_hash, partner_hash]
+
+    # Shared across templates: the logo is stored once
+    assert builder.assets.collection.count_documents({}) == 2
+    assert builder.assets.get_block_images(image_block) == [LOGO, PARTNER]
+
+    # Re-saving already extracted blocks keeps their references
+    document['metadata'] = {'hasImages': True, 'resaved': True}
+    assert builder.save_document(document)['success']
+    assert builder.get_document_by_id('tpl-assets-1')['blocks'][1]['assets'] == [logo_hash, partner_hash]
+    print("✅ Images extracted and deduplicated")
+
+
+def test_legacy_documents_migrate_and_still_render():
+    """Documents saved with inline images render before and after migration"""
+    print("🧪 Testing migration of inline images...")
+    builder = TemplateBuilderCollection()
+    legacy = _document('tpl-legacy', PARTNER)
+    builder.collection.insert_one({**legacy, 'created': None, 'updated': None, 'is_active': True})
+
+    stored = builder.collection.find_one({'id': 'tpl-legacy'})
+    assert builder.assets.get_block_images(stored['blocks'][1]) == [PARTNER]
+
+    assert builder.migrate_embedded_images() == 1
+    migrated = builder.collection.find_one({'id': 'tpl-legacy'})
+    assert 'data:image' not in migrated['blocks'][1]['content']
+    assert builder.assets.get_block_images(migrated['blocks'][1]) == [PARTNER]
+    print("✅ Legacy document migrated")
+
+
+def test_assets_are_served_with_immutable_caching():
+    """/assets/<hash> returns the bytes with long-lived caching and ETag revalidation"""
+    print("🧪 Testing asset endpoint...")
+    builder = TemplateBuilderCollection()
+    builder.save_document(_document('tpl-assets-served', LOGO))
+    logo_hash = hashlib.sha256(LOGO).hexdigest()
+
+    app = Flask(__name__)
+    app.register_blueprint(assets_bp)
+    client = app.test_client()
+
+    response = client.get(f'/assets/{logo_hash}')
+    assert response.status_code == 200
+    assert response.data == LOGO
+    assert response.mimetype == 'image/png'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.headers['Content-Security-Policy'] == "sandbox; default-src 'none'"
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+
+    revalidated = client.get(f'/assets/{logo_hash}', headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+
+    assert client.get('/assets/' + '0' * 64).status_code == 404
+    assert client.get('/assets/not-a-hash').status_code == 404
+    print("✅ Asset endpoint serves immutable content")
+
+
+def test_svg_images_are_not_served_from_our_origin():
+    """Inline SVG stays in the block instead of becoming a same-origin /assets URL"""
+    print("🧪 Testing SVG handling...")
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(document.cookie)</script></svg>'
+    data_uri = f'data:image/svg+xml;base64,{base64.b64encode(svg).decode()}'
+    builder = TemplateBuilderCollection()
+    blocks = builder.assets.extract_block_assets([{'type': 'image', 'content': f'<img src="{data_uri}">'}])
+    assert blocks[0]['content'] == f'<img src="{data_uri}">'
+    assert 'assets' not in blocks[0]
+    assert builder.assets.get_asset(hashlib.sha256(svg).hexdigest()) is None
+    print("✅ SVG left inline")
+
+
+def test_asset_urls_resolve_in_docx_and_html_renders():
+    """Saved blocks point at /assets/<hash>; the DOCX and HTML renderers still get the image"""
+    print("🧪 Testing asset resolution in renders...")
+    buffer = BytesIO()
+    Image.new('RGB', (80, 40), (200, 30, 30)).save(buffer, format='PNG')
+    png = buffer.getvalue()
+    builder = TemplateBuilderCollection()
+    builder.save_document(_document('tpl-assets-docx', png))
+    block = builder.get_document_by_id('tpl-assets-docx')['blocks'][1]
+    digest = hashlib.sha256(png).hexdigest()
+    assert f'src="/assets/{digest}"' in block['content']
+
+    success, docx_bytes = generate_agreement_docx(block['content'], {})
+    assert success
+    document = Document(BytesIO(docx_bytes))
+    assert len(document.inline_shapes) == 1
+    assert document.inline_shapes[0]._inline.graphic.graphicData.pic.blipFill.blip.embed
+    assert [part.blob for part in document.part.package.image_parts] == [png]
+
+    inlined = builder.assets.inline_assets(block['content'] + '<img src="/assets/' + '0' * 64 + '">')
+    assert f'src="data:image/png;base64,{base64.b64encode(png).decode()}"' in inlined
+    assert '/assets/' + '0' * 64 in inlined  # unknown assets are left alone
+    print("✅ Assets resolved")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
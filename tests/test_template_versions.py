@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test script for delta-compressed template version history.
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from mongodb_collections.template_collection import TemplateCollection
+from mongodb_collections.template_version_collection import (
+    SNAPSHOT_INTERVAL, apply_delta, compute_delta
+)
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+IMAGE = '<img src="data:image/png;base64,' + 'iVBORw0KGgo' * 5000 + '">'
+
+
+def _content(revision):
+    # Single-line HTML with a large embedded image, as saved by the editor
+    return f'<html><body><h1>Agreement</h1>{IMAGE}<p>Revision {revision}</p><p>Terms</p></body></html>'
+
+
+def test_delta_round_trip():
+    """apply_delta rebuilds the new content exactly"""
+    print("🧪 Testing delta round trip...")
+    old = _content(1)
+    new = _content(2).replace('<p>Terms</p>', '<p>New terms</p>\n<p>Signature</p>')
+    delta = compute_delta(old, new)
+    assert apply_delta(old, delta) == new
+    assert apply_delta('', compute_delta('', 'plain')) == 'plain'
+    # The unchanged image costs a copy op, not another copy of the image
+    assert len(delta) < 200
+    print(f"✅ Delta is {len(delta)} bytes for {len(new)} bytes of content")
+
+
+def test_history_snapshots_and_rebuilds_every_version():
+    """Every version rebuilds; snapshots recur so chains stay bounded"""
+    print("🧪 Testing version history...")
+    templates = TemplateCollection()
+    template_id = templates.create_template({'name': 'MSA', 'content': _content(1)})
+    assert template_id
+
+    total = SNAPSHOT_INTERVAL * 2 + 3
+    for revision in range(2, total + 1):
+        assert templates.update_template(template_id, {'name': f'MSA r{revision}', 'content': _content(revision)})
+
+    current = templates.get_template_by_id(template_id)
+    assert current['version'] == total and current['content'] == _content(total)
+
+    versions = templates.get_template_versions(template_id)
+    assert [v['version'] for v in versions] == list(range(total, 0, -1))
+    assert all('data' not in v for v in versions)
+    snapshots = sorted(v['version'] for v in versions if v['kind'] == 'snapshot')
+    assert snapshots == [1, SNAPSHOT_INTERVAL + 1, 2 * SNAPSHOT_INTERVAL + 1]
+
+    for revision in range(1, total + 1):
+        old = templates.get_template_version(template_id, revision)
+        assert old['content'] == _content(revision)
+        assert old['name'] == ('MSA' if revision == 1 else f'MSA r{revision}')
+
+    stored = sum(v['stored_bytes'] for v in versions)
+    assert stored < len(_content(1)) * total / 10
+    print(f"✅ {total} versions stored in {stored} bytes")
+
+
+def test_stale_update_is_rejected_without_breaking_history():
+    """A concurrent writer that lost the race leaves history consistent"""
+    print("🧪 Testing concurrent updates...")
+    templates = TemplateCollection()
+    template_id = templates.create_template({'name': 'NDA', 'content': _content(1)})
+    stale = templates.collection.find_one({'_id': templates.get_template_by_id(template_id)['_id']})
+
+    assert templates.update_template(template_id, {'content': _content(2)})
+    # A second writer that read version 1 cannot record version 2 again
+    with pytest.raises(DuplicateKeyError):
+        templates.versions.record_version({**stale, 'version': 2, 'content': _content(9)}, stale)
+
+    assert templates.update_template(template_id, {'content': _content(3)})
+    assert templates.get_template_version(template_id, 2)['content'] == _content(2)
+    assert templates.get_template_version(template_id, 3)['content'] == _content(3)
+    print("✅ History stays consistent")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))
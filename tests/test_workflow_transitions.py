@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script for the approval workflow state machine (manager -> CEO -> client).
+
+Runs on the in-memory storage backend, so no MongoDB server is needed.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('CPQ_STORAGE_BACKEND', 'memory')
+
+from cpq.db import STORAGE_BACKEND
+from mongodb_collections.approval_workflow_collection import ApprovalWorkflowCollection, WORKFLOW_TRANSITIONS
+
+pytestmark = pytest.mark.skipif(STORAGE_BACKEND != 'memory',
+                                reason="cpq.db was already configured for MongoDB")
+
+CLIENT_EMAIL = 'ada@example.com'
+
+# Each state as the transitions that lead to it from a new workflow, with the
+# transitions allowed from there
+STATES = {
+    'new': ([], {('manager', 'approved'), ('manager', 'denied')}),
+    'manager_approved': ([('manager', 'approved')], {('ceo', 'approved'), ('ceo', 'denied')}),
+    'client_review': ([('manager', 'approved'), ('ceo', 'approved')],
+                      {('client', 'accepted'), ('client', 'rejected'), ('client', 'needs_changes')}),
+    'denied_by_manager': ([('manager', 'denied')], set()),
+    'denied_by_ceo': ([('manager', 'approved'), ('ceo', 'denied')], set()),
+    'accepted': ([('manager', 'approved'), ('ceo', 'approved'), ('client', 'accepted')], set()),
+    'rejected': ([('manager', 'approved'), ('ceo', 'approved'), ('client', 'rejected')], set()),
+    'needs_changes': ([('manager', 'approved'), ('ceo', 'approved'), ('client', 'needs_changes')], set()),
+}
+
+
+@pytest.fixture
+def workflows():
+    collection = ApprovalWorkflowCollection()
+    collection.collection.delete_many({})
+    yield collection
+    collection.collection.delete_many({})
+
+
+def _workflow_at(workflows, state):
+    workflow_id = str(workflows.create_workflow({'document_id': 'doc-1', 'client_email': CLIENT_EMAIL}).inserted_id)
+    for role, outcome in STATES[state][0]:
+        assert workflows.transition(workflow_id, role, outcome, client_email=CLIENT_EMAIL) is not None
+    return workflow_id
+
+
+@pytest.mark.parametrize('state', list(STATES))
+def test_only_expected_transitions_apply(workflows, state):
+    """From every state exactly the modelled edges apply, and each sets its new state"""
+    print(f"🧪 Testing transitions from {state}...")
+    allowed = STATES[state][1]
+    for (role, outcome), rule in WORKFLOW_TRANSITIONS.items():
+        workflow_id = _workflow_at(workflows, state)
+        before = workflows.get_workflow_by_id(workflow_id)
+        after = workflows.transition(workflow_id, role, outcome, f'{role} says {outcome}', CLIENT_EMAIL)
+        if (role, outcome) not in allowed:
+            assert after is None, f"{role} {outcome} applied in state {state}"
+            assert workflows.get_workflow_by_id(workflow_id) == before
+            continue
+        assert after is not None, f"{role} {outcome} rejected in state {state}"
+        assert {key: after[key] for key in rule['set']} == rule['set']
+        comments = 'client_comments' if role == 'client' else f'{role}_comments'
+        assert after[comments] == f'{role} says {outcome}'
+    print(f"✅ {len(allowed)} transitions from {state}")
+
+
+def test_every_transition_is_reachable():
+    """The states above cover every WORKFLOW_TRANSITIONS edge"""
+    print("🧪 Testing transition coverage...")
+    assert set().union(*(allowed for _, allowed in STATES.values())) == set(WORKFLOW_TRANSITIONS)
+    print("✅ Every transition covered")
+
+
+def test_stale_transitions_are_rejected(workflows):
+    """A decision replayed after the workflow moved on (double click, concurrent approver) is a no-op"""
+    print("🧪 Testing stale transitions...")
+    workflow_id = _workflow_at(workflows, 'new')
+    assert workflows.update_workflow_status(workflow_id, 'manager', 'approve', 'ok')
+    assert not workflows.update_workflow_status(workflow_id, 'manager', 'approve', 'ok again')
+    assert not workflows.update_workflow_status(workflow_id, 'manager', 'deny', 'too late')
+    workflow = workflows.get_workflow_by_id(workflow_id)
+    assert (workflow['manager_status'], workflow['manager_comments']) == ('approved', 'ok')
+
+    assert workflows.update_workflow_status(workflow_id, 'ceo', 'approve', 'ok')
+    assert workflows.submit_client_feedback(workflow_id, 'looks good', 'accepted')
+    assert not workflows.submit_client_feedback(workflow_id, 'changed my mind', 'rejected')
+    workflow = workflows.get_workflow_by_id(workflow_id)
+    assert (workflow['workflow_status'], workflow['client_decision']) == ('completed', 'accepted')
+    assert workflow['completed_at'] == workflow['client_feedback_date']
+    print("✅ Stale transitions rejected")
+
+
+def test_invalid_requests_are_rejected(workflows):
+    """Unknown actions, the wrong client and malformed ids change nothing"""
+    print("🧪 Testing invalid transitions...")
+    workflow_id = _workflow_at(workflows, 'client_review')
+    assert workflows.transition(workflow_id, 'manager', 'escalate') is None
+    assert workflows.transition(workflow_id, 'client', 'accepted', client_email='mallory@example.com') is None
+    assert workflows.transition('not-an-id', 'manager', 'approved') is None
+    with pytest.raises(ValueError):
+        workflows.build_transition(workflow_id, 'ceo', 'needs_changes')
+    assert workflows.get_workflow_by_id(workflow_id)['client_status'] == 'pending_feedback'
+    print("✅ Invalid transitions rejected")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v", "-s"]))